@@ -0,0 +1,282 @@
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+
+from fastapi import Depends, HTTPException
+
+from metrics import registry
+
+# 每个用户、每类接口的令牌桶：名称=每秒补充令牌数:桶容量
+RATE_LIMITS = os.getenv("RATE_LIMITS", "upload=1:10,batch_upload=0.2:3,search=10:30,graph_query=5:20")
+# 同时处理的文件数上限
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", str(os.cpu_count() or 2)))
+# 排队等待处理的文件数上限（全局 / 单个用户），超出时返回429
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_MAX_QUEUE_PER_USER = int(os.getenv("ADMISSION_MAX_QUEUE_PER_USER", "8"))
+# 计算处理代价的文件大小单位：代价 = 1 + 文件大小 / 该单位
+ADMISSION_COST_UNIT_BYTES = int(os.getenv("ADMISSION_COST_UNIT_BYTES", str(1024 * 1024)))
+# 管理员的调度权重（普通用户为1）
+ADMISSION_ADMIN_WEIGHT = float(os.getenv("ADMISSION_ADMIN_WEIGHT", "2"))
+
+IN_FLIGHT = registry.gauge("kg_admission_in_flight", "正在处理的文件数")
+QUEUED = registry.gauge("kg_admission_queued", "排队等待处理的文件数")
+REJECTED = registry.counter("kg_admission_rejected_total", "被拒绝的请求数", ["reason"])
+
+class AdmissionRejected(Exception):
+    """请求未被接纳，retry_after 为建议的重试等待秒数"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """令牌桶：以 rate 个/秒补充，最多积累 capacity 个"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def try_acquire(self, cost: float = 1.0) -> Tuple[bool, float]:
+        """尝试取出令牌，返回 (是否成功, 不成功时需要等待的秒数)"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return True, 0.0
+        if cost > self.capacity or self.rate <= 0:
+            return False, float('inf')
+        return False, (cost - self.tokens) / self.rate
+
+class RateLimiter:
+    """按 (用户, 接口类别) 维护令牌桶"""
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]]):
+        self.limits = limits
+        self._buckets: Dict[Tuple[int, str], TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: str = RATE_LIMITS) -> "RateLimiter":
+        limits = {}
+        for item in filter(None, (part.strip() for part in config.split(","))):
+            name, spec = item.split("=")
+            rate, capacity = spec.split(":")
+            limits[name.strip()] = (float(rate), float(capacity))
+        return cls(limits)
+
+    def check(self, user_id: int, name: str, cost: float = 1.0):
+        """消耗令牌，超出限额时抛出 AdmissionRejected"""
+        if name not in self.limits:
+            return
+        with self._lock:
+            bucket = self._buckets.get((user_id, name))
+            if bucket is None:
+                bucket = self._buckets[(user_id, name)] = TokenBucket(*self.limits[name])
+            allowed, wait = bucket.try_acquire(cost)
+            if len(self._buckets) > 10000:
+                self._evict_full_buckets()
+        if not allowed:
+            REJECTED.inc(reason=f"rate_limit:{name}")
+            raise AdmissionRejected(f"请求过于频繁（{name}）", wait if wait != float('inf') else 60.0)
+
+    def _evict_full_buckets(self):
+        """清理已经回满的令牌桶（与新建的桶等价）"""
+        now = time.monotonic()
+        for key, bucket in list(self._buckets.items()):
+            if bucket.tokens + (now - bucket.updated) * bucket.rate >= bucket.capacity:
+                del self._buckets[key]
+
+class _Waiter:
+    __slots__ = ('user_id', 'cost', 'weight', 'grant', 'state')
+
+    def __init__(self, user_id: int, cost: float, weight: float, grant: Callable[[], None]):
+        self.user_id = user_id
+        self.cost = cost
+        self.weight = weight
+        self.grant = grant
+        # queued -> granted / cancelled
+        self.state = "queued"
+
+class FairScheduler:
+    """带全局并发上限的加权公平调度器
+
+    空闲槽位不足时请求进入队列，按加权公平排队（WFQ）出队：
+    每个请求的虚拟完成时间 = max(系统虚拟时间, 该用户上一个请求的虚拟完成时间) + 代价 / 权重，
+    总是先放行虚拟完成时间最小的请求，系统虚拟时间随之推进到该请求的虚拟开始时间。提交大量或大文件的用户只会推迟自己的请求，
+    不会挤占其他用户的份额。队列满时直接拒绝（由调用方转换为429）。
+
+    同时支持协程（acquire_async）和线程（acquire）两种等待方式，共享同一组槽位。
+    """
+
+    def __init__(self, max_concurrent: int = ADMISSION_MAX_CONCURRENT, max_queue: int = ADMISSION_MAX_QUEUE,
+                 max_queue_per_user: int = ADMISSION_MAX_QUEUE_PER_USER):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._heap: List[Tuple[float, int, _Waiter]] = []
+        self._queued_by_user: Dict[int, int] = {}
+        self._finish_tags: Dict[int, float] = {}
+        self._virtual_time = 0.0
+        self._sequence = itertools.count()
+        # 单位代价处理耗时的指数滑动平均，用于估算 Retry-After
+        self._seconds_per_cost = 1.0
+
+    # ---- 排队 ----
+
+    def _enqueue(self, user_id: int, cost: float, weight: float, grant: Callable[[], None],
+                 reject: bool) -> Optional[_Waiter]:
+        """有空闲槽位时直接占用并返回 None，否则加入队列并返回等待者"""
+        with self._lock:
+            if self._in_flight < self.max_concurrent and not self._heap:
+                self._in_flight += 1
+                IN_FLIGHT.set(self._in_flight)
+                return None
+
+            if reject:
+                if len(self._heap) >= self.max_queue:
+                    REJECTED.inc(reason="queue_full")
+                    raise AdmissionRejected("服务器繁忙，请稍后重试", self._estimate_wait(len(self._heap)))
+                if self._queued_by_user.get(user_id, 0) >= self.max_queue_per_user:
+                    REJECTED.inc(reason="user_queue_full")
+                    raise AdmissionRejected("排队中的文件过多，请稍后重试",
+                                            self._estimate_wait(self._queued_by_user[user_id]))
+
+            weight = max(weight, 1e-6)
+            start = max(self._virtual_time, self._finish_tags.get(user_id, 0.0))
+            finish = start + cost / weight
+            self._finish_tags[user_id] = finish
+            waiter = _Waiter(user_id, cost, weight, grant)
+            heapq.heappush(self._heap, (finish, next(self._sequence), waiter))
+            self._queued_by_user[user_id] = self._queued_by_user.get(user_id, 0) + 1
+            QUEUED.set(len(self._heap))
+            return waiter
+
+    def _estimate_wait(self, ahead: int) -> float:
+        return max(1.0, self._seconds_per_cost * (ahead + 1) / max(self.max_concurrent, 1))
+
+    def _cancel(self, waiter: _Waiter) -> bool:
+        """取消排队（请求断开），若已被放行则返回 False"""
+        with self._lock:
+            if waiter.state != "queued":
+                return waiter.state == "cancelled"
+            waiter.state = "cancelled"
+            for i, (_, _, queued) in enumerate(self._heap):
+                if queued is waiter:
+                    self._heap.pop(i)
+                    heapq.heapify(self._heap)
+                    self._dequeued(waiter)
+                    break
+            return True
+
+    def _dequeued(self, waiter: _Waiter):
+        remaining = self._queued_by_user.get(waiter.user_id, 1) - 1
+        if remaining > 0:
+            self._queued_by_user[waiter.user_id] = remaining
+        else:
+            self._queued_by_user.pop(waiter.user_id, None)
+        QUEUED.set(len(self._heap))
+
+    # ---- 获取与释放 ----
+
+    async def acquire_async(self, user_id: int, cost: float = 1.0, weight: float = 1.0,
+                            reject: bool = True) -> float:
+        """在协程中等待处理槽位，返回排队耗时"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        started = time.monotonic()
+        waiter = self._enqueue(user_id, cost, weight,
+                               lambda: loop.call_soon_threadsafe(_resolve, future), reject)
+        if waiter is None:
+            return 0.0
+        try:
+            await future
+        except asyncio.CancelledError:
+            if not self._cancel(waiter):
+                # 取消与放行同时发生：槽位已分配，需要归还
+                self.release()
+            raise
+        return time.monotonic() - started
+
+    def acquire(self, user_id: int, cost: float = 1.0, weight: float = 1.0, reject: bool = False) -> float:
+        """在线程中阻塞等待处理槽位（批量流水线使用），返回排队耗时"""
+        event = threading.Event()
+        started = time.monotonic()
+        waiter = self._enqueue(user_id, cost, weight, event.set, reject)
+        if waiter is not None:
+            event.wait()
+        return time.monotonic() - started
+
+    def release(self, cost: float = 0.0, elapsed: float = 0.0):
+        """归还槽位并放行下一个请求；cost/elapsed 用于更新耗时估计"""
+        with self._lock:
+            if cost > 0 and elapsed > 0:
+                self._seconds_per_cost = 0.8 * self._seconds_per_cost + 0.2 * (elapsed / cost)
+            while self._heap:
+                finish, _, waiter = heapq.heappop(self._heap)
+                self._dequeued(waiter)
+                if waiter.state != "queued":
+                    continue
+                # 虚拟时间推进到被放行请求的虚拟开始时间
+                self._virtual_time = max(self._virtual_time, finish - waiter.cost / waiter.weight)
+                waiter.state = "granted"
+                waiter.grant()
+                return
+            self._in_flight -= 1
+            IN_FLIGHT.set(self._in_flight)
+            if self._in_flight == 0:
+                # 系统空闲时重置虚拟时间，避免标签无限增长
+                self._virtual_time = 0.0
+                self._finish_tags.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'in_flight': self._in_flight,
+                'queued': len(self._heap),
+                'max_concurrent': self.max_concurrent,
+                'queued_by_user': dict(self._queued_by_user)
+            }
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+def processing_cost(file_size: int) -> float:
+    """文件的处理代价（按大小估算）"""
+    return 1.0 + (file_size or 0) / ADMISSION_COST_UNIT_BYTES
+
+def user_weight(user) -> float:
+    return ADMISSION_ADMIN_WEIGHT if getattr(user, 'is_admin', False) else 1.0
+
+def too_many_requests(error: AdmissionRejected) -> HTTPException:
+    """转换为带 Retry-After 头的429响应"""
+    return HTTPException(
+        status_code=429,
+        detail=error.reason,
+        headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))}
+    )
+
+rate_limiter = RateLimiter.from_config()
+scheduler = FairScheduler()
+
+def rate_limit(name: str):
+    """接口依赖：按当前用户消耗 name 类别的令牌，超限时返回429"""
+    from auth import get_current_user
+
+    def dependency(current_user=Depends(get_current_user)):
+        try:
+            rate_limiter.check(current_user.id, name)
+        except AdmissionRejected as e:
+            raise too_many_requests(e)
+    return dependency
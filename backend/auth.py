@@ -75,6 +75,15 @@ def get_current_user(
     
     return user
 
+def get_user_from_token(token: Optional[str], db: Session) -> Optional[User]:
+    """根据令牌获取用户（用于无法设置请求头的场景，如浏览器 EventSource）"""
+    if not token:
+        return None
+    username = verify_token(token)
+    if username is None:
+        return None
+    return db.query(User).filter(User.username == username).first()
+
 def get_admin_user(current_user: User = Depends(get_current_user)) -> User:
     """获取管理员用户"""
     if not current_user.is_admin:
@@ -0,0 +1,8 @@
+"""性能基准测试
+
+用法（在 backend 目录下）：
+    python -m benchmarks.run                      # 运行全部基准测试
+    python -m benchmarks.run --filter nlp         # 只运行名称包含 nlp 的测试
+    python -m benchmarks.run --save-baseline      # 将结果保存为基线
+    python -m benchmarks.run --compare            # 与基线比较，出现回归时退出码为1
+"""
@@ -0,0 +1,179 @@
+"""API级负载场景：通过 TestClient 在进程内调用接口，记录延迟分位数
+
+数据库、图谱和索引均位于 BenchContext 的临时目录中，不会触碰开发环境的数据。
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+
+from benchmarks import corpus
+from benchmarks.harness import benchmark, BenchContext
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {'p50_ms': round(pick(0.5) * 1000, 2), 'p95_ms': round(pick(0.95) * 1000, 2),
+            'max_ms': round(samples[-1] * 1000, 2)}
+
+def _client(ctx: BenchContext):
+    """创建指向隔离环境的 TestClient，并以默认管理员登录"""
+    def create():
+        # 数据库和数据目录已由 BenchContext 指向临时目录；main 以相对路径挂载 uploads 目录
+        os.makedirs(os.path.join(ctx.workdir, "uploads"), exist_ok=True)
+        os.chdir(ctx.workdir)
+
+        from fastapi.testclient import TestClient
+        import main
+
+        client = TestClient(main.app)
+        client.__enter__()  # 触发启动事件（创建默认管理员）
+        ctx.add_finalizer(lambda: client.__exit__(None, None, None))
+        response = client.post("/auth/login", json={'username': 'admin', 'password': 'admin123'})
+        response.raise_for_status()
+        client.headers['Authorization'] = f"Bearer {response.json()['access_token']}"
+        return client
+    return ctx.cached('api_client', create)
+
+def _seed(ctx: BenchContext, client, files: int):
+    """上传若干文档作为查询场景的数据"""
+    def upload():
+        ids = []
+        for i in range(files):
+            text = corpus.chinese_text(3000, seed=i).encode('utf-8')
+            response = client.post("/files/upload", files={'file': (f"seed_{i}.txt", text, 'text/plain')})
+            response.raise_for_status()
+            ids.append(response.json()['id'])
+        return ids
+    return ctx.cached('api_seed', upload)
+
+def _timed_requests(requests):
+    latencies = []
+    for request in requests:
+        start = time.perf_counter()
+        response = request()
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+    return _percentiles(latencies)
+
+@benchmark("api.login", group="api", unit="requests")
+def bench_login(ctx: BenchContext):
+    client = _client(ctx)
+    count = 10
+    body = {'username': 'admin', 'password': 'admin123'}
+    return lambda: _timed_requests([lambda: client.post("/auth/login", json=body)] * count), count
+
+@benchmark("api.upload_txt", group="api", unit="requests", repeat=3)
+def bench_upload(ctx: BenchContext):
+    """单文件上传（同步完成提取、NLP和图谱写入）"""
+    client = _client(ctx)
+    count = 5 * ctx.scale
+    payloads = [corpus.chinese_text(3000, seed=100 + i).encode('utf-8') for i in range(count)]
+    counter = iter(range(1 << 30))
+
+    def upload(payload):
+        return lambda: client.post("/files/upload",
+                                   files={'file': (f"upload_{next(counter)}.txt", payload, 'text/plain')})
+    return lambda: _timed_requests([upload(p) for p in payloads]), count
+
+@benchmark("api.read_graph", group="api", unit="requests")
+def bench_read_graph(ctx: BenchContext):
+    client = _client(ctx)
+    ids = _seed(ctx, client, 10)
+    requests = [lambda file_id=file_id: client.get(f"/graph/{file_id}") for file_id in ids] * 3
+    return lambda: _timed_requests(requests), len(requests)
+
+@benchmark("api.stats", group="api", unit="requests")
+def bench_stats(ctx: BenchContext):
+    client = _client(ctx)
+    _seed(ctx, client, 10)
+    requests = [lambda: client.get("/graph/stats")] * 50
+    return lambda: _timed_requests(requests), len(requests)
+
+@benchmark("api.search", group="api", unit="requests")
+def bench_search(ctx: BenchContext):
+    client = _client(ctx)
+    _seed(ctx, client, 10)
+    terms = corpus.PERSONS + corpus.PLACES
+    requests = [lambda t=t: client.get("/graph/search", params={'query': t}) for t in terms]
+    requests += [lambda t=t: client.get("/graph/search/semantic", params={'query': t}) for t in terms]
+    return lambda: _timed_requests(requests), len(requests)
+
+@benchmark("api.concurrent_reads", group="api", unit="requests", repeat=3)
+def bench_concurrent_reads(ctx: BenchContext):
+    """8个并发客户端混合读取统计、图谱和搜索接口"""
+    client = _client(ctx)
+    ids = _seed(ctx, client, 10)
+    requests = []
+    for i in range(40 * ctx.scale):
+        requests.append(lambda: client.get("/graph/stats"))
+        requests.append(lambda i=i: client.get(f"/graph/{ids[i % len(ids)]}"))
+        requests.append(lambda i=i: client.get("/graph/search",
+                                               params={'query': corpus.PLACES[i % len(corpus.PLACES)]}))
+
+    def run():
+        def one(request):
+            start = time.perf_counter()
+            request().raise_for_status()
+            return time.perf_counter() - start
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            return _percentiles(list(pool.map(one, requests)))
+    return run, len(requests)
+
+@benchmark("api.metrics_scrape", group="api", unit="requests")
+def bench_metrics_scrape(ctx: BenchContext):
+    """处理样本文件后抓取 /metrics，附带检查各阶段计时和计数是否已记录"""
+    client = _client(ctx)
+    _seed(ctx, client, 10)
+    count = 20
+
+    def run():
+        latencies = []
+        for _ in range(count):
+            start = time.perf_counter()
+            response = client.get("/metrics")
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+        text = response.text
+        stages = sorted({line.split('stage="')[1].split('"')[0] for line in text.splitlines()
+                         if line.startswith('kg_stage_duration_seconds_count')})
+        return {**_percentiles(latencies), 'stages': ",".join(stages),
+                'series': sum(1 for line in text.splitlines() if line and not line.startswith('#'))}
+    return run, count
+
+def _dashboard_requests(client, rounds: int):
+    """仪表盘式的重复查询：同一组实体的搜索、邻域和路径反复请求"""
+    requests = []
+    for _ in range(rounds):
+        for person, org in zip(corpus.PERSONS[:4], corpus.ORGS[:4]):
+            requests.append(lambda t=person: client.get("/graph/entities", params={'query': t}))
+            requests.append(lambda t=org: client.get("/graph/neighbors", params={'entity': t}))
+            requests.append(lambda p=person, o=org: client.post(
+                "/graph/paths", json={'start_node': p, 'end_node': o, 'max_depth': 3}))
+    return requests
+
+def _bench_dashboard(ctx: BenchContext, cached: bool):
+    client = _client(ctx)
+    _seed(ctx, client, 10)
+    import main
+
+    requests = _dashboard_requests(client, 5 * ctx.scale)
+    max_entries = main.query_cache.max_entries
+
+    def run():
+        main.query_cache.clear()
+        main.query_cache.max_entries = max_entries if cached else 0
+        try:
+            return _timed_requests(requests)
+        finally:
+            main.query_cache.max_entries = max_entries
+    return run, len(requests)
+
+@benchmark("api.dashboard_queries", group="api", unit="requests", repeat=3)
+def bench_dashboard_cached(ctx: BenchContext):
+    """重复的实体搜索/邻域/路径查询（启用查询结果缓存，每轮从空缓存开始）"""
+    return _bench_dashboard(ctx, cached=True)
+
+@benchmark("api.dashboard_queries_uncached", group="api", unit="requests", repeat=3)
+def bench_dashboard_uncached(ctx: BenchContext):
+    """同上，关闭查询结果缓存作为对照"""
+    return _bench_dashboard(ctx, cached=False)
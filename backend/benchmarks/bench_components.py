@@ -0,0 +1,787 @@
+"""独立组件的基准测试：图谱统计、实体向量索引、批量流水线、进度推送、准入调度、图谱版本、批量导出、DOCX解析、实体与关系记录内存、图片指纹、启动导入耗时"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks import corpus
+from benchmarks.harness import benchmark, BenchContext
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _entity_names(count: int):
+    names = set()
+    i = 0
+    while len(names) < count:
+        names.add(f"{corpus.PERSONS[i % 10]}{corpus.ORGS[(i // 10) % 6]}{i}")
+        i += 1
+    return sorted(names)
+
+@benchmark("index.ann_search", group="index", unit="queries")
+def bench_ann_search(ctx: BenchContext):
+    """IVF近似检索，附带以精确检索为参照的召回率（分数并列时任一并列项都算命中）"""
+    from entity_index import EntityVectorIndex
+    from records import Entity
+    index = EntityVectorIndex(None, min_train_size=2048)
+    names = _entity_names(20_000 * ctx.scale)
+    for start in range(0, len(names), 1000):
+        index.add_entities(start // 1000, 1, [Entity(t, 'ORG') for t in names[start:start + 1000]])
+    index.wait_for_training()
+    queries = names[::max(1, len(names) // 100)][:100]
+
+    hits = 0.0
+    for query in queries:
+        approx = index.search(query, limit=10)
+        exact = index.search_exact(query, limit=10)
+        if exact:
+            cutoff = exact[-1]['score']
+            hits += sum(1 for item in approx if item['score'] >= cutoff - 1e-6) / len(exact)
+    quality = {'recall@10': round(hits / len(queries), 3), 'index_size': index.size}
+
+    def run():
+        for query in queries:
+            index.search(query, limit=10)
+        return quality
+    return run, len(queries)
+
+@benchmark("index.exact_search", group="index", unit="queries")
+def bench_exact_search(ctx: BenchContext):
+    from entity_index import EntityVectorIndex
+    from records import Entity
+    index = EntityVectorIndex(None, min_train_size=1 << 62)
+    names = _entity_names(20_000 * ctx.scale)
+    index.add_entities(1, 1, [Entity(t, 'ORG') for t in names])
+    queries = names[::max(1, len(names) // 100)][:100]
+    return lambda: [index.search_exact(q, limit=10) for q in queries], len(queries)
+
+@benchmark("pipeline.batch", group="pipeline", unit="files", repeat=3)
+def bench_batch_pipeline(ctx: BenchContext):
+    """提取（线程）-> NLP（线程）-> 图谱写入的三阶段流水线，处理一批混合格式文件"""
+    from pipeline import IngestionPipeline
+    from knowledge_graph import KnowledgeGraphBuilder
+    from memory_graph import MemoryGraphBackend
+    from file_handler import FileProcessor
+    from nlp_processor import NLPProcessor
+    files = 12 * ctx.scale
+    paths = corpus.write_mixed_corpus(ctx.path("batch", "files"), files, chars=2000)
+    processor = ctx.cached('file_processor', FileProcessor)
+    nlp = ctx.cached('nlp', NLPProcessor)
+
+    def run():
+        builder = KnowledgeGraphBuilder(backend=MemoryGraphBackend(None))
+
+        def extract(job):
+            job['content'] = processor.extract_text(job['path'], job['type'])
+            return job
+
+        def analyze(job):
+            job['entities'], job['relations'] = nlp.extract_knowledge(job.pop('content'))
+            return job
+
+        def write(job):
+            builder.build_graph(job['entities'], job['relations'], job['file_id'], 1)
+
+        pipeline = IngestionPipeline([("extract", extract, 4), ("nlp", analyze, 2), ("graph", write, 1)],
+                                     queue_size=4)
+        for i, path in enumerate(paths):
+            pipeline.submit({'file_id': i, 'path': path, 'type': os.path.splitext(path)[1]})
+        pipeline.join()
+        metrics = pipeline.metrics()
+        pipeline.shutdown()
+        return {stage: f"{m['processed']} ok / {m['errors']} err, busy {m['busy_seconds']}s"
+                for stage, m in metrics.items()}
+    return run, files
+
+@benchmark("startup.import_main", group="startup", unit="imports", repeat=3, warmup=0)
+def bench_import_main(ctx: BenchContext):
+    """在子进程中导入 main 模块的耗时（不含组件预热）"""
+    workdir = ctx.path("startup", "run")
+    os.makedirs(os.path.join(workdir, "uploads"), exist_ok=True)
+    env = {**os.environ, 'PYTHONPATH': BACKEND_DIR}
+    code = "import time; s = time.perf_counter(); import main; print(time.perf_counter() - s)"
+
+    def run():
+        result = subprocess.run([sys.executable, "-c", code], cwd=workdir, env=env,
+                                capture_output=True, text=True, check=True)
+        return {'in_process_seconds': round(float(result.stdout.strip().splitlines()[-1]), 3)}
+    return run, 1
+
+@benchmark("progress.fanout", group="progress", unit="deliveries", repeat=3)
+def bench_progress_fanout(ctx: BenchContext):
+    """大量并发订阅者接收一个文件的进度事件，并估算被替代的轮询请求数"""
+    import asyncio
+    import threading
+    from progress import ProgressBroker
+
+    subscribers = 500 * ctx.scale
+    events = 50
+    poll_interval = 2.0  # 假设前端每2秒轮询一次 /files
+
+    async def scenario():
+        broker = ProgressBroker(queue_size=events)
+        subscriptions = [broker.subscribe(user_id=1) for _ in range(subscribers)]
+
+        async def consume(subscription):
+            received = 0
+            while received < events:
+                if await subscription.get(timeout=10) is None:
+                    break
+                received += 1
+            subscription.close()
+            return received
+
+        consumers = [asyncio.create_task(consume(s)) for s in subscriptions]
+        # 在工作线程中发布，与文件处理线程一致
+        started = time.perf_counter()
+        publisher = threading.Thread(target=lambda: [
+            broker.publish(1, 1, "extracting", done=i + 1, total=events) for i in range(events)
+        ])
+        publisher.start()
+        received = await asyncio.gather(*consumers)
+        elapsed = time.perf_counter() - started
+        publisher.join()
+        return sum(received), elapsed
+
+    def run():
+        delivered, elapsed = asyncio.run(scenario())
+        # 单个文件的真实处理时长取决于文件，这里按每个事件间隔1秒的长任务估算
+        job_seconds = events * 1.0
+        return {
+            'delivered': delivered,
+            'delivery_seconds': round(elapsed, 4),
+            'polling_requests_replaced': int(subscribers * job_seconds / poll_interval),
+            'sse_requests': subscribers
+        }
+    return run, subscribers * events
+
+@benchmark("admission.fairness", group="admission", unit="requests", repeat=3)
+def bench_admission_fairness(ctx: BenchContext):
+    """负载测试：一个用户一次性提交大量大文件时，其他用户单文件上传的延迟
+
+    同一调度器分别以公平模式（按用户排队）和FIFO模式（全部视为同一用户）运行，
+    对比轻量用户的p99延迟（排队 + 处理）；light_alone 为没有重度用户时的基线。
+    """
+    import asyncio
+    from admission import FairScheduler
+
+    slots = 4
+    unit_seconds = 0.005          # 单位代价的处理时间
+    heavy_requests = 100 * ctx.scale
+    heavy_cost = 4.0
+    light_users = 8
+    light_requests = 15           # 每个轻量用户顺序提交的请求数
+    think_seconds = 0.01
+
+    async def handle(scheduler, user_id, cost):
+        started = time.perf_counter()
+        await scheduler.acquire_async(user_id, cost)
+        try:
+            await asyncio.sleep(cost * unit_seconds)
+        finally:
+            scheduler.release(cost, cost * unit_seconds)
+        return time.perf_counter() - started
+
+    async def light_user(scheduler, user_id, fair):
+        latencies = []
+        for _ in range(light_requests):
+            latencies.append(await handle(scheduler, user_id if fair else 0, 1.0))
+            await asyncio.sleep(think_seconds)
+        return latencies
+
+    async def scenario(fair: bool, heavy: bool):
+        scheduler = FairScheduler(slots, max_queue=100_000, max_queue_per_user=100_000)
+        heavy_tasks = [asyncio.create_task(handle(scheduler, 1000 if fair else 0, heavy_cost))
+                       for _ in range(heavy_requests if heavy else 0)]
+        await asyncio.sleep(0)
+        results = await asyncio.gather(*[light_user(scheduler, user_id, fair) for user_id in range(light_users)])
+        heavy_latencies = await asyncio.gather(*heavy_tasks)
+        light = sorted(latency for latencies in results for latency in latencies)
+        p99 = light[min(len(light) - 1, int(0.99 * len(light)))]
+        return p99, (max(heavy_latencies) if heavy_latencies else 0.0)
+
+    def run():
+        alone, _ = asyncio.run(scenario(fair=True, heavy=False))
+        fair_p99, fair_heavy = asyncio.run(scenario(fair=True, heavy=True))
+        fifo_p99, fifo_heavy = asyncio.run(scenario(fair=False, heavy=True))
+        return {
+            'light_alone_p99_ms': round(alone * 1000, 1),
+            'light_fair_p99_ms': round(fair_p99 * 1000, 1),
+            'light_fifo_p99_ms': round(fifo_p99 * 1000, 1),
+            'heavy_fair_makespan_s': round(fair_heavy, 2),
+            'heavy_fifo_makespan_s': round(fifo_heavy, 2)
+        }
+    return run, heavy_requests + light_users * light_requests
+
+def _graph_revisions(ctx: BenchContext, count: int):
+    """同一文件的 count 次处理结果：每次约有2%的实体和关系发生变化，图存储每次重建（节点ID全部更换）"""
+    def build():
+        import random
+        from memory_graph import MemoryGraphBackend
+        from records import Entity, Relation
+        rng = random.Random(0)
+        backend = MemoryGraphBackend(None)
+        names = _entity_names(400 * ctx.scale)
+        labels = ['PERSON', 'ORG', 'GPE', 'PRODUCT']
+        entities = [Entity(t, labels[i % 4], i * 10, i * 10 + len(t), 0.8) for i, t in enumerate(names)]
+        relations = [Relation(names[i], '合作', names[(i * 7 + 3) % len(names)], 0.7, f"{names[i]}与某方合作")
+                     for i in range(0, len(names), 2)]
+        revisions = []
+        for _ in range(count):
+            for _ in range(max(1, len(entities) // 50)):
+                i = rng.randrange(len(entities))
+                e = entities[i]
+                entities[i] = Entity(e.text, e.label, e.start, e.end, round(rng.random(), 3))
+            r = relations[0]
+            relations = relations[1:] + [Relation(r.subject, r.predicate, r.object, round(rng.random(), 3), r.context)]
+            backend.delete_file(1)
+            graph_data = backend.write_graph(entities, relations, 1, 1)
+            revisions.append((list(entities), list(relations), graph_data))
+        return revisions
+    return ctx.cached(f'revisions:{count}', build)
+
+def _version_db(ctx: BenchContext):
+    def create():
+        from database import Base, SessionLocal, engine
+        import models  # noqa: F401
+        Base.metadata.create_all(bind=engine)
+        return SessionLocal
+    return ctx.cached('version_db', create)
+
+def _stats_file(file_id: int, nodes: int):
+    """统计对比用的单个文件：nodes 个实体（7种类型）和一半数量的关系（4种类型）"""
+    from records import Entity, Relation
+    labels = ['PERSON', 'ORG', 'GPE', 'PRODUCT', 'EVENT', 'TIME', 'MONEY']
+    predicates = ['合作', '位于', '任职', '发布']
+    names = [f"{corpus.PERSONS[i % 10]}{file_id}_{i}" for i in range(nodes)]
+    entities = [Entity(name, labels[i % len(labels)], 0, len(name), 0.8) for i, name in enumerate(names)]
+    relations = [Relation(names[i], predicates[i % len(predicates)], names[i + 1], 0.7)
+                 for i in range(0, nodes - 1, 2)]
+    return entities, relations
+
+@benchmark("stats.summary_vs_live_1m", group="stats", unit="queries", repeat=3)
+def bench_stats_summary(ctx: BenchContext):
+    """100万实体（2000个文件）时 /graph/stats 的数据来源：增量维护的汇总行 vs 对图存储的实时聚合（与规模参数无关）
+
+    live 为内置图引擎的实时聚合；设置 BENCH_NEO4J_URI（及 NEO4J_USERNAME/NEO4J_PASSWORD）时另外写入该 Neo4j
+    并计时 Cypher 聚合，结束后删除写入的数据。record_s 为逐个文件增量记录统计的总耗时。
+    """
+    from types import SimpleNamespace
+    from graph_stats import GraphStatsManager
+    from memory_graph import MemoryGraphBackend
+    files, per_file, user_id = 2000, 500, 1
+
+    def build():
+        manager = GraphStatsManager()
+        backend = MemoryGraphBackend(save_interval=float('inf'))
+        neo4j = None
+        if os.getenv("BENCH_NEO4J_URI"):
+            from neo4j import GraphDatabase
+            from knowledge_graph import Neo4jGraphBackend
+            neo4j = Neo4jGraphBackend(GraphDatabase.driver(os.getenv("BENCH_NEO4J_URI"), auth=(
+                os.getenv("NEO4J_USERNAME", "neo4j"), os.getenv("NEO4J_PASSWORD", "password"))))
+
+            def drop():
+                for file_id in range(1, files + 1):
+                    neo4j.delete_file(file_id)
+                neo4j.close()
+            ctx.add_finalizer(drop)
+        db = _version_db(ctx)()
+        record_seconds = 0.0
+        batch = []
+        for file_id in range(1, files + 1):
+            entities, relations = _stats_file(file_id, per_file)
+            start = time.perf_counter()
+            manager.record_file(db, SimpleNamespace(id=file_id, user_id=user_id), entities, relations)
+            db.commit()
+            record_seconds += time.perf_counter() - start
+            batch.append((entities, relations, file_id, user_id))
+            if len(batch) == 100:
+                backend.write_batch(batch)
+                if neo4j is not None:
+                    neo4j.write_batch(batch)
+                batch = []
+        db.close()
+        return manager, backend, neo4j, record_seconds
+    manager, backend, neo4j, record_seconds = ctx.cached('stats_1m', build)
+    queries = 20
+
+    def timed(func) -> float:
+        latencies = []
+        for _ in range(queries):
+            start = time.perf_counter()
+            func()
+            latencies.append(time.perf_counter() - start)
+        return sorted(latencies)[len(latencies) // 2]
+
+    def run():
+        db = _version_db(ctx)()
+        try:
+            summary = timed(lambda: manager.get_stats(db, user_id))
+        finally:
+            db.close()
+        live = timed(lambda: backend.get_graph_stats(user_id))
+        results = {'summary_p50_ms': round(summary * 1000, 3), 'live_p50_ms': round(live * 1000, 1),
+                   'live_ratio': round(live / summary, 1), 'record_s': round(record_seconds, 1)}
+        if neo4j is not None:
+            results['cypher_p50_ms'] = round(timed(lambda: neo4j.get_graph_stats(user_id)) * 1000, 1)
+        return results
+    return run, 2 * queries
+
+@benchmark("versions.store", group="versions", unit="revisions", repeat=3)
+def bench_versions_store(ctx: BenchContext):
+    """保存100个版本（每次提交一个），对比增量存储与每次完整复制的存储量"""
+    import itertools
+    from graph_versions import GraphVersionManager
+    from models import GraphVersion
+    revisions = _graph_revisions(ctx, 100)
+    session_factory = _version_db(ctx)
+    manager = GraphVersionManager(retention=0)
+    file_ids = itertools.count(1000)
+
+    def run():
+        file_id = next(file_ids)
+        db = session_factory()
+        try:
+            for entities, relations, _ in revisions:
+                manager.save(db, file_id, entities, relations)
+                db.commit()
+            rows = db.query(GraphVersion).filter(GraphVersion.file_id == file_id).all()
+            stored = sum(len(row.data) for row in rows)
+        finally:
+            db.close()
+        full = sum(len(json.dumps({'entities': [x.to_dict() for x in e], 'relations': [x.to_dict() for x in r],
+                                   'graph_data': g}, ensure_ascii=False).encode('utf-8'))
+                   for e, r, g in revisions)
+        return {
+            'stored_mb': round(stored / 1e6, 2),
+            'full_copy_mb': round(full / 1e6, 2),
+            'snapshots': sum(1 for row in rows if row.base_version is None)
+        }
+    return run, len(revisions)
+
+@benchmark("versions.fetch", group="versions", unit="fetches")
+def bench_versions_fetch(ctx: BenchContext):
+    """读取100个版本中的每一个（快照 + 最多一次增量合并）"""
+    from graph_versions import GraphVersionManager
+    revisions = _graph_revisions(ctx, 100)
+    session_factory = _version_db(ctx)
+    manager = GraphVersionManager(retention=0)
+    db = session_factory()
+    ctx.add_finalizer(db.close)
+    for entities, relations, _ in revisions:
+        manager.save(db, 1, entities, relations)
+        db.commit()
+
+    def run():
+        latencies = []
+        for version in range(1, len(revisions) + 1):
+            started = time.perf_counter()
+            manager.get(db, 1, version)
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        return {'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2),
+                'max_ms': round(latencies[-1] * 1000, 2)}
+    return run, len(revisions)
+
+def _bulk_corpus(ctx: BenchContext):
+    """在隔离数据库中写入 files 个文件的图谱记录，每个文件 500 个实体、1000 条关系"""
+    def seed():
+        from content_store import ContentStore
+        from models import FileRecord, KnowledgeGraph
+        session_factory = _version_db(ctx)
+        store = ContentStore(session_factory, dict_samples=0)
+        files = 100 * ctx.scale
+        names = _entity_names(500)
+        db = session_factory()
+        try:
+            for file_id in range(1, files + 1):
+                entities = [{'text': name, 'label': 'ORG', 'start': i, 'end': i + len(name), 'confidence': 0.8}
+                            for i, name in enumerate(names)]
+                relations = [{'subject': names[i % 500], 'predicate': '合作', 'object': names[(i * 7 + i // 500 + file_id) % 500],
+                              'relation': '合作', 'confidence': 0.7, 'context': f"{names[i % 500]}与对方合作"}
+                             for i in range(1000)]
+                db.add(FileRecord(id=file_id, filename=f"{file_id}.txt", file_path="", file_type=".txt",
+                                  file_size=0, user_id=1, status="completed"))
+                db.add(KnowledgeGraph(file_id=file_id, version=1,
+                                      entities=store.pack_json('graph', entities),
+                                      relations=store.pack_json('graph', relations)))
+            db.commit()
+        finally:
+            db.close()
+        return files, files * 1000
+    return ctx.cached('bulk_corpus', seed)
+
+@benchmark("bulk.export_csv", group="bulk", unit="relations", repeat=3)
+def bench_bulk_export_csv(ctx: BenchContext):
+    """从SQLite流式导出 neo4j-admin CSV，并按吞吐量推算1000万条关系的导出耗时"""
+    import graph_bulk
+    files, relations = _bulk_corpus(ctx)
+    output = ctx.path("bulk", "csv")
+
+    def run():
+        summary = graph_bulk.export_sqlite(output)
+        return {
+            'relationships': summary['relationships'],
+            'est_10m_relations_s': round(summary['seconds'] * 10_000_000 / max(summary['relationships'], 1), 1)
+        }
+    return run, relations
+
+@benchmark("bulk.per_file_rebuild", group="bulk", unit="relations", repeat=3)
+def bench_bulk_per_file_rebuild(ctx: BenchContext):
+    """对照：逐文件调用 write_graph 重建（内置图引擎，不含网络开销）
+
+    Neo4j 后端逐文件重建时每个实体和每条关系各需一次Bolt往返，
+    bolt_round_trips 给出同一语料所需的往返次数。
+    """
+    import graph_bulk
+    from database import SessionLocal
+    from memory_graph import MemoryGraphBackend
+    from records import Entity, Relation
+    files, relations = _bulk_corpus(ctx)
+
+    def run():
+        backend = MemoryGraphBackend(None)
+        round_trips = 0
+        started = time.perf_counter()
+        db = SessionLocal()
+        try:
+            for file_id, user_id, entities, file_relations in graph_bulk.iter_sqlite_graphs(db):
+                backend.write_graph([Entity.from_dict(e) for e in entities],
+                                    [Relation.from_dict(r) for r in file_relations], file_id, user_id)
+                round_trips += len(entities) + len(file_relations) + 2
+        finally:
+            db.close()
+        elapsed = time.perf_counter() - started
+        return {
+            'bolt_round_trips': round_trips,
+            'est_10m_relations_s': round(elapsed * 10_000_000 / relations, 1)
+        }
+    return run, relations
+
+DOCX_PAGES = 5000
+
+def _large_docx(ctx: BenchContext) -> str:
+    return ctx.cached('large_docx', lambda: corpus.write_large_docx(ctx.path("docx", "large.docx"), DOCX_PAGES * ctx.scale))
+
+def _docx_subprocess(path: str, statement: str) -> dict:
+    """在子进程中执行解析语句（结果为字符数 chars），返回峰值常驻内存相对导入依赖后的增量（MB）"""
+    code = (
+        "import os, resource, time\n"
+        "import docx, docx_reader, file_handler, pytesseract, PIL.Image\n"
+        "path = os.environ['DOCX_PATH']\n"
+        "base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss\n"
+        "started = time.perf_counter()\n"
+        f"{statement}\n"
+        "elapsed = time.perf_counter() - started\n"
+        "peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss\n"
+        "print(elapsed, (peak - base) / 1024, chars)\n"
+    )
+    env = {**os.environ, 'PYTHONPATH': BACKEND_DIR, 'DOCX_PATH': path}
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    elapsed, peak_mb, chars = result.stdout.strip().splitlines()[-1].split()
+    return {'peak_rss_mb': round(float(peak_mb), 1), 'chars': int(chars), 'in_process_seconds': round(float(elapsed), 3)}
+
+@benchmark("docx.stream_blocks", group="docx", unit="pages", repeat=3)
+def bench_docx_stream_blocks(ctx: BenchContext):
+    """DocxReader 逐块遍历生成的5000页DOCX（不保留文本），峰值内存即解析器自身的占用"""
+    path = _large_docx(ctx)
+
+    def run():
+        return _docx_subprocess(path, "chars = sum(len(str(value)) for _, value in docx_reader.iter_docx_blocks(path))")
+    return run, DOCX_PAGES * ctx.scale
+
+@benchmark("docx.stream_extract", group="docx", unit="pages", repeat=3)
+def bench_docx_stream_extract(ctx: BenchContext):
+    """完整的DOCX文本提取（正文、表格、页眉、内嵌图片OCR），峰值内存主要是输出文本本身"""
+    path = _large_docx(ctx)
+
+    def run():
+        return _docx_subprocess(path, "chars = len(file_handler.FileProcessor()._process_docx(path))")
+    return run, DOCX_PAGES * ctx.scale
+
+@benchmark("docx.dom_extract", group="docx", unit="pages", repeat=3)
+def bench_docx_dom_extract(ctx: BenchContext):
+    """对照：python-docx 载入完整文档对象后逐段取文本（原实现，不含表格和页眉）"""
+    path = _large_docx(ctx)
+
+    def run():
+        return _docx_subprocess(path, "chars = len('\\n'.join(p.text for p in docx.Document(path).paragraphs))")
+    return run, DOCX_PAGES * ctx.scale
+
+def _mentions(ctx: BenchContext):
+    """大文档（约200万字）中全部实体提及（合并前）和模式关系，以原始字段保存"""
+    def extract():
+        from document import Document
+        from nlp_processor import NLPProcessor
+        nlp = NLPProcessor()
+        document = Document(corpus.chinese_text(2_000_000 * ctx.scale, seed=7))
+        entities = [(e.text, e.label, e.start, e.end, e.confidence) for e in nlp._extract_entities_by_rules(document)]
+        relations = [(r.subject, r.predicate, r.object, r.confidence, r.context_start, r.context_end)
+                     for r in nlp.relation_engine.extract(document.text, document.sentences)]
+        return document.text, entities, relations
+    return ctx.cached('mentions', extract)
+
+def _fresh(value: str) -> str:
+    # 抽取时每个提及都是新切片出来的字符串，这里复制一份以免两种表示共享同一对象
+    return value.encode('utf-8').decode('utf-8')
+
+@benchmark("records.memory", group="records", unit="mentions", repeat=3)
+def bench_records_memory(ctx: BenchContext):
+    """同一批提及用 __slots__ 记录（驻留字符串、上下文存偏移）与原来的字典表示的内存占用和序列化体积
+
+    字典表示按原实现构造：每个提及独立的文本字符串，同一句子的关系共享一个上下文字符串。
+    pickle_mb 是结果从NLP进程池传回主进程时的序列化体积。
+    """
+    import pickle
+    import tracemalloc
+    from records import Entity, Relation
+    text, entities, relations = _mentions(ctx)
+
+    def build_records():
+        return ([Entity(_fresh(t), l, s, e, c) for t, l, s, e, c in entities],
+                [Relation(_fresh(subj), p, _fresh(obj), c, text, cs, ce) for subj, p, obj, c, cs, ce in relations])
+
+    def build_dicts():
+        sentences = {}
+        return ([{'text': _fresh(t), 'label': l, 'start': s, 'end': e, 'confidence': c} for t, l, s, e, c in entities],
+                [{'subject': _fresh(subj), 'predicate': p, 'object': _fresh(obj), 'confidence': c,
+                  'context': sentences.setdefault((cs, ce), text[cs:ce])}
+                 for subj, p, obj, c, cs, ce in relations])
+
+    def measure(build):
+        tracemalloc.start()
+        try:
+            result = build()
+            size = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        return result, size
+
+    def run():
+        records, records_size = measure(build_records)
+        records_pickle = len(pickle.dumps(records))
+        del records
+        dicts, dicts_size = measure(build_dicts)
+        dicts_pickle = len(pickle.dumps(dicts))
+        del dicts
+        return {
+            'records_mb': round(records_size / 1e6, 1),
+            'dicts_mb': round(dicts_size / 1e6, 1),
+            'records_pickle_mb': round(records_pickle / 1e6, 1),
+            'dicts_pickle_mb': round(dicts_pickle / 1e6, 1)
+        }
+    return run, len(entities) + len(relations)
+
+@benchmark("image.hash_lookup_1m", group="image", unit="queries", repeat=3)
+def bench_hash_lookup(ctx: BenchContext):
+    """100万个64位指纹的多索引哈希表查找（与规模参数无关），一半查询为已存指纹翻转若干位，一半为随机值
+
+    附带以逐个比较为参照的结果一致率。
+    """
+    import numpy as np
+    from image_hash import HammingIndex, IMAGE_DEDUP_PHASH_DISTANCE, popcount64
+    rng = np.random.default_rng(0)
+    count = 1_000_000
+    radius = max(IMAGE_DEDUP_PHASH_DISTANCE, 0)
+
+    def build():
+        hashes = rng.integers(0, 1 << 32, count, dtype=np.uint64) << np.uint64(32) \
+            | rng.integers(0, 1 << 32, count, dtype=np.uint64)
+        index = HammingIndex(radius)
+        start = time.perf_counter()
+        index.add_many(hashes, np.arange(count, dtype=np.int64))
+        return hashes, index, time.perf_counter() - start
+    hashes, index, build_seconds = ctx.cached('hamming_index_1m', build)
+
+    queries = []
+    for i in range(200):
+        value = int(hashes[rng.integers(count)])
+        for bit in rng.choice(64, rng.integers(0, radius + 1), replace=False):
+            value ^= 1 << int(bit)
+        queries.append(value)
+    queries += [int(v) for v in rng.integers(0, 1 << 63, 200, dtype=np.uint64)]
+    exact = sum(sorted(key for key, _ in index.query(q))
+                == np.nonzero(popcount64(hashes ^ np.uint64(q)) <= radius)[0].tolist() for q in queries)
+
+    def run():
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            index.query(query)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        return {'p50_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+                'p95_ms': round(latencies[int(len(latencies) * 0.95)] * 1000, 3),
+                'exact_match': round(exact / len(queries), 3), 'build_s': round(build_seconds, 2)}
+    return run, len(queries)
+
+@benchmark("image.ocr_dedupe", group="image", unit="images", repeat=3)
+def bench_ocr_dedupe(ctx: BenchContext):
+    """合成截图经指纹库去重：每张截图及其缩放/重新压缩版本、只改了一行的版本，以及布局相同文字不同的其他截图
+
+    OCR以返回来源编号代替；ocr_calls 为实际需要识别的次数，saved 为复用的次数，
+    wrong_reuse 为复用了其他截图（含只改一行的版本）文本的次数。
+    """
+    import random
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from image_hash import ImageFingerprintStore, fingerprint
+    from models import ImageFingerprint
+
+    def build():
+        images = []
+        for seed in range(10 * ctx.scale):
+            base = corpus.screenshot(seed)
+            images += [(f"{seed}", image) for image in [base] + corpus.image_variants(base)]
+            images.append((f"{seed}-edited", corpus.screenshot(seed, edit_line=seed % 25)))
+        random.Random(0).shuffle(images)
+        return [(source, fingerprint(image)) for source, image in images]
+    images = ctx.cached('ocr_dedupe_images', build)
+    counter = iter(range(1 << 30))
+
+    def run():
+        engine = create_engine(f"sqlite:///{ctx.path(f'fingerprints_{next(counter)}.db')}")
+        ImageFingerprint.__table__.create(bind=engine)
+        store = ImageFingerprintStore(sessionmaker(bind=engine))
+        ocr_calls = wrong = 0
+        latencies = []
+        for source, fp in images:
+            start = time.perf_counter()
+            text = store.find_text(1, fp)
+            latencies.append(time.perf_counter() - start)
+            if text is None:
+                ocr_calls += 1
+                store.add(1, None, fp, source)
+            elif text != source:
+                wrong += 1
+        engine.dispose()
+        latencies.sort()
+        return {'ocr_calls': ocr_calls, 'saved': len(images) - ocr_calls, 'wrong_reuse': wrong,
+                'lookup_p50_ms': round(latencies[len(latencies) // 2] * 1000, 2)}
+    return run, len(images)
+
+
+def _storage_file(file_id: int, names: list):
+    """存储对比用的单个文件：提取文本、30个实体、50条关系和带布局的可视化数据（按 file_id 确定性生成）"""
+    import random
+    from knowledge_graph import visualization_data
+    rng = random.Random(file_id)
+    text = corpus.chinese_text(2000, seed=file_id)
+    sentences = [s for s in text.replace('\n', '').split('。') if s]
+    picked = rng.sample(names, 30)
+    entities = [{'text': name, 'label': rng.choice(['PERSON', 'ORG', 'LOC', 'PRODUCT', 'EVENT']),
+                 'start': i * 60, 'end': i * 60 + len(name), 'confidence': round(rng.uniform(0.5, 0.95), 2)}
+                for i, name in enumerate(picked)]
+    relations = [{'subject': rng.choice(picked), 'predicate': rng.choice(['合作', '位于', '任职', '发布']),
+                  'object': rng.choice(picked), 'confidence': round(rng.uniform(0.5, 0.9), 2),
+                  'context': rng.choice(sentences)} for _ in range(50)]
+    graph_data = visualization_data(entities, relations, file_id)
+    for node in graph_data['nodes']:
+        node['x'], node['y'] = round(rng.uniform(-400, 400), 1), round(rng.uniform(-300, 300), 1)
+    graph_data['layout'] = {'version': 1, 'mode': 'full', 'seconds': 0.05}
+    return text, entities, relations, graph_data
+
+@benchmark("storage.compressed_graphs", group="storage", unit="reads", repeat=3)
+def bench_storage_compressed_graphs(ctx: BenchContext):
+    """500 × scale 个文件（large 规模为5万个）分别按旧格式（三列未压缩JSON，不保存文本）
+    和压缩格式（压缩的实体、关系、布局坐标和提取文本）写入数据库
+
+    对比数据库文件大小，以及随机读取图谱（等同 GET /graph/{file_id}：实体、关系和可视化数据）的延迟。
+    """
+    import random
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from content_store import CONTENT_DICT_SAMPLE_BYTES, ContentStore, train_dictionary
+    from database import Base
+    from graph_layout import _layout_document, graph_view
+    from graph_versions import graph_records
+    from models import CompressionDictionary, FileContent, KnowledgeGraph
+    files = 500 * ctx.scale
+    names = _entity_names(5000)
+
+    def legacy():
+        path = ctx.path('storage_legacy.db')
+        engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            for file_id in range(1, files + 1):
+                _, entities, relations, graph_data = _storage_file(file_id, names)
+                conn.exec_driver_sql(
+                    "INSERT INTO knowledge_graphs (file_id, version, entities, relations, graph_data) VALUES (?, 1, ?, ?, ?)",
+                    (file_id, json.dumps(entities, ensure_ascii=False), json.dumps(relations, ensure_ascii=False),
+                     json.dumps(graph_data, ensure_ascii=False)))
+        return path, engine
+
+    def compressed():
+        path = ctx.path('storage_compressed.db')
+        engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(bind=engine)
+        db = session_factory()
+        try:
+            # 与线上相同：用前200个文件的样本训练字典（线上在后台线程中训练）
+            samples = [_storage_file(file_id, names) for file_id in range(1, min(files, 200) + 1)]
+            db.add(CompressionDictionary(kind='text', codec='zlib', sample_count=len(samples), data=train_dictionary(
+                [text.encode('utf-8')[:CONTENT_DICT_SAMPLE_BYTES] for text, _, _, _ in samples], codec='zlib')))
+            db.add(CompressionDictionary(kind='graph', codec='zlib', sample_count=len(samples) * 2, data=train_dictionary(
+                [json.dumps(part, ensure_ascii=False).encode('utf-8')[:CONTENT_DICT_SAMPLE_BYTES]
+                 for _, entities, relations, _ in samples for part in (entities, relations)], codec='zlib')))
+            db.commit()
+            store = ContentStore(session_factory, codec='zlib')
+            for file_id in range(1, files + 1):
+                text, entities, relations, graph_data = _storage_file(file_id, names)
+                db.add(FileContent(file_id=file_id, data=store.pack('text', text), characters=len(text)))
+                db.add(KnowledgeGraph(file_id=file_id, version=1, entities=store.pack_json('graph', entities),
+                                      relations=store.pack_json('graph', relations),
+                                      layout=store.pack_json('layout', _layout_document(graph_data), dictionary=False)))
+                if file_id % 1000 == 0:
+                    db.commit()
+                    db.expunge_all()
+            db.commit()
+            text_bytes = sum(len(data) for data, in db.query(FileContent.data))
+        finally:
+            db.close()
+        return path, engine, store, text_bytes
+
+    legacy_path, legacy_engine = ctx.cached('storage_legacy', legacy)
+    compressed_path, compressed_engine, store, text_bytes = ctx.cached('storage_compressed', compressed)
+    legacy_sessions = sessionmaker(bind=legacy_engine)
+    compressed_sessions = sessionmaker(bind=compressed_engine)
+    reads = 500
+    file_ids = [random.Random(seed).randint(1, files) for seed in range(reads)]
+
+    def read_legacy(db, file_id):
+        kg = db.query(KnowledgeGraph).filter(KnowledgeGraph.file_id == file_id).first()
+        return json.loads(kg.entities), json.loads(kg.relations), json.loads(kg.graph_data)
+
+    def read_compressed(db, file_id):
+        kg = db.query(KnowledgeGraph).filter(KnowledgeGraph.file_id == file_id).first()
+        return graph_records(kg, store), graph_view(kg, store)
+
+    def timed(session_factory, read):
+        latencies = []
+        db = session_factory()
+        try:
+            for file_id in file_ids:
+                start = time.perf_counter()
+                read(db, file_id)
+                latencies.append(time.perf_counter() - start)
+                db.expunge_all()
+        finally:
+            db.close()
+        latencies.sort()
+        return latencies
+
+    def run():
+        new = timed(compressed_sessions, read_compressed)
+        old = timed(legacy_sessions, read_legacy)
+        legacy_mb = os.path.getsize(legacy_path) / 2 ** 20
+        compressed_mb = os.path.getsize(compressed_path) / 2 ** 20
+        return {'files': files, 'legacy_mb': round(legacy_mb, 1), 'compressed_mb': round(compressed_mb, 1),
+                'text_mb': round(text_bytes / 2 ** 20, 1),
+                'size_ratio': round(compressed_mb / legacy_mb, 3),
+                'legacy_p50_ms': round(old[len(old) // 2] * 1000, 3),
+                'compressed_p50_ms': round(new[len(new) // 2] * 1000, 3),
+                'compressed_p99_ms': round(new[int(len(new) * 0.99)] * 1000, 3)}
+    return run, reads
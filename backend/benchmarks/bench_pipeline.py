@@ -0,0 +1,456 @@
+"""摄取流水线各阶段的基准测试：文本提取（含视频抽帧）、清洗、实体识别、关系抽取、图谱构建、图谱布局"""
+import time
+
+import numpy as np
+
+from benchmarks import corpus
+from benchmarks.harness import benchmark, BenchContext
+
+def _nlp(ctx: BenchContext):
+    from nlp_processor import NLPProcessor
+    return ctx.cached('nlp', NLPProcessor)
+
+def _file_processor(ctx: BenchContext):
+    from file_handler import FileProcessor
+    return ctx.cached('file_processor', FileProcessor)
+
+def _text(ctx: BenchContext, chars: int) -> str:
+    return ctx.cached(f'text:{chars}', lambda: corpus.chinese_text(chars))
+
+def _knowledge(ctx: BenchContext, chars: int):
+    """某一长度文本的抽取结果（供图谱构建基准复用）"""
+    def extract():
+        return _nlp(ctx).extract_knowledge(_text(ctx, chars))
+    return ctx.cached(f'knowledge:{chars}', extract)
+
+# ---- 文本提取 ----
+
+@benchmark("extract.txt", group="extract", unit="chars")
+def bench_extract_txt(ctx: BenchContext):
+    chars = 200_000 * ctx.scale
+    path = corpus.write_txt(ctx.path("extract", "doc.txt"), chars)
+    processor = _file_processor(ctx)
+    return lambda: processor.extract_text(path, '.txt'), chars
+
+@benchmark("extract.docx", group="extract", unit="chars")
+def bench_extract_docx(ctx: BenchContext):
+    chars = 50_000 * ctx.scale
+    path = corpus.write_docx(ctx.path("extract", "doc.docx"), chars, tables=5)
+    processor = _file_processor(ctx)
+    return lambda: processor.extract_text(path, '.docx'), chars
+
+@benchmark("extract.pdf", group="extract", unit="pages")
+def bench_extract_pdf(ctx: BenchContext):
+    pages = 20 * ctx.scale
+    path = corpus.write_pdf(ctx.path("extract", "doc.pdf"), pages)
+    processor = _file_processor(ctx)
+    return lambda: processor.extract_text(path, '.pdf'), pages
+
+@benchmark("extract.video_keyframes", group="extract", unit="frames", repeat=3)
+def bench_extract_video(ctx: BenchContext):
+    """合成幻灯片视频的抽帧与关键帧选择（每秒2帧，每张幻灯片停留8秒）
+
+    有 ffmpeg 时把帧编码为视频文件，计时包含 ffmpeg 解码抽帧；否则直接使用内存中的帧，只计指纹和选择。
+    ocr_calls 为需要识别的关键帧数，saved 为跳过的冗余帧数，missed 为没有产生关键帧的画面数（应为0）。
+    """
+    from image_hash import fingerprint
+    from video_reader import KeyframeSelector, sample_frames
+
+    rate = 2
+    frames = corpus.slide_frames(10 * ctx.scale, 8 * rate)
+    path = corpus.write_video(ctx.path("extract", "slides.mp4"), frames, rate)
+    scenes = [scene for _, scene in frames]
+
+    def run():
+        selector = KeyframeSelector()
+        source = sample_frames(path, rate) if path else ((i / rate, image) for i, (image, _) in enumerate(frames))
+        keyframes = [i for i, (_, image) in enumerate(source) if selector.is_keyframe(fingerprint(image))]
+        return {'ocr_calls': len(keyframes), 'saved': len(frames) - len(keyframes),
+                'missed': len(set(scenes) - {scenes[i] for i in keyframes if i < len(scenes)}),
+                'ffmpeg': path is not None}
+    return run, len(frames)
+
+# ---- NLP ----
+
+@benchmark("nlp.clean", group="nlp", unit="chars")
+def bench_clean(ctx: BenchContext):
+    from document import clean_text
+    chars = 200_000 * ctx.scale
+    text = _text(ctx, chars)
+    return lambda: clean_text(text), chars
+
+@benchmark("nlp.entities", group="nlp", unit="chars", repeat=3)
+def bench_entities(ctx: BenchContext):
+    chars = 20_000 * ctx.scale
+    from document import Document
+    nlp = _nlp(ctx)
+    text = _text(ctx, chars)
+    return lambda: nlp._extract_entities(Document(text)), chars
+
+@benchmark("nlp.relations", group="nlp", unit="chars", repeat=3)
+def bench_relations(ctx: BenchContext):
+    chars = 5_000 * ctx.scale
+    from document import Document
+    nlp = _nlp(ctx)
+    text = _text(ctx, chars)
+    entities = nlp._extract_entities(Document(text))
+
+    def run():
+        relations = nlp._extract_relations(Document(text), entities)
+        return {'entities': len(entities), 'relations': len(relations)}
+    return run, chars
+
+@benchmark("nlp.extract_knowledge", group="nlp", unit="chars", repeat=3)
+def bench_extract_knowledge(ctx: BenchContext):
+    chars = 5_000 * ctx.scale
+    text = _text(ctx, chars)
+    nlp = _nlp(ctx)
+    return lambda: nlp.extract_knowledge(text), chars
+
+@benchmark("nlp.stage_profile", group="nlp", unit="chars", repeat=3)
+def bench_stage_profile(ctx: BenchContext):
+    """extract_knowledge 各阶段（clean/ner/merge/relations）的耗时，取自处理阶段耗时直方图"""
+    from metrics import STAGE_SECONDS
+    chars = 20_000 * ctx.scale
+    text = _text(ctx, chars)
+    nlp = _nlp(ctx)
+    stages = ("clean", "ner", "merge", "relations")
+
+    def totals():
+        return {stage: STAGE_SECONDS._series.get((stage, ""), [None, 0.0])[1] for stage in stages}
+
+    def run():
+        before = totals()
+        nlp.extract_knowledge(text)
+        after = totals()
+        return {f"{stage}_ms": round((after[stage] - before[stage]) * 1000, 1) for stage in stages}
+    return run, chars
+
+@benchmark("nlp.parallel_extract", group="nlp", unit="chars", repeat=1, warmup=0)
+def bench_parallel_extract(ctx: BenchContext):
+    """大文档分块并行抽取相对串行抽取的加速比（1MB/10MB/100MB 随规模变化），工作进程数取 1、2、4… 直到CPU核数"""
+    import multiprocessing
+    import os
+    from concurrent.futures import ProcessPoolExecutor
+    import nlp_processor
+    from document import Document
+    chars = 1_000_000 * ctx.scale
+    text = _text(ctx, chars)
+    nlp = _nlp(ctx)
+    cores = os.cpu_count() or 1
+    counts = sorted({2 ** i for i in range(cores.bit_length()) if 2 ** i <= cores} | {cores})
+
+    def key(entities, relations):
+        return ([(e.text, e.label, e.start, e.end) for e in entities],
+                [(r.subject, r.predicate, r.object, r.context_start, r.context_end) for r in relations])
+
+    def run():
+        start = time.perf_counter()
+        expected = key(*nlp.extract_knowledge(text))
+        serial = time.perf_counter() - start
+        result = {'serial_s': round(serial, 2), 'chunks': len(nlp._plan_chunks(Document(text)))}
+        for workers in counts:
+            # 工作进程启动时先加载好处理器，不计入抽取耗时
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=nlp_processor.extract_knowledge_worker, initargs=("王明",)) as pool:
+                list(pool.map(nlp_processor.extract_knowledge_worker, ["王明"] * workers))
+                start = time.perf_counter()
+                found = key(*nlp.extract_knowledge(text, executor=pool))
+                elapsed = time.perf_counter() - start
+            result[f'workers_{workers}_s'] = round(elapsed, 2)
+            result[f'speedup_{workers}'] = round(serial / elapsed, 2)
+            result['identical'] = result.get('identical', True) and found == expected
+        return result
+    return run, chars
+
+@benchmark("nlp.relation_worst_case", group="nlp", unit="chars", repeat=3)
+def bench_relation_worst_case(ctx: BenchContext):
+    """没有句子分隔、触发词密集的长文本（旧的全文正则在此类输入上会回溯爆炸）"""
+    from relation_patterns import RelationPatternEngine
+    chars = 20_000 * ctx.scale
+    text = ("在是" * (chars // 2))[:chars]
+    engine = RelationPatternEngine(config_path="")
+    return lambda: engine.extract(text), chars
+
+# ---- 图谱构建（内存图后端替代Neo4j） ----
+
+@benchmark("graph.build", group="graph", unit="files", repeat=3)
+def bench_graph_build(ctx: BenchContext):
+    from knowledge_graph import KnowledgeGraphBuilder
+    from memory_graph import MemoryGraphBackend
+    entities, relations = _knowledge(ctx, 5_000)
+    files = 20 * ctx.scale
+
+    def run():
+        builder = KnowledgeGraphBuilder(backend=MemoryGraphBackend(None))
+        for file_id in range(1, files + 1):
+            builder.build_graph(entities, relations, file_id, 1)
+        return {'entities_per_file': len(entities), 'relations_per_file': len(relations)}
+    return run, files
+
+@benchmark("graph.write_behind", group="graph", unit="files", repeat=3)
+def bench_graph_write_behind(ctx: BenchContext):
+    """大量小文件同时完成时的图存储写入吞吐：8个处理线程逐个文件写入 vs 经写入缓冲合并成批量事务
+
+    每个线程提交后等待写入完成（同 _process_file），合并写入包含追加写入日志的开销。
+    memory_*：内置图引擎只写内存，没有每个事务的提交开销，是合并收益的下限；
+    durable_*：每个事务提交后落盘（save_interval=0，对应Neo4j每个事务的提交开销）。
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from knowledge_graph import KnowledgeGraphBuilder
+    from memory_graph import MemoryGraphBackend
+    files = 2000 * ctx.scale
+    durable_files = 200 * ctx.scale
+    graphs = ctx.cached('write_behind_graphs', lambda: [_tenant_graph(seed, 12) for seed in range(200)])
+    runs = iter(range(1 << 30))
+
+    def ingest(write, count: int) -> float:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda file_id: write(*graphs[file_id % len(graphs)], file_id, file_id % 20),
+                          range(1, count + 1)))
+        return count / (time.perf_counter() - start)
+
+    def compare(count: int, durable: bool):
+        run_id = next(runs)
+
+        def backend(name: str):
+            return MemoryGraphBackend(ctx.path(f"{name}_{run_id}"), save_interval=0) if durable \
+                else MemoryGraphBackend(None)
+        direct = KnowledgeGraphBuilder(backend=backend("direct"))
+        direct_rate = ingest(direct.build_graph, count)
+        coalesced = KnowledgeGraphBuilder(backend=backend("coalesced"), batch_files=200,
+                                          write_log_dir=ctx.path(f"write_log_{run_id}"))
+        coalesced_rate = ingest(lambda *args: coalesced.submit_graph(*args).result(), count)
+        coalesced.close()
+        return direct_rate, coalesced_rate
+
+    def run():
+        memory_direct, memory_coalesced = compare(files, durable=False)
+        durable_direct, durable_coalesced = compare(durable_files, durable=True)
+        return {'memory_direct_files_per_s': round(memory_direct, 1),
+                'memory_coalesced_files_per_s': round(memory_coalesced, 1),
+                'durable_direct_files_per_s': round(durable_direct, 1),
+                'durable_coalesced_files_per_s': round(durable_coalesced, 1),
+                'durable_speedup': round(durable_coalesced / durable_direct, 2)}
+    return run, durable_files
+
+@benchmark("graph.queries", group="graph", unit="queries")
+def bench_graph_queries(ctx: BenchContext):
+    from knowledge_graph import KnowledgeGraphBuilder
+    from memory_graph import MemoryGraphBackend
+    entities, relations = _knowledge(ctx, 5_000)
+    builder = KnowledgeGraphBuilder(backend=MemoryGraphBackend(None))
+    for file_id in range(1, 20 * ctx.scale + 1):
+        builder.build_graph(entities, relations, file_id, 1)
+    names = [e.text for e in entities][:20] or ['北京']
+    queries = len(names) * 3
+
+    def run():
+        for i, name in enumerate(names):
+            builder.search_entities(1, name[:1])
+            builder.get_neighbors(1, name, depth=2)
+            builder.find_paths(1, name, names[(i + 1) % len(names)])
+    return run, queries
+
+def _tenant_graph(seed: int, nodes: int):
+    """一个用户的合成图谱：实体名取自同一词表（各用户之间大量重名、共享二元组），每个实体约两条关系"""
+    import random
+    from records import Entity, Relation
+    rng = random.Random(seed)
+    names = [f"{corpus.PERSONS[i % 10]}{corpus.ORGS[(i // 10) % 6]}{i}" for i in range(nodes)]
+    entities = [Entity(name, 'ORG', 0, len(name), round(rng.random(), 3)) for name in names]
+    relations = [Relation(names[i], '合作', names[rng.randrange(nodes)], 0.7, "")
+                 for i in range(nodes) for _ in range(2)]
+    return entities, relations
+
+@benchmark("graph.backend_compare", group="graph", unit="operations", repeat=3)
+def bench_graph_backend_compare(ctx: BenchContext):
+    """同一组操作在各图存储后端上的耗时：写入 10×规模 个文件（各200个实体、400条关系）后的搜索、路径、邻域和删除
+
+    内置图引擎总是参与；设置 BENCH_NEO4J_URI（及 NEO4J_USERNAME/NEO4J_PASSWORD）时同时测试该 Neo4j，
+    写入的文件在每轮结束时删除。结果为各后端每种操作的平均耗时（毫秒）。
+    """
+    import os
+    from memory_graph import MemoryGraphBackend
+    files = 10 * ctx.scale
+    graphs = [_tenant_graph(seed, 200) for seed in range(files)]
+    names = [e.text for e in graphs[0][0]][:20]
+
+    def backends():
+        yield 'memory', MemoryGraphBackend(None)
+        if os.getenv("BENCH_NEO4J_URI"):
+            from neo4j import GraphDatabase
+            from knowledge_graph import Neo4jGraphBackend
+            yield 'neo4j', Neo4jGraphBackend(GraphDatabase.driver(os.getenv("BENCH_NEO4J_URI"), auth=(
+                os.getenv("NEO4J_USERNAME", "neo4j"), os.getenv("NEO4J_PASSWORD", "password"))))
+
+    def timed(operations) -> float:
+        start = time.perf_counter()
+        for operation in operations:
+            operation()
+        return round((time.perf_counter() - start) * 1000 / len(operations), 3)
+
+    def run():
+        results = {}
+        for name, backend in backends():
+            # 文件ID取较大的值，避免与 Neo4j 中已有的数据冲突
+            file_ids = [800_000 + i for i in range(files)]
+            try:
+                results[f'{name}_write_ms'] = timed([
+                    lambda g=g, f=f: backend.write_graph(g[0], g[1], f, 1) for g, f in zip(graphs, file_ids)])
+                results[f'{name}_search_ms'] = timed([lambda n=n: backend.search_entities(1, n[:2]) for n in names])
+                results[f'{name}_path_ms'] = timed([
+                    lambda i=i: backend.find_paths(1, names[i], names[-1 - i]) for i in range(len(names))])
+                results[f'{name}_neighbors_ms'] = timed([
+                    lambda n=n: backend.get_neighbors(1, n, depth=2) for n in names])
+            finally:
+                results[f'{name}_delete_ms'] = timed([lambda f=f: backend.delete_file(f) for f in file_ids])
+                backend.close()
+        return results
+    return run, files * 2 + len(names) * 3
+
+@benchmark("graph.tenant_queries", group="graph", unit="queries", repeat=3)
+def bench_graph_tenant_queries(ctx: BenchContext):
+    """多用户部署中小用户的查询延迟：单独一个用户的图存储 vs 另有100个用户（各 1000×规模 个实体）的图存储
+
+    读取按用户分区后，两者的延迟应基本一致（tenant_ratio 接近1）。
+    large 规模（1000万实体）超出内存图后端在单机上的内存预算，只用于 Neo4j 对照。
+    """
+    from knowledge_graph import KnowledgeGraphBuilder
+    from memory_graph import MemoryGraphBackend
+    tenants = 100
+    per_tenant = 1000 * ctx.scale
+    file_nodes = 500
+    small_user = tenants + 1
+    entities, relations = _tenant_graph(0, 200)
+
+    def build(with_tenants: bool):
+        builder = KnowledgeGraphBuilder(backend=MemoryGraphBackend(None))
+        file_id = 0
+        if with_tenants:
+            for tenant in range(1, tenants + 1):
+                tenant_entities, tenant_relations = _tenant_graph(tenant, per_tenant)
+                for start in range(0, per_tenant, file_nodes):
+                    file_id += 1
+                    names = {e.text for e in tenant_entities[start:start + file_nodes]}
+                    builder.build_graph(tenant_entities[start:start + file_nodes],
+                                        [r for r in tenant_relations if r.subject in names and r.object in names],
+                                        file_id, tenant)
+        builder.build_graph(entities, relations, file_id + 1, small_user)
+        return builder
+
+    stores = {'alone': build(False), 'shared': build(True)}
+    names = [e.text for e in entities][:20]
+    queries = len(names) * 4
+
+    def latency(builder) -> float:
+        started = time.perf_counter()
+        for i, name in enumerate(names):
+            builder.search_entities(small_user, name[:1])
+            builder.search_entities(small_user, name[:2])
+            builder.get_neighbors(small_user, name, depth=2)
+            builder.find_paths(small_user, name, names[(i + 1) % len(names)])
+        return (time.perf_counter() - started) / queries
+
+    def run():
+        alone, shared = latency(stores['alone']), latency(stores['shared'])
+        return {'total_entities': tenants * per_tenant + len(entities),
+                'alone_ms': round(alone * 1000, 3), 'shared_ms': round(shared * 1000, 3),
+                'tenant_ratio': round(shared / alone, 2)}
+    return run, queries
+
+@benchmark("graph.analytics", group="graph", unit="edges", repeat=3)
+def bench_graph_analytics(ctx: BenchContext):
+    from graph_analytics import CSRGraph, pagerank, connected_components, label_propagation
+    nodes = 20_000 * ctx.scale
+    edges = nodes * 5
+    rng = np.random.default_rng(0)
+    graph = CSRGraph(nodes, rng.integers(0, nodes, edges), rng.integers(0, nodes, edges))
+
+    def run():
+        pagerank(graph)
+        connected_components(graph)
+        label_propagation(graph)
+    return run, edges
+
+def _community_graph(nodes: int, seed: int = 0) -> dict:
+    """图谱可视化数据：每20个节点一个社区，平均每个节点1.5条边，其中5%连向其他社区"""
+    rng = np.random.default_rng(seed)
+    edges = nodes * 3 // 2
+    src = rng.integers(0, nodes, edges)
+    dst = np.minimum(src // 20 * 20 + rng.integers(0, 20, edges), nodes - 1)
+    far = rng.random(edges) < 0.05
+    dst[far] = rng.integers(0, nodes, int(far.sum()))
+    return {
+        'nodes': [{'id': f"n{i}", 'label': f"实体{i}", 'type': 'ORG'} for i in range(nodes)],
+        'edges': [{'source': f"n{a}", 'target': f"n{b}", 'relation': 'related_to'} for a, b in zip(src, dst)]
+    }
+
+def _layout_quality(graph_data: dict, positions: np.ndarray) -> dict:
+    """连线长度的中位数与随机节点对距离的中位数（前者远小于后者说明相连的节点被放在了一起）"""
+    from graph_layout import graph_arrays
+    _, src, dst = graph_arrays(graph_data)
+    rng = np.random.default_rng(1)
+    a, b = rng.integers(0, len(positions), (2, 10_000))
+    return {'edge_length_median_px': round(float(np.median(np.hypot(*(positions[src] - positions[dst]).T))), 1),
+            'random_pair_median_px': round(float(np.median(np.hypot(*(positions[a] - positions[b]).T))), 1)}
+
+def _bench_layout(nodes: int):
+    def bench(ctx: BenchContext):
+        from graph_layout import compute_layout
+        graph_data = _community_graph(nodes)
+
+        def run():
+            positions, mode = compute_layout(graph_data)
+            return {'mode': mode, **_layout_quality(graph_data, positions)}
+        return run, nodes
+    return bench
+
+# 布局规模按请求中关心的节点数固定，不随 --scale 变化
+benchmark("graph.layout_1k", group="graph", unit="nodes", repeat=3)(_bench_layout(1_000))
+benchmark("graph.layout_20k", group="graph", unit="nodes", repeat=1)(_bench_layout(20_000))
+benchmark("graph.layout_200k", group="graph", unit="nodes", repeat=1, warmup=0)(_bench_layout(200_000))
+
+@benchmark("graph.layout_incremental_200k", group="graph", unit="nodes", repeat=1, warmup=0)
+def bench_layout_incremental(ctx: BenchContext):
+    """200k节点的图谱新增1%的节点（各连向一个已有节点）后的增量布局"""
+    from graph_layout import compute_layout
+    nodes = 200_000
+    graph_data = _community_graph(nodes)
+    positions, _ = compute_layout(graph_data)
+    previous = {node['label']: tuple(position) for node, position in zip(graph_data['nodes'], positions.tolist())}
+    added = nodes // 100
+    for i in range(added):
+        graph_data['nodes'].append({'id': f"m{i}", 'label': f"新实体{i}", 'type': 'PERSON'})
+        graph_data['edges'].append({'source': f"m{i}", 'target': f"n{i * 97 % nodes}", 'relation': 'works_at'})
+
+    def run():
+        updated, mode = compute_layout(graph_data, previous)
+        moved = int((np.hypot(*(updated[:nodes] - positions).T) > 0).sum())
+        return {'mode': mode, 'added_nodes': added, 'moved_existing_nodes': moved}
+    return run, nodes + added
+
+@benchmark("metrics.span_overhead", group="metrics", unit="spans")
+def bench_span_overhead(ctx: BenchContext):
+    """单个计时区间的开销（METRICS_ENABLED=false 时应接近空循环）"""
+    from metrics import span
+    count = 100_000
+
+    def run():
+        for _ in range(count):
+            with span(stage="bench"):
+                pass
+    return run, count
+
+@benchmark("metrics.profile_session_overhead", group="metrics", unit="sessions")
+def bench_profile_session_overhead(ctx: BenchContext):
+    """阈值内完成的剖析会话开销（登记 + 注销，不触发采样）"""
+    from profiling import profiler
+    count = 20_000
+
+    def run():
+        for _ in range(count):
+            with profiler.session("bench", threshold=60):
+                pass
+    return run, count
@@ -0,0 +1,300 @@
+from typing import List, Optional
+from xml.sax.saxutils import escape
+import os
+import random
+import struct
+import zipfile
+import zlib
+
+# 合成语料的词表：组合出的句子能命中规则NER和内置关系模式
+PERSONS = ['张伟', '王芳', '李娜', '刘洋', '陈静', '杨帆', '赵磊', '黄敏', '周杰', '吴婷']
+ORGS = ['华夏科技公司', '东方大学', '星辰研究院', '蓝海集团', '未来实验室', '长城银行']
+PLACES = ['北京', '上海', '深圳', '杭州', '成都', '武汉', '南京', '西安']
+PRODUCTS = ['智能助手', '数据平台', '云存储系统', '推荐引擎', '知识图谱']
+EVENTS = ['技术峰会', '创新大赛', '学术会议', '产品发布会']
+FILLERS = ['此外', '随后', '据报道', '与此同时', '总体来看']
+
+TEMPLATES = [
+    '{person}工作于{org}，负责{product}的研发。',
+    '{org}位于{place}，拥有{product}。',
+    '{person}参加了{event}，并在{place}发表演讲。',
+    '{person}创建了{org}。',
+    '{filler}，{org}是{place}最大的企业之一。',
+    '{person}在{org}任职于研发部门，{filler}参与了{event}。',
+    '{product}是{org}的核心产品，{filler}在{place}上线。',
+]
+
+LATIN_WORDS = ['graph', 'entity', 'relation', 'knowledge', 'system', 'data', 'model',
+               'pipeline', 'query', 'index', 'node', 'edge', 'search', 'cloud']
+
+def chinese_text(chars: int, seed: int = 0) -> str:
+    """生成约 chars 个字符的中文文本，按段落换行"""
+    rng = random.Random(seed)
+    parts: List[str] = []
+    length = 0
+    sentence_count = 0
+    while length < chars:
+        sentence = rng.choice(TEMPLATES).format(
+            person=rng.choice(PERSONS), org=rng.choice(ORGS), place=rng.choice(PLACES),
+            product=rng.choice(PRODUCTS), event=rng.choice(EVENTS), filler=rng.choice(FILLERS)
+        )
+        parts.append(sentence)
+        length += len(sentence)
+        sentence_count += 1
+        if sentence_count % 8 == 0:
+            parts.append('\n')
+    return ''.join(parts)
+
+def latin_text(words: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    return ' '.join(rng.choice(LATIN_WORDS) for _ in range(words))
+
+def screenshot(seed: int, edit_line: Optional[int] = None):
+    """合成的文字截图（800x600，标题栏 + 25行文字）；所有截图布局相同、文字不同
+
+    edit_line 指定时把该行替换为另一句话，模拟只改动了一行的截图。
+    """
+    from PIL import Image, ImageDraw
+
+    image = Image.new('RGB', (800, 600), 'white')
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([0, 0, 800, 40], fill=(40, 60, 120))
+    words = latin_text(300, seed).split()
+    for i in range(25):
+        line = ' '.join(words[i * 12:(i + 1) * 12])
+        if i == edit_line:
+            line = latin_text(10, seed + 1_000_003)
+        draw.text((20, 60 + i * 20), line, fill='black')
+    return image
+
+def image_variants(image) -> list:
+    """近似重复的图片：缩放、不同质量的JPEG重新压缩、PNG重新保存"""
+    import io
+    from PIL import Image
+
+    def reload(fmt: str, **options):
+        buffer = io.BytesIO()
+        image.save(buffer, fmt, **options)
+        return Image.open(io.BytesIO(buffer.getvalue()))
+
+    width, height = image.size
+    variants = [image.resize((int(width * scale), int(height * scale)), Image.LANCZOS)
+                for scale in (0.5, 0.75, 1.3)]
+    variants += [reload('JPEG', quality=quality) for quality in (40, 75, 95)]
+    variants.append(reload('PNG'))
+    return variants
+
+def slide_frames(slides: int, frames_per_slide: int, seed: int = 0):
+    """合成的幻灯片视频帧（灰度），返回 [(帧图像, 画面编号)]
+
+    每张幻灯片停留 frames_per_slide 帧，其间只有重新压缩的噪声和移动的鼠标指针；
+    每隔一张幻灯片的后半段只改动一行文字（如更新的字幕），画面编号随之改变。
+    """
+    import io
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    frames = []
+    for slide in range(slides):
+        base = screenshot(seed + slide).convert('L')
+        edited = screenshot(seed + slide, edit_line=slide % 25).convert('L') if slide % 2 else None
+        for i in range(frames_per_slide):
+            if edited is not None and i >= frames_per_slide // 2:
+                image, scene = edited.copy(), f"{slide}-edited"
+            else:
+                image, scene = base.copy(), f"{slide}"
+            x, y = 100 + i * 17 % 600, 80 + i * 29 % 450
+            ImageDraw.Draw(image).polygon([(x, y), (x, y + 16), (x + 11, y + 11)], fill=0)
+            buffer = io.BytesIO()
+            image.save(buffer, 'JPEG', quality=rng.choice((50, 70, 85)))
+            frames.append((Image.open(io.BytesIO(buffer.getvalue())).convert('L'), scene))
+    return frames
+
+def write_video(path: str, frames: list, fps: int) -> Optional[str]:
+    """用 ffmpeg 把帧编码为视频文件；没有 ffmpeg 时返回 None"""
+    import shutil
+    import subprocess
+
+    if shutil.which('ffmpeg') is None:
+        return None
+    width, height = frames[0][0].size
+    process = subprocess.Popen(['ffmpeg', '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'gray',
+                                '-s', f"{width}x{height}", '-r', str(fps), '-i', '-',
+                                '-c:v', 'mpeg4', '-q:v', '4', path], stdin=subprocess.PIPE)
+    for image, _ in frames:
+        process.stdin.write(image.tobytes())
+    process.stdin.close()
+    if process.wait() != 0:
+        raise RuntimeError("ffmpeg 编码失败")
+    return path
+
+def write_txt(path: str, chars: int, seed: int = 0) -> str:
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(chinese_text(chars, seed))
+    return path
+
+def write_docx(path: str, chars: int, seed: int = 0, tables: int = 0) -> str:
+    """生成DOCX文件：每段一行合成文本，可选附带表格"""
+    import docx
+
+    document = docx.Document()
+    for paragraph in chinese_text(chars, seed).split('\n'):
+        if paragraph:
+            document.add_paragraph(paragraph)
+    rng = random.Random(seed)
+    for _ in range(tables):
+        table = document.add_table(rows=4, cols=3)
+        for row in table.rows:
+            for cell in row.cells:
+                cell.text = rng.choice(PERSONS + ORGS + PLACES)
+    document.save(path)
+    return path
+
+_DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Default Extension="png" ContentType="image/png"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/header1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.header+xml"/>'
+    '</Types>'
+)
+_DOCX_PACKAGE_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/></Relationships>'
+)
+_DOCX_DOCUMENT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/header" '
+    'Target="header1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image" '
+    'Target="media/image1.png"/></Relationships>'
+)
+_W_NAMESPACES = (
+    'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" '
+    'xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing" '
+    'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+    'xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture"'
+)
+_DOCX_IMAGE_RUN = (
+    '<w:p><w:r><w:drawing><wp:inline><wp:extent cx="952500" cy="952500"/><wp:docPr id="{id}" name="图片{id}"/>'
+    '<a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture"><pic:pic>'
+    '<pic:nvPicPr><pic:cNvPr id="{id}" name="image1.png"/><pic:cNvPicPr/></pic:nvPicPr>'
+    '<pic:blipFill><a:blip r:embed="rId2"/></pic:blipFill></pic:pic></a:graphicData></a:graphic>'
+    '</wp:inline></w:drawing></w:r></w:p>'
+)
+
+def _png(width: int, height: int) -> bytes:
+    """生成纯白灰度PNG"""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    raw = b"".join(b"\x00" + b"\xff" * width for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b""))
+
+def write_large_docx(path: str, pages: int, seed: int = 0, paragraphs_per_page: int = 8,
+                     table_every: int = 10, image_every: int = 50) -> str:
+    """直接流式写出OOXML部件，生成大型DOCX（python-docx 构建同样规模的文档本身就要数GB内存）
+
+    每页 paragraphs_per_page 段约100字的文本并以分页符结束，每 table_every 页一个4x3表格，
+    每 image_every 页一张内嵌图片（所有图片引用同一个媒体文件），带一个页眉。
+    """
+    rng = random.Random(seed)
+    pool = [line for line in chinese_text(200_000, seed).split('\n') if line]
+    pool = [escape(line[:100]) for line in pool]
+    names = PERSONS + ORGS + PLACES
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', _DOCX_CONTENT_TYPES)
+        zf.writestr('_rels/.rels', _DOCX_PACKAGE_RELS)
+        zf.writestr('word/_rels/document.xml.rels', _DOCX_DOCUMENT_RELS)
+        zf.writestr('word/header1.xml', f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                                        f'<w:hdr {_W_NAMESPACES}><w:p><w:r><w:t>合成测试文档</w:t></w:r></w:p></w:hdr>')
+        zf.writestr('word/media/image1.png', _png(64, 64))
+        with zf.open('word/document.xml', 'w', force_zip64=True) as raw:
+            raw.write(f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                      f'<w:document {_W_NAMESPACES}><w:body>'.encode('utf-8'))
+            for page in range(1, pages + 1):
+                chunks = [f'<w:p><w:r><w:t>{rng.choice(pool)}</w:t></w:r></w:p>' for _ in range(paragraphs_per_page)]
+                if table_every and page % table_every == 0:
+                    rows = ''.join('<w:tr>' + ''.join(f'<w:tc><w:p><w:r><w:t>{rng.choice(names)}</w:t></w:r></w:p></w:tc>'
+                                                      for _ in range(3)) + '</w:tr>' for _ in range(4))
+                    chunks.append(f'<w:tbl>{rows}</w:tbl>')
+                if image_every and page % image_every == 0:
+                    chunks.append(_DOCX_IMAGE_RUN.format(id=page))
+                chunks.append('<w:p><w:r><w:br w:type="page"/></w:r></w:p>')
+                raw.write(''.join(chunks).encode('utf-8'))
+            raw.write(b'<w:sectPr><w:headerReference w:type="default" r:id="rId1"/></w:sectPr>'
+                      b'</w:body></w:document>')
+    return path
+
+def write_pdf(path: str, pages: int, words_per_page: int = 300, seed: int = 0) -> str:
+    """生成最小的文本PDF
+
+    标准14字体不含中文字形，嵌入CJK字体又会让生成器依赖外部字体文件，
+    因此PDF语料使用拉丁文本，只用于衡量PDF解析本身的开销。
+    """
+    rng = random.Random(seed)
+    objects: List[bytes] = []
+    page_ids = [3 + i * 2 for i in range(pages)]
+    font_id = 3 + pages * 2
+
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+    for i, page_id in enumerate(page_ids):
+        lines = []
+        words = latin_text(words_per_page, seed=rng.randrange(1 << 30)).split()
+        for start in range(0, len(words), 12):
+            lines.append(" ".join(words[start:start + 12]))
+        stream = "BT /F1 10 Tf 40 800 Td 12 TL " + " ".join(f"({line}) '" for line in lines) + " ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {page_id + 1} 0 R >>".encode()
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        output += f"{offset:010d} 00000 n \n".encode()
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+
+    with open(path, 'wb') as f:
+        f.write(output)
+    return path
+
+def write_mixed_corpus(directory: str, files: int, chars: int = 2000, seed: int = 0,
+                       archive: Optional[str] = None) -> List[str]:
+    """按 txt/docx/pdf 轮换生成一批文件，可选打包为ZIP"""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(files):
+        kind = ('txt', 'docx', 'pdf')[i % 3]
+        path = os.path.join(directory, f"doc_{i:04d}.{kind}")
+        if kind == 'txt':
+            write_txt(path, chars, seed + i)
+        elif kind == 'docx':
+            write_docx(path, chars, seed + i)
+        else:
+            write_pdf(path, pages=max(1, chars // 1500), seed=seed + i)
+        paths.append(path)
+
+    if archive:
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for path in paths:
+                zf.write(path, os.path.basename(path))
+    return paths
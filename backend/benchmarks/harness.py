@@ -0,0 +1,197 @@
+from typing import Callable, Dict, Any, List, Optional, Tuple
+import datetime
+import gc
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# 规模倍数：small 用于日常回归，medium/large 用于容量评估
+SCALES = {'small': 1, 'medium': 10, 'large': 100}
+
+class Benchmark:
+    """一个基准测试
+
+    func(ctx) 负责准备数据，返回 (被计时的函数, 每次调用处理的工作量)；
+    被计时的函数若返回字典，其内容作为附加指标（如召回率）记录，但不参与回归比较。
+    """
+
+    def __init__(self, name: str, group: str, func: Callable, unit: str = "ops",
+                 repeat: int = 5, warmup: int = 1):
+        self.name = name
+        self.group = group
+        self.func = func
+        self.unit = unit
+        self.repeat = repeat
+        self.warmup = warmup
+
+_registry: Dict[str, Benchmark] = {}
+
+def benchmark(name: str, group: str, unit: str = "ops", repeat: int = 5, warmup: int = 1):
+    """注册基准测试的装饰器"""
+    def decorator(func):
+        _registry[name] = Benchmark(name, group, func, unit, repeat, warmup)
+        return func
+    return decorator
+
+def registered() -> List[Benchmark]:
+    return list(_registry.values())
+
+class BenchContext:
+    """基准测试上下文：规模参数、临时目录和可复用的重量级对象"""
+
+    def __init__(self, scale: str = 'small'):
+        self.scale_name = scale
+        self.scale = SCALES[scale]
+        self.workdir = tempfile.mkdtemp(prefix="kg-bench-")
+        self._cache: Dict[str, Any] = {}
+        self._finalizers: List[Callable[[], None]] = []
+        self._cwd = os.getcwd()
+        self._isolate_environment()
+
+    def _isolate_environment(self):
+        """将数据库和各数据目录指向临时目录（须在导入 database 等模块之前调用）"""
+        os.environ.update({
+            'DATABASE_URL': f"sqlite:///{os.path.join(self.workdir, 'bench.db')}",
+            'GRAPH_BACKEND': 'memory',
+            'GRAPH_DATA_DIR': os.path.join(self.workdir, 'graph_data'),
+            'ENTITY_INDEX_DIR': os.path.join(self.workdir, 'entity_index'),
+            'WARM_UP_ON_STARTUP': 'false',
+            'PRELOAD_COMPONENTS': 'false',
+            'STATS_RECONCILE_INTERVAL': '0',
+            # 关闭按用户的接口限流，延迟场景的请求数不受令牌桶容量限制
+            'RATE_LIMITS': ''
+        })
+
+    def cached(self, key: str, factory: Callable[[], Any]) -> Any:
+        if key not in self._cache:
+            self._cache[key] = factory()
+        return self._cache[key]
+
+    def path(self, *parts: str) -> str:
+        path = os.path.join(self.workdir, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def add_finalizer(self, func: Callable[[], None]):
+        self._finalizers.append(func)
+
+    def cleanup(self):
+        for func in reversed(self._finalizers):
+            try:
+                func()
+            except Exception as e:
+                print(f"[bench] 清理失败: {e}")
+        os.chdir(self._cwd)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+def run_benchmark(bench: Benchmark, ctx: BenchContext) -> Dict[str, Any]:
+    """运行单个基准测试并汇总耗时"""
+    timed, work = bench.func(ctx)
+    extra: Dict[str, Any] = {}
+    for _ in range(bench.warmup):
+        timed()
+
+    samples = []
+    for _ in range(bench.repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = timed()
+        samples.append(time.perf_counter() - start)
+        if isinstance(result, dict):
+            extra = result
+
+    samples.sort()
+    median = statistics.median(samples)
+    return {
+        'group': bench.group,
+        'unit': bench.unit,
+        'work': work,
+        'repeat': bench.repeat,
+        'min_s': samples[0],
+        'median_s': median,
+        'mean_s': statistics.fmean(samples),
+        'max_s': samples[-1],
+        'throughput': work / median if median > 0 else None,
+        'extra': extra
+    }
+
+def run_all(scale: str = 'small', name_filter: Optional[str] = None,
+            groups: Optional[List[str]] = None) -> Dict[str, Any]:
+    """运行全部（或筛选后的）基准测试，返回可序列化的结果"""
+    ctx = BenchContext(scale)
+    results = {}
+    try:
+        for bench in registered():
+            if name_filter and name_filter not in bench.name:
+                continue
+            if groups and bench.group not in groups:
+                continue
+            print(f"[bench] {bench.name} ...", flush=True)
+            try:
+                results[bench.name] = run_benchmark(bench, ctx)
+            except Exception as e:
+                print(f"[bench] {bench.name} 失败: {e}", flush=True)
+                results[bench.name] = {'group': bench.group, 'error': str(e)}
+    finally:
+        ctx.cleanup()
+
+    return {'meta': _metadata(scale), 'results': results}
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any],
+            threshold: float = 0.2) -> List[Tuple[str, float, float, float]]:
+    """与基线比较中位耗时，返回 (名称, 基线秒数, 当前秒数, 变化比例) 的回归列表"""
+    regressions = []
+    for name, result in current['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if not base or 'median_s' not in base or 'median_s' not in result:
+            continue
+        # 规模不同的结果不可比
+        if base.get('work') != result.get('work'):
+            continue
+        change = result['median_s'] / base['median_s'] - 1 if base['median_s'] > 0 else 0.0
+        if change > threshold:
+            regressions.append((name, base['median_s'], result['median_s'], change))
+    return regressions
+
+def format_table(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> str:
+    lines = [f"{'benchmark':<40} {'median':>10} {'throughput':>18} {'vs base':>9}"]
+    for name, result in report['results'].items():
+        if 'error' in result:
+            lines.append(f"{name:<40} {'ERROR':>10}  {result['error']}")
+            continue
+        throughput = f"{result['throughput']:.1f} {result['unit']}/s" if result['throughput'] else "-"
+        delta = ""
+        base = (baseline or {}).get('results', {}).get(name)
+        if base and base.get('median_s') and base.get('work') == result.get('work'):
+            delta = f"{(result['median_s'] / base['median_s'] - 1) * 100:+.1f}%"
+        lines.append(f"{name:<40} {_format_seconds(result['median_s']):>10} {throughput:>18} {delta:>9}")
+        for key, value in result.get('extra', {}).items():
+            lines.append(f"    {key}: {value}")
+    return "\n".join(lines)
+
+def _format_seconds(seconds: float) -> str:
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f}us"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f}ms"
+    return f"{seconds:.3f}s"
+
+def _metadata(scale: str) -> Dict[str, Any]:
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                  text=True, timeout=5).stdout.strip()
+    except Exception:
+        revision = ""
+    return {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'scale': scale,
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'git_revision': revision
+    }
@@ -0,0 +1,65 @@
+import argparse
+import json
+import os
+import sys
+
+from benchmarks.harness import SCALES, run_all, compare, format_table
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+DEFAULT_BASELINE = os.path.join(RESULTS_DIR, "baseline.json")
+
+def load_suites():
+    """导入各基准测试模块以完成注册"""
+    from benchmarks import bench_pipeline, bench_components, bench_api  # noqa: F401
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="知识图谱系统性能基准测试")
+    parser.add_argument("--filter", help="只运行名称包含该字符串的基准测试")
+    parser.add_argument("--group", action="append", help="只运行指定分组（可重复）")
+    parser.add_argument("--scale", choices=list(SCALES), default="small", help="数据规模")
+    parser.add_argument("--output", help="结果JSON路径（默认写入 results/ 目录）")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基线JSON路径")
+    parser.add_argument("--compare", action="store_true", help="与基线比较并在回归时返回非零退出码")
+    parser.add_argument("--threshold", type=float, default=0.2, help="判定回归的中位耗时增幅（默认20%%）")
+    parser.add_argument("--save-baseline", action="store_true", help="将本次结果保存为基线")
+    args = parser.parse_args(argv)
+
+    load_suites()
+    report = run_all(args.scale, args.filter, args.group)
+
+    baseline = None
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f"基线文件不存在: {args.baseline}")
+            return 2
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print()
+    print(format_table(report, baseline))
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"bench-{report['meta']['timestamp'].replace(':', '')}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已写入 {output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"基线已更新 {args.baseline}")
+
+    failed = [name for name, result in report['results'].items() if 'error' in result]
+    if baseline is not None:
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n发现 {len(regressions)} 项性能回归（阈值 {args.threshold:.0%}）:")
+            for name, base, current, change in regressions:
+                print(f"  {name}: {base * 1000:.2f}ms -> {current * 1000:.2f}ms ({change:+.1%})")
+            return 1
+        print("\n未发现性能回归")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+from typing import Callable, Dict, Any, Optional
+import threading
+import time
+
+class LazyComponent:
+    """延迟初始化的组件代理
+
+    第一次访问属性时才调用工厂函数创建实例，之后所有属性访问都转发给该实例。
+    并发的首次访问会等待同一次初始化完成。
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any], preload: bool = True):
+        self._name = name
+        self._factory = factory
+        self._preload = preload
+        self._instance = None
+        self._lock = threading.Lock()
+        self._load_seconds: Optional[float] = None
+        self._error: Optional[str] = None
+
+    def load(self) -> Any:
+        """获取（必要时创建）组件实例"""
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    start = time.perf_counter()
+                    try:
+                        self._instance = self._factory()
+                        self._error = None
+                    except Exception as e:
+                        self._error = str(e)
+                        raise
+                    finally:
+                        self._load_seconds = time.perf_counter() - start
+        return self._instance
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._instance is not None
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            'ready': self.is_loaded,
+            'load_seconds': round(self._load_seconds, 3) if self._load_seconds is not None else None,
+            'error': self._error
+        }
+
+    def __getattr__(self, item):
+        return getattr(self.load(), item)
+
+class ComponentRegistry:
+    """组件注册表：统一管理延迟加载、预热和就绪状态"""
+
+    def __init__(self):
+        self._components: Dict[str, LazyComponent] = {}
+
+    def register(self, name: str, factory: Callable[[], Any], preload: bool = True) -> LazyComponent:
+        """注册组件；preload=False 的组件（持有网络连接或数据目录的）不在主进程中预加载"""
+        component = LazyComponent(name, factory, preload)
+        self._components[name] = component
+        return component
+
+    def warm_up(self, preload_only: bool = False) -> Dict[str, Any]:
+        """依次初始化组件，单个组件失败不影响其他组件"""
+        for name, component in self._components.items():
+            if preload_only and not component._preload:
+                continue
+            try:
+                component.load()
+            except Exception as e:
+                print(f"组件 {name} 初始化失败: {e}")
+        return self.status()
+
+    def start_background_warm_up(self) -> threading.Thread:
+        thread = threading.Thread(target=self.warm_up, name="component-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def status(self) -> Dict[str, Any]:
+        return {name: component.describe() for name, component in self._components.items()}
+
+    @property
+    def all_ready(self) -> bool:
+        return all(component.is_loaded for component in self._components.values())
@@ -0,0 +1,271 @@
+"""提取文本和图谱数据的压缩存储
+
+数据以压缩块保存在SQLite的BLOB列中：1字节编码方式 + 4字节字典ID（0 表示不用字典）+ 压缩数据。
+安装了 zstandard 时使用 zstd，否则使用标准库 zlib。每类数据（提取文本、图谱JSON）积累
+CONTENT_DICT_SAMPLES 个样本后在后台训练一个共享字典，保存在 compression_dictionaries 表中，
+之后的压缩块引用该字典：实体和关系列表里大量重复的JSON键、实体类型和常见实体名，
+以及文本中的套话，即使单个文档很短也能被压缩掉。字典一经保存不再修改或删除。
+
+旧版本保存的未压缩JSON文本读取时原样返回；已有数据可以离线转换（转换后执行VACUUM回收空间）：
+
+    python content_store.py compress
+"""
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+import heapq
+import json
+import os
+import struct
+import sys
+import threading
+import zlib
+
+from database import SessionLocal
+from metrics import registry
+from models import CompressionDictionary
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 压缩方式：zstd（需要 zstandard）或 zlib
+CONTENT_CODEC = os.getenv("CONTENT_CODEC", "zstd" if zstandard else "zlib")
+CONTENT_COMPRESSION_LEVEL = int(os.getenv("CONTENT_COMPRESSION_LEVEL", "9"))
+# 训练字典所需的样本数（0 表示不使用字典）
+CONTENT_DICT_SAMPLES = int(os.getenv("CONTENT_DICT_SAMPLES", "200"))
+# 字典大小（zlib 的预置字典最多利用32KB）与每个样本参与训练的前缀长度
+CONTENT_DICT_SIZE = 32 * 1024
+CONTENT_DICT_SAMPLE_BYTES = 4 * 1024
+
+_HEADER = struct.Struct(">BI")
+_CODEC_IDS = {'zlib': 1, 'zstd': 2}
+
+STORED_BYTES = registry.counter("kg_content_bytes_total", "压缩存储写入的数据量（raw：原始，stored：压缩后）",
+                                ["kind", "form"])
+
+def _train_zdict(samples: List[bytes], size: int, segment: int = 48, dmer: int = 6) -> bytes:
+    """简化的COVER算法：选出在最多样本中出现的片段拼成原始内容字典
+
+    d-mer 的权重为出现它的样本数（同一样本内只计一次）；候选片段按尚未被已选片段覆盖的 d-mer
+    权重之和贪心选取（延迟更新的最大堆）。zlib 引用越近的位置编码越短，得分高的片段放在字典末尾。
+    """
+    frequency = Counter()
+    for sample in samples:
+        frequency.update({sample[i:i + dmer] for i in range(len(sample) - dmer + 1)})
+
+    def dmers(piece: bytes) -> set:
+        return {piece[i:i + dmer] for i in range(len(piece) - dmer + 1) if frequency[piece[i:i + dmer]] > 1}
+
+    heap = []
+    for sample in samples:
+        for start in range(0, max(len(sample) - segment, 0) + 1, segment // 2):
+            piece = sample[start:start + segment]
+            score = sum(frequency[d] for d in dmers(piece))
+            if score:
+                heap.append((-score, len(heap), piece))
+    heapq.heapify(heap)
+
+    covered = set()
+    chosen = []
+    total = 0
+    while heap and total < size:
+        _, order, piece = heapq.heappop(heap)
+        fresh = dmers(piece) - covered
+        score = sum(frequency[d] for d in fresh)
+        if not score:
+            continue
+        if heap and score < -heap[0][0]:
+            heapq.heappush(heap, (-score, order, piece))
+            continue
+        covered |= fresh
+        chosen.append(piece)
+        total += len(piece)
+    return b"".join(reversed(chosen))[-size:]
+
+def train_dictionary(samples: List[bytes], size: int = CONTENT_DICT_SIZE, codec: str = CONTENT_CODEC) -> bytes:
+    if codec == 'zstd':
+        try:
+            return zstandard.train_dictionary(size, samples).as_bytes()
+        except zstandard.ZstdError:
+            # 样本太少或太相似时 zstd 无法训练，退回原始内容字典（zstd 同样支持）
+            pass
+    return _train_zdict(samples, size)
+
+class ContentStore:
+    """压缩存储的编解码：pack 返回带头部的压缩块，unpack 还原为文本
+
+    字典按ID缓存在内存中（只增不改）；训练在后台线程中进行并用独立的会话提交，
+    不占用调用方事务的写锁，训练完成之前的数据不使用字典。
+    """
+
+    def __init__(self, session_factory: Callable, codec: str = CONTENT_CODEC,
+                 level: int = CONTENT_COMPRESSION_LEVEL, dict_samples: int = CONTENT_DICT_SAMPLES):
+        if codec == 'zstd' and zstandard is None:
+            print("未安装 zstandard，压缩存储使用 zlib")
+            codec = 'zlib'
+        if codec not in _CODEC_IDS:
+            raise ValueError(f"未知的压缩方式: {codec}")
+        self._session_factory = session_factory
+        self.codec = codec
+        self.level = level
+        self.dict_samples = dict_samples
+        self._dictionaries: Dict[int, bytes] = {}
+        # 各类数据当前使用的字典ID；值为 None 表示正在训练
+        self._active: Dict[str, Optional[int]] = {}
+        self._samples: Dict[str, List[bytes]] = {}
+        self._lock = threading.Lock()
+
+    # ---- 编解码 ----
+
+    def pack(self, kind: str, value: str, dictionary: bool = True) -> bytes:
+        data = value.encode('utf-8')
+        dict_id = self._dictionary_for(kind, data) if dictionary and self.dict_samples > 0 else 0
+        zdict = self._dictionaries[dict_id] if dict_id else None
+        if self.codec == 'zstd':
+            compressor = zstandard.ZstdCompressor(
+                level=self.level, dict_data=zstandard.ZstdCompressionDict(zdict) if zdict else None)
+            payload = compressor.compress(data)
+        else:
+            compressor = zlib.compressobj(self.level, zdict=zdict) if zdict else zlib.compressobj(self.level)
+            payload = compressor.compress(data) + compressor.flush()
+        STORED_BYTES.inc(len(data), kind=kind, form="raw")
+        STORED_BYTES.inc(len(payload) + _HEADER.size, kind=kind, form="stored")
+        return _HEADER.pack(_CODEC_IDS[self.codec], dict_id) + payload
+
+    @staticmethod
+    def is_legacy(blob) -> bool:
+        """是否为旧格式的未压缩文本（部分数据库驱动把文本作为字节返回，以首字节区分：JSON文本不以编码方式ID开头）"""
+        if blob is None:
+            return False
+        return isinstance(blob, str) or len(blob) < _HEADER.size or blob[0] not in _CODEC_IDS.values()
+
+    def unpack(self, blob) -> Optional[str]:
+        """还原压缩块；旧格式的文本原样返回"""
+        if blob is None or isinstance(blob, str):
+            return blob
+        if self.is_legacy(blob):
+            return bytes(blob).decode('utf-8')
+        codec_id, dict_id = _HEADER.unpack_from(blob)
+        payload = bytes(blob[_HEADER.size:])
+        zdict = self._dictionary(dict_id) if dict_id else None
+        if codec_id == _CODEC_IDS['zstd']:
+            if zstandard is None:
+                raise RuntimeError("数据以 zstd 压缩，需要安装 zstandard")
+            decompressor = zstandard.ZstdDecompressor(
+                dict_data=zstandard.ZstdCompressionDict(zdict) if zdict else None)
+            data = decompressor.decompress(payload)
+        else:
+            decompressor = zlib.decompressobj(zdict=zdict) if zdict else zlib.decompressobj()
+            data = decompressor.decompress(payload) + decompressor.flush()
+        return data.decode('utf-8')
+
+    def pack_json(self, kind: str, value: Any, dictionary: bool = True) -> bytes:
+        return self.pack(kind, json.dumps(value, ensure_ascii=False), dictionary)
+
+    def unpack_json(self, blob, default: Any = None) -> Any:
+        text = self.unpack(blob)
+        return json.loads(text) if text else default
+
+    @staticmethod
+    def stored_size(blob) -> int:
+        if blob is None:
+            return 0
+        return len(blob.encode('utf-8')) if isinstance(blob, str) else len(blob)
+
+    # ---- 字典 ----
+
+    def _dictionary_for(self, kind: str, data: bytes) -> int:
+        """该类数据当前使用的字典ID（0 表示暂无），样本足够时启动后台训练"""
+        with self._lock:
+            if kind in self._active:
+                return self._active[kind] or 0
+            dict_id = self._latest_dictionary(kind)
+            if dict_id:
+                self._active[kind] = dict_id
+                return dict_id
+            samples = self._samples.setdefault(kind, [])
+            samples.append(data[:CONTENT_DICT_SAMPLE_BYTES])
+            if len(samples) < self.dict_samples:
+                return 0
+            self._active[kind] = None
+            del self._samples[kind]
+        threading.Thread(target=self._train, args=(kind, samples), daemon=True,
+                         name=f"content-dict-{kind}").start()
+        return 0
+
+    def _latest_dictionary(self, kind: str) -> int:
+        """读取其他worker已训练好的字典（调用方持有锁）"""
+        db = self._session_factory()
+        try:
+            row = db.query(CompressionDictionary).filter(
+                CompressionDictionary.kind == kind,
+                CompressionDictionary.codec == self.codec
+            ).order_by(CompressionDictionary.id.desc()).first()
+            if row is None:
+                return 0
+            self._dictionaries[row.id] = bytes(row.data)
+            return row.id
+        finally:
+            db.close()
+
+    def _train(self, kind: str, samples: List[bytes]):
+        db = self._session_factory()
+        try:
+            row = CompressionDictionary(kind=kind, codec=self.codec, sample_count=len(samples),
+                                        data=train_dictionary(samples, CONTENT_DICT_SIZE, self.codec))
+            db.add(row)
+            db.commit()
+            with self._lock:
+                self._dictionaries[row.id] = bytes(row.data)
+                self._active[kind] = row.id
+            print(f"压缩字典训练完成: {kind}（{len(samples)} 个样本，{len(row.data)} 字节）")
+        except Exception as e:
+            print(f"压缩字典训练失败({kind}): {e}")
+            with self._lock:
+                # 重新收集样本后再试
+                self._active.pop(kind, None)
+        finally:
+            db.close()
+
+    def _dictionary(self, dict_id: int) -> bytes:
+        with self._lock:
+            if dict_id in self._dictionaries:
+                return self._dictionaries[dict_id]
+        db = self._session_factory()
+        try:
+            row = db.query(CompressionDictionary).filter(CompressionDictionary.id == dict_id).first()
+            if row is None:
+                raise RuntimeError(f"压缩字典不存在: {dict_id}")
+            with self._lock:
+                self._dictionaries[dict_id] = bytes(row.data)
+            return self._dictionaries[dict_id]
+        finally:
+            db.close()
+
+content_store = ContentStore(SessionLocal)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    from database import Base, engine
+    from graph_versions import GraphVersionManager
+
+    parser = argparse.ArgumentParser(description="提取文本和图谱数据的压缩存储")
+    parser.add_argument("command", choices=["compress"], help="compress：把旧格式的未压缩图谱数据转换为压缩格式")
+    parser.add_argument("--no-vacuum", action="store_true", help="转换后不执行VACUUM")
+    args = parser.parse_args(argv)
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        converted = GraphVersionManager().compress_legacy(db)
+    finally:
+        db.close()
+    print(f"转换完成: {converted['graphs']} 个当前图谱, {converted['versions']} 个历史版本")
+    if not args.no_vacuum:
+        with engine.connect() as conn:
+            conn.exec_driver_sql("VACUUM")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
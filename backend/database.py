@@ -1,20 +1,42 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 
 # SQLite数据库配置
-SQLALCHEMY_DATABASE_URL = "sqlite:///./kg_system.db"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./kg_system.db")
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, 
-    connect_args={"check_same_thread": False}
+    connect_args={"check_same_thread": False} if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else {}
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+def add_missing_columns(table: str, columns: dict):
+    """轻量迁移：为已存在的表补充模型中新增的列（create_all 不会修改已有的表）
+
+    columns 为 {列名: 列定义}，如 {"version": "INTEGER DEFAULT 1"}；只支持追加列。
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table(table):
+        return
+    existing = {column['name'] for column in inspector.get_columns(table)}
+    with engine.begin() as conn:
+        for name, definition in columns.items():
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {definition}"))
+                print(f"数据库迁移: {table} 新增列 {name}")
+
+def add_missing_indexes(table):
+    """轻量迁移：为已存在的表补充模型中新增的索引（table 为模型的 __table__）"""
+    for index in table.indexes:
+        if not inspect(engine).has_index(table.name, index.name):
+            index.create(bind=engine)
+            print(f"数据库迁移: {table.name} 新增索引 {index.name}")
+
 # Neo4j数据库配置
 NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
 NEO4J_USERNAME = os.getenv("NEO4J_USERNAME", "neo4j")
@@ -0,0 +1,161 @@
+from array import array
+from bisect import bisect_right
+from typing import Iterator, List, Optional, Tuple
+import re
+
+import jieba
+
+from relation_patterns import split_sentences
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_SPECIAL_CHAR_RE = re.compile(r'[^\w\s\u4e00-\u9fff.,!?;:。，！？；：、]')
+# 清洗结果由这两类片段依次拼成：空白串（折叠为一个空格）、连续的保留字符；其余字符被删除
+_SEGMENT_RE = re.compile(r'(\s+)|[\w\u4e00-\u9fff.,!?;:。，！？；：、]+')
+_CJK_RUN_RE = re.compile(r'[\u4e00-\u9fff]+')
+
+def clean_text(text: str) -> str:
+    """清理文本"""
+    # 移除多余的空白字符
+    text = _WHITESPACE_RE.sub(' ', text)
+    # 移除特殊字符（保留中英文标点，供分句和子句切分使用）
+    text = _SPECIAL_CHAR_RE.sub('', text)
+    return text.strip()
+
+class Document:
+    """待抽取文本的共享表示
+
+    创建时清洗一次文本；分词、句子边界、汉字片段和回到原文的偏移映射在首次使用时计算并缓存，
+    实体识别和关系抽取的各个步骤共用同一份结果，不再各自从字符串重新推导。
+    偏移均相对清洗后的 text，original_span 把它换算为原文 raw 中的位置。
+    """
+
+    def __init__(self, raw: str):
+        self.raw = raw
+        self.text = clean_text(raw)
+        self._token_ends: Optional[array] = None
+        self._sentences: Optional[List[Tuple[int, int]]] = None
+        self._sentence_texts: Optional[List[str]] = None
+        self._sentence_starts: Optional[array] = None
+        self._run_starts: Optional[array] = None
+        self._offset_map: Optional[Tuple[array, array]] = None
+
+    @classmethod
+    def from_cleaned(cls, text: str, sentences: Optional[List[Tuple[int, int]]] = None) -> "Document":
+        """由已清洗的文本创建，不再重复清洗（清洗不是幂等的，二次清洗会移动偏移）
+
+        并行抽取时每个分块沿用整篇文本的句子切分，传入以分块为基准的句子偏移。
+        """
+        document = cls('')
+        document.raw = document.text = text
+        document._sentences = sentences
+        return document
+
+    # ---- 分词 ----
+
+    def tokens(self) -> Iterator[Tuple[str, int, int]]:
+        """jieba分词结果 (词, 起始, 结束)
+
+        只分词一次；词首尾相接覆盖全文，因此只保存每个词的结束偏移。
+        """
+        if self._token_ends is None:
+            self._token_ends = array('q', (end for _, _, end in jieba.tokenize(self.text)))
+        text = self.text
+        start = 0
+        for end in self._token_ends:
+            yield text[start:end], start, end
+            start = end
+
+    # ---- 句子 ----
+
+    @property
+    def sentences(self) -> List[Tuple[int, int]]:
+        """句子的 (起始, 结束) 偏移"""
+        if self._sentences is None:
+            self._sentences = split_sentences(self.text)
+        return self._sentences
+
+    @property
+    def sentence_texts(self) -> List[str]:
+        if self._sentence_texts is None:
+            text = self.text
+            self._sentence_texts = [text[start:end] for start, end in self.sentences]
+        return self._sentence_texts
+
+    def sentence_at(self, start: int, end: int) -> Optional[int]:
+        """完整包含 [start, end) 的句子序号，跨句或落在句子之外时返回 None"""
+        if self._sentence_starts is None:
+            self._sentence_starts = array('q', (s for s, _ in self.sentences))
+        index = bisect_right(self._sentence_starts, start) - 1
+        if index >= 0 and end <= self.sentences[index][1]:
+            return index
+        return None
+
+    # ---- 子串查找 ----
+
+    def occurrences(self, substring: str) -> Iterator[int]:
+        """substring 在文本中每次出现（含重叠出现）的起始偏移"""
+        find = self.text.find
+        position = find(substring)
+        while position != -1:
+            yield position
+            position = find(substring, position + 1)
+
+    def cjk_prefixed(self, keyword: str) -> List[Tuple[int, int]]:
+        """“若干汉字 + keyword” 的匹配区间（keyword 须全部由汉字组成）
+
+        结果与 re.finditer('[\\u4e00-\\u9fff]+' + keyword, text) 相同：贪婪匹配使每个连续汉字片段至多产生一个匹配，
+        从片段开头到片段内最后一个前面至少还有一个汉字的 keyword 结尾。这里只定位 keyword 的出现位置再归入所在片段，
+        不对每个起点做回溯，多个关键词共用一次汉字片段切分。
+        """
+        if self._run_starts is None:
+            self._run_starts = array('q', (m.start() for m in _CJK_RUN_RE.finditer(self.text)))
+        run_starts = self._run_starts
+        spans = []
+        current, last = -1, -1
+        for position in self.occurrences(keyword):
+            run = bisect_right(run_starts, position) - 1
+            if position == run_starts[run]:
+                continue
+            if run != current and current >= 0:
+                spans.append((run_starts[current], last + len(keyword)))
+            current, last = run, position
+        if current >= 0:
+            spans.append((run_starts[current], last + len(keyword)))
+        return spans
+
+    # ---- 原文偏移 ----
+
+    def original_span(self, start: int, end: int) -> Tuple[int, int]:
+        """清洗后文本中的区间 [start, end) 在原文中的对应区间"""
+        if end <= start:
+            position = self._to_original(start)
+            return position, position
+        return self._to_original(start), self._to_original(end - 1) + 1
+
+    def _to_original(self, offset: int) -> int:
+        clean_starts, raw_starts = self._offsets()
+        index = bisect_right(clean_starts, offset) - 1
+        if index < 0:
+            return offset
+        return raw_starts[index] + (offset - clean_starts[index])
+
+    def _offsets(self) -> Tuple[array, array]:
+        """每个保留片段在清洗后文本与原文中的起始偏移（空白串在清洗后只占一个字符）"""
+        if self._offset_map is None:
+            clean_starts, raw_starts = array('q'), array('q')
+            position = 0
+            leading = 0
+            for match in _SEGMENT_RE.finditer(self.raw):
+                clean_starts.append(position)
+                raw_starts.append(match.start())
+                if match.group(1):
+                    # 清洗结果去掉了开头的空格，之后的偏移整体前移
+                    if position == leading:
+                        leading += 1
+                    position += 1
+                else:
+                    position += match.end() - match.start()
+            for i in range(len(clean_starts)):
+                clean_starts[i] -= leading
+            self._offset_map = clean_starts, raw_starts
+        return self._offset_map
@@ -0,0 +1,178 @@
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import posixpath
+import zipfile
+
+from lxml import etree
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+R_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+A_NS = "http://schemas.openxmlformats.org/drawingml/2006/main"
+V_NS = "urn:schemas-microsoft-com:vml"
+
+_P = f"{{{W_NS}}}p"
+_T = f"{{{W_NS}}}t"
+_TAB = f"{{{W_NS}}}tab"
+_BR = f"{{{W_NS}}}br"
+_CR = f"{{{W_NS}}}cr"
+_TBL = f"{{{W_NS}}}tbl"
+_TR = f"{{{W_NS}}}tr"
+_TC = f"{{{W_NS}}}tc"
+_BLIP = f"{{{A_NS}}}blip"
+_IMAGEDATA = f"{{{V_NS}}}imagedata"
+_EMBED = f"{{{R_NS}}}embed"
+_RID = f"{{{R_NS}}}id"
+
+_HEADER_TYPE = "/header"
+_FOOTER_TYPE = "/footer"
+
+# 块类型：paragraph（正文段落）、row（表格的一行，文本为各单元格）、image（内嵌图片在压缩包中的路径）
+Block = Tuple[str, object]
+
+class _CountingReader:
+    """记录已读取的解压后字节数，用于报告进度"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.consumed = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.raw.read(size)
+        self.consumed += len(data)
+        return data
+
+class DocxReader:
+    """流式读取DOCX
+
+    用 iterparse 逐个元素解析压缩包中的 word/document.xml，按文档顺序产出段落、表格行和图片，
+    每个顶层段落或表格处理完后立即释放对应的元素，内存占用与文档长度无关。
+    页眉页脚从各自的XML部件中读取。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._zip = zipfile.ZipFile(path)
+        self._relationships = self._read_relationships("word/document.xml")
+
+    def close(self):
+        self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _read_relationships(self, part: str) -> Dict[str, Tuple[str, str]]:
+        """部件的关系表：{关系ID: (类型, 目标部件路径)}"""
+        directory, name = posixpath.split(part)
+        rels_path = posixpath.join(directory, "_rels", name + ".rels")
+        if rels_path not in self._zip.namelist():
+            return {}
+        relationships = {}
+        root = etree.fromstring(self._zip.read(rels_path))
+        for rel in root.iter(f"{{{REL_NS}}}Relationship"):
+            if rel.get("TargetMode") == "External":
+                continue
+            target = posixpath.normpath(posixpath.join(directory, rel.get("Target")))
+            relationships[rel.get("Id")] = (rel.get("Type", ""), target)
+        return relationships
+
+    def image_bytes(self, name: str) -> bytes:
+        return self._zip.read(name)
+
+    def header_footer_parts(self) -> Tuple[List[str], List[str]]:
+        headers, footers = [], []
+        for rel_type, target in self._relationships.values():
+            if rel_type.endswith(_HEADER_TYPE):
+                headers.append(target)
+            elif rel_type.endswith(_FOOTER_TYPE):
+                footers.append(target)
+        return sorted(headers), sorted(footers)
+
+    def iter_blocks(self, progress: Optional[Callable[[int, int], None]] = None) -> Iterator[Block]:
+        """按文档顺序产出正文的块；progress(已解析字节, 总字节) 在每个顶层块之后调用"""
+        info = self._zip.getinfo("word/document.xml")
+        with self._zip.open(info) as raw:
+            reader = _CountingReader(raw)
+            for block in self._iter_part(reader, self._relationships):
+                yield block
+                if progress:
+                    progress(reader.consumed, info.file_size)
+
+    def iter_part_blocks(self, part: str) -> Iterator[Block]:
+        """页眉、页脚等其他部件"""
+        with self._zip.open(part) as raw:
+            yield from self._iter_part(raw, self._read_relationships(part))
+
+    def _iter_part(self, source, relationships: Dict[str, Tuple[str, str]]) -> Iterator[Block]:
+        # 文本框中的段落嵌套在外层段落内，paragraphs 栈的每一层对应一个打开的段落；
+        # 嵌套表格的内容并入外层单元格，cells 栈的每一层对应一个打开的单元格
+        paragraphs: List[List[str]] = []
+        rows: List[List[str]] = []
+        cells: List[List[str]] = []
+        table_depth = 0
+
+        for event, elem in etree.iterparse(source, events=("start", "end"), huge_tree=True):
+            tag = elem.tag
+            if event == "start":
+                if tag == _P:
+                    paragraphs.append([])
+                elif tag == _TBL:
+                    table_depth += 1
+                elif tag == _TR and table_depth == 1:
+                    rows.append([])
+                elif tag == _TC:
+                    cells.append([])
+                continue
+
+            if tag == _T:
+                if elem.text and paragraphs:
+                    paragraphs[-1].append(elem.text)
+            elif tag == _TAB:
+                if paragraphs:
+                    paragraphs[-1].append("\t")
+            elif tag in (_BR, _CR):
+                if paragraphs:
+                    paragraphs[-1].append("\n")
+            elif tag in (_BLIP, _IMAGEDATA):
+                target = relationships.get(elem.get(_EMBED) or elem.get(_RID))
+                if target:
+                    yield "image", target[1]
+            elif tag == _P:
+                text = "".join(paragraphs.pop())
+                if cells:
+                    cells[-1].append(text)
+                else:
+                    yield "paragraph", text
+                    if not paragraphs:
+                        self._release(elem)
+            elif tag == _TC:
+                text = "\n".join(t for t in cells.pop() if t)
+                if cells:
+                    # 嵌套表格的单元格
+                    cells[-1].append(text)
+                elif rows:
+                    rows[-1].append(text)
+            elif tag == _TR and table_depth == 1:
+                yield "row", rows.pop()
+                self._release(elem)
+            elif tag == _TBL:
+                table_depth -= 1
+                if table_depth == 0:
+                    self._release(elem)
+
+    @staticmethod
+    def _release(elem):
+        """释放已处理的元素及其之前的兄弟节点"""
+        elem.clear()
+        parent = elem.getparent()
+        if parent is None:
+            return
+        while elem.getprevious() is not None:
+            del parent[0]
+
+def iter_docx_blocks(path: str) -> Iterator[Block]:
+    with DocxReader(path) as reader:
+        yield from reader.iter_blocks()
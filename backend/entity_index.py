@@ -0,0 +1,421 @@
+from typing import List, Dict, Any, Optional
+import json
+import os
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from records import Entity
+
+# 实体向量索引的数据目录
+ENTITY_INDEX_DIR = os.getenv("ENTITY_INDEX_DIR", "./entity_index")
+
+class NGramHashEmbedder:
+    """字符n-gram哈希向量化（本地计算，无需模型或网络）"""
+
+    def __init__(self, dim: int = 256, ngram_range=(1, 3)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        text = text.lower().strip()
+        padded = f"^{text}$"
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            source = text if n == 1 else padded
+            for i in range(len(source) - n + 1):
+                # 用crc32保证跨进程稳定，最高位决定符号以减少哈希冲突的偏差
+                h = zlib.crc32(source[i:i + n].encode('utf-8'))
+                vector[h % self.dim] += -1.0 if h & 0x80000000 else 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def embed_many(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.vstack([self.embed(text) for text in texts])
+
+class EntityVectorIndex:
+    """实体向量索引
+
+    向量保存在按容量倍增的 NumPy memmap 中，元数据以追加日志保存；
+    数量达到阈值后训练 IVF（倒排文件）粗聚类，查询时只扫描最近的 nprobe 个簇。
+    写入路径上触发的训练在后台线程中基于当时的数据副本进行，完成后在锁内一次替换聚类中心和倒排表，
+    训练期间新增的行在替换时补充分配；训练完成前仍使用旧的聚类中心（或精确检索）。
+    删除为逻辑删除；手动调用 train() 时（或已删除的行多于有效行时）压缩：重写向量文件和元数据日志，清除已删除的行。
+    压缩后的日志首行指明所用的向量文件，日志原子替换后旧的向量文件才被删除，中途退出不会错配。
+    """
+
+    def __init__(self, data_dir: Optional[str] = ENTITY_INDEX_DIR, dim: int = 256,
+                 nprobe: int = 8, min_train_size: int = 2048):
+        self.data_dir = data_dir
+        self.dim = dim
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.embedder = NGramHashEmbedder(dim)
+        self._lock = threading.RLock()
+
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._size = 0
+        self._meta: List[Dict[str, Any]] = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._owners = np.zeros(0, dtype=np.int64)
+        self._file_rows: Dict[int, List[int]] = {}
+        self._user_rows: Dict[int, List[int]] = {}
+        self._vectors_file = "vectors.f32"
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[List[int]] = []
+        self._trained_size = 0
+        # 压缩会重新编号行，后台训练据此判断分配结果是否仍然有效
+        self._compactions = 0
+        self._training: Optional[threading.Thread] = None
+
+        if data_dir:
+            os.makedirs(data_dir, exist_ok=True)
+            self._load()
+
+    # ---- 写入 ----
+
+    def add_entities(self, file_id: int, user_id: int, entities: List[Entity]):
+        """为一个文件的实体建立向量（同一文件内相同文本只保留一条）"""
+        seen = set()
+        rows = []
+        for entity in entities:
+            if entity.text in seen:
+                continue
+            seen.add(entity.text)
+            rows.append({'text': entity.text, 'label': entity.label,
+                         'file_id': file_id, 'user_id': user_id})
+        if not rows:
+            return
+
+        vectors = self.embedder.embed_many([row['text'] for row in rows])
+        with self._lock:
+            start = self._size
+            self._reserve(start + len(rows))
+            self._vectors[start:start + len(rows)] = vectors
+            self._size += len(rows)
+            self._meta.extend(rows)
+            self._alive[start:start + len(rows)] = True
+            self._owners[start:start + len(rows)] = user_id
+            self._file_rows.setdefault(file_id, []).extend(range(start, start + len(rows)))
+            self._user_rows.setdefault(user_id, []).extend(range(start, start + len(rows)))
+            self._append_log([{'op': 'add', **row} for row in rows])
+
+            if self._centroids is not None:
+                assignments = np.argmax(vectors @ self._centroids.T, axis=1)
+                for offset, cluster in enumerate(assignments):
+                    self._lists[cluster].append(start + offset)
+            self._maybe_train()
+
+    def remove_file(self, file_id: int):
+        """逻辑删除一个文件的全部实体向量"""
+        with self._lock:
+            rows = self._file_rows.pop(file_id, [])
+            if not rows:
+                return
+            self._alive[rows] = False
+            self._append_log([{'op': 'delete', 'file_id': file_id}])
+            alive = self.size
+            if self._size - alive > max(alive, self.min_train_size):
+                self.compact()
+
+    # ---- 查询 ----
+
+    def search(self, query: str, limit: int = 20, user_id: Optional[int] = None,
+               nprobe: Optional[int] = None) -> List[Dict[str, Any]]:
+        """近似最近邻检索（未训练IVF时退化为精确检索）
+
+        限定用户时，该用户的实体不多于所探测的簇平均包含的实体数时直接精确扫描该用户的实体；
+        否则按与查询的相似度依次探测簇，命中的该用户实体不足 limit 个时加倍探测的簇数。
+        """
+        vector = self.embedder.embed(query)
+        with self._lock:
+            if user_id is not None:
+                user_rows = self._rows_of(user_id)
+                if self._centroids is None or \
+                        len(user_rows) <= (nprobe or self.nprobe) * self.size / len(self._centroids):
+                    return self._rank(vector, user_rows, limit, user_id)
+            if self._centroids is None:
+                return self._rank(vector, np.arange(self._size), limit, user_id)
+
+            order = np.argsort(-(self._centroids @ vector))
+            probe = min(nprobe or self.nprobe, len(order))
+            while True:
+                candidates = np.fromiter(
+                    (row for cluster in order[:probe] for row in self._lists[cluster]), dtype=np.int64
+                )
+                if user_id is None or probe == len(order) or self._user_hits(candidates, user_id) >= limit:
+                    return self._rank(vector, candidates, limit, user_id)
+                probe = min(probe * 2, len(order))
+
+    def _rows_of(self, user_id: int) -> np.ndarray:
+        rows = np.array(self._user_rows.get(user_id, []), dtype=np.int64)
+        return rows[self._alive[rows]]
+
+    def _user_hits(self, candidates: np.ndarray, user_id: int) -> int:
+        return int((self._alive[candidates] & (self._owners[candidates] == user_id)).sum())
+
+    def search_exact(self, query: str, limit: int = 20, user_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """暴力精确检索（用于评估召回率）"""
+        vector = self.embedder.embed(query)
+        with self._lock:
+            return self._rank(vector, np.arange(self._size), limit, user_id)
+
+    def _rank(self, vector: np.ndarray, candidates: np.ndarray, limit: int,
+              user_id: Optional[int]) -> List[Dict[str, Any]]:
+        if len(candidates) == 0:
+            return []
+        candidates = candidates[self._alive[candidates]]
+        if user_id is not None:
+            candidates = candidates[self._owners[candidates] == user_id]
+        if len(candidates) == 0:
+            return []
+
+        if len(candidates) == self._size:
+            # 全量扫描时直接在连续内存上计算，避免花式索引复制整个矩阵
+            scores = (self._vectors[:self._size] @ vector)[candidates]
+        else:
+            scores = self._vectors[candidates] @ vector
+        top = np.argsort(-scores)[:limit] if len(scores) > limit else np.argsort(-scores)
+        return [{**self._meta[candidates[i]], 'score': float(scores[i])} for i in top]
+
+    @property
+    def size(self) -> int:
+        return int(self._alive[:self._size].sum())
+
+    # ---- IVF训练 ----
+
+    def _maybe_train(self):
+        alive = self.size
+        if alive < self.min_train_size or self._training is not None:
+            return
+        if self._centroids is not None and alive < self._trained_size * 4:
+            return
+        self._training = threading.Thread(target=self._train_in_background, daemon=True)
+        self._training.start()
+
+    def _train_in_background(self):
+        try:
+            self._fit_and_install()
+        except Exception as e:
+            print(f"实体索引训练失败: {e}")
+        finally:
+            with self._lock:
+                self._training = None
+
+    def wait_for_training(self, timeout: Optional[float] = None):
+        """等待后台训练完成"""
+        thread = self._training
+        if thread is not None:
+            thread.join(timeout)
+
+    def train(self, iterations: int = 10, seed: int = 0):
+        """压缩后用k-means训练粗聚类中心并重建倒排表（簇数约为 sqrt(n)），同步执行"""
+        self.compact()
+        self._fit_and_install(iterations, seed)
+
+    def _fit_and_install(self, iterations: int = 10, seed: int = 0):
+        """在数据副本上训练和分配，只在替换时持有锁"""
+        with self._lock:
+            rows = np.flatnonzero(self._alive[:self._size])
+            if len(rows) == 0:
+                return
+            nlist = max(1, int(np.sqrt(len(rows))))
+            rng = np.random.default_rng(seed)
+            sample = np.array(self._vectors[rng.choice(rows, size=min(len(rows), nlist * 64), replace=False)])
+
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            order = np.argsort(assignments, kind='stable')
+            clusters, starts = np.unique(assignments[order], return_index=True)
+            sums = np.zeros_like(centroids)
+            sums[clusters] = np.add.reduceat(sample[order], starts, axis=0)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # 空簇保留原中心
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+        centroids = centroids.astype(np.float32)
+
+        while True:
+            with self._lock:
+                compactions, size, vectors = self._compactions, self._size, self._vectors
+                rows = np.flatnonzero(self._alive[:size])
+            # 向量只追加，已有的行在压缩前不会变化，可在锁外分配
+            lists = self._assign(vectors, rows, centroids)
+            with self._lock:
+                if self._compactions != compactions:
+                    continue
+                tail = np.arange(size, self._size)
+                for cluster, extra in enumerate(self._assign(self._vectors, tail, centroids)):
+                    lists[cluster].extend(extra)
+                self._centroids = centroids
+                self._lists = lists
+                self._trained_size = len(rows) + len(tail)
+                if self.data_dir:
+                    np.save(os.path.join(self.data_dir, "centroids.npy"), self._centroids)
+                return
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, rows: np.ndarray, centroids: np.ndarray) -> List[List[int]]:
+        lists = [[] for _ in range(len(centroids))]
+        for start in range(0, len(rows), 65536):
+            chunk = rows[start:start + 65536]
+            assignments = np.argmax(vectors[chunk] @ centroids.T, axis=1)
+            for row, cluster in zip(chunk.tolist(), assignments.tolist()):
+                lists[cluster].append(row)
+        return lists
+
+    def _assign_all(self, rows: np.ndarray):
+        self._lists = self._assign(self._vectors, rows, self._centroids)
+
+    # ---- 存储 ----
+
+    def compact(self):
+        """清除已删除的行：保留的行按原顺序重新编号，重写向量文件和元数据日志"""
+        with self._lock:
+            keep = np.flatnonzero(self._alive[:self._size])
+            if len(keep) == self._size:
+                return
+            capacity = self._capacity_for(len(keep))
+            if self.data_dir:
+                name = f"vectors-{time.time_ns()}.f32"
+                path = os.path.join(self.data_dir, name)
+                with open(path, "wb") as f:
+                    f.truncate(capacity * self.dim * 4)
+                vectors = np.memmap(path, dtype=np.float32, mode='r+', shape=(capacity, self.dim))
+            else:
+                vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+            for start in range(0, len(keep), 65536):
+                chunk = keep[start:start + 65536]
+                vectors[start:start + len(chunk)] = self._vectors[chunk]
+            meta = [self._meta[row] for row in keep.tolist()]
+
+            if self.data_dir:
+                vectors.flush()
+                log_path = os.path.join(self.data_dir, "entities.jsonl")
+                with open(log_path + ".tmp", "w", encoding="utf-8") as f:
+                    f.write(json.dumps({'op': 'vectors', 'file': name}) + "\n")
+                    for row in meta:
+                        f.write(json.dumps({'op': 'add', **row}, ensure_ascii=False) + "\n")
+                os.replace(log_path + ".tmp", log_path)
+                old_path = self._vectors_path()
+                self._vectors_file = name
+                if os.path.exists(old_path):
+                    os.remove(old_path)
+
+            remap = np.full(self._size, -1, dtype=np.int64)
+            remap[keep] = np.arange(len(keep))
+            self._vectors = vectors
+            self._meta = meta
+            self._size = len(keep)
+            self._alive = np.zeros(capacity, dtype=bool)
+            self._alive[:self._size] = True
+            self._owners = np.zeros(capacity, dtype=np.int64)
+            self._owners[:self._size] = [row['user_id'] for row in meta]
+            self._file_rows = {file_id: remap[rows].tolist() for file_id, rows in self._file_rows.items()}
+            self._rebuild_user_rows()
+            self._compactions += 1
+            if self._centroids is not None:
+                self._assign_all(np.arange(self._size))
+
+    def _rebuild_user_rows(self):
+        self._user_rows = {}
+        for row in np.flatnonzero(self._alive[:self._size]).tolist():
+            self._user_rows.setdefault(int(self._owners[row]), []).append(row)
+
+    def _vectors_path(self) -> str:
+        return os.path.join(self.data_dir, self._vectors_file)
+
+    @staticmethod
+    def _capacity_for(count: int) -> int:
+        capacity = 1024
+        while capacity < count:
+            capacity *= 2
+        return capacity
+
+    def _reserve(self, capacity: int):
+        """扩容向量存储（落盘时重新映射更大的文件）"""
+        if capacity <= len(self._vectors):
+            return
+        new_capacity = max(1024, len(self._vectors))
+        while new_capacity < capacity:
+            new_capacity *= 2
+
+        if self.data_dir:
+            path = self._vectors_path()
+            if isinstance(self._vectors, np.memmap):
+                self._vectors.flush()
+            with open(path, "ab") as f:
+                f.truncate(new_capacity * self.dim * 4)
+            vectors = np.memmap(path, dtype=np.float32, mode='r+', shape=(new_capacity, self.dim))
+        else:
+            vectors = np.zeros((new_capacity, self.dim), dtype=np.float32)
+            vectors[:self._size] = self._vectors[:self._size]
+        self._vectors = vectors
+
+        alive = np.zeros(new_capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        self._alive = alive
+        owners = np.zeros(new_capacity, dtype=np.int64)
+        owners[:self._size] = self._owners[:self._size]
+        self._owners = owners
+
+    def _append_log(self, records: List[Dict[str, Any]]):
+        if not self.data_dir:
+            return
+        if isinstance(self._vectors, np.memmap):
+            self._vectors.flush()
+        with open(os.path.join(self.data_dir, "entities.jsonl"), "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _load(self):
+        """重放元数据日志，映射已有的向量文件"""
+        log_path = os.path.join(self.data_dir, "entities.jsonl")
+        if not os.path.exists(log_path):
+            return
+
+        with open(log_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 忽略崩溃时写了一半的最后一行
+                    continue
+                op = record.pop('op')
+                if op == 'add':
+                    self._file_rows.setdefault(record['file_id'], []).append(len(self._meta))
+                    self._meta.append(record)
+                elif op == 'vectors':
+                    self._vectors_file = record['file']
+                else:
+                    self._file_rows.pop(record['file_id'], None)
+
+        # 压缩中途退出时遗留的新向量文件
+        for name in os.listdir(self.data_dir):
+            if name.startswith("vectors") and name.endswith(".f32") and name != self._vectors_file:
+                os.remove(os.path.join(self.data_dir, name))
+
+        path = self._vectors_path()
+        capacity = os.path.getsize(path) // (self.dim * 4) if os.path.exists(path) else 0
+        self._size = min(len(self._meta), capacity)
+        self._meta = self._meta[:self._size]
+        if capacity:
+            self._vectors = np.memmap(path, dtype=np.float32, mode='r+', shape=(capacity, self.dim))
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._owners = np.zeros(capacity, dtype=np.int64)
+        self._owners[:self._size] = [row['user_id'] for row in self._meta]
+        for rows in self._file_rows.values():
+            rows[:] = [row for row in rows if row < self._size]
+            self._alive[rows] = True
+        self._rebuild_user_rows()
+
+        centroids_path = os.path.join(self.data_dir, "centroids.npy")
+        if os.path.exists(centroids_path) and self.size:
+            self._centroids = np.load(centroids_path)
+            rows = np.flatnonzero(self._alive[:self._size])
+            self._assign_all(rows)
+            self._trained_size = len(rows)
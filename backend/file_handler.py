@@ -1,14 +1,42 @@
+import io
+import multiprocessing
 import os
-import docx
-import PyPDF2
-from PIL import Image
-import pytesseract
-from typing import Dict, Any
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Dict, Any, Callable, Optional, Tuple
+
+from image_hash import ImageFingerprintStore, fingerprint
+from metrics import span, registry, record_error
+
+# DOCX内嵌图片的OCR并行数，0 表示不识别内嵌图片
+DOCX_OCR_WORKERS = int(os.getenv("DOCX_OCR_WORKERS", "4"))
+# 可以OCR的内嵌图片格式（EMF/WMF等矢量图跳过）
+OCR_IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff'}
+# 视频关键帧OCR的进程数
+VIDEO_OCR_WORKERS = max(1, int(os.getenv("VIDEO_OCR_WORKERS", "2")))
+
+OCR_IMAGES = registry.counter("kg_ocr_images_total", "需要识别的图片数（ocr：调用tesseract，reused：复用近似重复图片的文本）",
+                              ["result"])
+VIDEO_FRAMES = registry.counter("kg_video_frames_total", "视频抽取的帧数（keyframe：关键帧，redundant：与上一个关键帧近似相同而跳过）",
+                                ["result"])
+
+def ocr_frame_worker(size: Tuple[int, int], pixels: bytes) -> str:
+    """供进程池调用的视频帧OCR函数（灰度像素）"""
+    from PIL import Image
+    return FileProcessor._tesseract(Image.frombytes('L', size, pixels))
 
 class FileProcessor:
-    """文件处理器"""
+    """文件处理器
+
+    指定 fingerprints 时，图片（含DOCX内嵌图片和视频关键帧）OCR前先按感知哈希查找同一用户识别过的近似重复图片。
+    """
     
-    def __init__(self):
+    def __init__(self, fingerprints: Optional[ImageFingerprintStore] = None):
+        from video_reader import VIDEO_EXTENSIONS
+        
+        self.fingerprints = fingerprints
+        self._video_pool: Optional[ProcessPoolExecutor] = None
+        self._video_pool_lock = threading.Lock()
         self.supported_types = {
             '.txt': self._process_txt,
             '.pdf': self._process_pdf,
@@ -17,60 +45,250 @@ class FileProcessor:
             '.jpeg': self._process_image,
             '.png': self._process_image
         }
+        self.supported_types.update((extension, self._process_video) for extension in VIDEO_EXTENSIONS)
     
-    def extract_text(self, file_path: str, file_type: str) -> str:
-        """提取文件文本内容"""
+    def extract_text(self, file_path: str, file_type: str,
+                     progress_callback: Optional[Callable[[int, int], None]] = None,
+                     user_id: Optional[int] = None, file_id: Optional[int] = None) -> str:
+        """提取文件文本内容
+
+        progress_callback(已完成, 总数) 在PDF每页之后、DOCX每解析完1%时调用；
+        user_id/file_id 为文件的所有者，图片OCR结果按用户复用
+        """
+        owner = (user_id, file_id) if user_id is not None else None
         if file_type not in self.supported_types:
             raise ValueError(f"不支持的文件类型: {file_type}")
         
         try:
-            return self.supported_types[file_type](file_path)
+            with span(stage="extract", file_type=file_type):
+                return self.supported_types[file_type](file_path, progress_callback, owner)
         except Exception as e:
             raise Exception(f"文件处理失败: {str(e)}")
     
-    def _process_txt(self, file_path: str) -> str:
+    def _process_txt(self, file_path: str, progress_callback=None, owner=None) -> str:
         """处理TXT文件"""
         with open(file_path, 'r', encoding='utf-8') as file:
             return file.read()
     
-    def _process_pdf(self, file_path: str) -> str:
+    def _process_pdf(self, file_path: str, progress_callback=None, owner=None) -> str:
         """处理PDF文件"""
+        import PyPDF2
+        
         text = ""
         try:
             with open(file_path, 'rb') as file:
                 pdf_reader = PyPDF2.PdfReader(file)
-                for page in pdf_reader.pages:
+                total = len(pdf_reader.pages)
+                for i, page in enumerate(pdf_reader.pages, 1):
                     text += page.extract_text() + "\n"
+                    if progress_callback:
+                        progress_callback(i, total)
         except Exception as e:
             raise Exception(f"PDF处理失败: {str(e)}")
         
         return text
     
-    def _process_docx(self, file_path: str) -> str:
-        """处理DOCX文件"""
+    def _process_docx(self, file_path: str, progress_callback=None, owner=None) -> str:
+        """处理DOCX文件
+        
+        流式解析正文（段落和表格按文档顺序，表格每行的单元格以制表符分隔）及页眉页脚，
+        不构建整个文档对象；正文中的内嵌图片在线程池中并行OCR，识别结果放在图片所在位置。
+        """
+        from docx_reader import DocxReader
+        
         try:
-            doc = docx.Document(file_path)
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text
+            with DocxReader(file_path) as reader, ThreadPoolExecutor(max(DOCX_OCR_WORKERS, 1)) as pool:
+                headers, footers = reader.header_footer_parts()
+                parts = []
+                for part in headers:
+                    parts.extend(self._docx_block_text(block) for block in reader.iter_part_blocks(part))
+                
+                reported = [0]
+                def progress(done: int, total: int):
+                    percent = done * 100 // max(total, 1)
+                    if percent > reported[0]:
+                        reported[0] = percent
+                        progress_callback(percent, 100)
+                
+                ocr_submitted = set()
+                for block in reader.iter_blocks(progress if progress_callback else None):
+                    if block[0] != 'image':
+                        parts.append(self._docx_block_text(block))
+                    elif DOCX_OCR_WORKERS > 0 and block[1] not in ocr_submitted \
+                            and os.path.splitext(block[1])[1].lower() in OCR_IMAGE_EXTENSIONS:
+                        # 同一图片多次引用时只识别一次
+                        ocr_submitted.add(block[1])
+                        parts.append(pool.submit(self._ocr_bytes, reader.image_bytes(block[1]), owner))
+                
+                for part in footers:
+                    parts.extend(self._docx_block_text(block) for block in reader.iter_part_blocks(part))
+                
+                return "\n".join(part if isinstance(part, str) else part.result() for part in parts
+                                 if isinstance(part, str) or part.result())
         except Exception as e:
             raise Exception(f"DOCX处理失败: {str(e)}")
     
-    def _process_image(self, file_path: str) -> str:
+    @staticmethod
+    def _docx_block_text(block) -> str:
+        kind, value = block
+        if kind == 'row':
+            return "\t".join(value)
+        if kind == 'paragraph':
+            return value
+        return ""  # 页眉页脚中的图片（通常是徽标）不做OCR
+    
+    def _process_image(self, file_path: str, progress_callback=None, owner=None) -> str:
         """处理图像文件（OCR）"""
+        from PIL import Image
+        
         try:
-            # 使用OCR提取图像中的文字
-            image = Image.open(file_path)
-            # 配置tesseract支持中文
-            custom_config = r'--oem 3 --psm 6 -l chi_sim+eng'
-            text = pytesseract.image_to_string(image, config=custom_config)
-            return text
+            return self._ocr(Image.open(file_path), owner)
         except Exception as e:
             # 如果OCR失败，返回空字符串（图像处理可选）
             print(f"OCR处理失败: {str(e)}")
             return ""
     
+    def _process_video(self, file_path: str, progress_callback=None, owner=None) -> str:
+        """处理视频文件
+        
+        按 VIDEO_FRAME_RATE 抽帧，跳过与上一个关键帧近似相同的帧；关键帧先查找同一用户识别过的近似重复图片，
+        其余在进程池中并行OCR，抽帧、去重与识别同时进行。每个识别出文字的关键帧前加一行时间标记，
+        抽取的实体据此标注出现的时间。
+        """
+        from video_reader import KeyframeSelector, format_timestamp, sample_frames
+        
+        selector = KeyframeSelector()
+        pool = self._video_ocr_pool()
+        keyframes = []
+        in_flight = set()
+        try:
+            for seconds, image in sample_frames(file_path):
+                with span(stage="fingerprint"):
+                    fp = fingerprint(image)
+                if not selector.is_keyframe(fp):
+                    VIDEO_FRAMES.inc(result="redundant")
+                    continue
+                VIDEO_FRAMES.inc(result="keyframe")
+                text = self._find_text(fp, owner)
+                if text is not None:
+                    OCR_IMAGES.inc(result="reused")
+                else:
+                    OCR_IMAGES.inc(result="ocr")
+                    text = pool.submit(ocr_frame_worker, image.size, image.tobytes())
+                    # 识别完成时立即保存结果，之后再次出现的相同画面（如切回上一页幻灯片）直接复用
+                    text.add_done_callback(self._remember_frame_text(fp, owner))
+                    in_flight.add(text)
+                    # 每个排队的帧带一份像素数据，排队过多时等待识别完成
+                    while len(in_flight) > 2 * VIDEO_OCR_WORKERS:
+                        in_flight = wait(in_flight, return_when=FIRST_COMPLETED).not_done
+                keyframes.append((seconds, fp, text))
+        except Exception:
+            for future in in_flight:
+                future.cancel()
+            raise
+        
+        parts = []
+        for seconds, fp, text in keyframes:
+            if not isinstance(text, str):
+                try:
+                    text = text.result()
+                except Exception as e:
+                    print(f"OCR处理失败: {str(e)}")
+                    continue
+            text = text.strip()
+            if text:
+                parts.append(f"{format_timestamp(seconds)}\n{text}")
+        return "\n".join(parts)
+    
+    def _remember_frame_text(self, fp, owner: Optional[Tuple[int, Optional[int]]]) -> Callable[[Future], None]:
+        """关键帧OCR完成时的回调：保存识别结果（失败或取消时不保存）"""
+        def callback(future: Future):
+            if not future.cancelled() and future.exception() is None:
+                self._remember_text(fp, owner, future.result())
+        return callback
+    
+    def _video_ocr_pool(self) -> ProcessPoolExecutor:
+        with self._video_pool_lock:
+            if self._video_pool is None:
+                self._video_pool = ProcessPoolExecutor(
+                    max_workers=VIDEO_OCR_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._video_pool
+    
+    def close(self):
+        """关闭视频OCR进程池"""
+        with self._video_pool_lock:
+            if self._video_pool is not None:
+                self._video_pool.shutdown()
+                self._video_pool = None
+    
+    def _ocr_bytes(self, data: bytes, owner=None) -> str:
+        """识别内存中的图片（DOCX内嵌图片）"""
+        from PIL import Image
+        
+        try:
+            return self._ocr(Image.open(io.BytesIO(data)), owner).strip()
+        except Exception as e:
+            print(f"OCR处理失败: {str(e)}")
+            return ""
+    
+    def _ocr(self, image, owner: Optional[Tuple[int, Optional[int]]] = None) -> str:
+        """OCR识别；已识别过近似重复图片（重新保存、压缩、缩放）时直接复用其文本"""
+        if self.fingerprints is None or owner is None:
+            OCR_IMAGES.inc(result="ocr")
+            return self._tesseract(image)
+        
+        try:
+            with span(stage="fingerprint"):
+                fp = fingerprint(image)
+        except Exception as e:
+            # 指纹只用于节省OCR，失败时照常识别
+            print(f"图片指纹计算失败: {str(e)}")
+            record_error("image_hash")
+            OCR_IMAGES.inc(result="ocr")
+            return self._tesseract(image)
+        text = self._find_text(fp, owner)
+        if text is not None:
+            OCR_IMAGES.inc(result="reused")
+            return text
+        
+        OCR_IMAGES.inc(result="ocr")
+        text = self._tesseract(image)
+        self._remember_text(fp, owner, text)
+        return text
+    
+    def _find_text(self, fp, owner: Optional[Tuple[int, Optional[int]]]) -> Optional[str]:
+        """同一用户识别过的近似重复图片的文本；没有或查找失败时返回 None"""
+        if self.fingerprints is None or owner is None:
+            return None
+        try:
+            with span(stage="fingerprint"):
+                return self.fingerprints.find_text(owner[0], fp)
+        except Exception as e:
+            print(f"图片指纹查找失败: {str(e)}")
+            record_error("image_hash")
+            return None
+    
+    def _remember_text(self, fp, owner: Optional[Tuple[int, Optional[int]]], text: str):
+        """保存识别结果供近似重复的图片复用"""
+        if self.fingerprints is None or owner is None:
+            return
+        try:
+            self.fingerprints.add(owner[0], owner[1], fp, text)
+        except Exception as e:
+            print(f"图片指纹保存失败: {str(e)}")
+            record_error("image_hash")
+    
+    @staticmethod
+    def _tesseract(image) -> str:
+        # 依赖导入较慢（pytesseract会引入pandas），延迟到首次使用
+        import pytesseract
+        
+        # 配置tesseract支持中文
+        custom_config = r'--oem 3 --psm 6 -l chi_sim+eng'
+        return pytesseract.image_to_string(image, config=custom_config)
+    
     def get_file_metadata(self, file_path: str) -> Dict[str, Any]:
         """获取文件元数据"""
         stat = os.stat(file_path)
@@ -0,0 +1,207 @@
+from collections import OrderedDict
+from typing import List, Dict, Any, Tuple, Hashable, Callable
+import threading
+
+import numpy as np
+
+class CSRGraph:
+    """以CSR稀疏矩阵表示的有向图（行为起点，列为终点）"""
+
+    def __init__(self, num_nodes: int, src: np.ndarray, dst: np.ndarray, weights: np.ndarray = None):
+        self.num_nodes = num_nodes
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        if weights is None:
+            weights = np.ones(len(src), dtype=np.float64)
+
+        order = np.argsort(src, kind='stable')
+        self.src = src[order]
+        self.indices = dst[order]
+        self.weights = np.asarray(weights, dtype=np.float64)[order]
+        self.indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.src, minlength=num_nodes), out=self.indptr[1:])
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.indices)
+
+    def out_degree(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    def in_degree(self) -> np.ndarray:
+        return np.bincount(self.indices, minlength=self.num_nodes)
+
+    def undirected(self) -> Tuple[np.ndarray, np.ndarray]:
+        """返回去掉自环的双向边列表"""
+        mask = self.src != self.indices
+        src, dst = self.src[mask], self.indices[mask]
+        return np.concatenate([src, dst]), np.concatenate([dst, src])
+
+def degree_centrality(graph: CSRGraph) -> np.ndarray:
+    """度中心性（出度+入度，按 n-1 归一化）"""
+    degree = graph.out_degree() + graph.in_degree()
+    return degree / max(graph.num_nodes - 1, 1)
+
+def pagerank(graph: CSRGraph, damping: float = 0.85, tol: float = 1e-6, max_iter: int = 100) -> np.ndarray:
+    """幂迭代计算PageRank，悬挂节点的权重均匀分配给所有节点"""
+    n = graph.num_nodes
+    if n == 0:
+        return np.zeros(0)
+
+    out_weight = np.bincount(graph.src, weights=graph.weights, minlength=n)
+    dangling = out_weight == 0
+    # 每条边上传递的比例
+    edge_share = graph.weights / np.where(dangling, 1.0, out_weight)[graph.src]
+
+    rank = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        contributions = np.bincount(graph.indices, weights=rank[graph.src] * edge_share, minlength=n)
+        new_rank = (1 - damping) / n + damping * (contributions + rank[dangling].sum() / n)
+        converged = np.abs(new_rank - rank).sum() < tol
+        rank = new_rank
+        if converged:
+            break
+    return rank
+
+def _group_by_target(src: np.ndarray, dst: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """按终点排序边，返回(排序后的起点, 有入边的节点, 每组起始位置)，供 reduceat 分组计算"""
+    order = np.argsort(dst, kind='stable')
+    src, dst = src[order], dst[order]
+    starts = np.flatnonzero(np.r_[True, dst[1:] != dst[:-1]]) if len(dst) else np.zeros(0, dtype=np.int64)
+    return src, dst[starts], starts
+
+def connected_components(graph: CSRGraph) -> np.ndarray:
+    """弱连通分量：最小标签传播 + 指针跳跃，返回从0开始连续编号的分量ID"""
+    n = graph.num_nodes
+    labels = np.arange(n)
+    src, targets, starts = _group_by_target(*graph.undirected())
+    while len(src):
+        new_labels = labels.copy()
+        neighbor_min = np.minimum.reduceat(labels[src], starts)
+        new_labels[targets] = np.minimum(labels[targets], neighbor_min)
+        # 指针跳跃，加速长链收敛
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+    return np.unique(labels, return_inverse=True)[1]
+
+def label_propagation(graph: CSRGraph, max_iter: int = 20, seed: int = 0) -> np.ndarray:
+    """同步标签传播社区发现
+
+    每轮每个节点取邻居中出现次数最多的标签（自身标签计一票以避免振荡，平局取较小标签），
+    返回从0开始连续编号的社区ID。
+    """
+    n = graph.num_nodes
+    labels = np.random.default_rng(seed).permutation(n)
+    src, dst = graph.undirected()
+    src = np.concatenate([src, np.arange(n)])
+    dst = np.concatenate([dst, np.arange(n)])
+    # 预先按终点排序，之后每轮的键已按节点分段有序，稳定排序只需处理段内顺序
+    order = np.argsort(dst, kind='stable')
+    src, base = src[order], dst[order] * n
+
+    for _ in range(max_iter):
+        keys = np.sort(base + labels[src], kind='stable')
+        # 相同(节点, 标签)构成一段，段长即票数
+        run_starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        counts = np.diff(np.r_[run_starts, len(keys)])
+        run_keys = keys[run_starts]
+        run_nodes = run_keys // n
+        run_labels = run_keys % n
+        # 票数优先、标签较小者次之，编码为单个分数后按节点分组取最大
+        scores = counts * n + (n - 1 - run_labels)
+        node_starts = np.flatnonzero(np.r_[True, run_nodes[1:] != run_nodes[:-1]])
+        best = np.maximum.reduceat(scores, node_starts)
+        new_labels = labels.copy()
+        new_labels[run_nodes[node_starts]] = n - 1 - best % n
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+    return np.unique(labels, return_inverse=True)[1]
+
+class GraphAnalytics:
+    """图谱分析器
+
+    将图谱可视化数据转换为CSR矩阵并计算度中心性、PageRank、连通分量和社区，
+    结果按调用方给出的版本键缓存（LRU）。
+    """
+
+    def __init__(self, max_cache_entries: int = 128):
+        self.max_cache_entries = max_cache_entries
+        self._cache: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def analyze(self, cache_key: Hashable, load_graphs: Callable[[], List[Dict[str, Any]]],
+                merge_by_text: bool = False) -> Dict[str, Any]:
+        """分析一个或多个图谱
+
+        load_graphs 返回要分析的图谱可视化数据，只在缓存未命中时调用，命中时不必解压和重建图谱。
+        merge_by_text 为 True 时按实体文本合并不同文件中的同名节点（用于用户级语料分析），
+        否则按节点ID区分。
+        """
+        with self._lock:
+            if cache_key in self._cache:
+                self._cache.move_to_end(cache_key)
+                return self._cache[cache_key]
+
+        result = self._compute(load_graphs(), merge_by_text)
+
+        with self._lock:
+            self._cache[cache_key] = result
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > self.max_cache_entries:
+                self._cache.popitem(last=False)
+        return result
+
+    def _compute(self, graphs: List[Dict[str, Any]], merge_by_text: bool) -> Dict[str, Any]:
+        node_index = {}
+        node_info = []
+        id_to_key = {}
+        for graph_data in graphs:
+            for node in graph_data.get('nodes', []):
+                key = node['label'] if merge_by_text else node['id']
+                id_to_key[node['id']] = key
+                if key not in node_index:
+                    node_index[key] = len(node_info)
+                    node_info.append({'id': key, 'text': node['label'], 'type': node.get('type')})
+
+        src, dst, weights = [], [], []
+        for graph_data in graphs:
+            for edge in graph_data.get('edges', []):
+                source = node_index.get(id_to_key.get(edge['source']))
+                target = node_index.get(id_to_key.get(edge['target']))
+                if source is None or target is None:
+                    continue
+                src.append(source)
+                dst.append(target)
+                weights.append(edge.get('confidence') or 1.0)
+
+        graph = CSRGraph(len(node_info), np.array(src, dtype=np.int64),
+                         np.array(dst, dtype=np.int64), np.array(weights, dtype=np.float64))
+        degree = degree_centrality(graph)
+        ranks = pagerank(graph)
+        components = connected_components(graph)
+        communities = label_propagation(graph)
+
+        nodes = []
+        for i, info in enumerate(node_info):
+            nodes.append({
+                **info,
+                'degree': float(degree[i]),
+                'pagerank': float(ranks[i]),
+                'component': int(components[i]),
+                'community': int(communities[i])
+            })
+
+        top = np.argsort(-ranks)[:10] if len(node_info) else []
+        return {
+            'nodes': nodes,
+            'summary': {
+                'total_nodes': graph.num_nodes,
+                'total_edges': graph.num_edges,
+                'components': int(components.max()) + 1 if len(components) else 0,
+                'communities': int(communities.max()) + 1 if len(communities) else 0,
+                'top_nodes': [node_info[i]['id'] for i in top]
+            }
+        }
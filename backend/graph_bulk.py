@@ -0,0 +1,211 @@
+"""知识图谱的离线批量导出，生成 neo4j-admin database import 可直接使用的CSV
+
+    python graph_bulk.py export-sqlite --output exports/graph   # 从SQLite中已保存的图谱生成CSV
+    python graph_bulk.py export-neo4j --output exports/graph    # 从运行中的Neo4j流式导出CSV
+
+导出后用 neo4j-admin 离线导入（数据库需停止），比逐文件通过Bolt执行 MERGE 快几个数量级：
+
+    neo4j-admin database import full --overwrite-destination --multiline-fields=true \\
+        --nodes=exports/graph/nodes.csv --relationships=exports/graph/relationships.csv neo4j
+
+两种导出都按块读取（SQLite 使用 yield_per 游标，Neo4j 使用 fetch_size 分批拉取），内存占用与总数据量无关。
+"""
+from typing import Dict, Iterator, List, Optional, Tuple
+import argparse
+import csv
+import gzip
+import os
+import sys
+import time
+
+# 每批读取的记录数（SQLite为文件数，Neo4j为节点/边数）
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "1000"))
+
+NODE_HEADER = ["id:ID", "text", "label", "confidence:float", "start:int", "end:int", "file_id:long",
+               "user_id:long", ":LABEL"]
+RELATIONSHIP_HEADER = [":START_ID", ":END_ID", "type", "confidence:float", "context", "file_id:long",
+                       "user_id:long", ":TYPE"]
+
+def file_graph_rows(file_id: int, user_id: int, entities: List[Dict],
+                    relations: List[Dict]) -> Tuple[List[list], List[list]]:
+    """把一个文件的实体和关系转换为CSV行，合并规则与 Neo4jGraphBackend 的 MERGE 相同：
+
+    节点按 (文本, 文件) 合并、边按 (起点, 终点, 类型, 文件) 合并，重复时保留最高置信度；
+    起点或终点不在实体中的关系被丢弃。节点ID为“文件ID-序号”，同一数据重复导出的结果一致。
+    """
+    nodes: Dict[str, list] = {}
+    for entity in entities:
+        confidence = entity.get('confidence', 0.0)
+        row = nodes.get(entity['text'])
+        if row is None:
+            nodes[entity['text']] = [f"{file_id}-{len(nodes)}", entity['text'], entity['label'],
+                                     confidence, entity.get('start', 0), entity.get('end', 0), file_id, user_id,
+                                     "Entity"]
+        elif row[3] < confidence:
+            row[3] = confidence
+
+    edges: Dict[tuple, list] = {}
+    for relation in relations:
+        subject = nodes.get(relation['subject'])
+        obj = nodes.get(relation['object'])
+        if subject is None or obj is None:
+            continue
+        key = (subject[0], obj[0], relation['predicate'])
+        confidence = relation.get('confidence', 0.0)
+        row = edges.get(key)
+        if row is None:
+            edges[key] = [subject[0], obj[0], relation['predicate'], confidence,
+                          relation.get('context', ''), file_id, user_id, "RELATION"]
+        elif row[3] < confidence:
+            row[3] = confidence
+
+    return list(nodes.values()), list(edges.values())
+
+class CSVGraphWriter:
+    """写出节点和关系CSV（可选gzip，neo4j-admin 可直接读取 .csv.gz）"""
+
+    def __init__(self, output_dir: str, compress: bool = False):
+        os.makedirs(output_dir, exist_ok=True)
+        suffix = ".csv.gz" if compress else ".csv"
+        self.nodes_path = os.path.join(output_dir, "nodes" + suffix)
+        self.relationships_path = os.path.join(output_dir, "relationships" + suffix)
+        opener = (lambda path: gzip.open(path, "wt", encoding="utf-8", newline="")) if compress else \
+            (lambda path: open(path, "w", encoding="utf-8", newline=""))
+        self._files = [opener(self.nodes_path), opener(self.relationships_path)]
+        self._nodes = csv.writer(self._files[0])
+        self._relationships = csv.writer(self._files[1])
+        self._nodes.writerow(NODE_HEADER)
+        self._relationships.writerow(RELATIONSHIP_HEADER)
+        self.node_count = 0
+        self.relationship_count = 0
+
+    def write_nodes(self, rows: List[list]):
+        self._nodes.writerows(rows)
+        self.node_count += len(rows)
+
+    def write_relationships(self, rows: List[list]):
+        self._relationships.writerows(rows)
+        self.relationship_count += len(rows)
+
+    def close(self):
+        for f in self._files:
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+def iter_sqlite_graphs(db, chunk_size: int = BULK_CHUNK_SIZE) -> Iterator[Tuple[int, int, List[Dict], List[Dict]]]:
+    """逐个文件读取当前版本的 (文件ID, 用户ID, 实体, 关系)"""
+    from content_store import content_store
+    from models import FileRecord, KnowledgeGraph
+
+    query = db.query(KnowledgeGraph.file_id, FileRecord.user_id, KnowledgeGraph.entities,
+                     KnowledgeGraph.relations).join(
+        FileRecord, FileRecord.id == KnowledgeGraph.file_id
+    ).order_by(KnowledgeGraph.file_id).yield_per(chunk_size)
+    for file_id, user_id, entities, relations in query:
+        yield file_id, user_id, content_store.unpack_json(entities, []), content_store.unpack_json(relations, [])
+
+def export_sqlite(output_dir: str, chunk_size: int = BULK_CHUNK_SIZE, compress: bool = False,
+                  db=None) -> Dict[str, float]:
+    """把SQLite中全部文件的图谱导出为CSV，返回统计信息"""
+    from database import SessionLocal
+
+    started = time.perf_counter()
+    own_session = db is None
+    db = db or SessionLocal()
+    files = 0
+    try:
+        with CSVGraphWriter(output_dir, compress) as writer:
+            for file_id, user_id, entities, relations in iter_sqlite_graphs(db, chunk_size):
+                nodes, edges = file_graph_rows(file_id, user_id, entities, relations)
+                writer.write_nodes(nodes)
+                writer.write_relationships(edges)
+                files += 1
+    finally:
+        if own_session:
+            db.close()
+    return _summary(writer, started, files=files)
+
+def export_neo4j(output_dir: str, chunk_size: int = BULK_CHUNK_SIZE, compress: bool = False,
+                 driver=None) -> Dict[str, float]:
+    """从Neo4j流式导出全部实体和关系为CSV（驱动按 fetch_size 分批拉取结果）"""
+    from database import get_neo4j_driver
+
+    started = time.perf_counter()
+    own_driver = driver is None
+    driver = driver or get_neo4j_driver()
+    try:
+        with CSVGraphWriter(output_dir, compress) as writer, driver.session(fetch_size=chunk_size) as session:
+            batch = []
+            for record in session.run(
+                "MATCH (n:Entity) RETURN n.id AS id, n.text AS text, n.label AS label, "
+                "n.confidence AS confidence, n.start AS start, n.end AS end, n.file_id AS file_id, "
+                "n.user_id AS user_id"
+            ):
+                batch.append([record['id'], record['text'], record['label'], record['confidence'],
+                              record['start'], record['end'], record['file_id'], record['user_id'], "Entity"])
+                if len(batch) >= chunk_size:
+                    writer.write_nodes(batch)
+                    batch = []
+            writer.write_nodes(batch)
+
+            batch = []
+            for record in session.run(
+                "MATCH (s:Entity)-[r:RELATION]->(o:Entity) RETURN s.id AS source, o.id AS target, "
+                "r.type AS type, r.confidence AS confidence, r.context AS context, r.file_id AS file_id, "
+                "r.user_id AS user_id"
+            ):
+                batch.append([record['source'], record['target'], record['type'], record['confidence'],
+                              record['context'], record['file_id'], record['user_id'], "RELATION"])
+                if len(batch) >= chunk_size:
+                    writer.write_relationships(batch)
+                    batch = []
+            writer.write_relationships(batch)
+    finally:
+        if own_driver:
+            driver.close()
+    return _summary(writer, started)
+
+def _summary(writer: CSVGraphWriter, started: float, **extra) -> Dict[str, float]:
+    return {
+        'nodes': writer.node_count,
+        'relationships': writer.relationship_count,
+        'seconds': round(time.perf_counter() - started, 3),
+        'nodes_path': writer.nodes_path,
+        'relationships_path': writer.relationships_path,
+        **extra
+    }
+
+def import_command(summary: Dict[str, float], database: str = "neo4j") -> str:
+    """对应的 neo4j-admin 离线导入命令（Neo4j 5）"""
+    return (
+        "neo4j-admin database import full --overwrite-destination --multiline-fields=true "
+        f"--nodes={summary['nodes_path']} --relationships={summary['relationships_path']} {database}"
+    )
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="知识图谱批量导出（neo4j-admin CSV格式）")
+    parser.add_argument("source", choices=["export-sqlite", "export-neo4j"], help="数据来源")
+    parser.add_argument("--output", required=True, help="CSV输出目录")
+    parser.add_argument("--chunk-size", type=int, default=BULK_CHUNK_SIZE, help="每批读取的记录数")
+    parser.add_argument("--gzip", action="store_true", help="输出 .csv.gz")
+    parser.add_argument("--database", default="neo4j", help="导入命令中的目标数据库名")
+    args = parser.parse_args(argv)
+
+    if args.source == "export-sqlite":
+        summary = export_sqlite(args.output, args.chunk_size, args.gzip)
+    else:
+        summary = export_neo4j(args.output, args.chunk_size, args.gzip)
+
+    print(f"导出完成: {summary['nodes']} 个节点, {summary['relationships']} 条关系, 耗时 {summary['seconds']}s")
+    print("离线导入命令（需先停止Neo4j）:")
+    print("  " + import_command(summary, args.database))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
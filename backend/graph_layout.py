@@ -0,0 +1,379 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, Tuple
+import json
+import os
+import threading
+import time
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from content_store import ContentStore, content_store
+from graph_analytics import CSRGraph, label_propagation
+from graph_versions import graph_records
+from knowledge_graph import visualization_data
+from models import KnowledgeGraph
+
+# 完整布局、增量布局的力导向迭代次数
+GRAPH_LAYOUT_ITERATIONS = int(os.getenv("GRAPH_LAYOUT_ITERATIONS", "100"))
+GRAPH_LAYOUT_INCREMENTAL_ITERATIONS = int(os.getenv("GRAPH_LAYOUT_INCREMENTAL_ITERATIONS", "30"))
+# 与上一版本相比新增和删除的节点不超过该比例时增量布局，否则重新布局
+GRAPH_LAYOUT_INCREMENTAL_MAX_CHANGE = float(os.getenv("GRAPH_LAYOUT_INCREMENTAL_MAX_CHANGE", "0.2"))
+# 输出坐标中理想边长对应的像素数（与前端默认连线长度相当）
+LAYOUT_UNIT = 80.0
+# 把所有节点拉向中心的线性引力系数，平衡远距斥力，避免不连通的分量无限远离
+LAYOUT_GRAVITY = 1.0
+# 超过该节点数时先按社区粗化、布局社区图，再展开细化（多层布局）
+LAYOUT_COARSEN_MIN_NODES = 2000
+
+def _undirected(src: np.ndarray, dst: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    mask = src != dst
+    src, dst = src[mask], dst[mask]
+    return np.concatenate([src, dst]), np.concatenate([dst, src])
+
+def spectral_layout(num_nodes: int, src: np.ndarray, dst: np.ndarray, iterations: int = 100,
+                    seed: int = 0) -> np.ndarray:
+    """谱布局：随机游走矩阵 D⁻¹A 第二、三大特征向量作为坐标（作为力导向布局的初值）
+
+    对 (I + D⁻¹A) / 2 做幂迭代，每轮按度数加权与常向量及彼此正交化；
+    每轮只需按边做一次 bincount，代价与边数成正比，不需要稠密矩阵或分解。
+    """
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((num_nodes, 2))
+    if num_nodes < 3:
+        return vectors
+    src, dst = _undirected(src, dst)
+    degree = np.bincount(src, minlength=num_nodes).astype(np.float64)
+    degree[degree == 0] = 1.0
+
+    def normalize(vector: np.ndarray) -> np.ndarray:
+        norm = np.sqrt((vector * vector * degree).sum())
+        return vector / norm if norm > 0 else vector
+
+    for _ in range(iterations):
+        for k in range(2):
+            vector = vectors[:, k]
+            vector = 0.5 * (vector + np.bincount(dst, weights=vector[src], minlength=num_nodes) / degree)
+            vector = vector - (vector * degree).sum() / degree.sum()
+            if k == 1:
+                vector = vector - (vector * vectors[:, 0] * degree).sum() * vectors[:, 0]
+            vectors[:, k] = normalize(vector)
+    return vectors
+
+def _grid_size(num_nodes: int) -> int:
+    """斥力网格的边长（2的幂，平均每格约一个节点）"""
+    size = 32
+    while size * size < num_nodes and size < 512:
+        size *= 2
+    return size
+
+@lru_cache(maxsize=8)
+def _repulsion_kernel(grid: int) -> Tuple[np.ndarray, np.ndarray]:
+    """斥力核 d/|d|² 的傅里叶变换（以格为单位，按循环卷积的方式排列在 2grid × 2grid 的网格上）"""
+    size = 2 * grid
+    offsets = np.fft.fftfreq(size, 1.0 / size)
+    dx, dy = np.meshgrid(offsets, offsets, indexing='ij')
+    # 软化距离，避免同一格内的节点产生过大的斥力
+    r2 = dx * dx + dy * dy + 1.0
+    return np.fft.rfft2(dx / r2), np.fft.rfft2(dy / r2)
+
+class _Mesh:
+    """斥力（大小 1/d）的网格近似
+
+    节点质量按双线性权重分配到网格（cloud-in-cell），与斥力核做一次FFT卷积得到每格的力场，
+    再以相同的权重插值回节点。代价为 O(n + G² log G)，不随节点数平方增长；
+    分配与插值使用相同权重且核为奇函数，节点对自身的作用恰好抵消。
+    """
+
+    def __init__(self, positions: np.ndarray):
+        self.grid = _grid_size(len(positions))
+        self.size = 2 * self.grid
+        # 网格只覆盖绝大多数节点所在的范围，个别远离的节点按网格边缘计算，不至于把网格拉得过粗
+        low, high = np.quantile(positions, [0.001, 0.999], axis=0)
+        self.cell = max(float((high - low).max()) / (self.grid - 3), 1e-9)
+        self.low = low - self.cell
+
+    def _weights(self, positions: np.ndarray):
+        grid, size = self.grid, self.size
+        scaled = np.clip((positions - self.low) / self.cell, 0, grid - 1.000001)
+        corner = np.minimum(scaled.astype(np.int64), grid - 2)
+        frac = scaled - corner
+        fx, fy = frac[:, 0], frac[:, 1]
+        base = corner[:, 0] * size + corner[:, 1]
+        return ((base, base + size, base + 1, base + size + 1),
+                ((1 - fx) * (1 - fy), fx * (1 - fy), (1 - fx) * fy, fx * fy))
+
+    def field(self, positions: np.ndarray) -> np.ndarray:
+        """positions 处的节点在每个格点产生的斥力场，形状 (2, 格点数)"""
+        size = self.size
+        density = np.zeros(size * size)
+        for index, weight in zip(*self._weights(positions)):
+            density += np.bincount(index, weights=weight, minlength=size * size)
+        density_fft = np.fft.rfft2(density.reshape(size, size))
+        # 核以格为单位，换算为实际距离下的 1/d
+        return np.stack([np.fft.irfft2(density_fft * kernel, s=(size, size)).ravel() / self.cell
+                         for kernel in _repulsion_kernel(self.grid)])
+
+    def sample(self, field: np.ndarray, positions: np.ndarray) -> np.ndarray:
+        force = np.zeros((len(positions), 2))
+        for index, weight in zip(*self._weights(positions)):
+            force += weight[:, None] * field[:, index].T
+        return force
+
+def _repulsion(positions: np.ndarray) -> np.ndarray:
+    """所有节点之间的斥力"""
+    mesh = _Mesh(positions)
+    return mesh.sample(mesh.field(positions), positions)
+
+def force_layout(positions: np.ndarray, src: np.ndarray, dst: np.ndarray, iterations: int = 100,
+                 movable: Optional[np.ndarray] = None, temperature: Optional[float] = None) -> np.ndarray:
+    """Fruchterman-Reingold 力导向布局（理想边长为1）
+
+    斥力用网格卷积近似，引力（d²）按边向量化累加，另加指向中心的线性引力；
+    每个节点每轮的位移不超过随迭代线性降低的温度。movable 给出时只移动其中的节点（增量布局）：
+    固定节点的斥力场只计算一次，之后每轮只对移动的节点及与其相连的边计算。
+    """
+    positions = np.array(positions, dtype=np.float64)
+    n = len(positions)
+    if n < 2 or iterations <= 0:
+        return positions
+    mask = src != dst
+    src, dst = src[mask], dst[mask]
+    if temperature is None:
+        temperature = max(np.sqrt(n) / 10, 1.0)
+
+    moving = np.arange(n) if movable is None else np.flatnonzero(movable)
+    if movable is not None:
+        mesh = _Mesh(positions)
+        fixed_field = mesh.field(positions[~movable])
+        touched = movable[src] | movable[dst]
+        src, dst = src[touched], dst[touched]
+    # 边的端点在 moving 中的序号（固定端为 -1）
+    local = np.full(n, -1)
+    local[moving] = np.arange(len(moving))
+    source, target = local[src], local[dst]
+    source_mask, target_mask = source >= 0, target >= 0
+    source, target = source[source_mask], target[target_mask]
+
+    for iteration in range(iterations):
+        current = positions[moving]
+        if movable is None:
+            force = _repulsion(current)
+        else:
+            force = mesh.sample(fixed_field + mesh.field(current), current)
+        delta = positions[dst] - positions[src]
+        pull = delta * np.sqrt((delta * delta).sum(axis=1))[:, None]
+        for axis in range(2):
+            force[:, axis] += (np.bincount(source, weights=pull[source_mask, axis], minlength=len(moving))
+                               - np.bincount(target, weights=pull[target_mask, axis], minlength=len(moving)))
+        force -= LAYOUT_GRAVITY * (current - positions.mean(axis=0))
+
+        limit = temperature * (1 - iteration / iterations)
+        length = np.sqrt((force * force).sum(axis=1))
+        positions[moving] = current + force * (np.minimum(length, limit) / np.where(length > 0, length, 1.0))[:, None]
+    return positions
+
+def graph_arrays(graph_data: Dict[str, Any]) -> Tuple[list, np.ndarray, np.ndarray]:
+    """图谱可视化数据中的节点列表和以节点序号表示的边"""
+    nodes = graph_data.get('nodes', [])
+    index = {node['id']: i for i, node in enumerate(nodes)}
+    src, dst = [], []
+    for edge in graph_data.get('edges', []):
+        source, target = index.get(edge['source']), index.get(edge['target'])
+        if source is not None and target is not None:
+            src.append(source)
+            dst.append(target)
+    return nodes, np.array(src, dtype=np.int64), np.array(dst, dtype=np.int64)
+
+def has_layout(graph_data: Dict[str, Any]) -> bool:
+    return 'layout' in graph_data
+
+def node_positions(graph_data: Dict[str, Any]) -> Dict[str, Tuple[float, float]]:
+    """已布局节点的坐标（按实体文本，不同版本中同一实体的节点ID不同）"""
+    return {node['label']: (node['x'], node['y']) for node in graph_data.get('nodes', [])
+            if 'x' in node and 'y' in node}
+
+def _layout_document(graph_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """KnowledgeGraph.layout 保存的内容：布局信息和按实体文本的坐标"""
+    if not has_layout(graph_data):
+        return None
+    return {'layout': graph_data['layout'],
+            'positions': {text: list(position) for text, position in node_positions(graph_data).items()}}
+
+def legacy_layout(graph_data_json: Optional[str]) -> Optional[bytes]:
+    """旧格式的完整可视化数据中的布局，转换为压缩的布局坐标"""
+    document = _layout_document(json.loads(graph_data_json)) if graph_data_json else None
+    return content_store.pack_json('layout', document, dictionary=False) if document else None
+
+def graph_view(kg: KnowledgeGraph, store: ContentStore = content_store) -> Dict[str, Any]:
+    """图谱记录的可视化数据：由实体和关系生成，附上已计算的布局坐标（旧数据取自保存的可视化数据）"""
+    graph_data = visualization_data(*graph_records(kg, store), kg.file_id)
+    if kg.layout is not None:
+        document = store.unpack_json(kg.layout)
+    else:
+        document = _layout_document(json.loads(kg.graph_data)) if kg.graph_data else None
+    if document:
+        positions = document['positions']
+        for node in graph_data['nodes']:
+            position = positions.get(node['label'])
+            if position is not None:
+                node['x'], node['y'] = position
+        graph_data['layout'] = document['layout']
+    return graph_data
+
+def compute_layout(graph_data: Dict[str, Any],
+                   previous: Optional[Dict[str, Tuple[float, float]]] = None) -> Tuple[np.ndarray, str]:
+    """计算节点坐标（像素），返回 (坐标数组, 布局方式)
+
+    previous 为上一版本的节点坐标：变化不大时增量布局，未变化的节点保持原位置，
+    新节点放在已布局邻居的中心附近，只让新节点及其邻居参与力导向迭代；
+    否则用谱布局初值加完整的力导向迭代重新布局。
+    """
+    nodes, src, dst = graph_arrays(graph_data)
+    n = len(nodes)
+    rng = np.random.default_rng(0)
+    if n == 0:
+        return np.zeros((0, 2)), 'full'
+
+    if previous:
+        known = np.array([node['label'] in previous for node in nodes], dtype=bool)
+        labels = {node['label'] for node in nodes}
+        changed = int((~known).sum()) + sum(1 for label in previous if label not in labels)
+        if changed <= GRAPH_LAYOUT_INCREMENTAL_MAX_CHANGE * n:
+            positions = np.zeros((n, 2))
+            for i, node in enumerate(nodes):
+                if known[i]:
+                    positions[i] = previous[node['label']]
+            positions /= LAYOUT_UNIT
+            if known.all():
+                return positions * LAYOUT_UNIT, 'unchanged'
+            return _incremental(positions, known, src, dst, rng) * LAYOUT_UNIT, 'incremental'
+
+    positions = _full_layout(n, src, dst, rng)
+    return (positions - positions.mean(axis=0)) * LAYOUT_UNIT, 'full'
+
+def _full_layout(n: int, src: np.ndarray, dst: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """完整布局（理想边长为1）
+
+    节点较少时以谱布局为初值；较多时力导向迭代难以把相距很远的同社区节点拉到一起，
+    先用标签传播划分社区，递归布局社区之间的粗化图，再把每个节点放到所在社区的位置附近细化。
+    """
+    communities = None
+    if n > LAYOUT_COARSEN_MIN_NODES:
+        communities = label_propagation(CSRGraph(n, src, dst))
+        count = int(communities.max()) + 1
+        if count > n // 2:
+            communities = None
+
+    if communities is None:
+        positions = spectral_layout(n, src, dst)
+        # 谱布局坐标缩放到与节点数相当的面积，叠加少量扰动以分开重合的节点（如孤立节点）
+        spread = positions.std(axis=0)
+        positions = np.clip(positions / np.where(spread > 0, spread, 1.0), -3, 3) * (np.sqrt(n) / 2)
+        positions += rng.normal(scale=0.5, size=positions.shape)
+        return force_layout(positions, src, dst, GRAPH_LAYOUT_ITERATIONS)
+
+    outer = communities[src] != communities[dst]
+    coarse = _full_layout(count, communities[src][outer], communities[dst][outer], rng)
+    # 社区图的坐标按平均社区大小放大，使每个社区有容纳其成员的面积，细化阶段只需局部调整
+    scale = np.sqrt(n / count)
+    positions = coarse[communities] * scale + rng.normal(scale=scale / 2, size=(n, 2))
+    return force_layout(positions, src, dst, GRAPH_LAYOUT_ITERATIONS, temperature=scale)
+
+def _incremental(positions: np.ndarray, known: np.ndarray, src: np.ndarray, dst: np.ndarray,
+                 rng: np.random.Generator) -> np.ndarray:
+    n = len(positions)
+    both_src, both_dst = _undirected(src, dst)
+    # 新节点的初始位置：已布局邻居的中心，没有这样的邻居时随机放在已布局区域内
+    from_known = known[both_src]
+    counts = np.bincount(both_dst[from_known], minlength=n)
+    centers = np.stack([np.bincount(both_dst[from_known], weights=positions[both_src[from_known], axis],
+                                    minlength=n) for axis in range(2)], axis=1)
+    low, high = positions[known].min(axis=0), positions[known].max(axis=0)
+    placed = np.where(counts[:, None] > 0, centers / np.maximum(counts, 1)[:, None],
+                      rng.uniform(low, high, size=(n, 2)))
+    new = ~known
+    positions[new] = placed[new] + rng.normal(scale=0.5, size=(int(new.sum()), 2))
+    # 新节点及其邻居参与迭代
+    movable = new.copy()
+    movable[both_dst[new[both_src]]] = True
+    return force_layout(positions, src, dst, GRAPH_LAYOUT_INCREMENTAL_ITERATIONS, movable=movable, temperature=2.0)
+
+class GraphLayoutManager:
+    """图谱布局的后台计算
+
+    每个图谱版本保存后提交一次布局任务，在后台线程中计算，完成后把按实体文本的坐标
+    （x、y，单位为像素，以原点为中心）和布局信息压缩写入该版本的 KnowledgeGraph.layout，
+    读取时合并到生成的可视化数据中；写回时图谱已有更新的版本则放弃结果。
+    增量布局依据保存新版本之前读取的上一版本坐标。
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], workers: int = 1):
+        self._session_factory = session_factory
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="graph-layout")
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def current_positions(self, db: Session, file_id: int) -> Optional[Dict[str, Tuple[float, float]]]:
+        """文件当前版本的节点坐标（在保存新版本之前调用，供新版本增量布局）"""
+        row = db.query(KnowledgeGraph.layout, KnowledgeGraph.graph_data).filter(
+            KnowledgeGraph.file_id == file_id
+        ).first()
+        if row is None:
+            return None
+        if row.layout is not None:
+            positions = content_store.unpack_json(row.layout)['positions']
+            return {text: tuple(position) for text, position in positions.items()} or None
+        if row.graph_data:
+            return node_positions(json.loads(row.graph_data)) or None
+        return None
+
+    def submit(self, file_id: int, version: int, previous: Optional[Dict[str, Tuple[float, float]]] = None):
+        """提交某个版本的布局任务（同一版本已在排队或计算中时忽略）"""
+        key = (file_id, version)
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        try:
+            self._executor.submit(self._run, file_id, version, previous)
+        except RuntimeError:
+            # 已关闭
+            with self._lock:
+                self._pending.discard(key)
+
+    def _run(self, file_id: int, version: int, previous: Optional[Dict[str, Tuple[float, float]]]):
+        db = self._session_factory()
+        try:
+            row = db.query(KnowledgeGraph).filter(
+                KnowledgeGraph.file_id == file_id,
+                KnowledgeGraph.version == version
+            ).first()
+            if row is None:
+                return
+            graph_data = visualization_data(*graph_records(row), file_id)
+            started = time.perf_counter()
+            positions, mode = compute_layout(graph_data, previous)
+            document = {
+                'layout': {'version': version, 'mode': mode, 'seconds': round(time.perf_counter() - started, 3)},
+                'positions': {node['label']: [round(x, 1), round(y, 1)]
+                              for node, (x, y) in zip(graph_data.get('nodes', []), positions.tolist())}
+            }
+            # 只在版本未变时写回，避免覆盖计算期间保存的新版本（旧格式的完整可视化数据随之清除）
+            db.query(KnowledgeGraph).filter(
+                KnowledgeGraph.file_id == file_id,
+                KnowledgeGraph.version == version
+            ).update({KnowledgeGraph.layout: content_store.pack_json('layout', document, dictionary=False),
+                      KnowledgeGraph.graph_data: None},
+                     synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            print(f"图谱布局失败(file_id={file_id}, version={version}): {e}")
+        finally:
+            db.close()
+            with self._lock:
+                self._pending.discard((file_id, version))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,223 @@
+from collections import Counter
+from typing import List, Dict, Any, Optional
+import json
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from graph_versions import graph_records
+from models import FileRecord, KnowledgeGraph, GraphStatistics, UserGraphStatistics
+from records import Entity, Relation
+
+class GraphStatsManager:
+    """图谱统计管理器
+
+    在文件入库/删除时增量维护文件级与用户级计数，查询时直接读取汇总行，
+    不再对整个图谱做聚合查询。reconcile() 用于定期从已保存的图谱数据重建计数，
+    修正因异常中断等原因产生的偏差。用户汇总行在读-改-写之前先锁定（见 _lock_user_stats），
+    多个worker同时入库时不会丢失增量。
+    """
+
+    def record_file(self, db: Session, file_record: FileRecord,
+                    entities: List[Entity], relations: List[Relation]):
+        """记录文件的图谱统计（重复处理同一文件时按差值更新用户汇总）"""
+        entity_types = Counter(e.label for e in entities)
+        relation_types = Counter(r.predicate for r in relations)
+
+        user_stats = self._lock_user_stats(db, file_record.user_id)
+        file_stats = db.query(GraphStatistics).filter(
+            GraphStatistics.file_id == file_record.id
+        ).first()
+
+        if file_stats:
+            # 先撤销旧的计数，再叠加新的计数
+            self._apply(user_stats, file_stats.total_entities, file_stats.total_relations,
+                        json.loads(file_stats.entity_types), json.loads(file_stats.relation_types),
+                        sign=-1)
+        else:
+            file_stats = GraphStatistics(file_id=file_record.id, user_id=file_record.user_id)
+            db.add(file_stats)
+            user_stats.files_processed = (user_stats.files_processed or 0) + 1
+
+        file_stats.total_entities = len(entities)
+        file_stats.total_relations = len(relations)
+        file_stats.entity_types = json.dumps(entity_types, ensure_ascii=False)
+        file_stats.relation_types = json.dumps(relation_types, ensure_ascii=False)
+
+        self._apply(user_stats, len(entities), len(relations), entity_types, relation_types)
+
+    def remove_file(self, db: Session, file_id: int):
+        """删除文件时扣减统计"""
+        file_stats = db.query(GraphStatistics).filter(GraphStatistics.file_id == file_id).first()
+        if not file_stats:
+            return
+
+        user_stats = self._lock_user_stats(db, file_stats.user_id)
+        self._apply(user_stats, file_stats.total_entities, file_stats.total_relations,
+                    json.loads(file_stats.entity_types), json.loads(file_stats.relation_types),
+                    sign=-1)
+        user_stats.files_processed = max((user_stats.files_processed or 0) - 1, 0)
+        db.delete(file_stats)
+
+    def touch(self, db: Session, user_id: int):
+        """图存储中的内容可能已变化但统计未更新时（如重新处理中途失败）使查询缓存失效"""
+        self._lock_user_stats(db, user_id)
+
+    def generation(self, db: Session, user_id: int) -> int:
+        """用户的图谱代数（图谱内容每次变化后加一）"""
+        value = db.query(UserGraphStatistics.graph_generation).filter(
+            UserGraphStatistics.user_id == user_id
+        ).scalar()
+        return value or 0
+
+    def get_stats(self, db: Session, user_id: int, file_id: Optional[int] = None) -> Dict[str, Any]:
+        """获取统计信息（字段与GraphStats Schema一致）"""
+        if file_id is not None:
+            stats = db.query(GraphStatistics).filter(GraphStatistics.file_id == file_id).first()
+            files_processed = 1 if stats else 0
+        else:
+            stats = db.query(UserGraphStatistics).filter(UserGraphStatistics.user_id == user_id).first()
+            files_processed = stats.files_processed if stats else 0
+
+        if not stats:
+            return self._empty_stats()
+
+        return {
+            'total_entities': stats.total_entities or 0,
+            'total_relations': stats.total_relations or 0,
+            'entity_types': json.loads(stats.entity_types or '{}'),
+            'relation_types': json.loads(stats.relation_types or '{}'),
+            'files_processed': files_processed or 0
+        }
+
+    def reconcile(self, db: Session) -> int:
+        """根据已保存的图谱数据重建全部统计，返回被修正的用户数"""
+        # 每个文件只取最新的一条图谱记录，已删除文件的残留记录不计入
+        latest_ids = {}
+        for kg_id, file_id in db.query(KnowledgeGraph.id, KnowledgeGraph.file_id).join(
+            FileRecord, FileRecord.id == KnowledgeGraph.file_id
+        ):
+            if kg_id > latest_ids.get(file_id, -1):
+                latest_ids[file_id] = kg_id
+
+        expected_files = {}
+        expected_users = {}
+        owners = dict(db.query(FileRecord.id, FileRecord.user_id))
+        for kg_id in latest_ids.values():
+            kg = db.query(KnowledgeGraph).filter(KnowledgeGraph.id == kg_id).first()
+            entities, relations = graph_records(kg)
+            entity_types = Counter(e.get('label', '') for e in entities)
+            relation_types = Counter(r.get('predicate', '') for r in relations)
+            user_id = owners[kg.file_id]
+
+            expected_files[kg.file_id] = (user_id, len(entities), len(relations),
+                                          entity_types, relation_types)
+
+            totals = expected_users.setdefault(user_id, [0, 0, 0, Counter(), Counter()])
+            totals[0] += 1
+            totals[1] += len(entities)
+            totals[2] += len(relations)
+            totals[3].update(entity_types)
+            totals[4].update(relation_types)
+
+        # 文件级统计
+        for file_stats in db.query(GraphStatistics).all():
+            if file_stats.file_id not in expected_files:
+                db.delete(file_stats)
+        existing_files = {s.file_id: s for s in db.query(GraphStatistics).all()}
+        for file_id, (user_id, n_entities, n_relations, entity_types, relation_types) in expected_files.items():
+            file_stats = existing_files.get(file_id)
+            if not file_stats:
+                file_stats = GraphStatistics(file_id=file_id, user_id=user_id)
+                db.add(file_stats)
+            file_stats.user_id = user_id
+            file_stats.total_entities = n_entities
+            file_stats.total_relations = n_relations
+            file_stats.entity_types = json.dumps(entity_types, ensure_ascii=False)
+            file_stats.relation_types = json.dumps(relation_types, ensure_ascii=False)
+
+        # 用户级统计
+        fixed = 0
+        existing_users = {s.user_id: s for s in db.query(UserGraphStatistics).all()}
+        for user_id in set(existing_users) | set(expected_users):
+            files, n_entities, n_relations, entity_types, relation_types = expected_users.get(
+                user_id, [0, 0, 0, Counter(), Counter()]
+            )
+            user_stats = existing_users.get(user_id)
+            if not user_stats:
+                user_stats = UserGraphStatistics(user_id=user_id)
+                db.add(user_stats)
+
+            current = (user_stats.files_processed, user_stats.total_entities, user_stats.total_relations,
+                       json.loads(user_stats.entity_types or '{}'), json.loads(user_stats.relation_types or '{}'))
+            expected = (files, n_entities, n_relations, dict(entity_types), dict(relation_types))
+            if current != expected:
+                user_stats.files_processed = files
+                user_stats.total_entities = n_entities
+                user_stats.total_relations = n_relations
+                user_stats.entity_types = json.dumps(entity_types, ensure_ascii=False)
+                user_stats.relation_types = json.dumps(relation_types, ensure_ascii=False)
+                fixed += 1
+
+        db.commit()
+        return fixed
+
+    def _lock_user_stats(self, db: Session, user_id: int) -> UserGraphStatistics:
+        """锁定（或创建）用户汇总行，图谱代数加一，返回锁定后重新读取的行
+
+        先用一条 UPDATE 在数据库中自增代数：SQLite 由此取得写锁，其他数据库锁定该行，
+        直到事务提交。之后在同一事务内对计数的读-改-写不会与其他worker的更新交错，
+        读取时也不会用到会话中缓存的旧值。
+        """
+        locked = db.query(UserGraphStatistics).filter(UserGraphStatistics.user_id == user_id).update(
+            {UserGraphStatistics.graph_generation: func.coalesce(UserGraphStatistics.graph_generation, 0) + 1},
+            synchronize_session=False
+        )
+        if not locked:
+            try:
+                with db.begin_nested():
+                    db.add(UserGraphStatistics(
+                        user_id=user_id, files_processed=0, total_entities=0, total_relations=0,
+                        entity_types="{}", relation_types="{}", graph_generation=1
+                    ))
+            except IntegrityError:
+                # 其他worker同时创建了该行，改为锁定已有的行
+                return self._lock_user_stats(db, user_id)
+        return db.query(UserGraphStatistics).filter(
+            UserGraphStatistics.user_id == user_id
+        ).populate_existing().with_for_update().one()
+
+    def _apply(self, user_stats: UserGraphStatistics, n_entities: int, n_relations: int,
+               entity_types: Dict[str, int], relation_types: Dict[str, int], sign: int = 1):
+        """将一个文件的计数叠加（或扣减）到用户汇总行"""
+        user_stats.total_entities = max((user_stats.total_entities or 0) + sign * n_entities, 0)
+        user_stats.total_relations = max((user_stats.total_relations or 0) + sign * n_relations, 0)
+        user_stats.entity_types = json.dumps(
+            self._merge_counts(json.loads(user_stats.entity_types or '{}'), entity_types, sign),
+            ensure_ascii=False
+        )
+        user_stats.relation_types = json.dumps(
+            self._merge_counts(json.loads(user_stats.relation_types or '{}'), relation_types, sign),
+            ensure_ascii=False
+        )
+
+    def _merge_counts(self, base: Dict[str, int], delta: Dict[str, int], sign: int) -> Dict[str, int]:
+        """合并计数字典，丢弃归零的键"""
+        merged = dict(base)
+        for key, count in delta.items():
+            value = merged.get(key, 0) + sign * count
+            if value > 0:
+                merged[key] = value
+            else:
+                merged.pop(key, None)
+        return merged
+
+    def _empty_stats(self) -> Dict[str, Any]:
+        return {
+            'total_entities': 0,
+            'total_relations': 0,
+            'entity_types': {},
+            'relation_types': {},
+            'files_processed': 0
+        }
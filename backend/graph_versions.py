@@ -0,0 +1,361 @@
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import os
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from content_store import ContentStore, content_store
+from knowledge_graph import visualization_data
+from models import KnowledgeGraph, GraphVersion
+from records import Entity, Relation
+
+# 每个文件保留的历史版本数，0 表示全部保留
+GRAPH_VERSION_RETENTION = int(os.getenv("GRAPH_VERSION_RETENTION", "20"))
+# 增量大小超过完整内容的该比例时改存快照（新版本与基准快照差异太大时增量不再划算）
+GRAPH_DELTA_MAX_RATIO = float(os.getenv("GRAPH_DELTA_MAX_RATIO", "0.5"))
+
+def _canonical(item: Any):
+    """元素的可比较键：扁平字典直接用排好序的键值元组，嵌套结构退回到JSON文本"""
+    if isinstance(item, dict):
+        key = tuple(sorted(item.items()))
+        try:
+            hash(key)
+            return key
+        except TypeError:
+            pass
+    return json.dumps(item, ensure_ascii=False, sort_keys=True)
+
+def _diff_list(base: List, new: List) -> List:
+    """列表增量：[i, j] 表示复制基准的 base[i:j]，{"+": [...]} 表示插入新元素
+
+    按元素的规范形式查找它在基准中的位置（线性时间）：紧接上一段复制的位置优先，
+    使未变化的连续区间合并为一段；基准中没有的元素作为插入。
+    """
+    base_keys = [_canonical(x) for x in base]
+    positions = {}
+    for i, key in enumerate(base_keys):
+        positions.setdefault(key, i)
+    ops = []
+    for item in new:
+        key = _canonical(item)
+        last = ops[-1] if ops else None
+        if isinstance(last, list) and last[1] < len(base_keys) and base_keys[last[1]] == key:
+            last[1] += 1
+        elif key in positions:
+            ops.append([positions[key], positions[key] + 1])
+        elif isinstance(last, dict):
+            last['+'].append(item)
+        else:
+            ops.append({'+': [item]})
+    return ops
+
+def _apply_list(base: List, ops: List) -> List:
+    result = []
+    for op in ops:
+        if isinstance(op, list):
+            result.extend(base[op[0]:op[1]])
+        else:
+            result.extend(op['+'])
+    return result
+
+def diff_document(base: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """逐字段计算增量：列表字段按元素的规范形式对应到基准中的位置，字典字段递归，其他值直接保存新值"""
+    delta = {}
+    for key, value in new.items():
+        old = base.get(key)
+        if isinstance(value, list) and isinstance(old, list):
+            delta[key] = {'list': _diff_list(old, value)}
+        elif isinstance(value, dict) and isinstance(old, dict):
+            delta[key] = {'dict': diff_document(old, value)}
+        else:
+            delta[key] = {'value': value}
+    return delta
+
+def apply_delta(base: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    document = {}
+    for key, change in delta.items():
+        if 'list' in change:
+            document[key] = _apply_list(base[key], change['list'])
+        elif 'dict' in change:
+            document[key] = apply_delta(base[key], change['dict'])
+        else:
+            document[key] = change['value']
+    return document
+
+def graph_records(kg: KnowledgeGraph, store: ContentStore = content_store) -> Tuple[List[Dict], List[Dict]]:
+    """图谱记录中的实体和关系（兼容旧格式的未压缩JSON）"""
+    return store.unpack_json(kg.entities, []), store.unpack_json(kg.relations, [])
+
+def _entity_key(entity: Dict) -> tuple:
+    return entity.get('text'), entity.get('label')
+
+def _relation_key(relation: Dict) -> tuple:
+    return relation.get('subject'), relation.get('predicate'), relation.get('object')
+
+def _changes(old: List[Dict], new: List[Dict], key) -> Dict[str, List[Dict]]:
+    """按键比较：新增、删除，以及键相同但属性（置信度、上下文等）变化的元素（同键多次出现时取第一次）"""
+    old_items = {}
+    for item in old:
+        old_items.setdefault(key(item), item)
+    new_items = {}
+    for item in new:
+        new_items.setdefault(key(item), item)
+    return {
+        'added': [item for k, item in new_items.items() if k not in old_items],
+        'removed': [item for k, item in old_items.items() if k not in new_items],
+        'changed': [{'before': old_items[k], 'after': item} for k, item in new_items.items()
+                    if k in old_items and old_items[k] != item]
+    }
+
+class GraphVersionManager:
+    """文件图谱的版本管理（写时复制）
+
+    KnowledgeGraph 保存每个文件当前版本的完整内容，供查询直接读取；
+    每次处理另外在 GraphVersion 中追加一个版本：第一个版本存完整快照，
+    之后的版本只存相对最近一个快照的增量，读取任意版本最多合并一次增量。
+    增量过大时改存新的快照，后续版本以它为基准。
+    超出保留数量的旧版本在保存新版本时被清理，仍被保留版本引用的快照会先被重新计算。
+    """
+
+    def __init__(self, retention: int = GRAPH_VERSION_RETENTION, delta_max_ratio: float = GRAPH_DELTA_MAX_RATIO):
+        self.retention = retention
+        self.delta_max_ratio = delta_max_ratio
+
+    # ---- 写入 ----
+
+    def save(self, db: Session, file_id: int, entities: List[Entity], relations: List[Relation]) -> KnowledgeGraph:
+        """保存新版本并把它设为当前版本（不提交事务）
+
+        只保存实体和关系（压缩），可视化数据读取时由二者生成，布局坐标由布局任务另行写入。
+        """
+        # 持久化是记录转换为字典的边界，版本历史和接口都读取这里的JSON
+        entities = [entity.to_dict() for entity in entities]
+        relations = [relation.to_dict() for relation in relations]
+        entities_json = json.dumps(entities, ensure_ascii=False)
+        relations_json = json.dumps(relations, ensure_ascii=False)
+        version = self._append(db, file_id, entities, relations, (entities_json, relations_json))
+
+        current = db.query(KnowledgeGraph).filter(KnowledgeGraph.file_id == file_id).first()
+        if current is None:
+            current = KnowledgeGraph(file_id=file_id)
+            db.add(current)
+        current.entities = content_store.pack('graph', entities_json)
+        current.relations = content_store.pack('graph', relations_json)
+        current.graph_data = None
+        current.layout = None
+        current.version = version
+
+        self.compact(db, file_id)
+        return current
+
+    def _append(self, db: Session, file_id: int, entities: List[Dict], relations: List[Dict],
+                encoded: Optional[tuple] = None) -> int:
+        """追加下一个版本，返回版本号
+
+        版本号取当前最大值加一；同一文件被并发处理时，后插入的一方违反 (file_id, version)
+        唯一约束，回滚到保存点后按新的最大版本号重试。
+        """
+        document = {'entities': entities, 'relations': relations}
+        full = None
+        if encoded is not None:
+            # 复用已经序列化好的实体和关系，拼出与 json.dumps(document) 相同的文本
+            full = f'{{"entities": {encoded[0]}, "relations": {encoded[1]}}}'
+
+        while True:
+            latest = db.query(GraphVersion).filter(
+                GraphVersion.file_id == file_id
+            ).order_by(GraphVersion.version.desc()).populate_existing().first()
+            version = latest.version + 1 if latest else 1
+
+            row = GraphVersion(file_id=file_id, version=version,
+                               entity_count=len(entities), relation_count=len(relations))
+            base = None
+            if latest is not None:
+                base = latest if latest.base_version is None else self._row(db, file_id, latest.base_version)
+            self._encode(db, row, document, base, full)
+            try:
+                with db.begin_nested():
+                    db.add(row)
+                    db.flush()
+            except IntegrityError:
+                if self._row(db, file_id, version) is None:
+                    raise
+                # 其他worker已写入了该版本号
+                continue
+            return version
+
+    def _encode(self, db: Session, row: GraphVersion, document: Dict[str, Any], base: Optional[GraphVersion],
+                full: Optional[str] = None):
+        """以 base 快照为基准编码为增量，增量不划算时存为快照（按压缩前的大小比较）"""
+        full = full or json.dumps(document, ensure_ascii=False)
+        if base is not None:
+            delta = json.dumps(diff_document(self._document(base), document), ensure_ascii=False)
+            if len(delta) <= len(full) * self.delta_max_ratio:
+                row.base_version = base.version
+                row.data = content_store.pack('graph', delta)
+                return
+        row.base_version = None
+        row.data = content_store.pack('graph', full)
+
+    # ---- 读取 ----
+
+    def _row(self, db: Session, file_id: int, version: int) -> Optional[GraphVersion]:
+        return db.query(GraphVersion).filter(
+            GraphVersion.file_id == file_id,
+            GraphVersion.version == version
+        ).first()
+
+    @staticmethod
+    def _document(row: GraphVersion) -> Dict[str, Any]:
+        """版本行保存的快照或增量（兼容旧格式的未压缩JSON）"""
+        return json.loads(content_store.unpack(row.data))
+
+    def _decode(self, db: Session, row: GraphVersion) -> Dict[str, Any]:
+        if row.base_version is None:
+            return self._document(row)
+        base = self._row(db, row.file_id, row.base_version)
+        return apply_delta(self._document(base), self._document(row))
+
+    def get(self, db: Session, file_id: int, version: int) -> Optional[Dict[str, Any]]:
+        """读取某个版本的完整内容（entities、relations，以及由二者生成的 graph_data）"""
+        row = self._row(db, file_id, version)
+        if row is None:
+            return None
+        document = self._decode(db, row)
+        document['graph_data'] = visualization_data(document['entities'], document['relations'], file_id)
+        return document
+
+    def list_versions(self, db: Session, file_id: int) -> List[Dict[str, Any]]:
+        current = db.query(KnowledgeGraph.version).filter(KnowledgeGraph.file_id == file_id).scalar()
+        return [
+            {
+                'version': row.version,
+                'current': row.version == current,
+                'storage': 'snapshot' if row.base_version is None else 'delta',
+                'base_version': row.base_version,
+                'stored_bytes': content_store.stored_size(row.data),
+                'entity_count': row.entity_count,
+                'relation_count': row.relation_count,
+                'created_at': row.created_at
+            }
+            for row in db.query(GraphVersion).filter(
+                GraphVersion.file_id == file_id
+            ).order_by(GraphVersion.version.desc())
+        ]
+
+    def diff(self, db: Session, file_id: int, from_version: int, to_version: int) -> Optional[Dict[str, Any]]:
+        """比较两个版本的实体（按文本+类型）与关系（按主语+谓语+宾语）变化"""
+        old = self.get(db, file_id, from_version)
+        new = self.get(db, file_id, to_version)
+        if old is None or new is None:
+            return None
+        return {
+            'from_version': from_version,
+            'to_version': to_version,
+            'entities': _changes(old['entities'], new['entities'], _entity_key),
+            'relations': _changes(old['relations'], new['relations'], _relation_key)
+        }
+
+    # ---- 清理 ----
+
+    def compact(self, db: Session, file_id: int):
+        """只保留最近 retention 个版本（不提交事务）"""
+        if self.retention <= 0:
+            return
+        rows = db.query(GraphVersion).filter(
+            GraphVersion.file_id == file_id
+        ).order_by(GraphVersion.version).all()
+        if len(rows) <= self.retention:
+            return
+
+        dropped, kept = rows[:-self.retention], rows[-self.retention:]
+        dropped_versions = {row.version for row in dropped}
+        by_version = {row.version: row for row in rows}
+
+        # 保留的增量版本若基于将被删除的快照，先以保留版本中最早的一个为新快照重新编码
+        new_base = None
+        for row in kept:
+            if row.base_version not in dropped_versions:
+                continue
+            document = apply_delta(self._document(by_version[row.base_version]), self._document(row))
+            if new_base is None:
+                row.base_version = None
+                row.data = content_store.pack('graph', json.dumps(document, ensure_ascii=False))
+                new_base = row
+            else:
+                self._encode(db, row, document, new_base)
+
+        for row in dropped:
+            db.delete(row)
+        db.flush()
+
+    def delete_file(self, db: Session, file_id: int):
+        db.query(GraphVersion).filter(GraphVersion.file_id == file_id).delete()
+
+    def migrate_legacy(self, db: Session) -> int:
+        """迁移旧数据：旧版本每次处理都追加一条完整的 KnowledgeGraph 记录
+
+        按记录顺序转换为版本历史，只保留最新一条作为当前版本，返回迁移的文件数。
+        """
+        versioned = {file_id for (file_id,) in db.query(GraphVersion.file_id).distinct()}
+        pending = {}
+        for kg in db.query(KnowledgeGraph).order_by(KnowledgeGraph.id):
+            if kg.file_id not in versioned:
+                pending.setdefault(kg.file_id, []).append(kg)
+
+        for file_id, records in pending.items():
+            for kg in records:
+                version = self._append(db, file_id, *graph_records(kg))
+            for kg in records[:-1]:
+                db.delete(kg)
+            records[-1].version = version
+            self.compact(db, file_id)
+            db.commit()
+        if pending:
+            print(f"图谱版本迁移完成: {len(pending)} 个文件")
+        return len(pending)
+
+    def compress_legacy(self, db: Session, batch_size: int = 500) -> Dict[str, int]:
+        """把旧格式（未压缩JSON文本）的当前图谱和历史版本转换为压缩格式，返回转换数量
+
+        旧的当前图谱另外保存了完整的可视化数据，转换时只保留其中的布局坐标。
+        """
+        from graph_layout import legacy_layout
+
+        converted = {'graphs': 0, 'versions': 0}
+        # 按ID分批扫描，在Python中判断是否为旧格式，不依赖特定数据库的列类型函数
+        last_id = 0
+        while True:
+            rows = db.query(KnowledgeGraph).filter(
+                KnowledgeGraph.id > last_id
+            ).order_by(KnowledgeGraph.id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            legacy = [kg for kg in rows if kg.graph_data is not None
+                      or ContentStore.is_legacy(kg.entities) or ContentStore.is_legacy(kg.relations)]
+            for kg in legacy:
+                entities, relations = graph_records(kg)
+                if kg.layout is None:
+                    kg.layout = legacy_layout(kg.graph_data)
+                kg.entities = content_store.pack_json('graph', entities)
+                kg.relations = content_store.pack_json('graph', relations)
+                kg.graph_data = None
+            db.commit()
+            converted['graphs'] += len(legacy)
+
+        last_id = 0
+        while True:
+            rows = db.query(GraphVersion).filter(
+                GraphVersion.id > last_id
+            ).order_by(GraphVersion.id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            legacy = [row for row in rows if ContentStore.is_legacy(row.data)]
+            for row in legacy:
+                row.data = content_store.pack('graph', content_store.unpack(row.data))
+            db.commit()
+            converted['versions'] += len(legacy)
+        return converted
@@ -0,0 +1,258 @@
+from functools import lru_cache
+from itertools import combinations
+from typing import Callable, List, NamedTuple, Optional, Tuple
+import os
+import threading
+
+import numpy as np
+
+# 近似重复图片的候选：64位 pHash 的 Hamming 距离上限；为负数时关闭OCR结果复用
+IMAGE_DEDUP_PHASH_DISTANCE = int(os.getenv("IMAGE_DEDUP_PHASH_DISTANCE", "10"))
+# 候选的确认：细节 dHash 逐条带（每2行）的不同位比例的最大值上限
+IMAGE_DEDUP_DETAIL_DISTANCE = float(os.getenv("IMAGE_DEDUP_DETAIL_DISTANCE", "0.105"))
+# 宽高比允许的相对差异（缩放不改变宽高比，裁剪或拼接过的截图不视为重复）
+IMAGE_DEDUP_ASPECT_TOLERANCE = 0.02
+# 细节 dHash 的宽、高（文字行是横向的，水平方向取更多的位）与比较条带的行数
+DETAIL_HASH_WIDTH = 128
+DETAIL_HASH_HEIGHT = 64
+DETAIL_BAND_ROWS = 2
+
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+class Fingerprint(NamedTuple):
+    """图片指纹：64位 pHash（索引查找）、128x64 dHash 的打包位（确认细节）和原图尺寸"""
+    phash: int
+    dhash: bytes
+    width: int
+    height: int
+
+def popcount64(values: np.ndarray) -> np.ndarray:
+    """uint64 数组逐元素的置位数"""
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    return _POPCOUNT[values.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.int64)
+
+def _pack_bits(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), 'big')
+
+@lru_cache(maxsize=None)
+def _dct_matrix(size: int) -> np.ndarray:
+    """DCT-II 变换矩阵（未归一化，只比较系数与中位数的大小）"""
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    return np.cos(np.pi * (2 * n + 1) * k / (2 * size))
+
+def phash(image, hash_size: int = 8, highfreq_factor: int = 4) -> int:
+    """感知哈希：灰度缩放到 32x32 后做二维DCT，取左上角 8x8 低频系数与其中位数（不含直流分量）比较"""
+    from PIL import Image
+
+    size = hash_size * highfreq_factor
+    pixels = np.asarray(image.convert('L').resize((size, size), Image.LANCZOS), dtype=np.float64)
+    matrix = _dct_matrix(size)
+    low = (matrix @ pixels @ matrix.T)[:hash_size, :hash_size]
+    median = np.median(low.ravel()[1:])
+    return _pack_bits(low > median)
+
+def dhash_bits(image, width: int = 8, height: int = 8) -> np.ndarray:
+    """差分哈希：灰度缩放到 (width+1) x height，比较每行相邻像素的亮度"""
+    from PIL import Image
+
+    pixels = np.asarray(image.convert('L').resize((width + 1, height), Image.LANCZOS), dtype=np.int16)
+    return pixels[:, 1:] > pixels[:, :-1]
+
+def fingerprint(image) -> Fingerprint:
+    width, height = image.size
+    detail = np.packbits(dhash_bits(image, DETAIL_HASH_WIDTH, DETAIL_HASH_HEIGHT).ravel()).tobytes()
+    return Fingerprint(phash(image), detail, width, height)
+
+def detail_distance(a: bytes, b: bytes) -> float:
+    """两个细节 dHash 逐条带不同位比例的最大值
+
+    截图、扫描件的整体布局相同而文字不同时，64位哈希往往完全一致；按条带比较时，
+    重新压缩和缩放的差异分散在各处，改动过的文字行则集中在少数条带中。
+    """
+    diff = np.unpackbits(np.frombuffer(a, dtype=np.uint8) ^ np.frombuffer(b, dtype=np.uint8))
+    bands = diff.reshape(-1, DETAIL_BAND_ROWS * DETAIL_HASH_WIDTH)
+    return float(bands.mean(axis=1).max())
+
+def _to_signed(value: int) -> int:
+    """SQLite的INTEGER是有符号64位，存储前换算"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+class HammingIndex:
+    """64位哈希的多索引哈希表，查找 Hamming 距离不超过 radius 的全部条目
+
+    哈希分为 blocks 段，距离不超过 radius 时至少有一段的距离不超过 radius // blocks（抽屉原理），
+    因此只需在每段的有序数组中查找与查询值相差不超过该位数的段值，再对候选计算完整距离。
+    新条目先追加到未排序的尾部（查找时直接逐个比较），尾部超过已排序部分的1/8时合并重排。
+    """
+
+    def __init__(self, radius: int, blocks: int = 4):
+        if 64 % blocks:
+            raise ValueError("blocks 必须整除64")
+        self.radius = radius
+        self.blocks = blocks
+        self.block_bits = 64 // blocks
+        self._hashes = np.zeros(0, dtype=np.uint64)
+        self._keys = np.zeros(0, dtype=np.int64)
+        self._size = 0
+        self._sorted_size = 0
+        self._sorted: List[Tuple[np.ndarray, np.ndarray]] = []
+        # 段内允许翻转的位组合
+        flips = [0]
+        for count in range(1, min(radius // blocks, self.block_bits) + 1):
+            for positions in combinations(range(self.block_bits), count):
+                flips.append(sum(1 << p for p in positions))
+        self._flips = np.array(flips, dtype=np.uint64)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def add(self, value: int, key: int):
+        self.add_many(np.array([value], dtype=np.uint64), np.array([key], dtype=np.int64))
+
+    def add_many(self, values: np.ndarray, keys: np.ndarray):
+        count = len(values)
+        if self._size + count > len(self._hashes):
+            capacity = max(1024, len(self._hashes) * 2, self._size + count)
+            self._hashes = np.resize(self._hashes, capacity)
+            self._keys = np.resize(self._keys, capacity)
+        self._hashes[self._size:self._size + count] = values
+        self._keys[self._size:self._size + count] = keys
+        self._size += count
+        if self._size - self._sorted_size > max(4096, self._sorted_size // 8):
+            self._rebuild()
+
+    def query(self, value: int) -> List[Tuple[int, int]]:
+        """返回 [(key, 距离)]，按距离升序"""
+        value = np.uint64(value)
+        positions = [np.arange(self._sorted_size, self._size)]
+        mask = np.uint64((1 << self.block_bits) - 1)
+        for block, (block_values, order) in enumerate(self._sorted):
+            shift = np.uint64(block * self.block_bits)
+            # 探测值排序后二分查找的访存更集中；probe+1 的左边界即 probe 的右边界
+            probes = np.sort(((value >> shift) & mask) ^ self._flips)
+            bounds = np.searchsorted(block_values, np.concatenate([probes, probes + np.uint64(1)]))
+            lo = bounds[:len(probes)]
+            lengths = bounds[len(probes):] - lo
+            # 把各探测值命中的区间 [lo, lo+length) 拼接成一个下标数组
+            offsets = np.repeat(lo - np.cumsum(lengths) + lengths, lengths)
+            positions.append(order[offsets + np.arange(len(offsets))])
+        # 同一条目可能从多个段命中，先按距离过滤（结果很少）再去重
+        positions = np.concatenate(positions)
+        distances = popcount64(self._hashes[positions] ^ value)
+        keep = distances <= self.radius
+        positions, first = np.unique(positions[keep], return_index=True)
+        distances = distances[keep][first]
+        ranked = np.argsort(distances, kind='stable')
+        return [(int(self._keys[p]), int(d)) for p, d in zip(positions[ranked], distances[ranked])]
+
+    def _rebuild(self):
+        hashes = self._hashes[:self._size]
+        mask = np.uint64((1 << self.block_bits) - 1)
+        self._sorted = []
+        for block in range(self.blocks):
+            block_values = (hashes >> np.uint64(block * self.block_bits)) & mask
+            order = np.argsort(block_values, kind='stable')
+            self._sorted.append((block_values[order], order))
+        self._sorted_size = self._size
+
+class ImageFingerprintStore:
+    """已OCR图片的指纹库，近似重复的图片（重新保存、压缩、缩放）复用已识别的文本
+
+    pHash 建立 HammingIndex 做距离查找，候选再用细节 dHash 和宽高比确认。指纹和文本保存在 image_fingerprints 表中，
+    内存索引只保存 pHash、行ID和用户，每次查找前增量载入新写入的行（包括其他worker写入的）；
+    命中后从数据库读取细节哈希和文本，文件删除后其指纹随之失效。只在同一用户的图片之间复用。
+    """
+
+    # 每次查找最多从数据库读取的候选数（按 pHash 距离取最近的）
+    MAX_CANDIDATES = 100
+
+    def __init__(self, session_factory: Callable, phash_distance: int = IMAGE_DEDUP_PHASH_DISTANCE,
+                 detail_distance: float = IMAGE_DEDUP_DETAIL_DISTANCE):
+        self._session_factory = session_factory
+        self.phash_distance = phash_distance
+        self.detail_distance = detail_distance
+        self._index = HammingIndex(phash_distance)
+        # 索引中第 i 条对应的行ID与用户
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._users = np.zeros(0, dtype=np.int64)
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def find_text(self, user_id: int, fp: Fingerprint) -> Optional[str]:
+        """查找该用户已识别过的近似重复图片，返回其OCR文本；没有时返回 None"""
+        from models import ImageFingerprint
+
+        db = self._session_factory()
+        try:
+            with self._lock:
+                self._sync(db)
+                candidates = {
+                    int(self._ids[position]): distance
+                    for position, distance in self._index.query(fp.phash)
+                    if self._users[position] == user_id
+                }
+            candidates = dict(sorted(candidates.items(), key=lambda item: item[1])[:self.MAX_CANDIDATES])
+            if not candidates:
+                return None
+            rows = db.query(ImageFingerprint).filter(
+                ImageFingerprint.id.in_(list(candidates)),
+                ImageFingerprint.user_id == user_id
+            ).all()
+            best = None
+            for row in rows:
+                if not self._same_aspect(row.width, row.height, fp) or len(row.dhash) != len(fp.dhash):
+                    continue
+                distance = detail_distance(row.dhash, fp.dhash)
+                if distance > self.detail_distance:
+                    continue
+                rank = (distance, candidates[row.id], row.id)
+                if best is None or rank < best[0]:
+                    best = (rank, row.text)
+            return best[1] if best else None
+        finally:
+            db.close()
+
+    def add(self, user_id: int, file_id: Optional[int], fp: Fingerprint, text: str):
+        from models import ImageFingerprint
+
+        db = self._session_factory()
+        try:
+            db.add(ImageFingerprint(user_id=user_id, file_id=file_id, phash=_to_signed(fp.phash),
+                                    dhash=fp.dhash, width=fp.width, height=fp.height, text=text))
+            db.commit()
+            with self._lock:
+                self._sync(db)
+        finally:
+            db.close()
+
+    def _sync(self, db):
+        """载入上次同步之后新增的指纹（调用方持有锁）"""
+        from models import ImageFingerprint
+
+        rows = db.query(ImageFingerprint.id, ImageFingerprint.user_id, ImageFingerprint.phash).filter(
+            ImageFingerprint.id > self._last_id
+        ).order_by(ImageFingerprint.id).all()
+        if not rows:
+            return
+        start, end = self._index.size, self._index.size + len(rows)
+        if end > len(self._ids):
+            capacity = max(1024, len(self._ids) * 2, end)
+            self._ids = np.resize(self._ids, capacity)
+            self._users = np.resize(self._users, capacity)
+        self._ids[start:end] = [row_id for row_id, _, _ in rows]
+        self._users[start:end] = [user_id for _, user_id, _ in rows]
+        self._index.add_many(np.array([_to_unsigned(h) for _, _, h in rows], dtype=np.uint64),
+                             np.arange(start, end, dtype=np.int64))
+        self._last_id = rows[-1][0]
+
+    @staticmethod
+    def _same_aspect(width: int, height: int, fp: Fingerprint) -> bool:
+        if not (width and height and fp.width and fp.height):
+            return False
+        expected = width / height
+        return abs(fp.width / fp.height - expected) <= IMAGE_DEDUP_ASPECT_TOLERANCE * expected
@@ -1,114 +1,266 @@
-from neo4j import GraphDatabase
-from typing import List, Dict, Any, Tuple
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from typing import List, Dict, Any, Tuple, Optional, Callable
 import json
+import os
 import uuid
 from database import get_neo4j_driver
+from records import Entity, Relation
+from metrics import span, record_error, GRAPH_QUERY_SECONDS
+from write_behind import GraphWrite, GraphWriteBuffer, replay_logs
 
-class KnowledgeGraphBuilder:
-    """知识图谱构建器"""
-    
-    def __init__(self):
-        self.driver = None
-        self._connect()
-    
-    def _connect(self):
-        """连接Neo4j数据库"""
-        try:
-            self.driver = get_neo4j_driver()
-            # 测试连接
-            with self.driver.session() as session:
-                session.run("RETURN 1")
-            print("Neo4j连接成功")
-        except Exception as e:
-            print(f"Neo4j连接失败: {e}")
-            self.driver = None
-    
-    def build_graph(self, entities: List[Dict], relations: List[Dict], file_id: int) -> Dict[str, Any]:
-        """构建知识图谱"""
-        if not self.driver:
-            # 如果Neo4j不可用，返回简化的图谱数据
-            return self._build_simple_graph(entities, relations, file_id)
-        
-        try:
-            with self.driver.session() as session:
-                # 创建实体节点
-                node_mapping = {}
-                for entity in entities:
-                    node_id = self._create_entity_node(session, entity, file_id)
-                    node_mapping[entity['text']] = node_id
-                
-                # 创建关系边
-                for relation in relations:
-                    self._create_relation_edge(session, relation, node_mapping, file_id)
-                
-                # 获取图谱数据用于可视化
-                graph_data = self._get_graph_visualization_data(session, file_id)
-                
-                return graph_data
-        
-        except Exception as e:
-            print(f"Neo4j图谱构建失败: {e}")
-            return self._build_simple_graph(entities, relations, file_id)
-    
-    def _create_entity_node(self, session, entity: Dict, file_id: int) -> str:
+# 图存储后端: auto（优先Neo4j，不可用时使用内置引擎）、neo4j、memory
+GRAPH_BACKEND = os.getenv("GRAPH_BACKEND", "auto")
+# 内置图引擎的数据目录
+GRAPH_DATA_DIR = os.getenv("GRAPH_DATA_DIR", "./graph_data")
+
+def visualization_data(entities: List[Dict], relations: List[Dict], file_id: int) -> Dict[str, Any]:
+    """由保存的实体和关系生成图谱可视化数据（格式与图存储返回的一致，不访问图存储）
+
+    合并规则与图存储写入相同：节点按文本合并、边按 (起点, 终点, 类型) 合并，重复时保留最高置信度，
+    起点或终点不在实体中的关系被丢弃。节点ID为“n:实体文本”，同一文件的各个版本之间保持不变。
+    视频的实体带有出现时间，节点的 timestamps 为合并后的全部时间。
+    """
+    nodes: Dict[str, Dict] = {}
+    for entity in entities:
+        confidence = entity.get('confidence', 0.0)
+        node = nodes.get(entity['text'])
+        if node is None:
+            nodes[entity['text']] = {'id': f"n:{entity['text']}", 'label': entity['text'],
+                                     'type': entity['label'], 'confidence': confidence}
+        elif node['confidence'] < confidence:
+            node['confidence'] = confidence
+        if entity.get('timestamps') is not None:
+            node = nodes[entity['text']]
+            node['timestamps'] = sorted(set(node.get('timestamps', [])) | set(entity['timestamps']))
+
+    edges: Dict[tuple, Dict] = {}
+    for relation in relations:
+        subject, obj = relation['subject'], relation['object']
+        if subject not in nodes or obj not in nodes:
+            continue
+        key = (subject, obj, relation['predicate'])
+        confidence = relation.get('confidence', 0.0)
+        edge = edges.get(key)
+        if edge is None:
+            edges[key] = {'source': f"n:{subject}", 'target': f"n:{obj}", 'relation': relation['predicate'],
+                          'confidence': confidence, 'context': relation.get('context', ''), 'file_id': file_id}
+        elif edge['confidence'] < confidence:
+            edge['confidence'] = confidence
+
+    for node in nodes.values():
+        node['size'] = min(max(node['confidence'] * 20, 10), 30)
+    for edge in edges.values():
+        edge['width'] = max(edge['confidence'] * 3, 1)
+    return {
+        'nodes': list(nodes.values()),
+        'edges': list(edges.values()),
+        'stats': {
+            'total_nodes': len(nodes),
+            'total_edges': len(edges)
+        }
+    }
+
+class GraphBackend(ABC):
+    """图存储后端接口"""
+
+    name = "base"
+    # 写入返回后数据是否还须调用 flush 才会持久化（合并写入据此推迟写入日志的检查点）
+    flush_required = False
+
+    @abstractmethod
+    def write_graph(self, entities: List[Entity], relations: List[Relation], file_id: int,
+                    user_id: int) -> Dict[str, Any]:
+        """写入一个文件的实体和关系（节点和边记录所属用户），返回该文件的图谱可视化数据"""
+
+    def write_batch(self, writes: List[GraphWrite]):
+        """在一个事务中写入多个文件的实体和关系（合并写入时使用，不返回可视化数据）"""
+        for entities, relations, file_id, user_id in writes:
+            self.write_graph(entities, relations, file_id, user_id)
+
+    @abstractmethod
+    def delete_file(self, file_id: int):
+        """删除一个文件的全部节点和边"""
+
+    @abstractmethod
+    def search_entities(self, user_id: int, query: str, limit: int = 20) -> List[Dict]:
+        """在该用户的实体中按文本搜索"""
+
+    @abstractmethod
+    def find_paths(self, user_id: int, start_entity: str, end_entity: str, max_depth: int = 3) -> List[List[Dict]]:
+        """查找该用户图谱中两个实体之间的最短路径"""
+
+    @abstractmethod
+    def get_neighbors(self, user_id: int, entity: str, depth: int = 1, limit: int = 100) -> Dict[str, Any]:
+        """获取该用户图谱中实体的邻域子图"""
+
+    @abstractmethod
+    def get_graph_stats(self, user_id: int, file_id: int = None) -> Dict[str, Any]:
+        """获取该用户（或其中一个文件）的图谱统计信息"""
+
+    def needs_owners(self) -> bool:
+        """是否存在未记录所属用户的旧数据"""
+        return False
+
+    def assign_owners(self, owners: Dict[int, int]):
+        """按 {文件ID: 用户ID} 为旧数据补写所属用户（对应文件已删除的残留数据保持无主，不会被任何查询读到）"""
+        pass
+
+    def flush(self):
+        """持久化已写入的数据（写入在事务提交时即已持久化的后端无需实现）"""
+        pass
+
+    def close(self):
+        """释放资源"""
+        pass
+
+class Neo4jGraphBackend(GraphBackend):
+    """基于Neo4j的图存储后端"""
+
+    name = "neo4j"
+
+    # 查询按用户分区：所有读取都从 (user_id) 或 (user_id, text) 索引开始，只访问该用户的节点
+    SCHEMA = [
+        "CREATE INDEX entity_user IF NOT EXISTS FOR (n:Entity) ON (n.user_id)",
+        "CREATE INDEX entity_user_text IF NOT EXISTS FOR (n:Entity) ON (n.user_id, n.text)",
+        "CREATE INDEX entity_file IF NOT EXISTS FOR (n:Entity) ON (n.file_id)",
+        "CREATE INDEX entity_file_text IF NOT EXISTS FOR (n:Entity) ON (n.file_id, n.text)",
+        "CREATE INDEX entity_id IF NOT EXISTS FOR (n:Entity) ON (n.id)",
+        "CREATE INDEX relation_user IF NOT EXISTS FOR ()-[r:RELATION]-() ON (r.user_id)",
+    ]
+    # 补写所属用户时每批处理的文件数
+    OWNER_BATCH_FILES = 500
+    # 合并写入时每条 UNWIND 语句的行数
+    WRITE_BATCH_ROWS = 5000
+
+    def __init__(self, driver):
+        self.driver = driver
+        with self.driver.session() as session:
+            for statement in self.SCHEMA:
+                session.run(statement)
+
+    def write_graph(self, entities: List[Entity], relations: List[Relation], file_id: int,
+                    user_id: int) -> Dict[str, Any]:
+        with self.driver.session() as session:
+            # 创建实体节点
+            node_mapping = {}
+            for entity in entities:
+                node_id = self._create_entity_node(session, entity, file_id, user_id)
+                node_mapping[entity.text] = node_id
+
+            # 创建关系边
+            for relation in relations:
+                self._create_relation_edge(session, relation, node_mapping, file_id, user_id)
+
+            # 获取图谱数据用于可视化
+            return self._get_graph_visualization_data(session, file_id)
+
+    def write_batch(self, writes: List[GraphWrite]):
+        # 语义同 write_graph，但所有文件的节点和边分别用 UNWIND 批量写入，整批一个事务
+        nodes = []
+        edges = []
+        for entities, relations, file_id, user_id in writes:
+            texts = set()
+            for entity in entities:
+                texts.add(entity.text)
+                nodes.append({'text': entity.text, 'file_id': file_id, 'user_id': user_id,
+                              'node_id': str(uuid.uuid4()), 'label': entity.label,
+                              'confidence': entity.confidence, 'start': entity.start, 'end': entity.end})
+            for relation in relations:
+                if relation.subject in texts and relation.object in texts:
+                    edges.append({'subject': relation.subject, 'object': relation.object,
+                                  'relation_type': relation.predicate, 'file_id': file_id, 'user_id': user_id,
+                                  'confidence': relation.confidence, 'context': relation.context})
+
+        with self.driver.session() as session:
+            with session.begin_transaction() as tx:
+                for start in range(0, len(nodes), self.WRITE_BATCH_ROWS):
+                    tx.run("""
+                    UNWIND $rows AS row
+                    MERGE (n:Entity {text: row.text, file_id: row.file_id})
+                    ON CREATE SET n.id = row.node_id, n.label = row.label, n.confidence = row.confidence,
+                                 n.start = row.start, n.end = row.end, n.created_at = datetime()
+                    ON MATCH SET n.confidence = CASE WHEN n.confidence < row.confidence
+                                                     THEN row.confidence ELSE n.confidence END
+                    SET n.user_id = row.user_id
+                    """, {'rows': nodes[start:start + self.WRITE_BATCH_ROWS]})
+                for start in range(0, len(edges), self.WRITE_BATCH_ROWS):
+                    tx.run("""
+                    UNWIND $rows AS row
+                    MATCH (s:Entity {file_id: row.file_id, text: row.subject}),
+                          (o:Entity {file_id: row.file_id, text: row.object})
+                    MERGE (s)-[r:RELATION {type: row.relation_type, file_id: row.file_id}]->(o)
+                    ON CREATE SET r.confidence = row.confidence, r.context = row.context,
+                                 r.created_at = datetime()
+                    ON MATCH SET r.confidence = CASE WHEN r.confidence < row.confidence
+                                                     THEN row.confidence ELSE r.confidence END
+                    SET r.user_id = row.user_id
+                    """, {'rows': edges[start:start + self.WRITE_BATCH_ROWS]})
+                tx.commit()
+
+    def _create_entity_node(self, session, entity: Entity, file_id: int, user_id: int) -> str:
         """创建实体节点"""
         node_id = str(uuid.uuid4())
-        
+
         query = """
         MERGE (n:Entity {text: $text, file_id: $file_id})
         ON CREATE SET n.id = $node_id, n.label = $label, n.confidence = $confidence,
                      n.start = $start, n.end = $end, n.created_at = datetime()
         ON MATCH SET n.confidence = CASE WHEN n.confidence < $confidence THEN $confidence ELSE n.confidence END
+        SET n.user_id = $user_id
         RETURN n.id as id
         """
-        
+
         result = session.run(query, {
-            'text': entity['text'],
+            'text': entity.text,
             'file_id': file_id,
+            'user_id': user_id,
             'node_id': node_id,
-            'label': entity['label'],
-            'confidence': entity.get('confidence', 0.0),
-            'start': entity.get('start', 0),
-            'end': entity.get('end', 0)
+            'label': entity.label,
+            'confidence': entity.confidence,
+            'start': entity.start,
+            'end': entity.end
         })
-        
+
         record = result.single()
         return record['id'] if record else node_id
-    
-    def _create_relation_edge(self, session, relation: Dict, node_mapping: Dict, file_id: int):
+
+    def _create_relation_edge(self, session, relation: Relation, node_mapping: Dict, file_id: int, user_id: int):
         """创建关系边"""
-        subject_id = node_mapping.get(relation['subject'])
-        object_id = node_mapping.get(relation['object'])
-        
+        subject_id = node_mapping.get(relation.subject)
+        object_id = node_mapping.get(relation.object)
+
         if not subject_id or not object_id:
             return
-        
+
         query = """
         MATCH (s:Entity {id: $subject_id}), (o:Entity {id: $object_id})
         MERGE (s)-[r:RELATION {type: $relation_type, file_id: $file_id}]->(o)
-        ON CREATE SET r.confidence = $confidence, r.context = $context, 
+        ON CREATE SET r.confidence = $confidence, r.context = $context,
                      r.created_at = datetime()
         ON MATCH SET r.confidence = CASE WHEN r.confidence < $confidence THEN $confidence ELSE r.confidence END
+        SET r.user_id = $user_id
         """
-        
+
         session.run(query, {
             'subject_id': subject_id,
             'object_id': object_id,
-            'relation_type': relation['predicate'],
+            'relation_type': relation.predicate,
             'file_id': file_id,
-            'confidence': relation.get('confidence', 0.0),
-            'context': relation.get('context', '')
+            'user_id': user_id,
+            'confidence': relation.confidence,
+            'context': relation.context
         })
-    
+
     def _get_graph_visualization_data(self, session, file_id: int) -> Dict[str, Any]:
         """获取图谱可视化数据"""
         # 获取节点
         nodes_query = """
         MATCH (n:Entity {file_id: $file_id})
-        RETURN n.id as id, n.text as text, n.label as label, 
+        RETURN n.id as id, n.text as text, n.label as label,
                n.confidence as confidence
         """
-        
+
         nodes_result = session.run(nodes_query, {'file_id': file_id})
         nodes = []
         for record in nodes_result:
@@ -119,14 +271,14 @@ class KnowledgeGraphBuilder:
                 'confidence': record['confidence'],
                 'size': min(max(record['confidence'] * 20, 10), 30)  # 节点大小
             })
-        
+
         # 获取边
         edges_query = """
         MATCH (s:Entity {file_id: $file_id})-[r:RELATION {file_id: $file_id}]->(o:Entity {file_id: $file_id})
-        RETURN s.id as source, o.id as target, r.type as relation, 
+        RETURN s.id as source, o.id as target, r.type as relation,
                r.confidence as confidence, r.context as context
         """
-        
+
         edges_result = session.run(edges_query, {'file_id': file_id})
         edges = []
         for record in edges_result:
@@ -138,7 +290,7 @@ class KnowledgeGraphBuilder:
                 'context': record['context'],
                 'width': max(record['confidence'] * 3, 1)  # 边宽度
             })
-        
+
         return {
             'nodes': nodes,
             'edges': edges,
@@ -147,41 +299,293 @@ class KnowledgeGraphBuilder:
                 'total_edges': len(edges)
             }
         }
-    
-    def _build_simple_graph(self, entities: List[Dict], relations: List[Dict], file_id: int) -> Dict[str, Any]:
-        """构建简化的图谱数据（不使用Neo4j）"""
+
+    def delete_file(self, file_id: int):
+        with self.driver.session() as session:
+            session.run("MATCH (n:Entity {file_id: $file_id}) DETACH DELETE n", {'file_id': file_id})
+
+    def search_entities(self, user_id: int, query: str, limit: int = 20) -> List[Dict]:
+        with self.driver.session() as session:
+            search_query = """
+            MATCH (n:Entity {user_id: $user_id})
+            WHERE toLower(n.text) CONTAINS toLower($query)
+            RETURN n.id as id, n.text as text, n.label as label,
+                   n.confidence as confidence, n.file_id as file_id
+            ORDER BY n.confidence DESC
+            LIMIT $limit
+            """
+
+            result = session.run(search_query, {'user_id': user_id, 'query': query, 'limit': limit})
+            entities = []
+            for record in result:
+                entities.append({
+                    'id': record['id'],
+                    'text': record['text'],
+                    'label': record['label'],
+                    'confidence': record['confidence'],
+                    'file_id': record['file_id']
+                })
+
+            return entities
+
+    def find_paths(self, user_id: int, start_entity: str, end_entity: str, max_depth: int = 3) -> List[List[Dict]]:
+        with self.driver.session() as session:
+            # 可变长度上限不能参数化，这里先转换为整数再拼接
+            path_query = f"""
+            MATCH (start:Entity {{user_id: $user_id, text: $start}}), (end:Entity {{user_id: $user_id, text: $end}})
+            MATCH path = shortestPath((start)-[*1..{int(max_depth)}]-(end))
+            WHERE all(n IN nodes(path) WHERE n.user_id = $user_id)
+            RETURN path
+            LIMIT 10
+            """
+
+            result = session.run(path_query, {
+                'user_id': user_id,
+                'start': start_entity,
+                'end': end_entity
+            })
+
+            paths = []
+            for record in result:
+                path = record['path']
+                path_data = []
+
+                for i in range(len(path.nodes)):
+                    node = path.nodes[i]
+                    path_data.append({
+                        'type': 'node',
+                        'id': node['id'],
+                        'text': node['text'],
+                        'label': node['label'],
+                        'file_id': node.get('file_id')
+                    })
+
+                    if i < len(path.relationships):
+                        rel = path.relationships[i]
+                        path_data.append({
+                            'type': 'relationship',
+                            'relation': rel['type'],
+                            'confidence': rel.get('confidence', 0.0)
+                        })
+
+                paths.append(path_data)
+
+            return paths
+
+    def get_neighbors(self, user_id: int, entity: str, depth: int = 1, limit: int = 100) -> Dict[str, Any]:
+        with self.driver.session() as session:
+            neighbors_query = f"""
+            MATCH (start:Entity {{user_id: $user_id, text: $text}})-[rels:RELATION*1..{int(depth)}]-(n:Entity)
+            WHERE n.user_id = $user_id
+            WITH start, n, rels LIMIT $limit
+            UNWIND rels as r
+            WITH collect(DISTINCT start) + collect(DISTINCT n) as nodes, collect(DISTINCT r) as edges
+            RETURN [x IN nodes | {{id: x.id, text: x.text, label: x.label,
+                                  confidence: x.confidence, file_id: x.file_id}}] as nodes,
+                   [e IN edges | {{source: startNode(e).id, target: endNode(e).id, relation: e.type,
+                                  confidence: e.confidence, file_id: e.file_id}}] as edges
+            """
+            record = session.run(neighbors_query, {'user_id': user_id, 'text': entity, 'limit': limit}).single()
+            if not record:
+                return {'nodes': [], 'edges': []}
+
+            nodes = {node['id']: node for node in record['nodes']}
+            return {'nodes': list(nodes.values()), 'edges': record['edges']}
+
+    def get_graph_stats(self, user_id: int, file_id: int = None) -> Dict[str, Any]:
+        with self.driver.session() as session:
+            if file_id:
+                # 特定文件的统计
+                stats_query = """
+                MATCH (n:Entity {file_id: $file_id, user_id: $user_id})
+                OPTIONAL MATCH (n)-[r:RELATION {file_id: $file_id}]->(m)
+                RETURN count(DISTINCT n) as entities, count(r) as relations,
+                       collect(DISTINCT n.label) as entity_types,
+                       collect(DISTINCT r.type) as relation_types
+                """
+                result = session.run(stats_query, {'file_id': file_id, 'user_id': user_id})
+            else:
+                # 该用户的全部文件
+                stats_query = """
+                MATCH (n:Entity {user_id: $user_id})
+                OPTIONAL MATCH (n)-[r:RELATION {user_id: $user_id}]->(m)
+                RETURN count(DISTINCT n) as entities, count(r) as relations,
+                       collect(DISTINCT n.label) as entity_types,
+                       collect(DISTINCT r.type) as relation_types
+                """
+                result = session.run(stats_query, {'user_id': user_id})
+
+            record = result.single()
+            if record:
+                return {
+                    'total_entities': record['entities'],
+                    'total_relations': record['relations'],
+                    'entity_types': record['entity_types'],
+                    'relation_types': record['relation_types']
+                }
+
+            return {'total_entities': 0, 'total_relations': 0}
+
+    def needs_owners(self) -> bool:
+        # 补写完成后留下标记节点，之后启动时不再扫描
+        with self.driver.session() as session:
+            record = session.run("MATCH (s:GraphSchema) RETURN s.user_scoped AS done").single()
+            return not (record and record['done'])
+
+    def assign_owners(self, owners: Dict[int, int]):
+        rows = [{'file_id': file_id, 'user_id': user_id} for file_id, user_id in owners.items()]
+        with self.driver.session() as session:
+            for start in range(0, len(rows), self.OWNER_BATCH_FILES):
+                batch = rows[start:start + self.OWNER_BATCH_FILES]
+                session.run("""
+                UNWIND $rows AS row
+                MATCH (n:Entity {file_id: row.file_id}) WHERE n.user_id IS NULL
+                SET n.user_id = row.user_id
+                """, {'rows': batch})
+                session.run("""
+                UNWIND $rows AS row
+                MATCH (:Entity {file_id: row.file_id})-[r:RELATION {file_id: row.file_id}]->()
+                WHERE r.user_id IS NULL
+                SET r.user_id = row.user_id
+                """, {'rows': batch})
+            session.run("MERGE (s:GraphSchema) SET s.user_scoped = true")
+
+    def close(self):
+        self.driver.close()
+
+class KnowledgeGraphBuilder:
+    """知识图谱构建器
+
+    图存储按用户分区，所有读取都限定在调用者自己的数据中。owners 返回 {文件ID: 用户ID}，
+    用于在首次加载时为分区之前写入的旧数据补写所属用户。
+
+    batch_files 大于0时，submit_graph 的写入经 GraphWriteBuffer 与其他文件合并成批量事务，
+    写入日志保存在 write_log_dir；创建时先重放已退出进程遗留的日志，on_replayed 收到重放的文件ID。
+    """
+
+    def __init__(self, backend: Optional[GraphBackend] = None,
+                 owners: Optional[Callable[[], Dict[int, int]]] = None,
+                 batch_files: int = 0, write_log_dir: Optional[str] = None,
+                 on_replayed: Optional[Callable[[List[int]], None]] = None):
+        self.backend = backend or self._create_backend()
+        if owners is not None and self.backend.needs_owners():
+            with self._timed("assign_owners"):
+                self.backend.assign_owners(owners())
+            print("已为图存储中的旧数据补写所属用户")
+
+        self.writer = None
+        if batch_files > 0:
+            persist = self.backend.flush if self.backend.flush_required else None
+            replayed = replay_logs(self._write_batch, write_log_dir, batch_files, persist)
+            if replayed and on_replayed is not None:
+                on_replayed(replayed)
+            self.writer = GraphWriteBuffer(self._write_batch, write_log_dir, max_files=batch_files,
+                                           persist=persist)
+
+    def _create_backend(self) -> GraphBackend:
+        """根据配置选择图存储后端"""
+        if GRAPH_BACKEND in ("auto", "neo4j"):
+            driver = self._connect()
+            if driver:
+                return Neo4jGraphBackend(driver)
+
+        from memory_graph import MemoryGraphBackend
+        print(f"使用内置图引擎，数据目录: {GRAPH_DATA_DIR}")
+        return MemoryGraphBackend(GRAPH_DATA_DIR)
+
+    def _connect(self):
+        """连接Neo4j数据库"""
+        try:
+            driver = get_neo4j_driver()
+            # 测试连接
+            with driver.session() as session:
+                session.run("RETURN 1")
+            print("Neo4j连接成功")
+            return driver
+        except Exception as e:
+            print(f"Neo4j连接失败: {e}")
+            return None
+
+    def submit_graph(self, entities: List[Entity], relations: List[Relation], file_id: int, user_id: int,
+                     callback: Optional[Callable[[Future], Any]] = None) -> Future:
+        """提交一个文件的图谱写入，返回写入图存储后完成的 Future
+
+        Future 的结果为该文件的图谱数据（合并写入时只含 stats）；合并写入失败时 Future 得到该异常，
+        调用方据此把文件标记为出错（写入记录保留在日志中，下次启动时重放）。
+        callback 在写入完成后以该 Future 为参数在回调线程中执行。
+        """
+        if self.writer is None:
+            result = Future()
+            result.set_result(self.build_graph(entities, relations, file_id, user_id))
+            if callback is not None:
+                callback(result)
+            return result
+
+        result = Future()
+
+        def written(future: Future):
+            if future.exception() is None:
+                result.set_result(future.result())
+            else:
+                result.set_exception(future.exception())
+
+        self.writer.submit(entities, relations, file_id, user_id).add_done_callback(written)
+        if callback is not None:
+            self.writer.add_callback(result, callback)
+        return result
+
+    def _write_batch(self, writes: List[GraphWrite]):
+        with self._timed("write_batch"):
+            self.backend.write_batch(writes)
+
+    def build_graph(self, entities: List[Entity], relations: List[Relation], file_id: int,
+                    user_id: int) -> Dict[str, Any]:
+        """构建知识图谱（单独写入，不经合并）"""
+        try:
+            with span(stage="graph_write"), self._timed("write_graph"):
+                return self.backend.write_graph(entities, relations, file_id, user_id)
+        except Exception as e:
+            record_error("graph")
+            print(f"图谱构建失败({self.backend.name}): {e}")
+            return self._build_simple_graph(entities, relations, file_id)
+
+    def _timed(self, operation: str):
+        return span(GRAPH_QUERY_SECONDS, backend=self.backend.name, operation=operation)
+
+    def _build_simple_graph(self, entities: List[Entity], relations: List[Relation], file_id: int) -> Dict[str, Any]:
+        """构建简化的图谱数据（不写入图存储）"""
         # 创建节点
         nodes = []
         node_mapping = {}
-        
+
         for i, entity in enumerate(entities):
             node_id = f"node_{i}"
-            node_mapping[entity['text']] = node_id
+            node_mapping[entity.text] = node_id
             nodes.append({
                 'id': node_id,
-                'label': entity['text'],
-                'type': entity['label'],
-                'confidence': entity.get('confidence', 0.0),
-                'size': min(max(entity.get('confidence', 0.5) * 20, 10), 30)
+                'label': entity.text,
+                'type': entity.label,
+                'confidence': entity.confidence,
+                'size': min(max(entity.confidence * 20, 10), 30)
             })
-        
+
         # 创建边
         edges = []
         for i, relation in enumerate(relations):
-            source_id = node_mapping.get(relation['subject'])
-            target_id = node_mapping.get(relation['object'])
-            
+            source_id = node_mapping.get(relation.subject)
+            target_id = node_mapping.get(relation.object)
+
             if source_id and target_id:
                 edges.append({
                     'id': f"edge_{i}",
                     'source': source_id,
                     'target': target_id,
-                    'relation': relation['predicate'],
-                    'confidence': relation.get('confidence', 0.0),
-                    'context': relation.get('context', ''),
-                    'width': max(relation.get('confidence', 0.5) * 3, 1)
+                    'relation': relation.predicate,
+                    'confidence': relation.confidence,
+                    'context': relation.context,
+                    'width': max(relation.confidence * 3, 1)
                 })
-        
+
         return {
             'nodes': nodes,
             'edges': edges,
@@ -190,133 +594,60 @@ class KnowledgeGraphBuilder:
                 'total_edges': len(edges)
             }
         }
-    
-    def search_entities(self, query: str, limit: int = 20) -> List[Dict]:
-        """搜索实体"""
-        if not self.driver:
-            return []
-        
+
+    def delete_file(self, file_id: int):
+        """删除文件对应的图谱数据（先等待该文件尚未写入的数据写入，避免删除后又被写入）"""
+        if self.writer is not None:
+            self.writer.wait_file(file_id)
         try:
-            with self.driver.session() as session:
-                search_query = """
-                MATCH (n:Entity)
-                WHERE toLower(n.text) CONTAINS toLower($query)
-                RETURN n.id as id, n.text as text, n.label as label, 
-                       n.confidence as confidence, n.file_id as file_id
-                ORDER BY n.confidence DESC
-                LIMIT $limit
-                """
-                
-                result = session.run(search_query, {'query': query, 'limit': limit})
-                entities = []
-                for record in result:
-                    entities.append({
-                        'id': record['id'],
-                        'text': record['text'],
-                        'label': record['label'],
-                        'confidence': record['confidence'],
-                        'file_id': record['file_id']
-                    })
-                
-                return entities
-        
+            with self._timed("delete_file"):
+                self.backend.delete_file(file_id)
+        except Exception as e:
+            record_error("graph")
+            print(f"图谱删除失败: {e}")
+
+    def search_entities(self, user_id: int, query: str, limit: int = 20) -> List[Dict]:
+        """在该用户的实体中搜索"""
+        try:
+            with self._timed("search_entities"):
+                return self.backend.search_entities(user_id, query, limit)
         except Exception as e:
+            record_error("graph")
             print(f"实体搜索失败: {e}")
             return []
-    
-    def find_paths(self, start_entity: str, end_entity: str, max_depth: int = 3) -> List[List[Dict]]:
-        """查找两个实体之间的路径"""
-        if not self.driver:
-            return []
-        
+
+    def find_paths(self, user_id: int, start_entity: str, end_entity: str, max_depth: int = 3) -> List[List[Dict]]:
+        """查找该用户图谱中两个实体之间的路径"""
         try:
-            with self.driver.session() as session:
-                path_query = """
-                MATCH path = shortestPath((start:Entity {text: $start})-[*1..$max_depth]-(end:Entity {text: $end}))
-                RETURN path
-                LIMIT 10
-                """
-                
-                result = session.run(path_query, {
-                    'start': start_entity,
-                    'end': end_entity,
-                    'max_depth': max_depth
-                })
-                
-                paths = []
-                for record in result:
-                    path = record['path']
-                    path_data = []
-                    
-                    for i in range(len(path.nodes)):
-                        node = path.nodes[i]
-                        path_data.append({
-                            'type': 'node',
-                            'id': node['id'],
-                            'text': node['text'],
-                            'label': node['label']
-                        })
-                        
-                        if i < len(path.relationships):
-                            rel = path.relationships[i]
-                            path_data.append({
-                                'type': 'relationship',
-                                'relation': rel['type'],
-                                'confidence': rel.get('confidence', 0.0)
-                            })
-                    
-                    paths.append(path_data)
-                
-                return paths
-        
+            with self._timed("find_paths"):
+                return self.backend.find_paths(user_id, start_entity, end_entity, max_depth)
         except Exception as e:
+            record_error("graph")
             print(f"路径查找失败: {e}")
             return []
-    
-    def get_graph_stats(self, file_id: int = None) -> Dict[str, Any]:
-        """获取图谱统计信息"""
-        if not self.driver:
-            return {'total_entities': 0, 'total_relations': 0}
-        
+
+    def get_neighbors(self, user_id: int, entity: str, depth: int = 1, limit: int = 100) -> Dict[str, Any]:
+        """获取该用户图谱中实体的邻域子图"""
         try:
-            with self.driver.session() as session:
-                if file_id:
-                    # 特定文件的统计
-                    stats_query = """
-                    MATCH (n:Entity {file_id: $file_id})
-                    OPTIONAL MATCH (n)-[r:RELATION {file_id: $file_id}]->(m)
-                    RETURN count(DISTINCT n) as entities, count(r) as relations,
-                           collect(DISTINCT n.label) as entity_types,
-                           collect(DISTINCT r.type) as relation_types
-                    """
-                    result = session.run(stats_query, {'file_id': file_id})
-                else:
-                    # 全局统计
-                    stats_query = """
-                    MATCH (n:Entity)
-                    OPTIONAL MATCH (n)-[r:RELATION]->(m)
-                    RETURN count(DISTINCT n) as entities, count(r) as relations,
-                           collect(DISTINCT n.label) as entity_types,
-                           collect(DISTINCT r.type) as relation_types
-                    """
-                    result = session.run(stats_query)
-                
-                record = result.single()
-                if record:
-                    return {
-                        'total_entities': record['entities'],
-                        'total_relations': record['relations'],
-                        'entity_types': record['entity_types'],
-                        'relation_types': record['relation_types']
-                    }
-                
-                return {'total_entities': 0, 'total_relations': 0}
-        
+            with self._timed("get_neighbors"):
+                return self.backend.get_neighbors(user_id, entity, depth, limit)
         except Exception as e:
+            record_error("graph")
+            print(f"邻域查询失败: {e}")
+            return {'nodes': [], 'edges': []}
+
+    def get_graph_stats(self, user_id: int, file_id: int = None) -> Dict[str, Any]:
+        """获取该用户（或其中一个文件）的图谱统计信息"""
+        try:
+            with self._timed("get_graph_stats"):
+                return self.backend.get_graph_stats(user_id, file_id)
+        except Exception as e:
+            record_error("graph")
             print(f"统计信息获取失败: {e}")
             return {'total_entities': 0, 'total_relations': 0}
-    
+
     def close(self):
-        """关闭连接"""
-        if self.driver:
-            self.driver.close()
\ No newline at end of file
+        """写入缓冲中剩余的数据并关闭连接"""
+        if self.writer is not None:
+            self.writer.close()
+        self.backend.close()
@@ -1,23 +1,56 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, load_only
+from starlette.concurrency import run_in_threadpool
 import uvicorn
 import os
-from typing import List, Optional
-import json
+import asyncio
+import shutil
+import threading
+import uuid
+import zipfile
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+import time
 
-from database import SessionLocal, engine, Base
-from models import User, FileRecord, KnowledgeGraph
-from auth import get_current_user, create_access_token, verify_password, get_password_hash
-from schemas import UserCreate, UserLogin, UserResponse, FileResponse, GraphResponse
+from database import SessionLocal, engine, Base, add_missing_columns, add_missing_indexes
+from models import User, FileRecord, KnowledgeGraph, ProfileRecord, ImageFingerprint, FileContent
+from auth import get_current_user, get_admin_user, get_user_from_token, create_access_token, verify_password, get_password_hash
+from schemas import UserCreate, UserLogin, UserResponse, FileResponse, GraphResponse, GraphStats, PathRequest, PathResponse
 from file_handler import FileProcessor
 from knowledge_graph import KnowledgeGraphBuilder
-from nlp_processor import NLPProcessor
+from write_behind import GRAPH_WRITE_BATCH_FILES, GRAPH_WRITE_LOG_DIR
+from nlp_processor import NLPProcessor, extract_knowledge_worker, use_parallel_extract
+from video_reader import VIDEO_EXTENSIONS, tag_timestamps
+from records import Entity, Relation
+from graph_stats import GraphStatsManager
+from graph_versions import GraphVersionManager, graph_records
+from graph_analytics import GraphAnalytics
+from graph_layout import GraphLayoutManager, graph_view, has_layout
+from image_hash import ImageFingerprintStore, IMAGE_DEDUP_PHASH_DISTANCE
+from query_cache import QueryCache
+from content_store import content_store
+from entity_index import EntityVectorIndex
+from pipeline import IngestionPipeline
+from components import ComponentRegistry
+import metrics
+from metrics import span, record_knowledge, record_error
+import profiling
+from profiling import profile_file, save_profile
+from progress import broker, stream_events
+from admission import scheduler, rate_limit, processing_cost, user_weight, too_many_requests, AdmissionRejected
 
 # 创建数据库表
 Base.metadata.create_all(bind=engine)
+add_missing_columns("knowledge_graphs", {"version": "INTEGER DEFAULT 1", "layout": "BLOB"})
+add_missing_indexes(KnowledgeGraph.__table__)
+add_missing_columns("user_graph_statistics", {"graph_generation": "INTEGER DEFAULT 0"})
+metrics.instrument_engine(engine)
 
 app = FastAPI(
     title="多模态知识图谱系统",
@@ -34,6 +67,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def _save_request_profile(result: profiling.ProfileResult):
+    db = SessionLocal()
+    try:
+        save_profile(db, result, "request")
+    finally:
+        db.close()
+
+# 慢请求剖析（阈值内完成的请求只有登记/注销的开销）
+if profiling.PROFILE_REQUEST_THRESHOLD > 0:
+    app.add_middleware(profiling.RequestProfilingMiddleware, on_result=_save_request_profile,
+                       exclude_suffixes=("/events",))
+
 # 静态文件服务
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
@@ -47,10 +92,49 @@ def get_db():
     finally:
         db.close()
 
-# 初始化处理器
-file_processor = FileProcessor()
-nlp_processor = NLPProcessor()
-kg_builder = KnowledgeGraphBuilder()
+# 初始化处理器（重量级组件延迟到首次使用或后台预热时加载）
+components = ComponentRegistry()
+# 已OCR图片的指纹库（近似重复的图片复用识别文本）
+image_fingerprints = ImageFingerprintStore(SessionLocal) if IMAGE_DEDUP_PHASH_DISTANCE >= 0 else None
+file_processor = components.register("file_processor", lambda: FileProcessor(image_fingerprints))
+nlp_processor = components.register("nlp_processor", NLPProcessor)
+def _file_owners() -> Dict[int, int]:
+    """文件ID到所属用户的映射（为分区之前写入的图数据补写用户）"""
+    db = SessionLocal()
+    try:
+        return dict(db.query(FileRecord.id, FileRecord.user_id))
+    finally:
+        db.close()
+
+kg_builder = components.register("kg_builder", lambda: KnowledgeGraphBuilder(
+    owners=_file_owners, batch_files=GRAPH_WRITE_BATCH_FILES, write_log_dir=GRAPH_WRITE_LOG_DIR,
+    on_replayed=_complete_replayed), preload=False)
+# 索引在内存中维护行数并追加写入文件，不能在fork前打开后由多个进程共用
+entity_index = components.register("entity_index", EntityVectorIndex, preload=False)
+stats_manager = GraphStatsManager()
+version_manager = GraphVersionManager()
+graph_analytics = GraphAnalytics()
+layout_manager = GraphLayoutManager(SessionLocal)
+query_cache = QueryCache()
+
+# 启动后在后台预热组件
+WARM_UP_ON_STARTUP = os.getenv("WARM_UP_ON_STARTUP", "true").lower() == "true"
+# 导入时同步加载模型；配合 gunicorn --preload 由主进程加载一次，重启的worker无需重新加载（仍只能运行单个worker）
+PRELOAD_COMPONENTS = os.getenv("PRELOAD_COMPONENTS", "false").lower() == "true"
+
+# 统计信息对账周期（秒）
+STATS_RECONCILE_INTERVAL = int(os.getenv("STATS_RECONCILE_INTERVAL", "3600"))
+
+# 支持上传的文件类型
+ALLOWED_EXTENSIONS = ['.txt', '.pdf', '.docx', '.jpg', '.png', '.jpeg'] + VIDEO_EXTENSIONS
+
+# 批量摄取流水线配置
+BATCH_EXTRACT_WORKERS = int(os.getenv("BATCH_EXTRACT_WORKERS", "4"))
+BATCH_NLP_WORKERS = int(os.getenv("BATCH_NLP_WORKERS", str(os.cpu_count() or 2)))
+BATCH_QUEUE_SIZE = int(os.getenv("BATCH_QUEUE_SIZE", "16"))
+# 批量任务记录的保留时间（秒）和条数上限，超出后最早的记录被淘汰
+BATCH_JOB_TTL = float(os.getenv("BATCH_JOB_TTL", "86400"))
+BATCH_JOB_MAX_ENTRIES = int(os.getenv("BATCH_JOB_MAX_ENTRIES", "10000"))
 
 @app.on_event("startup")
 async def startup_event():
@@ -69,6 +153,46 @@ async def startup_event():
             db.add(admin_user)
             db.commit()
             print("Created default admin user: admin/admin123")
+        version_manager.migrate_legacy(db)
+    finally:
+        db.close()
+    
+    if WARM_UP_ON_STARTUP:
+        components.start_background_warm_up()
+    
+    if STATS_RECONCILE_INTERVAL > 0:
+        asyncio.create_task(reconcile_stats_periodically())
+
+@app.on_event("shutdown")
+def shutdown_event():
+    """关闭时等待流水线处理完已提交的任务并释放资源"""
+    ingestion_pipeline.shutdown()
+    if kg_builder.is_loaded:
+        # 写入缓冲中剩余的文件在这里写入并标记为已完成
+        kg_builder.close()
+    layout_manager.shutdown()
+    if file_processor.is_loaded:
+        file_processor.close()
+    if _nlp_pool is not None:
+        _nlp_pool.shutdown()
+
+async def reconcile_stats_periodically():
+    """定期对账图谱统计信息"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(STATS_RECONCILE_INTERVAL)
+        try:
+            fixed = await loop.run_in_executor(None, _reconcile_stats)
+            if fixed:
+                print(f"统计信息对账完成，修正了 {fixed} 个用户的统计")
+        except Exception as e:
+            record_error("stats_reconcile")
+            print(f"统计信息对账失败: {e}")
+
+def _reconcile_stats() -> int:
+    db = SessionLocal()
+    try:
+        return stats_manager.reconcile(db)
     finally:
         db.close()
 
@@ -76,6 +200,21 @@ async def startup_event():
 async def root():
     return {"message": "多模态知识图谱系统 API", "version": "1.0.0"}
 
+@app.get("/health/ready")
+async def readiness():
+    """就绪检查：报告各组件是否已完成加载，全部就绪前返回503"""
+    return JSONResponse(
+        status_code=200 if components.all_ready else 503,
+        content={"ready": components.all_ready, "components": components.status()}
+    )
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus文本格式的运行指标"""
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="指标未启用")
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
 # 用户认证相关接口
 @app.post("/auth/register", response_model=UserResponse)
 async def register(user: UserCreate, db: Session = Depends(get_db)):
@@ -138,26 +277,49 @@ async def get_current_user_info(current_user: User = Depends(get_current_user)):
     )
 
 # 文件管理接口
-@app.post("/files/upload", response_model=FileResponse)
+@app.post("/files/upload", response_model=FileResponse, dependencies=[Depends(rate_limit("upload"))])
 async def upload_file(
     file: UploadFile = File(...),
+    profile: bool = False,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """上传文件"""
+    """上传文件（管理员可指定 profile=true 对本次处理做完整剖析）
+    
+    处理槽位已满时在公平队列中等待，队列已满时返回429，此时文件不会被保存。
+    """
     # 检查文件类型
-    allowed_extensions = ['.txt', '.pdf', '.docx', '.jpg', '.png', '.jpeg']
     file_extension = os.path.splitext(file.filename)[1].lower()
-    if file_extension not in allowed_extensions:
+    if file_extension not in ALLOWED_EXTENSIONS:
         raise HTTPException(status_code=400, detail="不支持的文件类型")
     
+    content = await file.read()
+    return await _run_admitted(
+        current_user, processing_cost(len(content)),
+        lambda: _store_and_process(file, content, file_extension, profile, current_user, db)
+    )
+
+async def _run_admitted(user: User, cost: float, work):
+    """申请处理槽位后执行 work（返回协程的函数），队列已满时返回429"""
+    try:
+        await scheduler.acquire_async(user.id, cost, user_weight(user))
+    except AdmissionRejected as e:
+        raise too_many_requests(e)
+    
+    started = time.perf_counter()
+    try:
+        return await work()
+    finally:
+        scheduler.release(cost, time.perf_counter() - started)
+
+async def _store_and_process(file: UploadFile, content: bytes, file_extension: str, profile: bool,
+                             current_user: User, db: Session) -> FileResponse:
     # 保存文件
     upload_dir = "uploads"
     os.makedirs(upload_dir, exist_ok=True)
     file_path = os.path.join(upload_dir, f"{current_user.id}_{file.filename}")
     
     with open(file_path, "wb") as buffer:
-        content = await file.read()
         buffer.write(content)
     
     # 记录到数据库
@@ -175,7 +337,7 @@ async def upload_file(
     
     # 异步处理文件（这里简化为同步）
     try:
-        await process_file_async(file_record.id, db)
+        await process_file_async(file_record.id, db, force_profile=profile and current_user.is_admin)
     except Exception as e:
         file_record.status = "error"
         file_record.error_message = str(e)
@@ -190,42 +352,494 @@ async def upload_file(
         created_at=file_record.created_at
     )
 
-async def process_file_async(file_id: int, db: Session):
-    """异步处理文件"""
+@app.post("/files/{file_id}/reprocess", response_model=FileResponse, dependencies=[Depends(rate_limit("upload"))])
+async def reprocess_file(
+    file_id: int,
+    profile: bool = False,
+    reextract: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """重新处理文件，结果保存为图谱的新版本（旧版本可通过版本接口查看和比较）
+
+    默认复用首次处理时保存的提取文本，只重新执行NLP和图谱构建；reextract=true 时重新解析文件（包括OCR）。
+    """
+    file_record = db.query(FileRecord).filter(
+        FileRecord.id == file_id,
+        FileRecord.user_id == current_user.id
+    ).first()
+    
+    if not file_record:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    if file_record.status == "processing":
+        raise HTTPException(status_code=409, detail="文件正在处理中")
+    
+    async def work():
+        try:
+            await process_file_async(file_record.id, db, force_profile=profile and current_user.is_admin,
+                                     reprocess=True, reextract=reextract)
+        except Exception:
+            pass  # 错误已记录在文件状态中
+        db.refresh(file_record)
+        return FileResponse(
+            id=file_record.id,
+            filename=file_record.filename,
+            file_type=file_record.file_type,
+            file_size=file_record.file_size,
+            status=file_record.status,
+            created_at=file_record.created_at
+        )
+    return await _run_admitted(current_user, processing_cost(file_record.file_size), work)
+
+async def process_file_async(file_id: int, db: Session, force_profile: bool = False, reprocess: bool = False,
+                             reextract: bool = False):
+    """异步处理文件（在线程池中执行，处理期间事件循环可以继续推送进度事件）"""
+    await run_in_threadpool(_process_file, file_id, db, force_profile, reprocess, reextract)
+
+def _process_file(file_id: int, db: Session, force_profile: bool = False, reprocess: bool = False,
+                  reextract: bool = False):
     file_record = db.query(FileRecord).filter(FileRecord.id == file_id).first()
     if not file_record:
         return
     
+    started = time.perf_counter()
+    session = profile_file("process_file", force=force_profile)
     try:
-        file_record.status = "processing"
-        db.commit()
-        
-        # 处理文件内容
-        content = file_processor.extract_text(file_record.file_path, file_record.file_type)
-        
-        # NLP处理
-        entities, relations = nlp_processor.extract_knowledge(content)
-        
-        # 构建知识图谱
-        graph_data = kg_builder.build_graph(entities, relations, file_record.id)
-        
-        # 保存图谱数据
-        kg_record = KnowledgeGraph(
-            file_id=file_record.id,
-            entities=json.dumps(entities, ensure_ascii=False),
-            relations=json.dumps(relations, ensure_ascii=False),
-            graph_data=json.dumps(graph_data, ensure_ascii=False)
-        )
-        db.add(kg_record)
-        
-        file_record.status = "completed"
-        db.commit()
+        with session:
+            file_record.status = "processing"
+            db.commit()
+            _publish(file_record, "processing")
+            
+            # 处理文件内容（重新处理时复用保存的提取文本，不再重新解析和OCR）
+            content = _stored_text(db, file_record.id) if reprocess and not reextract else None
+            if content is None:
+                content = file_processor.extract_text(
+                    file_record.file_path, file_record.file_type,
+                    progress_callback=_extract_progress(file_record),
+                    user_id=file_record.user_id, file_id=file_record.id
+                )
+                _save_text(db, file_record, content)
+                db.commit()
+            _publish(file_record, "extracted", characters=len(content))
+            
+            # NLP处理（大文档分块后在进程池中并行抽取）
+            executor = _get_nlp_pool() if use_parallel_extract(content) else None
+            entities, relations = nlp_processor.extract_knowledge(content, executor=executor)
+            if file_record.file_type in VIDEO_EXTENSIONS:
+                entities = tag_timestamps(content, entities)
+            _publish(file_record, "analyzed", entities=len(entities), relations=len(relations))
+            
+            # 构建知识图谱（重新处理时先清除图存储和向量索引中的旧版本）
+            if reprocess:
+                kg_builder.delete_file(file_record.id)
+                entity_index.remove_file(file_record.id)
+            _save_knowledge(db, file_record, entities, relations)
+            # 图存储写入与同时完成的其他文件合并，写入后才标记为已完成
+            graph_data = kg_builder.submit_graph(entities, relations, file_record.id, file_record.user_id).result()
+            _publish_graph_written(file_record, graph_data)
+            _mark_completed(db, file_record)
+        _record_file_metrics(file_record, started)
+        _publish(file_record, "completed")
         
     except Exception as e:
+        print(f"文件处理失败(file_id={file_id}): {e}")
+        record_error("process_file")
         file_record.status = "error"
         file_record.error_message = str(e)
+        stats_manager.touch(db, file_record.user_id)
         db.commit()
+        _record_file_metrics(file_record, started)
+        _publish(file_record, "error", message=str(e))
         raise
+    finally:
+        if session.result is not None:
+            save_profile(db, session.result, "file", file_id)
+
+def _stored_text(db: Session, file_id: int) -> Optional[str]:
+    """首次处理时保存的提取文本"""
+    row = db.query(FileContent.data).filter(FileContent.file_id == file_id).first()
+    return content_store.unpack(row.data) if row else None
+
+def _save_text(db: Session, file_record: FileRecord, content: str):
+    """压缩保存提取文本（不提交事务）"""
+    with span(stage="text_save", file_type=file_record.file_type):
+        row = db.query(FileContent).filter(FileContent.file_id == file_record.id).first()
+        if row is None:
+            row = FileContent(file_id=file_record.id)
+            db.add(row)
+        row.data = content_store.pack('text', content)
+        row.characters = len(content)
+
+def _publish(file_record: FileRecord, event: str, **data):
+    broker.publish(file_record.user_id, file_record.id, event, **data)
+
+def _extract_progress(file_record: FileRecord):
+    """文本提取进度回调（PDF按页、DOCX按段落）"""
+    def callback(done: int, total: int):
+        _publish(file_record, "extracting", done=done, total=total)
+    return callback
+
+def _publish_graph_written(file_record: FileRecord, graph_data: dict):
+    stats = graph_data.get('stats', {})
+    _publish(file_record, "graph_written",
+             nodes=stats.get('total_nodes', len(graph_data.get('nodes', []))),
+             edges=stats.get('total_edges', len(graph_data.get('edges', []))))
+
+def _save_knowledge(db: Session, file_record: FileRecord, entities: List[Entity], relations: List[Relation]):
+    """保存图谱数据（新版本）并更新统计和索引
+
+    在提交图存储写入之前提交：写入日志中的文件在重启重放后即可直接标记为已完成。
+    """
+    with span(stage="sql_save", file_type=file_record.file_type):
+        # 上一版本的节点坐标，新版本在其基础上增量布局
+        previous_layout = layout_manager.current_positions(db, file_record.id)
+        current = version_manager.save(db, file_record.id, entities, relations)
+        stats_manager.record_file(db, file_record, entities, relations)
+        db.commit()
+    
+    layout_manager.submit(file_record.id, current.version, previous_layout)
+    with span(stage="index", file_type=file_record.file_type):
+        entity_index.add_entities(file_record.id, file_record.user_id, entities)
+    record_knowledge(entities, relations)
+
+def _mark_completed(db: Session, file_record: FileRecord):
+    """图存储写入完成后将文件标记为已完成（写入期间缓存的图查询结果随之失效）"""
+    file_record.status = "completed"
+    stats_manager.touch(db, file_record.user_id)
+    db.commit()
+
+def _complete_replayed(file_ids: List[int]):
+    """启动时从写入日志重放了图数据的文件：SQL部分已在写入图存储之前保存，标记为已完成"""
+    db = SessionLocal()
+    try:
+        for file_record in db.query(FileRecord).filter(FileRecord.id.in_(file_ids),
+                                                        FileRecord.status == "processing"):
+            _mark_completed(db, file_record)
+    finally:
+        db.close()
+
+def _record_file_metrics(file_record: FileRecord, started: float):
+    """记录单个文件的处理耗时、大小和结果"""
+    metrics.FILE_SECONDS.observe(time.perf_counter() - started,
+                                 file_type=file_record.file_type, status=file_record.status)
+    metrics.FILE_SIZE_BYTES.observe(file_record.file_size or 0, file_type=file_record.file_type)
+    metrics.FILES_TOTAL.inc(file_type=file_record.file_type, status=file_record.status)
+
+# 批量摄取：提取 -> NLP（进程池）-> 图谱写入，三个阶段通过有界队列并行
+_nlp_pool = None
+_nlp_pool_lock = threading.Lock()
+batch_jobs: "OrderedDict[str, dict]" = OrderedDict()
+
+def _remember_batch(batch_id: str, user_id: int, file_ids: List[int]):
+    """记录批量任务，同时淘汰过期和超出条数上限的记录（按创建顺序）"""
+    now = time.time()
+    batch_jobs[batch_id] = {'user_id': user_id, 'file_ids': file_ids, 'created': now}
+    while batch_jobs:
+        oldest = next(iter(batch_jobs.values()))
+        if len(batch_jobs) <= BATCH_JOB_MAX_ENTRIES and now - oldest['created'] <= BATCH_JOB_TTL:
+            break
+        batch_jobs.popitem(last=False)
+
+def _get_nlp_pool() -> ProcessPoolExecutor:
+    global _nlp_pool
+    with _nlp_pool_lock:
+        if _nlp_pool is None:
+            _nlp_pool = ProcessPoolExecutor(
+                max_workers=BATCH_NLP_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _nlp_pool
+
+def _pipeline_extract(job: dict) -> dict:
+    db = SessionLocal()
+    try:
+        file_record = db.query(FileRecord).filter(FileRecord.id == job['file_id']).first()
+        file_record.status = "processing"
+        db.commit()
+        job['user_id'] = file_record.user_id
+        job['file_type'] = file_record.file_type
+        job['started'] = time.perf_counter()
+        _publish(file_record, "processing")
+        with profile_file("extract", force=job.get('profile', False)) as session:
+            job['content'] = file_processor.extract_text(
+                file_record.file_path, file_record.file_type,
+                progress_callback=_extract_progress(file_record),
+                user_id=file_record.user_id, file_id=file_record.id
+            )
+        _save_text(db, file_record, job['content'])
+        db.commit()
+        if session.result is not None:
+            save_profile(db, session.result, "file", file_record.id)
+        _publish(file_record, "extracted", characters=len(job['content']))
+        return job
+    finally:
+        db.close()
+
+def _pipeline_nlp(job: dict) -> dict:
+    content = job.pop('content')
+    # 工作进程内的分阶段计时无法回传，这里记录整个NLP阶段（含排队等待）的耗时
+    with span(stage="nlp_pool"):
+        if use_parallel_extract(content):
+            # 大文档不整篇交给一个工作进程，而是在本线程中分块提交到同一个进程池
+            job['entities'], job['relations'] = nlp_processor.extract_knowledge(content, executor=_get_nlp_pool())
+        else:
+            job['entities'], job['relations'] = _get_nlp_pool().submit(extract_knowledge_worker, content).result()
+    if job['file_type'] in VIDEO_EXTENSIONS:
+        job['entities'] = tag_timestamps(content, job['entities'])
+    broker.publish(job['user_id'], job['file_id'], "analyzed",
+                   entities=len(job['entities']), relations=len(job['relations']))
+    return job
+
+def _pipeline_write(job: dict):
+    """保存SQL数据并提交图存储写入；写入阶段不等待图存储，多个文件的写入合并成批量事务"""
+    db = SessionLocal()
+    try:
+        file_record = db.query(FileRecord).filter(FileRecord.id == job['file_id']).first()
+        with profile_file("graph_write", force=job.get('profile', False)) as session:
+            _save_knowledge(db, file_record, job['entities'], job['relations'])
+        if session.result is not None:
+            save_profile(db, session.result, "file", file_record.id)
+        entities, relations = job.pop('entities'), job.pop('relations')
+        kg_builder.submit_graph(entities, relations, file_record.id, file_record.user_id,
+                                callback=lambda future: _pipeline_written(job, future))
+    finally:
+        db.close()
+
+def _pipeline_written(job: dict, future: Future):
+    """图存储写入完成（在写入缓冲的回调线程中执行），写入失败时文件标记为出错"""
+    if future.exception() is not None:
+        _pipeline_error(job, future.exception())
+        return
+    db = SessionLocal()
+    try:
+        file_record = db.query(FileRecord).filter(FileRecord.id == job['file_id']).first()
+        _publish_graph_written(file_record, future.result())
+        _mark_completed(db, file_record)
+        _record_file_metrics(file_record, job['started'])
+        _publish(file_record, "completed")
+        _release_admission(job)
+    except Exception as e:
+        _pipeline_error(job, e)
+    finally:
+        db.close()
+
+def _submit_batch(jobs: List[dict], user_id: int, weight: float):
+    """逐个为批量任务申请处理槽位后送入流水线（与单文件上传共享并发上限和公平队列）
+
+    批量任务只排队不拒绝：同一批次同时只有一个任务在公平队列中等待，
+    因此大批量不会占满队列，也不会挤占其他用户的处理份额。
+    """
+    for job in jobs:
+        scheduler.acquire(user_id, job['cost'], weight)
+        job['admitted'] = time.perf_counter()
+        ingestion_pipeline.submit(job)
+
+def _release_admission(job: dict):
+    """归还批量任务占用的处理槽位（完成和出错时都会调用，只归还一次）"""
+    admitted = job.pop('admitted', None)
+    if admitted is not None:
+        scheduler.release(job['cost'], time.perf_counter() - admitted)
+
+def _pipeline_error(job: dict, error: Exception):
+    print(f"批量处理失败(file_id={job['file_id']}): {error}")
+    record_error("pipeline")
+    _release_admission(job)
+    db = SessionLocal()
+    try:
+        file_record = db.query(FileRecord).filter(FileRecord.id == job['file_id']).first()
+        if file_record:
+            file_record.status = "error"
+            file_record.error_message = str(error)
+            stats_manager.touch(db, file_record.user_id)
+            db.commit()
+            _record_file_metrics(file_record, job.get('started', time.perf_counter()))
+            _publish(file_record, "error", message=str(error))
+    finally:
+        db.close()
+
+ingestion_pipeline = IngestionPipeline(
+    [
+        ("extract", _pipeline_extract, BATCH_EXTRACT_WORKERS),
+        ("nlp", _pipeline_nlp, BATCH_NLP_WORKERS),
+        ("graph", _pipeline_write, 1),
+    ],
+    queue_size=BATCH_QUEUE_SIZE,
+    on_error=_pipeline_error
+)
+
+def _collect_pipeline_metrics():
+    for stage, stage_metrics in ingestion_pipeline.metrics().items():
+        metrics.PIPELINE_QUEUE_DEPTH.set(stage_metrics['queue_depth'], stage=stage)
+        metrics.PIPELINE_BLOCKED_SECONDS.set(stage_metrics['blocked_seconds'], stage=stage)
+
+metrics.registry.register_collector(_collect_pipeline_metrics)
+
+def _store_upload(db: Session, user: User, filename: str, source, prefix: str) -> FileRecord:
+    """将上传内容流式写入上传目录并创建文件记录"""
+    upload_dir = "uploads"
+    os.makedirs(upload_dir, exist_ok=True)
+    file_path = os.path.join(upload_dir, f"{user.id}_{prefix}_{filename}")
+    
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(source, buffer, 1024 * 1024)
+    
+    file_record = FileRecord(
+        filename=filename,
+        file_path=file_path,
+        file_type=os.path.splitext(filename)[1].lower(),
+        file_size=os.path.getsize(file_path),
+        user_id=user.id,
+        status="uploaded"
+    )
+    db.add(file_record)
+    return file_record
+
+def _store_batch(db: Session, user: User, files: List[UploadFile], batch_id: str):
+    """保存批量上传的文件（展开ZIP压缩包），返回 (文件记录, 跳过的文件名)"""
+    records = []
+    skipped = []
+    
+    for upload in files:
+        extension = os.path.splitext(upload.filename)[1].lower()
+        if extension == '.zip':
+            # 逐个成员流式读取，不整体解压
+            try:
+                archive = zipfile.ZipFile(upload.file)
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=400, detail=f"无效的压缩包: {upload.filename}")
+            with archive:
+                for member in archive.infolist():
+                    name = os.path.basename(member.filename)
+                    if member.is_dir() or not name:
+                        continue
+                    if os.path.splitext(name)[1].lower() not in ALLOWED_EXTENSIONS:
+                        skipped.append(member.filename)
+                        continue
+                    with archive.open(member) as source:
+                        records.append(_store_upload(
+                            db, user, name, source, f"{batch_id[:8]}_{len(records)}"
+                        ))
+        elif extension in ALLOWED_EXTENSIONS:
+            records.append(_store_upload(
+                db, user, upload.filename, upload.file, f"{batch_id[:8]}_{len(records)}"
+            ))
+        else:
+            skipped.append(upload.filename)
+    return records, skipped
+
+@app.post("/files/batch-upload", dependencies=[Depends(rate_limit("batch_upload"))])
+async def batch_upload_files(
+    files: List[UploadFile] = File(...),
+    profile: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """批量上传文件（支持多个文件或ZIP压缩包），后台流水线处理；管理员可指定 profile=true 剖析各文件"""
+    batch_id = uuid.uuid4().hex
+    # 解压和写盘是阻塞操作，放到线程池执行
+    records, skipped = await run_in_threadpool(_store_batch, db, current_user, files, batch_id)
+    
+    if not records:
+        raise HTTPException(status_code=400, detail="没有可处理的文件")
+    db.commit()
+    
+    _remember_batch(batch_id, current_user.id, [r.id for r in records])
+    
+    # 由独立线程提交任务，等待处理槽位或流水线满时阻塞该线程而不是事件循环
+    jobs = [
+        {'file_id': r.id, 'profile': profile and current_user.is_admin, 'cost': processing_cost(r.file_size)}
+        for r in records
+    ]
+    threading.Thread(
+        target=_submit_batch, args=(jobs, current_user.id, user_weight(current_user)), daemon=True
+    ).start()
+    
+    return {
+        'batch_id': batch_id,
+        'files': [
+            FileResponse(
+                id=r.id,
+                filename=r.filename,
+                file_type=r.file_type,
+                file_size=r.file_size,
+                status=r.status,
+                created_at=r.created_at
+            )
+            for r in records
+        ],
+        'skipped': skipped
+    }
+
+@app.get("/files/batch/{batch_id}")
+async def get_batch_status(
+    batch_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """查询批量任务进度及流水线各阶段的吞吐和背压指标"""
+    batch = batch_jobs.get(batch_id)
+    if not batch or batch['user_id'] != current_user.id or time.time() - batch['created'] > BATCH_JOB_TTL:
+        raise HTTPException(status_code=404, detail="批量任务不存在")
+    
+    status_counts = {}
+    for (status,) in db.query(FileRecord.status).filter(FileRecord.id.in_(batch['file_ids'])):
+        status_counts[status] = status_counts.get(status, 0) + 1
+    
+    return {
+        'batch_id': batch_id,
+        'total': len(batch['file_ids']),
+        'status_counts': status_counts,
+        'pipeline': ingestion_pipeline.metrics()
+    }
+
+# 进度事件推送（SSE）：浏览器 EventSource 无法设置请求头，令牌可通过 token 查询参数传递
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+def _stream_user(request: Request, token: Optional[str]) -> User:
+    if token is None:
+        authorization = request.headers.get("Authorization", "")
+        token = authorization[7:] if authorization.startswith("Bearer ") else None
+    db = SessionLocal()
+    try:
+        user = get_user_from_token(token, db)
+    finally:
+        db.close()
+    if user is None:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    return user
+
+@app.get("/files/events")
+async def user_file_events(request: Request, token: Optional[str] = None):
+    """推送当前用户所有文件的处理进度事件"""
+    user = _stream_user(request, token)
+    subscription = broker.subscribe(user.id)
+    return StreamingResponse(stream_events(subscription), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.get("/files/{file_id}/events")
+async def file_events(file_id: int, request: Request, token: Optional[str] = None):
+    """推送单个文件的处理进度事件，文件处理结束（completed/error）后关闭数据流"""
+    user = _stream_user(request, token)
+    # 先订阅再读取当前状态，避免错过两者之间发生的结束事件
+    subscription = broker.subscribe(user.id, file_id)
+    db = SessionLocal()
+    try:
+        file_record = db.query(FileRecord).filter(
+            FileRecord.id == file_id,
+            FileRecord.user_id == user.id
+        ).first()
+        if not file_record:
+            subscription.close()
+            raise HTTPException(status_code=404, detail="文件不存在")
+        current = {
+            'file_id': file_id,
+            'event': file_record.status if file_record.status in ("completed", "error") else "status",
+            'status': file_record.status,
+            'time': time.time()
+        }
+    finally:
+        db.close()
+    return StreamingResponse(stream_events(subscription, initial=[current]),
+                             media_type="text/event-stream", headers=SSE_HEADERS)
 
 @app.get("/files", response_model=List[FileResponse])
 async def get_files(
@@ -265,20 +879,183 @@ async def delete_file(
     if os.path.exists(file_record.file_path):
         os.remove(file_record.file_path)
     
+    # 删除图存储中的节点和边
+    kg_builder.delete_file(file_record.id)
+    entity_index.remove_file(file_record.id)
+    
     # 删除数据库记录
+    stats_manager.remove_file(db, file_record.id)
+    db.query(KnowledgeGraph).filter(KnowledgeGraph.file_id == file_record.id).delete()
+    version_manager.delete_file(db, file_record.id)
+    db.query(ProfileRecord).filter(ProfileRecord.file_id == file_record.id).delete()
+    db.query(ImageFingerprint).filter(ImageFingerprint.file_id == file_record.id).delete()
+    db.query(FileContent).filter(FileContent.file_id == file_record.id).delete()
     db.delete(file_record)
     db.commit()
     
     return {"message": "文件删除成功"}
 
+# 性能剖析接口（仅管理员）
+@app.get("/admin/profiles")
+async def list_profiles(
+    file_id: Optional[int] = None,
+    kind: Optional[str] = None,
+    limit: int = 50,
+    admin: User = Depends(get_admin_user),
+    db: Session = Depends(get_db)
+):
+    """列出已采集的性能剖析"""
+    query = db.query(ProfileRecord)
+    if file_id is not None:
+        query = query.filter(ProfileRecord.file_id == file_id)
+    if kind:
+        query = query.filter(ProfileRecord.kind == kind)
+    records = query.order_by(ProfileRecord.id.desc()).limit(limit).all()
+    return [
+        {
+            'id': r.id,
+            'file_id': r.file_id,
+            'kind': r.kind,
+            'name': r.name,
+            'mode': r.mode,
+            'duration_seconds': round(r.duration_seconds or 0.0, 3),
+            'sample_count': r.sample_count,
+            'size': len(r.data),
+            'created_at': r.created_at
+        }
+        for r in records
+    ]
+
+@app.get("/admin/profiles/{profile_id}/download")
+async def download_profile(
+    profile_id: int,
+    admin: User = Depends(get_admin_user),
+    db: Session = Depends(get_db)
+):
+    """下载剖析数据：sampling 为折叠栈文本（flamegraph.pl/speedscope），cprofile 为 pstats 文件（snakeviz）"""
+    record = db.query(ProfileRecord).filter(ProfileRecord.id == profile_id).first()
+    if not record:
+        raise HTTPException(status_code=404, detail="剖析记录不存在")
+    
+    if record.mode == "sampling":
+        filename, media_type = f"profile_{record.id}.folded", "text/plain; charset=utf-8"
+    else:
+        filename, media_type = f"profile_{record.id}.prof", "application/octet-stream"
+    return Response(
+        content=record.data,
+        media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
 # 知识图谱接口
-@app.get("/graph/{file_id}", response_model=GraphResponse)
-async def get_graph(
+@app.get("/graph/stats", response_model=GraphStats)
+async def get_graph_stats(
+    file_id: Optional[int] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """获取图谱统计信息（指定file_id时为单个文件，否则为当前用户的全部文件）"""
+    if file_id is not None:
+        file_record = db.query(FileRecord).filter(
+            FileRecord.id == file_id,
+            FileRecord.user_id == current_user.id
+        ).first()
+        
+        if not file_record:
+            raise HTTPException(status_code=404, detail="文件不存在")
+    
+    return GraphStats(**stats_manager.get_stats(db, current_user.id, file_id))
+
+def _user_file_ids(db: Session, user: User) -> set:
+    """获取用户拥有的文件ID集合"""
+    return {file_id for (file_id,) in db.query(FileRecord.id).filter(FileRecord.user_id == user.id)}
+
+@app.get("/graph/entities", dependencies=[Depends(rate_limit("search"))])
+async def search_entities(
+    query: str,
+    limit: int = 20,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """在图存储中搜索实体（结果按用户的图谱代数缓存，搜索不区分大小写）"""
+    def compute():
+        return {"results": kg_builder.search_entities(current_user.id, query, limit)}
+
+    generation = stats_manager.generation(db, current_user.id)
+    return query_cache.get_or_compute("search_entities", current_user.id, generation,
+                                      (query.lower(), limit), compute)
+
+@app.post("/graph/paths", response_model=PathResponse, dependencies=[Depends(rate_limit("graph_query"))])
+async def find_paths(
+    request: PathRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """查找两个实体之间的路径（结果按用户的图谱代数缓存）"""
+    def compute():
+        paths = kg_builder.find_paths(current_user.id, request.start_node, request.end_node, request.max_depth)
+        return PathResponse(paths=paths, total_count=len(paths))
+
+    generation = stats_manager.generation(db, current_user.id)
+    return query_cache.get_or_compute("find_paths", current_user.id, generation,
+                                      (request.start_node, request.end_node, request.max_depth), compute)
+
+@app.get("/graph/neighbors", dependencies=[Depends(rate_limit("graph_query"))])
+async def get_neighbors(
+    entity: str,
+    depth: int = 1,
+    limit: int = 100,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """获取实体的邻域子图（结果按用户的图谱代数缓存）"""
+    def compute():
+        return kg_builder.get_neighbors(current_user.id, entity, depth, limit)
+
+    generation = stats_manager.generation(db, current_user.id)
+    return query_cache.get_or_compute("get_neighbors", current_user.id, generation,
+                                      (entity, depth, limit), compute)
+
+def _latest_graph_records(db: Session, file_ids) -> List[KnowledgeGraph]:
+    """获取每个文件最新的图谱记录（只加载ID和版本号，图谱内容用 _load_graph_views 读取）"""
+    latest = {}
+    query = db.query(KnowledgeGraph).options(
+        load_only(KnowledgeGraph.id, KnowledgeGraph.file_id, KnowledgeGraph.version)
+    ).filter(KnowledgeGraph.file_id.in_(file_ids)).order_by(KnowledgeGraph.id)
+    for kg in query:
+        latest[kg.file_id] = kg
+    return list(latest.values())
+
+def _load_graph_views(db: Session, kg_records: List[KnowledgeGraph]) -> List[Dict[str, Any]]:
+    """一次查询读取图谱内容并生成可视化数据"""
+    ids = [kg.id for kg in kg_records]
+    full_records = db.query(KnowledgeGraph).filter(KnowledgeGraph.id.in_(ids)).populate_existing().all()
+    return [graph_view(kg) for kg in full_records]
+
+@app.get("/graph/analytics", dependencies=[Depends(rate_limit("graph_query"))])
+async def get_user_graph_analytics(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """分析当前用户的全部图谱（同名实体跨文件合并）"""
+    kg_records = _latest_graph_records(db, _user_file_ids(db, current_user))
+    # 重新处理时图谱记录原地更新，只有版本号变化，因此缓存键包含版本号
+    cache_key = ('user', current_user.id, tuple(sorted((kg.id, kg.version) for kg in kg_records)))
+    # 图谱解压和矩阵计算较慢，放到线程池执行，避免阻塞事件循环
+    return await run_in_threadpool(
+        graph_analytics.analyze,
+        cache_key,
+        lambda: _load_graph_views(db, kg_records),
+        merge_by_text=True
+    )
+
+@app.get("/graph/{file_id}/analytics", dependencies=[Depends(rate_limit("graph_query"))])
+async def get_graph_analytics(
     file_id: int,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """获取文件的知识图谱"""
+    """分析单个文件的图谱（度中心性、PageRank、连通分量、社区）"""
     file_record = db.query(FileRecord).filter(
         FileRecord.id == file_id,
         FileRecord.user_id == current_user.id
@@ -287,22 +1064,18 @@ async def get_graph(
     if not file_record:
         raise HTTPException(status_code=404, detail="文件不存在")
     
-    kg_record = db.query(KnowledgeGraph).filter(
-        KnowledgeGraph.file_id == file_id
-    ).first()
-    
-    if not kg_record:
+    kg_records = _latest_graph_records(db, [file_id])
+    if not kg_records:
         raise HTTPException(status_code=404, detail="知识图谱不存在")
     
-    return GraphResponse(
-        id=kg_record.id,
-        file_id=kg_record.file_id,
-        entities=json.loads(kg_record.entities),
-        relations=json.loads(kg_record.relations),
-        graph_data=json.loads(kg_record.graph_data)
+    kg = kg_records[0]
+    return await run_in_threadpool(
+        graph_analytics.analyze,
+        ('file', file_id, kg.id, kg.version),
+        lambda: _load_graph_views(db, kg_records)
     )
 
-@app.get("/graph/search")
+@app.get("/graph/search", dependencies=[Depends(rate_limit("search"))])
 async def search_graph(
     query: str,
     current_user: User = Depends(get_current_user),
@@ -319,8 +1092,7 @@ async def search_graph(
     
     results = []
     for kg in kg_records:
-        entities = json.loads(kg.entities)
-        relations = json.loads(kg.relations)
+        entities, relations = graph_records(kg)
         
         # 简单的关键词匹配
         for entity in entities:
@@ -341,5 +1113,110 @@ async def search_graph(
     
     return {"results": results[:20]}  # 限制返回结果数量
 
+@app.get("/graph/search/semantic", dependencies=[Depends(rate_limit("search"))])
+async def semantic_search(
+    query: str,
+    limit: int = 20,
+    current_user: User = Depends(get_current_user)
+):
+    """基于实体向量的相似度搜索（可匹配近义写法和变体）"""
+    results = await run_in_threadpool(entity_index.search, query, limit, user_id=current_user.id)
+    return {"results": results}
+
+@app.get("/graph/{file_id}", response_model=GraphResponse)
+async def get_graph(
+    file_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """获取文件的知识图谱"""
+    file_record = db.query(FileRecord).filter(
+        FileRecord.id == file_id,
+        FileRecord.user_id == current_user.id
+    ).first()
+    
+    if not file_record:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    
+    kg_record = db.query(KnowledgeGraph).filter(
+        KnowledgeGraph.file_id == file_id
+    ).first()
+    
+    if not kg_record:
+        raise HTTPException(status_code=404, detail="知识图谱不存在")
+    
+    # 可视化数据由保存的实体和关系生成，不单独存储
+    entities, relations = graph_records(kg_record)
+    graph_data = graph_view(kg_record)
+    if not has_layout(graph_data):
+        # 布局尚未完成（或为启用布局之前保存的图谱），后台计算，之后的请求即可拿到坐标
+        layout_manager.submit(kg_record.file_id, kg_record.version)
+    
+    return GraphResponse(
+        id=kg_record.id,
+        file_id=kg_record.file_id,
+        version=kg_record.version,
+        entities=entities,
+        relations=relations,
+        graph_data=graph_data
+    )
+
+def _owned_file(db: Session, file_id: int, user: User) -> FileRecord:
+    file_record = db.query(FileRecord).filter(
+        FileRecord.id == file_id,
+        FileRecord.user_id == user.id
+    ).first()
+    if not file_record:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    return file_record
+
+@app.get("/graph/{file_id}/versions")
+async def list_graph_versions(
+    file_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """列出文件图谱的历史版本（新版本在前）"""
+    _owned_file(db, file_id, current_user)
+    return {"file_id": file_id, "versions": version_manager.list_versions(db, file_id)}
+
+@app.get("/graph/{file_id}/versions/{version}", response_model=GraphResponse)
+async def get_graph_version(
+    file_id: int,
+    version: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """获取文件图谱的某个历史版本（节点ID为按实体文本生成的稳定ID）"""
+    _owned_file(db, file_id, current_user)
+    document = version_manager.get(db, file_id, version)
+    if document is None:
+        raise HTTPException(status_code=404, detail="版本不存在")
+    return GraphResponse(id=0, file_id=file_id, version=version, **document)
+
+@app.get("/graph/{file_id}/diff")
+async def diff_graph_versions(
+    file_id: int,
+    from_version: Optional[int] = None,
+    to_version: Optional[int] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """比较两个版本的实体和关系变化（默认比较当前版本与上一个版本）"""
+    _owned_file(db, file_id, current_user)
+    if to_version is None:
+        to_version = db.query(KnowledgeGraph.version).filter(KnowledgeGraph.file_id == file_id).scalar()
+        if to_version is None:
+            raise HTTPException(status_code=404, detail="知识图谱不存在")
+    if from_version is None:
+        from_version = to_version - 1
+    result = version_manager.diff(db, file_id, from_version, to_version)
+    if result is None:
+        raise HTTPException(status_code=404, detail="版本不存在")
+    return result
+
+if PRELOAD_COMPONENTS:
+    components.warm_up(preload_only=True)
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,647 @@
+from collections import deque
+from typing import List, Dict, Any, Optional
+import glob
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from knowledge_graph import GraphBackend
+from metrics import record_error
+from records import Entity, Relation
+from write_behind import GraphWrite
+
+# 距上次落盘超过该秒数时，写入后立即持久化；空闲时由后台线程在该间隔内落盘
+MEMORY_GRAPH_SAVE_INTERVAL = float(os.getenv("MEMORY_GRAPH_SAVE_INTERVAL", "5"))
+
+class _Column:
+    """按容量倍增的定长类型数组
+
+    从磁盘加载时直接持有只读的内存映射数组，第一次写入时才复制到内存。
+    """
+
+    def __init__(self, dtype, data: Optional[np.ndarray] = None):
+        self.dtype = np.dtype(dtype)
+        if data is None:
+            self._data = np.zeros(1024, dtype=self.dtype)
+            self.size = 0
+            self._writable = True
+        else:
+            self._data = data
+            self.size = len(data)
+            self._writable = False
+
+    def append(self, value):
+        if not self._writable or self.size == len(self._data):
+            self._reserve(self.size + 1)
+        self._data[self.size] = value
+        self.size += 1
+
+    def _reserve(self, capacity: int):
+        if self._writable and capacity <= len(self._data):
+            return
+        new_capacity = max(1024, len(self._data))
+        while new_capacity < capacity:
+            new_capacity *= 2
+        data = np.zeros(new_capacity, dtype=self.dtype)
+        data[:self.size] = self._data[:self.size]
+        self._data = data
+        self._writable = True
+
+    def __getitem__(self, index):
+        return self._data[index]
+
+    def __setitem__(self, index, value):
+        if not self._writable:
+            self._reserve(self.size)
+        self._data[index] = value
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._data[:self.size]
+
+    def snapshot(self) -> np.ndarray:
+        """当前数据的只读视图：之后的第一次写入先复制数组，视图内容不再变化"""
+        self._writable = False
+        return self._data[:self.size]
+
+class MemoryGraphBackend(GraphBackend):
+    """内置的进程内图引擎
+
+    节点和边以列式数组存储，另维护(文件, 文本)唯一索引、小写文本索引、字符二元组索引和标签索引。
+    数据按用户分区：文本和二元组索引以 (用户, 键) 为键，邻接关系按用户分别构建为CSR，
+    查询只访问调用者自己的节点和边，耗时与该用户的数据量相关而与总数据量无关。
+    数据以 .npy 文件持久化，启动时以内存映射方式加载。写入后距上次落盘超过 save_interval 时立即落盘，
+    否则由后台线程在 save_interval 内落盘，进程空闲时写入的数据同样会被持久化。
+    每次落盘写入一个新的快照目录，写完后原子替换指针文件 CURRENT，中途退出时仍加载上一个完整的快照。
+    """
+
+    name = "memory"
+
+    _NODE_COLUMNS = {'uid': np.int64, 'file': np.int64, 'user': np.int64, 'label': np.int32,
+                     'confidence': np.float64, 'start': np.int64, 'end': np.int64, 'alive': np.bool_}
+    _EDGE_COLUMNS = {'src': np.int64, 'dst': np.int64, 'type': np.int32, 'file': np.int64, 'user': np.int64,
+                     'confidence': np.float64, 'alive': np.bool_}
+    # 分区之前保存的数据没有 user 列，加载后以该值占位，直到 assign_owners 补写
+    _NO_OWNER = -1
+
+    def __init__(self, data_dir: Optional[str] = None, save_interval: float = MEMORY_GRAPH_SAVE_INTERVAL):
+        self.data_dir = data_dir
+        self.save_interval = save_interval
+        self._lock = threading.RLock()
+        # 同一时间只进行一次落盘
+        self._save_lock = threading.Lock()
+        self._last_save = 0.0
+        self._dirty = False
+
+        self._nodes = {name: _Column(dtype) for name, dtype in self._NODE_COLUMNS.items()}
+        self._edges = {name: _Column(dtype) for name, dtype in self._EDGE_COLUMNS.items()}
+        self._texts: List[str] = []
+        self._contexts: List[str] = []
+        self._labels: List[str] = []
+        self._relation_types: List[str] = []
+        self._next_uid = 0
+
+        snapshot_dir = self._snapshot_dir() if data_dir else None
+        if snapshot_dir:
+            self._load(snapshot_dir)
+            self._remove_stale_snapshots(snapshot_dir)
+        self._rebuild_indexes()
+
+        self._closed = threading.Event()
+        self._flusher = None
+        if data_dir and 0 < save_interval < float('inf'):
+            self._flusher = threading.Thread(target=self._flush_periodically, name="memory-graph-flush", daemon=True)
+            self._flusher.start()
+
+    # ---- 写入 ----
+
+    def write_graph(self, entities: List[Entity], relations: List[Relation], file_id: int,
+                    user_id: int) -> Dict[str, Any]:
+        with self._lock:
+            self._write_file(entities, relations, file_id, user_id)
+            self._dirty = True
+            graph = self._get_graph_visualization_data(file_id)
+        self._maybe_save()
+        return graph
+
+    def write_batch(self, writes: List[GraphWrite]):
+        with self._lock:
+            for entities, relations, file_id, user_id in writes:
+                self._write_file(entities, relations, file_id, user_id)
+            self._dirty = True
+        self._maybe_save()
+
+    def _write_file(self, entities: List[Entity], relations: List[Relation], file_id: int, user_id: int):
+        node_mapping = {}
+        for entity in entities:
+            node_mapping[entity.text] = self._merge_node(entity, file_id, user_id)
+
+        for relation in relations:
+            subject = node_mapping.get(relation.subject)
+            obj = node_mapping.get(relation.object)
+            if subject is None or obj is None:
+                continue
+            self._merge_edge(subject, obj, relation, file_id, user_id)
+
+        self._adjacency.pop(user_id, None)
+
+    def _merge_node(self, entity: Entity, file_id: int, user_id: int) -> int:
+        """按(文本, 文件)合并节点，语义同Neo4j的MERGE"""
+        key = (entity.text, file_id)
+        confidence = entity.confidence
+        index = self._node_key_index.get(key)
+        if index is not None:
+            if self._nodes['confidence'][index] < confidence:
+                self._nodes['confidence'][index] = confidence
+            return index
+
+        index = len(self._texts)
+        self._texts.append(entity.text)
+        self._nodes['uid'].append(self._next_uid)
+        self._nodes['file'].append(file_id)
+        self._nodes['user'].append(user_id)
+        self._nodes['label'].append(self._intern(self._labels, self._label_ids, entity.label))
+        self._nodes['confidence'].append(confidence)
+        self._nodes['start'].append(entity.start)
+        self._nodes['end'].append(entity.end)
+        self._nodes['alive'].append(True)
+        self._next_uid += 1
+        self._index_node(index)
+        return index
+
+    def _merge_edge(self, subject: int, obj: int, relation: Relation, file_id: int, user_id: int):
+        """按(起点, 终点, 类型, 文件)合并边"""
+        type_id = self._intern(self._relation_types, self._relation_type_ids, relation.predicate)
+        key = (subject, obj, type_id, file_id)
+        confidence = relation.confidence
+        index = self._edge_key_index.get(key)
+        if index is not None:
+            if self._edges['confidence'][index] < confidence:
+                self._edges['confidence'][index] = confidence
+            return
+
+        index = len(self._contexts)
+        self._contexts.append(relation.context)
+        self._edges['src'].append(subject)
+        self._edges['dst'].append(obj)
+        self._edges['type'].append(type_id)
+        self._edges['file'].append(file_id)
+        self._edges['user'].append(user_id)
+        self._edges['confidence'].append(confidence)
+        self._edges['alive'].append(True)
+        self._edge_key_index[key] = index
+        self._file_edges.setdefault(file_id, []).append(index)
+
+    def delete_file(self, file_id: int):
+        with self._lock:
+            for index in self._file_nodes.pop(file_id, []):
+                self._nodes['alive'][index] = False
+                text = self._texts[index]
+                user_id = int(self._nodes['user'][index])
+                self._node_key_index.pop((text, file_id), None)
+                self._remove_from(self._text_index, (user_id, text.lower()), index)
+                self._remove_from(self._label_index, int(self._nodes['label'][index]), index)
+                for bigram in self._bigrams(text.lower()):
+                    self._remove_from(self._bigram_index, (user_id, bigram), index)
+                self._user_files.get(user_id, set()).discard(file_id)
+                self._adjacency.pop(user_id, None)
+
+            for index in self._file_edges.pop(file_id, []):
+                self._edges['alive'][index] = False
+                key = (int(self._edges['src'][index]), int(self._edges['dst'][index]),
+                       int(self._edges['type'][index]), file_id)
+                self._edge_key_index.pop(key, None)
+
+            self._dirty = True
+        self._maybe_save()
+
+    # ---- 查询 ----
+
+    def search_entities(self, user_id: int, query: str, limit: int = 20) -> List[Dict]:
+        with self._lock:
+            candidates = self._candidates_containing(user_id, query.lower())
+            confidence = self._nodes['confidence']
+            ranked = sorted(candidates, key=lambda i: -confidence[i])[:limit]
+            return [self._node_dict(i) for i in ranked]
+
+    def find_paths(self, user_id: int, start_entity: str, end_entity: str, max_depth: int = 3) -> List[List[Dict]]:
+        with self._lock:
+            starts = self._exact_text_nodes(user_id, start_entity)
+            targets = self._exact_text_nodes(user_id, end_entity)
+            if not starts or not targets:
+                return []
+
+            nodes, indptr, neighbors, edge_ids = self._get_adjacency(user_id)
+            targets = set(np.searchsorted(nodes, targets).tolist())
+            paths = []
+            for start in np.searchsorted(nodes, starts).tolist():
+                path = self._shortest_path(start, targets, max_depth, nodes, indptr, neighbors, edge_ids)
+                if path:
+                    paths.append(path)
+                    if len(paths) >= 10:
+                        break
+            return paths
+
+    def _shortest_path(self, start: int, targets: set, max_depth: int, nodes: np.ndarray,
+                       indptr: np.ndarray, neighbors: np.ndarray, edge_ids: np.ndarray) -> Optional[List[Dict]]:
+        """无向BFS，返回到任一目标节点的最短路径（节点为用户邻接表中的局部序号）"""
+        parents = {start: None}
+        frontier = deque([(start, 0)])
+        while frontier:
+            node, depth = frontier.popleft()
+            if node in targets and node != start:
+                return self._path_dicts(node, parents, nodes)
+            if depth >= max_depth:
+                continue
+            for k in range(indptr[node], indptr[node + 1]):
+                neighbor = int(neighbors[k])
+                if neighbor not in parents:
+                    parents[neighbor] = (node, int(edge_ids[k]))
+                    frontier.append((neighbor, depth + 1))
+        return None
+
+    def _path_dicts(self, node: int, parents: Dict, nodes: np.ndarray) -> List[Dict]:
+        path_data = [self._path_node(int(nodes[node]))]
+        while parents[node] is not None:
+            node, edge = parents[node]
+            path_data.append({
+                'type': 'relationship',
+                'relation': self._relation_types[self._edges['type'][edge]],
+                'confidence': float(self._edges['confidence'][edge])
+            })
+            path_data.append(self._path_node(int(nodes[node])))
+        path_data.reverse()
+        return path_data
+
+    def get_neighbors(self, user_id: int, entity: str, depth: int = 1, limit: int = 100) -> Dict[str, Any]:
+        with self._lock:
+            starts = self._exact_text_nodes(user_id, entity)
+            if not starts:
+                return {'nodes': [], 'edges': []}
+            nodes, indptr, neighbors, edge_ids = self._get_adjacency(user_id)
+            seen = set()
+            edges = set()
+            frontier = deque((node, 0) for node in np.searchsorted(nodes, starts).tolist())
+            seen.update(node for node, _ in frontier)
+            while frontier and len(seen) < limit:
+                node, level = frontier.popleft()
+                if level >= depth:
+                    continue
+                for k in range(indptr[node], indptr[node + 1]):
+                    neighbor = int(neighbors[k])
+                    edges.add(int(edge_ids[k]))
+                    if neighbor not in seen:
+                        seen.add(neighbor)
+                        frontier.append((neighbor, level + 1))
+
+            seen = {int(nodes[node]) for node in seen}
+            return {
+                'nodes': [self._node_dict(i) for i in seen],
+                'edges': [self._edge_dict(e) for e in edges
+                          if int(self._edges['src'][e]) in seen and int(self._edges['dst'][e]) in seen]
+            }
+
+    def get_graph_stats(self, user_id: int, file_id: int = None) -> Dict[str, Any]:
+        with self._lock:
+            if file_id:
+                files = [file_id] if file_id in self._user_files.get(user_id, ()) else []
+            else:
+                files = self._user_files.get(user_id, ())
+            node_ids = np.array([i for f in files for i in self._file_nodes.get(f, [])], dtype=np.int64)
+            edge_ids = np.array([i for f in files for i in self._file_edges.get(f, [])], dtype=np.int64)
+
+            return {
+                'total_entities': len(node_ids),
+                'total_relations': len(edge_ids),
+                'entity_types': [self._labels[i] for i in np.unique(self._nodes['label'].values[node_ids])],
+                'relation_types': [self._relation_types[i] for i in np.unique(self._edges['type'].values[edge_ids])]
+            }
+
+    def needs_owners(self) -> bool:
+        with self._lock:
+            alive = self._nodes['alive'].values
+            return bool((self._nodes['user'].values[alive] == self._NO_OWNER).any())
+
+    def assign_owners(self, owners: Dict[int, int]):
+        with self._lock:
+            files = np.array(sorted(owners), dtype=np.int64)
+            users = np.array([owners[f] for f in files.tolist()], dtype=np.int64)
+            for columns in (self._nodes, self._edges):
+                file_column = columns['file'].values
+                missing = np.flatnonzero(columns['user'].values == self._NO_OWNER)
+                if not len(missing) or not len(files):
+                    continue
+                position = np.minimum(np.searchsorted(files, file_column[missing]), len(files) - 1)
+                known = files[position] == file_column[missing]
+                columns['user'][missing[known]] = users[position[known]]
+            self._rebuild_indexes()
+            # 一次性的迁移，立即写盘（生成 user 列文件）
+            self._dirty = True
+        self.save()
+
+    def _get_graph_visualization_data(self, file_id: int) -> Dict[str, Any]:
+        """获取图谱可视化数据（格式与Neo4j后端一致）"""
+        nodes = []
+        for index in self._file_nodes.get(file_id, []):
+            confidence = float(self._nodes['confidence'][index])
+            nodes.append({
+                'id': self._node_id(index),
+                'label': self._texts[index],
+                'type': self._labels[self._nodes['label'][index]],
+                'confidence': confidence,
+                'size': min(max(confidence * 20, 10), 30)
+            })
+
+        edges = []
+        for index in self._file_edges.get(file_id, []):
+            edge = self._edge_dict(index)
+            edge['width'] = max(edge['confidence'] * 3, 1)
+            edges.append(edge)
+
+        return {
+            'nodes': nodes,
+            'edges': edges,
+            'stats': {
+                'total_nodes': len(nodes),
+                'total_edges': len(edges)
+            }
+        }
+
+    # ---- 索引 ----
+
+    def _rebuild_indexes(self):
+        """从列数据重建全部内存索引"""
+        self._label_ids = {label: i for i, label in enumerate(self._labels)}
+        self._relation_type_ids = {name: i for i, name in enumerate(self._relation_types)}
+        self._node_key_index = {}
+        self._text_index = {}
+        self._bigram_index = {}
+        self._label_index = {}
+        self._file_nodes = {}
+        self._user_files = {}
+        self._edge_key_index = {}
+        self._file_edges = {}
+        # 按用户缓存的CSR邻接表，该用户的文件写入或删除后失效
+        self._adjacency = {}
+
+        for index in np.flatnonzero(self._nodes['alive'].values):
+            self._index_node(int(index))
+
+        for index in np.flatnonzero(self._edges['alive'].values):
+            index = int(index)
+            file_id = int(self._edges['file'][index])
+            key = (int(self._edges['src'][index]), int(self._edges['dst'][index]),
+                   int(self._edges['type'][index]), file_id)
+            self._edge_key_index[key] = index
+            self._file_edges.setdefault(file_id, []).append(index)
+
+    def _index_node(self, index: int):
+        text = self._texts[index]
+        file_id = int(self._nodes['file'][index])
+        user_id = int(self._nodes['user'][index])
+        self._node_key_index[(text, file_id)] = index
+        self._text_index.setdefault((user_id, text.lower()), []).append(index)
+        self._label_index.setdefault(int(self._nodes['label'][index]), []).append(index)
+        self._file_nodes.setdefault(file_id, []).append(index)
+        self._user_files.setdefault(user_id, set()).add(file_id)
+        for bigram in self._bigrams(text.lower()):
+            self._bigram_index.setdefault((user_id, bigram), []).append(index)
+
+    def _bigrams(self, text: str) -> set:
+        return {text[i:i + 2] for i in range(len(text) - 1)}
+
+    def _candidates_containing(self, user_id: int, query: str) -> List[int]:
+        """利用该用户的二元组索引缩小候选集，再逐个校验子串"""
+        if len(query) >= 2:
+            postings = [self._bigram_index.get((user_id, b), []) for b in self._bigrams(query)]
+            candidates = set(min(postings, key=len))
+        else:
+            candidates = self._user_nodes(user_id)
+        return [i for i in candidates if query in self._texts[i].lower()]
+
+    def _exact_text_nodes(self, user_id: int, text: str) -> List[int]:
+        return [i for i in self._text_index.get((user_id, text.lower()), []) if self._texts[i] == text]
+
+    def _user_nodes(self, user_id: int) -> List[int]:
+        return [i for f in self._user_files.get(user_id, ()) for i in self._file_nodes.get(f, [])]
+
+    def _get_adjacency(self, user_id: int):
+        """构建该用户的无向CSR邻接表，返回 (节点, indptr, 邻居, 边)
+
+        邻接表中的节点用局部序号表示，nodes[局部序号] 为全局节点序号；
+        写入或删除该用户的文件后失效，查询时按需重建，其他用户的写入不影响。
+        """
+        adjacency = self._adjacency.get(user_id)
+        if adjacency is None:
+            nodes = np.sort(np.array(self._user_nodes(user_id), dtype=np.int64))
+            edges = np.array([i for f in self._user_files.get(user_id, ()) for i in self._file_edges.get(f, [])],
+                             dtype=np.int64)
+            src = np.searchsorted(nodes, self._edges['src'].values[edges])
+            dst = np.searchsorted(nodes, self._edges['dst'].values[edges])
+            heads = np.concatenate([src, dst])
+            tails = np.concatenate([dst, src])
+            edge_ids = np.concatenate([edges, edges])
+
+            order = np.argsort(heads, kind='stable')
+            counts = np.bincount(heads, minlength=len(nodes))
+            indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+            np.cumsum(counts, out=indptr[1:])
+            adjacency = (nodes, indptr, tails[order], edge_ids[order])
+            self._adjacency[user_id] = adjacency
+        return adjacency
+
+    def _intern(self, table: List[str], ids: Dict[str, int], value: str) -> int:
+        if value not in ids:
+            ids[value] = len(table)
+            table.append(value)
+        return ids[value]
+
+    def _remove_from(self, index: Dict, key, value: int):
+        postings = index.get(key)
+        if postings is None:
+            return
+        try:
+            postings.remove(value)
+        except ValueError:
+            return
+        if not postings:
+            del index[key]
+
+    # ---- 结果格式 ----
+
+    def _node_id(self, index: int) -> str:
+        return f"m{int(self._nodes['uid'][index])}"
+
+    def _node_dict(self, index: int) -> Dict:
+        return {
+            'id': self._node_id(index),
+            'text': self._texts[index],
+            'label': self._labels[self._nodes['label'][index]],
+            'confidence': float(self._nodes['confidence'][index]),
+            'file_id': int(self._nodes['file'][index])
+        }
+
+    def _path_node(self, index: int) -> Dict:
+        return {
+            'type': 'node',
+            'id': self._node_id(index),
+            'text': self._texts[index],
+            'label': self._labels[self._nodes['label'][index]],
+            'file_id': int(self._nodes['file'][index])
+        }
+
+    def _edge_dict(self, index: int) -> Dict:
+        return {
+            'source': self._node_id(int(self._edges['src'][index])),
+            'target': self._node_id(int(self._edges['dst'][index])),
+            'relation': self._relation_types[self._edges['type'][index]],
+            'confidence': float(self._edges['confidence'][index]),
+            'context': self._contexts[index],
+            'file_id': int(self._edges['file'][index])
+        }
+
+    # ---- 持久化 ----
+
+    @property
+    def flush_required(self) -> bool:
+        return bool(self.data_dir)
+
+    def flush(self):
+        """有未落盘的写入时立即落盘"""
+        if self._dirty:
+            self.save()
+
+    def _maybe_save(self):
+        """写入后调用（不持有存储锁）：距上次落盘超过间隔时落盘，已有落盘在进行时跳过"""
+        if self.data_dir and time.time() - self._last_save >= self.save_interval:
+            self.save(wait=False)
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.save_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"内置图引擎落盘失败: {e}")
+                record_error("memory_graph")
+
+    def save(self, wait: bool = True):
+        """将图数据写入新的快照目录，再原子替换 CURRENT 指向它
+
+        锁内只取得各列的只读视图（列在之后的第一次写入时复制）和元数据列表的长度，
+        序列化和写文件在锁外进行，不阻塞查询和写入。wait 为 False 时若已有落盘在进行则直接返回。
+        """
+        if not self.data_dir:
+            return
+        if not self._save_lock.acquire(blocking=wait):
+            return
+        try:
+            with self._lock:
+                self._compact()
+                columns = {f"{prefix}_{name}": column.snapshot()
+                           for prefix, group in (('node', self._nodes), ('edge', self._edges))
+                           for name, column in group.items()}
+                # 元数据列表只追加（压缩时整体替换为新列表），记下长度即可在锁外截取
+                lists = [(key, values, len(values)) for key, values in (
+                    ('texts', self._texts), ('contexts', self._contexts),
+                    ('labels', self._labels), ('relation_types', self._relation_types))]
+                next_uid = self._next_uid
+                self._dirty = False
+            try:
+                meta = {key: values[:count] for key, values, count in lists}
+                meta['next_uid'] = next_uid
+                self._write_snapshot(columns, meta)
+            except Exception:
+                self._dirty = True
+                raise
+            self._last_save = time.time()
+        finally:
+            self._save_lock.release()
+
+    def _write_snapshot(self, columns: Dict[str, np.ndarray], meta: Dict[str, Any]):
+        name = f"snapshot-{time.time_ns()}"
+        directory = os.path.join(self.data_dir, name)
+        os.makedirs(directory)
+        for key, values in columns.items():
+            with open(os.path.join(directory, f"{key}.npy"), "wb") as f:
+                np.save(f, values)
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+        pointer = os.path.join(self.data_dir, "CURRENT")
+        with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+            f.write(name)
+        os.replace(pointer + ".tmp", pointer)
+        self._remove_stale_snapshots(directory)
+
+    def _snapshot_dir(self) -> Optional[str]:
+        """CURRENT 指向的快照目录；旧版本直接保存在数据目录中的数据返回数据目录本身"""
+        pointer = os.path.join(self.data_dir, "CURRENT")
+        if os.path.exists(pointer):
+            with open(pointer, encoding="utf-8") as f:
+                return os.path.join(self.data_dir, f.read().strip())
+        if os.path.exists(os.path.join(self.data_dir, "meta.json")):
+            return self.data_dir
+        return None
+
+    def _remove_stale_snapshots(self, current: str):
+        """删除旧快照和中途退出时写了一半的快照（已映射的文件删除后仍可读取）"""
+        for path in glob.glob(os.path.join(self.data_dir, "snapshot-*")):
+            if os.path.abspath(path) != os.path.abspath(current):
+                shutil.rmtree(path, ignore_errors=True)
+        if os.path.abspath(current) != os.path.abspath(self.data_dir):
+            for pattern in ("node_*.npy", "edge_*.npy", "meta.json"):
+                for path in glob.glob(os.path.join(self.data_dir, pattern)):
+                    os.remove(path)
+
+    def _load(self, directory: str):
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        self._texts = meta['texts']
+        self._contexts = meta['contexts']
+        self._labels = meta['labels']
+        self._relation_types = meta['relation_types']
+        self._next_uid = meta['next_uid']
+
+        for prefix, columns, specs in (('node', self._nodes, self._NODE_COLUMNS),
+                                       ('edge', self._edges, self._EDGE_COLUMNS)):
+            for name, dtype in specs.items():
+                path = os.path.join(directory, f"{prefix}_{name}.npy")
+                if name == 'user' and not os.path.exists(path):
+                    # 分区之前保存的数据
+                    count = len(meta['texts'] if prefix == 'node' else meta['contexts'])
+                    columns[name] = _Column(dtype, np.full(count, self._NO_OWNER, dtype=dtype))
+                    continue
+                columns[name] = _Column(dtype, np.load(path, mmap_mode='r'))
+        self._last_save = time.time()
+
+    def _compact(self):
+        """已删除的节点和边超过一半时重写列数据"""
+        node_alive = self._nodes['alive'].values
+        edge_alive = self._edges['alive'].values
+        if node_alive.sum() * 2 >= len(node_alive) and edge_alive.sum() * 2 >= len(edge_alive):
+            return
+
+        keep_nodes = np.flatnonzero(node_alive)
+        remap = np.full(len(node_alive), -1, dtype=np.int64)
+        remap[keep_nodes] = np.arange(len(keep_nodes))
+        keep_edges = np.flatnonzero(edge_alive)
+
+        self._nodes = {name: _Column(column.dtype, np.array(column.values[keep_nodes]))
+                       for name, column in self._nodes.items()}
+        edges = {name: np.array(column.values[keep_edges]) for name, column in self._edges.items()}
+        edges['src'] = remap[edges['src']]
+        edges['dst'] = remap[edges['dst']]
+        self._edges = {name: _Column(self._EDGE_COLUMNS[name], data) for name, data in edges.items()}
+        self._texts = [self._texts[i] for i in keep_nodes]
+        self._contexts = [self._contexts[i] for i in keep_edges]
+        self._rebuild_indexes()
+
+    def close(self):
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
@@ -0,0 +1,268 @@
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import math
+import os
+import threading
+import time
+
+from records import Entity, Relation
+
+# 关闭后所有计数、计时操作直接返回，/metrics 接口返回404
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# 默认的耗时分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 文件大小分桶（字节）：1KB ~ 100MB
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 5e6, 1e7, 5e7, 1e8)
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    """指标基类：按标签值组合保存子序列"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            series = list(self._series.items())
+        for key, value in series:
+            lines.extend(self._render_series(key, value))
+        return lines
+
+    def _render_series(self, key: Tuple[str, ...], value) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [各分桶计数（非累计）, 总和, 总数]
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels):
+        """计时上下文管理器"""
+        return span(self, **labels)
+
+    def _render_series(self, key: Tuple[str, ...], value) -> List[str]:
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class MetricsRegistry:
+    """指标注册表，按Prometheus文本格式（0.0.4）输出"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], None]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector: Callable[[], None]):
+        """注册在每次抓取前调用的回调，用于刷新队列深度等瞬时值"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"指标采集失败: {e}")
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _add(self, metric: _Metric):
+        self._metrics.append(metric)
+        return metric
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+def span(histogram: Optional[Histogram] = None, **labels):
+    """计时区间，默认记录到各处理阶段的耗时直方图；指标关闭时返回空操作"""
+    if not METRICS_ENABLED:
+        return _NULL_SPAN
+    return _Span(histogram or STAGE_SECONDS, labels)
+
+registry = MetricsRegistry()
+
+# 处理阶段
+STAGE_SECONDS = registry.histogram(
+    "kg_stage_duration_seconds", "各处理阶段耗时",
+    ["stage", "file_type"]
+)
+FILE_SECONDS = registry.histogram(
+    "kg_file_processing_seconds", "单个文件从提取到入库的总耗时",
+    ["file_type", "status"]
+)
+FILE_SIZE_BYTES = registry.histogram(
+    "kg_file_size_bytes", "已处理文件的大小",
+    ["file_type"], buckets=SIZE_BUCKETS
+)
+FILES_TOTAL = registry.counter(
+    "kg_files_processed_total", "已处理文件数",
+    ["file_type", "status"]
+)
+ENTITIES_TOTAL = registry.counter(
+    "kg_entities_extracted_total", "抽取出的实体数",
+    ["label"]
+)
+RELATIONS_TOTAL = registry.counter(
+    "kg_relations_extracted_total", "抽取出的关系数",
+    ["predicate"]
+)
+ERRORS_TOTAL = registry.counter(
+    "kg_errors_total", "各组件发生的错误数",
+    ["component"]
+)
+
+# 存储查询
+GRAPH_QUERY_SECONDS = registry.histogram(
+    "kg_graph_query_seconds", "图存储操作耗时",
+    ["backend", "operation"]
+)
+SQL_QUERY_SECONDS = registry.histogram(
+    "kg_sql_query_seconds", "SQL语句执行耗时",
+    ["statement"]
+)
+
+# 批量流水线
+PIPELINE_QUEUE_DEPTH = registry.gauge(
+    "kg_pipeline_queue_depth", "批量流水线各阶段的队列深度",
+    ["stage"]
+)
+PIPELINE_BLOCKED_SECONDS = registry.gauge(
+    "kg_pipeline_blocked_seconds", "上游因各阶段队列已满而阻塞的累计时间",
+    ["stage"]
+)
+
+def record_knowledge(entities: List[Entity], relations: List[Relation]):
+    """按实体类型和关系类型累计抽取数量"""
+    if not METRICS_ENABLED:
+        return
+    for entity in entities:
+        ENTITIES_TOTAL.inc(label=entity.label)
+    for relation in relations:
+        RELATIONS_TOTAL.inc(predicate=relation.predicate)
+
+def record_error(component: str):
+    ERRORS_TOTAL.inc(component=component)
+
+def instrument_engine(engine):
+    """为SQLAlchemy引擎注册语句计时（按语句类型 SELECT/INSERT/... 分组）"""
+    if not METRICS_ENABLED:
+        return
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        stack = conn.info.get('metrics_query_start')
+        if stack:
+            verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+            SQL_QUERY_SECONDS.observe(time.perf_counter() - stack.pop(), statement=verb)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        stack = context.connection.info.get('metrics_query_start') if context.connection else None
+        if stack:
+            stack.pop()
+        record_error("sql")
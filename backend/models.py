@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Float, LargeBinary, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -40,22 +40,38 @@ class FileRecord(Base):
     knowledge_graphs = relationship("KnowledgeGraph", back_populates="file")
 
 class KnowledgeGraph(Base):
-    """知识图谱模型"""
+    """知识图谱模型（每个文件一条，保存当前版本的完整内容）"""
     __tablename__ = "knowledge_graphs"
     
     id = Column(Integer, primary_key=True, index=True)
-    entities = Column(Text)  # JSON格式存储实体数据
-    relations = Column(Text)  # JSON格式存储关系数据
-    graph_data = Column(Text)  # JSON格式存储图谱可视化数据
+    entities = Column(LargeBinary)  # 压缩的实体JSON（旧数据为未压缩的JSON文本）
+    relations = Column(LargeBinary)  # 压缩的关系JSON（同上）
+    graph_data = Column(Text)  # 旧数据的图谱可视化JSON；新数据为空，读取时由实体和关系生成
+    layout = Column(LargeBinary)  # 压缩的节点布局坐标（按实体文本）
+    version = Column(Integer, default=1)  # 当前版本号，历史版本见 GraphVersion
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # 外键
-    file_id = Column(Integer, ForeignKey("file_records.id"), nullable=False)
+    file_id = Column(Integer, ForeignKey("file_records.id"), index=True, nullable=False)
     
     # 关系
     file = relationship("FileRecord", back_populates="knowledge_graphs")
 
+class GraphVersion(Base):
+    """图谱历史版本：快照保存完整内容，增量版本保存相对基准快照的差异"""
+    __tablename__ = "graph_versions"
+    __table_args__ = (UniqueConstraint("file_id", "version"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    file_id = Column(Integer, ForeignKey("file_records.id"), index=True, nullable=False)
+    version = Column(Integer, nullable=False)
+    base_version = Column(Integer, nullable=True)  # 为空表示快照，否则为增量所基于的快照版本
+    data = Column(LargeBinary, nullable=False)  # 压缩的JSON快照或增量（旧数据为未压缩的JSON文本）
+    entity_count = Column(Integer, default=0)
+    relation_count = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class EntityType(Base):
     """实体类型模型"""
     __tablename__ = "entity_types"
@@ -73,4 +89,81 @@ class RelationType(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, nullable=False)  # 工作于、位于等
     description = Column(Text)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class GraphStatistics(Base):
+    """文件级图谱统计模型（入库/删除时增量维护）"""
+    __tablename__ = "graph_statistics"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    file_id = Column(Integer, ForeignKey("file_records.id"), unique=True, index=True, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
+    total_entities = Column(Integer, default=0)
+    total_relations = Column(Integer, default=0)
+    entity_types = Column(Text, default="{}")  # JSON格式存储各实体类型计数
+    relation_types = Column(Text, default="{}")  # JSON格式存储各关系类型计数
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class UserGraphStatistics(Base):
+    """用户级图谱统计模型（文件级统计的汇总）"""
+    __tablename__ = "user_graph_statistics"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), unique=True, index=True, nullable=False)
+    files_processed = Column(Integer, default=0)
+    total_entities = Column(Integer, default=0)
+    total_relations = Column(Integer, default=0)
+    entity_types = Column(Text, default="{}")
+    relation_types = Column(Text, default="{}")
+    # 图谱代数：文件入库或删除时加一，查询结果缓存据此判断结果是否过期
+    graph_generation = Column(Integer, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class ProfileRecord(Base):
+    """性能剖析记录（处理或请求超过阈值时自动采集，或由管理员要求采集）"""
+    __tablename__ = "profile_records"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    file_id = Column(Integer, ForeignKey("file_records.id"), index=True, nullable=True)
+    kind = Column(String, nullable=False)  # file, request
+    name = Column(String, nullable=False)  # 处理阶段或请求路径
+    mode = Column(String, nullable=False)  # sampling（折叠栈文本）, cprofile（pstats二进制）
+    duration_seconds = Column(Float, default=0.0)
+    sample_count = Column(Integer, default=0)
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ImageFingerprint(Base):
+    """已OCR图片的感知哈希指纹（近似重复的图片复用识别文本）"""
+    __tablename__ = "image_fingerprints"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
+    file_id = Column(Integer, ForeignKey("file_records.id"), index=True, nullable=True)
+    phash = Column(Integer, nullable=False)  # 64位哈希按有符号整数存储
+    dhash = Column(LargeBinary, nullable=False)  # 128x64 差分哈希的打包位
+    width = Column(Integer, nullable=False)
+    height = Column(Integer, nullable=False)
+    text = Column(Text, default="")
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class FileContent(Base):
+    """文件的提取文本（压缩存储，重新处理时无需再次提取和OCR）"""
+    __tablename__ = "file_contents"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    file_id = Column(Integer, ForeignKey("file_records.id"), unique=True, index=True, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    characters = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class CompressionDictionary(Base):
+    """压缩存储的共享字典（按数据类别训练，压缩块通过ID引用，保存后不再修改或删除）"""
+    __tablename__ = "compression_dictionaries"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, index=True, nullable=False)  # text, graph
+    codec = Column(String, nullable=False)  # zlib, zstd
+    data = Column(LargeBinary, nullable=False)
+    sample_count = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -1,19 +1,44 @@
-import spacy
 import jieba
-import re
-from typing import List, Tuple, Dict, Any
+from bisect import bisect_left, bisect_right
+from concurrent.futures import Executor
+from typing import List, Tuple, Dict, Any, Optional
 import json
+import os
+from relation_patterns import RelationPatternEngine
+from records import Entity, Relation
+from document import Document
+from metrics import span
+
+# 规则实体识别：以常见姓氏开头的词视为人名，以下列关键词结尾的汉字串视为组织、地点
+CHINESE_SURNAMES = frozenset(['王', '李', '张', '刘', '陈', '杨', '赵', '黄', '周', '吴', '徐', '孙', '胡', '朱', '高', '林', '何', '郭', '马', '罗', '梁', '宋', '郑', '谢', '韩', '唐', '冯', '于', '董', '萧', '程', '曹', '袁', '邓', '许', '傅', '沈', '曾', '彭', '吕', '苏', '卢', '蒋', '蔡', '贾', '丁', '魏', '薛', '叶', '阎', '余', '潘', '杜', '戴', '夏', '钟', '汪', '田', '任', '姜', '范', '方', '石', '姚', '谭', '廖', '邹', '熊', '金', '陆', '郝', '孔', '白', '崔', '康', '毛', '邱', '秦', '江', '史', '顾', '侯', '邵', '孟', '龙', '万', '段', '雷', '钱', '汤', '尹', '黎', '易', '常', '武', '乔', '贺', '赖', '龚', '文'])
+ORG_KEYWORDS = ['公司', '大学', '学院', '研究院', '集团', '企业', '机构', '部门', '政府', '银行']
+LOCATION_KEYWORDS = ['市', '省', '县', '区', '街', '路', '国', '州']
+
+# 大文档并行抽取：超过 PARALLEL_EXTRACT_MIN_CHARS 个字符的文本按句子边界切块，
+# 实体识别和模式关系在进程池中并行（0 关闭）；分块前后各带约 PARALLEL_EXTRACT_OVERLAP_CHARS 个字符的上下文
+PARALLEL_EXTRACT_MIN_CHARS = int(os.getenv("PARALLEL_EXTRACT_MIN_CHARS", "200000"))
+PARALLEL_EXTRACT_CHUNK_CHARS = max(1, int(os.getenv("PARALLEL_EXTRACT_CHUNK_CHARS", "100000")))
+PARALLEL_EXTRACT_OVERLAP_CHARS = int(os.getenv("PARALLEL_EXTRACT_OVERLAP_CHARS", "500"))
+# 合并实体时为不超过该长度的实体文本建立全部子串的索引，更长的文本逐个比较
+MERGE_INDEX_MAX_CHARS = 32
+
+def use_parallel_extract(text: str) -> bool:
+    """文本是否足够长、值得分块并行抽取"""
+    return PARALLEL_EXTRACT_MIN_CHARS > 0 and len(text) >= PARALLEL_EXTRACT_MIN_CHARS
 
 class NLPProcessor:
     """NLP处理器"""
     
     def __init__(self):
-        # 尝试加载spaCy中文模型
+        # 尝试加载spaCy中文模型（spaCy导入较慢，延迟到创建处理器时）
         try:
+            import spacy
             self.nlp = spacy.load("zh_core_web_sm")
-        except OSError:
+        except (ImportError, OSError):
             print("警告: 未找到spaCy中文模型，使用简化的NLP处理")
             self.nlp = None
+            # 预先加载jieba词典，避免首次分词时的延迟
+            jieba.initialize()
         
         # 预定义的实体类型和关系类型
         self.entity_types = {
@@ -26,188 +51,329 @@ class NLPProcessor:
             'MONEY': '金额'
         }
         
-        self.relation_patterns = [
-            (r'(.+?)(?:是|为)(.+?)(?:的)?(.+)', 'is_a'),
-            (r'(.+?)(?:工作于|任职于|在)(.+)', 'works_at'),
-            (r'(.+?)(?:位于|在)(.+)', 'located_in'),
-            (r'(.+?)(?:拥有|持有)(.+)', 'owns'),
-            (r'(.+?)(?:创建|建立|创办)(?:了)?(.+)', 'founded'),
-            (r'(.+?)(?:参与|参加)(?:了)?(.+)', 'participates_in')
-        ]
+        # 关系模式引擎（内置模式 + RELATION_PATTERNS_FILE 中的自定义模式）
+        self.relation_engine = RelationPatternEngine()
     
-    def extract_knowledge(self, text: str) -> Tuple[List[Dict], List[Dict]]:
-        """从文本中提取知识（实体和关系）"""
-        # 清理文本
-        text = self._clean_text(text)
+    def extract_knowledge(self, text: str, executor: Optional[Executor] = None) -> Tuple[List[Entity], List[Relation]]:
+        """从文本中提取知识（实体和关系）
+
+        传入进程池且文本足够长时按 map-reduce 方式抽取：各分块的实体提及和模式关系在进程池中并行识别，
+        实体合并、共现关系和去重在本进程对整篇文本完成。规则识别的结果与串行抽取完全相同；
+        使用spaCy模型时每个分块只带有限的上下文，识别结果可能与整篇识别略有差异。
+        返回的实体偏移对应传入的原文 text；关系的上下文偏移对应其携带的清洗后文本。
+        """
+        # 清理文本（分词、分句等在各步骤首次使用时由 Document 计算一次）
+        with span(stage="clean"):
+            document = Document(text)
+        
+        if executor is not None and use_parallel_extract(text):
+            chunks = self._plan_chunks(document)
+            if len(chunks) > 1:
+                entities, relations = self._extract_parallel(document, chunks, executor)
+                return self._map_to_original(document, entities), relations
         
         # 提取实体
-        entities = self._extract_entities(text)
+        entities = self._extract_entities(document)
         
         # 提取关系
-        relations = self._extract_relations(text, entities)
+        with span(stage="relations"):
+            relations = self._extract_relations(document, entities)
         
-        return entities, relations
+        return self._map_to_original(document, entities), relations
     
-    def _clean_text(self, text: str) -> str:
-        """清理文本"""
-        # 移除多余的空白字符
-        text = re.sub(r'\s+', ' ', text)
-        # 移除特殊字符
-        text = re.sub(r'[^\w\s\u4e00-\u9fff.,!?;:]', '', text)
-        return text.strip()
+    def _map_to_original(self, document: Document, entities: List[Entity]) -> List[Entity]:
+        """把实体偏移从清洗后的文本换算到原文（抽取的各步骤都使用清洗后的偏移，最后统一换算）"""
+        for entity in entities:
+            entity.start, entity.end = document.original_span(entity.start, entity.end)
+        return entities
     
-    def _extract_entities(self, text: str) -> List[Dict]:
+    def _extract_entities(self, document: Document) -> List[Entity]:
         """提取实体"""
-        entities = []
-        
-        if self.nlp:
-            # 使用spaCy提取实体
-            doc = self.nlp(text)
-            for ent in doc.ents:
-                entity = {
-                    'text': ent.text,
-                    'label': ent.label_,
-                    'start': ent.start_char,
-                    'end': ent.end_char,
-                    'confidence': 0.8
-                }
-                entities.append(entity)
-        else:
-            # 简化的实体提取（基于规则）
-            entities = self._extract_entities_by_rules(text)
+        with span(stage="ner"):
+            entities = [entity for group in self._extract_mentions(document) for entity in group]
         
         # 去重并合并相似实体
-        entities = self._merge_similar_entities(entities)
+        with span(stage="merge"):
+            entities = self._merge_similar_entities(entities)
         
         return entities
     
-    def _extract_entities_by_rules(self, text: str) -> List[Dict]:
+    def _extract_mentions(self, document: Document) -> List[List[Entity]]:
+        """识别实体提及，按识别步骤分组
+        
+        组内按出现位置排列，各组依次相连即为合并前的实体顺序；
+        并行抽取时逐组拼接各分块的结果，以保持与串行抽取相同的顺序。
+        """
+        if self.nlp:
+            # 使用spaCy提取实体
+            doc = self.nlp(document.text)
+            return [[Entity(ent.text, ent.label_, ent.start_char, ent.end_char, 0.8) for ent in doc.ents]]
+        # 简化的实体提取（基于规则）
+        return self._rule_mention_groups(document)
+    
+    def _extract_entities_by_rules(self, document: Document) -> List[Entity]:
         """基于规则的实体提取"""
-        entities = []
-        
-        # 使用jieba分词
-        words = jieba.cut(text)
-        word_list = list(words)
-        
-        # 简单的人名识别（包含姓氏的词）
-        chinese_surnames = ['王', '李', '张', '刘', '陈', '杨', '赵', '黄', '周', '吴', '徐', '孙', '胡', '朱', '高', '林', '何', '郭', '马', '罗', '梁', '宋', '郑', '谢', '韩', '唐', '冯', '于', '董', '萧', '程', '曹', '袁', '邓', '许', '傅', '沈', '曾', '彭', '吕', '苏', '卢', '蒋', '蔡', '贾', '丁', '魏', '薛', '叶', '阎', '余', '潘', '杜', '戴', '夏', '钟', '汪', '田', '任', '姜', '范', '方', '石', '姚', '谭', '廖', '邹', '熊', '金', '陆', '郝', '孔', '白', '崔', '康', '毛', '邱', '秦', '江', '史', '顾', '侯', '邵', '孟', '龙', '万', '段', '雷', '钱', '汤', '尹', '黎', '易', '常', '武', '乔', '贺', '赖', '龚', '文']
-        
-        current_pos = 0
-        for word in word_list:
-            if len(word) >= 2 and word[0] in chinese_surnames:
-                start_pos = text.find(word, current_pos)
-                if start_pos != -1:
-                    entities.append({
-                        'text': word,
-                        'label': 'PERSON',
-                        'start': start_pos,
-                        'end': start_pos + len(word),
-                        'confidence': 0.6
-                    })
-                    current_pos = start_pos + len(word)
+        return [entity for group in self._rule_mention_groups(document) for entity in group]
+    
+    def _rule_mention_groups(self, document: Document) -> List[List[Entity]]:
+        text = document.text
+        
+        # 简单的人名识别（以姓氏开头的词）
+        groups = [[Entity(word, 'PERSON', start, end, 0.6) for word, start, end in document.tokens()
+                   if len(word) >= 2 and word[0] in CHINESE_SURNAMES]]
         
         # 简单的组织识别（包含公司、大学等关键词）
-        org_keywords = ['公司', '大学', '学院', '研究院', '集团', '企业', '机构', '部门', '政府', '银行']
-        for keyword in org_keywords:
-            for match in re.finditer(r'[\u4e00-\u9fff]+' + keyword, text):
-                entities.append({
-                    'text': match.group(),
-                    'label': 'ORG',
-                    'start': match.start(),
-                    'end': match.end(),
-                    'confidence': 0.7
-                })
+        for keyword in ORG_KEYWORDS:
+            groups.append([Entity(text[start:end], 'ORG', start, end, 0.7)
+                           for start, end in document.cjk_prefixed(keyword)])
         
         # 地点识别
-        location_keywords = ['市', '省', '县', '区', '街', '路', '国', '州']
-        for keyword in location_keywords:
-            for match in re.finditer(r'[\u4e00-\u9fff]+' + keyword, text):
-                entities.append({
-                    'text': match.group(),
-                    'label': 'GPE',
-                    'start': match.start(),
-                    'end': match.end(),
-                    'confidence': 0.6
-                })
+        for keyword in LOCATION_KEYWORDS:
+            groups.append([Entity(text[start:end], 'GPE', start, end, 0.6)
+                           for start, end in document.cjk_prefixed(keyword)])
         
-        return entities
+        return groups
     
-    def _extract_relations(self, text: str, entities: List[Dict]) -> List[Dict]:
+    def _extract_relations(self, document: Document, entities: List[Entity]) -> List[Relation]:
         """提取关系"""
-        relations = []
-        
-        # 基于模式的关系提取
-        for pattern, relation_type in self.relation_patterns:
-            for match in re.finditer(pattern, text):
-                groups = match.groups()
-                if len(groups) >= 2:
-                    subject = groups[0].strip()
-                    obj = groups[1].strip() if len(groups) > 1 else ""
-                    
-                    # 检查是否为有效的实体
-                    if self._is_valid_entity(subject) and self._is_valid_entity(obj):
-                        relations.append({
-                            'subject': subject,
-                            'predicate': relation_type,
-                            'object': obj,
-                            'confidence': 0.7,
-                            'context': match.group()
-                        })
+        # 基于模式的关系提取（按句扫描）
+        relations = self._pattern_relations(document.text, document.sentences)
         
         # 基于实体的关系提取
-        entity_texts = [e['text'] for e in entities]
-        for i, ent1 in enumerate(entity_texts):
-            for j, ent2 in enumerate(entity_texts):
-                if i != j:
-                    # 查找两个实体在文本中的共现
-                    relation = self._find_relation_between_entities(text, ent1, ent2)
-                    if relation:
-                        relations.append(relation)
+        relations.extend(self._cooccurrence_relations(document, entities))
         
         return self._deduplicate_relations(relations)
     
+    def _pattern_relations(self, text: str, sentences: List[Tuple[int, int]]) -> List[Relation]:
+        # 检查主语、宾语是否为有效的实体
+        return [relation for relation in self.relation_engine.extract(text, sentences)
+                if self._is_valid_entity(relation.subject) and self._is_valid_entity(relation.object)]
+    
+    # ---- 大文档并行抽取 ----
+    
+    def _plan_chunks(self, document: Document) -> List[Tuple[int, int, int, int]]:
+        """按句子边界把文本切成 (上下文起点, 上下文终点, 归属起点, 归属终点) 分块
+        
+        分界点都取句子起点：其前一个字符是分隔符或空白，不会落在汉字片段或jieba分词块的中间，
+        因此分块内的规则识别结果在归属区间内与整篇识别逐字相同。归属区间首尾相接覆盖全文，
+        实体提及和模式关系按起点归属唯一的分块；重叠的上下文只为模型识别提供前后文，不产生重复结果。
+        """
+        text_length = len(document.text)
+        starts = [start for start, _ in document.sentences]
+        bounds = [0]
+        for start in starts:
+            if start - bounds[-1] >= PARALLEL_EXTRACT_CHUNK_CHARS:
+                bounds.append(start)
+        bounds.append(text_length)
+        
+        chunks = []
+        for own_start, own_end in zip(bounds, bounds[1:]):
+            index = bisect_right(starts, own_start - PARALLEL_EXTRACT_OVERLAP_CHARS) - 1
+            context_start = starts[index] if index >= 0 else 0
+            index = bisect_left(starts, own_end + PARALLEL_EXTRACT_OVERLAP_CHARS)
+            context_end = starts[index] if index < len(starts) else text_length
+            chunks.append((context_start, context_end, own_start, own_end))
+        return chunks
+    
+    def _extract_parallel(self, document: Document, chunks: List[Tuple[int, int, int, int]],
+                          executor: Executor) -> Tuple[List[Entity], List[Relation]]:
+        """map：各分块在进程池中识别实体提及和模式关系；reduce：换算偏移后在整篇文本上合并实体、推断共现关系、去重"""
+        text = document.text
+        sentences = document.sentences
+        starts = [start for start, _ in sentences]
+        
+        with span(stage="map"):
+            futures = []
+            for context_start, context_end, own_start, own_end in chunks:
+                first, last = bisect_left(starts, context_start), bisect_left(starts, context_end)
+                futures.append(executor.submit(
+                    extract_chunk_worker,
+                    text[context_start:context_end],
+                    [(start - context_start, end - context_start) for start, end in sentences[first:last]],
+                    own_start - context_start, own_end - context_start
+                ))
+            results = [future.result() for future in futures]
+        
+        # 逐个识别步骤拼接各分块的提及
+        mentions = []
+        for group in range(len(results[0][0])):
+            for (context_start, *_), (groups, _) in zip(chunks, results):
+                for entity in groups[group]:
+                    entity.start += context_start
+                    entity.end += context_start
+                    mentions.append(entity)
+        
+        with span(stage="merge"):
+            entities = self._merge_similar_entities(mentions)
+        
+        with span(stage="relations"):
+            relations = [
+                Relation(subject, predicate, obj, confidence, text, start + context_start, end + context_start)
+                for (context_start, *_), (_, found) in zip(chunks, results)
+                for subject, predicate, obj, confidence, start, end in found
+            ]
+            relations.extend(self._cooccurrence_relations(document, entities))
+            relations = self._deduplicate_relations(relations)
+        
+        return entities, relations
+    
+    def _extract_chunk(self, text: str, sentences: List[Tuple[int, int]], own_start: int, own_end: int):
+        document = Document.from_cleaned(text, sentences)
+        groups = [[entity for entity in group if own_start <= entity.start < own_end]
+                  for group in self._extract_mentions(document)]
+        owned = [(start, end) for start, end in sentences if own_start <= start < own_end]
+        relations = [(relation.subject, relation.predicate, relation.object, relation.confidence,
+                      relation.context_start, relation.context_end)
+                     for relation in self._pattern_relations(text, owned)]
+        return groups, relations
+    
+    def _cooccurrence_relations(self, document: Document, entities: List[Entity]) -> List[Relation]:
+        """两个实体在同一句子中共现时推断关系：句中有“工作/任职”为 works_at，有“位于/在”为 located_in
+
+        每个有序实体对取第一个同时包含两者且含上述词语的句子，按实体列表的顺序输出。
+        先定位每个实体出现在哪些候选句子中，再只在句子内部配对，
+        代价与实体的出现次数成正比，而不是逐对扫描全部句子（实体数² × 句子数）。
+        """
+        kinds = {}
+        for i, sentence in enumerate(document.sentence_texts):
+            if '工作' in sentence or '任职' in sentence:
+                kinds[i] = 'works_at'
+            elif '位于' in sentence or '在' in sentence:
+                kinds[i] = 'located_in'
+        if not kinds:
+            return []
+        
+        positions: Dict[str, List[int]] = {}
+        for i, entity in enumerate(entities):
+            positions.setdefault(entity.text, []).append(i)
+        
+        # 候选句子 -> 其中出现的实体文本
+        members: Dict[int, set] = {}
+        for entity_text in positions:
+            if not entity_text:
+                continue
+            for start in document.occurrences(entity_text):
+                index = document.sentence_at(start, start + len(entity_text))
+                if index in kinds:
+                    members.setdefault(index, set()).add(entity_text)
+        
+        # 每个实体文本对第一次共现的句子
+        first: Dict[Tuple[str, str], int] = {}
+        for index in sorted(members):
+            texts = members[index]
+            for subject in texts:
+                for obj in texts:
+                    first.setdefault((subject, obj), index)
+        
+        found = []
+        for (subject, obj), index in first.items():
+            for i in positions[subject]:
+                for j in positions[obj]:
+                    if i != j:
+                        found.append((i, j, index))
+        found.sort()
+        
+        text = document.text
+        return [
+            Relation(entities[i].text, kinds[index], entities[j].text, 0.6, text, *document.sentences[index])
+            for i, j, index in found
+        ]
+    
     def _is_valid_entity(self, text: str) -> bool:
         """检查是否为有效实体"""
         return len(text.strip()) > 1 and len(text.strip()) < 20
     
-    def _find_relation_between_entities(self, text: str, ent1: str, ent2: str) -> Dict:
-        """查找两个实体之间的关系"""
-        # 查找包含两个实体的句子
-        sentences = re.split(r'[。！？.!?]', text)
-        
-        for sentence in sentences:
-            if ent1 in sentence and ent2 in sentence:
-                # 简单的关系推断
-                if '工作' in sentence or '任职' in sentence:
-                    return {
-                        'subject': ent1,
-                        'predicate': 'works_at',
-                        'object': ent2,
-                        'confidence': 0.6,
-                        'context': sentence.strip()
-                    }
-                elif '位于' in sentence or '在' in sentence:
-                    return {
-                        'subject': ent1,
-                        'predicate': 'located_in',
-                        'object': ent2,
-                        'confidence': 0.6,
-                        'context': sentence.strip()
-                    }
-        
-        return None
-    
-    def _merge_similar_entities(self, entities: List[Dict]) -> List[Dict]:
-        """合并相似实体"""
+    def _merge_similar_entities(self, entities: List[Entity]) -> List[Entity]:
+        """合并相似实体
+        
+        依次处理每个实体：与已合并列表中第一个相似的实体合并（保留置信度更高的），没有则追加。
+        相似的已合并实体通过索引查找，而不是逐个比较：按小写文本、完整文本和全部子串建立索引，
+        候选序号取最小即为“第一个”；超过 MERGE_INDEX_MAX_CHARS 的文本不枚举子串，退回逐个比较。
+        同一文本反复出现时直接复用上次找到的序号：追加实体不会改变已有的“第一个”，
+        替换第 i 个实体只会影响找到的序号不小于 i 的文本。
+        结果与逐个比较（_merge_similar_linear）完全相同。
+        """
+        if any(not entity.text for entity in entities):
+            # 空文本与任何实体都相似，直接逐个比较
+            return self._merge_similar_linear(entities)
+        
+        merged: List[Entity] = []
+        by_lower: Dict[str, set] = {}
+        by_text: Dict[str, set] = {}
+        by_substring: Dict[str, set] = {}
+        long_indexes = set()
+        first: Dict[str, int] = {}
+        
+        def substrings(text: str) -> set:
+            return {text[i:j] for i in range(len(text)) for j in range(i + 1, len(text) + 1)}
+        
+        def index(i: int, text: str, add: bool):
+            keys = [(by_lower, text.lower()), (by_text, text)]
+            if len(text) <= MERGE_INDEX_MAX_CHARS:
+                keys.extend((by_substring, substring) for substring in substrings(text))
+            elif add:
+                long_indexes.add(i)
+            else:
+                long_indexes.discard(i)
+            for table, key in keys:
+                if add:
+                    table.setdefault(key, set()).add(i)
+                else:
+                    table[key].discard(i)
+                    if not table[key]:
+                        del table[key]
+        
+        def merge(i: int, entity: Entity):
+            # 保留置信度更高的；替换后第 i 个实体的文本改变，缓存中不小于 i 的序号失效
+            nonlocal first
+            if entity.confidence > merged[i].confidence:
+                index(i, merged[i].text, False)
+                merged[i] = entity
+                index(i, entity.text, True)
+                first = {text: k for text, k in first.items() if k < i}
+                return True
+            return False
+        
+        for entity in entities:
+            text = entity.text
+            i = first.get(text)
+            if i is not None:
+                merge(i, entity)
+                continue
+            
+            found = set(by_lower.get(text.lower(), ()))
+            # 已合并实体包含该实体
+            found.update(by_substring.get(text, ()))
+            found.update(i for i in long_indexes if text in merged[i].text)
+            # 该实体包含已合并实体
+            if len(text) <= MERGE_INDEX_MAX_CHARS:
+                for substring in substrings(text):
+                    if substring in by_text:
+                        found.update(by_text[substring])
+            else:
+                found.update(i for i, merged_entity in enumerate(merged) if merged_entity.text in text)
+            
+            if not found:
+                first[text] = len(merged)
+                index(len(merged), text, True)
+                merged.append(entity)
+                continue
+            i = min(found)
+            if not merge(i, entity):
+                first[text] = i
+        
+        return merged
+    
+    def _merge_similar_linear(self, entities: List[Entity]) -> List[Entity]:
         merged = []
         for entity in entities:
             # 检查是否有相似的实体已经存在
             similar_found = False
-            for merged_entity in merged:
-                if self._is_similar_entity(entity['text'], merged_entity['text']):
+            for i, merged_entity in enumerate(merged):
+                if self._is_similar_entity(entity.text, merged_entity.text):
                     # 合并实体，保留置信度更高的
-                    if entity['confidence'] > merged_entity['confidence']:
-                        merged_entity.update(entity)
+                    if entity.confidence > merged_entity.confidence:
+                        merged[i] = entity
                     similar_found = True
                     break
             
@@ -221,15 +387,37 @@ class NLPProcessor:
         # 简单的相似度判断
         return text1.lower() == text2.lower() or text1 in text2 or text2 in text1
     
-    def _deduplicate_relations(self, relations: List[Dict]) -> List[Dict]:
+    def _deduplicate_relations(self, relations: List[Relation]) -> List[Relation]:
         """去重关系"""
         seen = set()
         unique_relations = []
         
         for relation in relations:
-            key = (relation['subject'], relation['predicate'], relation['object'])
+            key = relation.key
             if key not in seen:
                 seen.add(key)
                 unique_relations.append(relation)
         
-        return unique_relations
\ No newline at end of file
+        return unique_relations
+
+# 进程池工作进程内的处理器实例（每个进程只加载一次模型）
+_worker_processor = None
+
+def extract_knowledge_worker(text: str) -> Tuple[List[Entity], List[Relation]]:
+    """供进程池调用的知识抽取函数"""
+    global _worker_processor
+    if _worker_processor is None:
+        _worker_processor = NLPProcessor()
+    return _worker_processor.extract_knowledge(text)
+
+def extract_chunk_worker(text: str, sentences: List[Tuple[int, int]], own_start: int, own_end: int):
+    """供进程池调用的分块抽取函数（并行抽取的 map 阶段）
+    
+    text 为已清洗的分块（含前后重叠的上下文），sentences 为分块内的句子偏移。只返回起点落在
+    归属区间 [own_start, own_end) 内的实体提及（按识别步骤分组）和模式关系（元组，不回传分块文本），
+    偏移均相对分块，由调用方换算回整篇文本。
+    """
+    global _worker_processor
+    if _worker_processor is None:
+        _worker_processor = NLPProcessor()
+    return _worker_processor._extract_chunk(text, sentences, own_start, own_end)
@@ -0,0 +1,133 @@
+from typing import Callable, List, Dict, Any, Optional, Tuple
+import queue
+import threading
+import time
+
+_STOP = object()
+
+class PipelineStage:
+    """流水线阶段：一个有界输入队列加若干工作线程"""
+
+    def __init__(self, name: str, func: Callable[[Any], Any], workers: int = 1, queue_size: int = 16):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self.next_stage: Optional["PipelineStage"] = None
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+
+        # 指标
+        self.processed = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0  # 上游因本阶段队列已满而阻塞的时间（背压）
+        self.max_depth = 0
+
+    def put(self, item: Any):
+        """放入任务，队列满时阻塞并记录背压时间"""
+        start = time.perf_counter()
+        self.queue.put(item)
+        waited = time.perf_counter() - start
+        with self._lock:
+            self.blocked_seconds += waited
+            self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def start(self, on_error: Callable[[Any, Exception], None]):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, args=(on_error,),
+                                      name=f"pipeline-{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _run(self, on_error: Callable[[Any, Exception], None]):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                self.queue.task_done()
+                break
+
+            start = time.perf_counter()
+            try:
+                result = self.func(item)
+                failed = False
+            except Exception as e:
+                failed = True
+                on_error(item, e)
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                self.busy_seconds += elapsed
+                if failed:
+                    self.errors += 1
+                else:
+                    self.processed += 1
+
+            if not failed and result is not None and self.next_stage is not None:
+                self.next_stage.put(result)
+            self.queue.task_done()
+
+    def stop(self):
+        for _ in self._threads:
+            self.queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'processed': self.processed,
+                'errors': self.errors,
+                'busy_seconds': round(self.busy_seconds, 4),
+                # 单个工作线程的处理速率（条/秒）
+                'throughput': round(self.processed / self.busy_seconds, 2) if self.busy_seconds else 0.0,
+                'queue_depth': self.queue.qsize(),
+                'queue_capacity': self.queue.maxsize,
+                'max_queue_depth': self.max_depth,
+                'blocked_seconds': round(self.blocked_seconds, 4)
+            }
+
+class IngestionPipeline:
+    """多阶段摄取流水线
+
+    各阶段通过有界队列串联，阶段之间并行运行：I/O密集的提取阶段与CPU密集的NLP阶段可重叠执行，
+    下游处理不过来时上游在 put 处阻塞，形成背压。阶段函数返回 None 表示该任务到此结束。
+    """
+
+    def __init__(self, stages: List[Tuple[str, Callable[[Any], Any], int]], queue_size: int = 16,
+                 on_error: Optional[Callable[[Any, Exception], None]] = None):
+        self.stages = [PipelineStage(name, func, workers, queue_size) for name, func, workers in stages]
+        for upstream, downstream in zip(self.stages, self.stages[1:]):
+            upstream.next_stage = downstream
+        self.on_error = on_error or (lambda item, e: print(f"流水线任务失败: {e}"))
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._started:
+                return
+            for stage in self.stages:
+                stage.start(self.on_error)
+            self._started = True
+
+    def submit(self, item: Any):
+        """提交任务到第一阶段（队列满时阻塞）"""
+        self.start()
+        self.stages[0].put(item)
+
+    def join(self):
+        """等待当前已提交的任务全部处理完"""
+        for stage in self.stages:
+            stage.queue.join()
+
+    def shutdown(self):
+        """处理完已提交的任务后停止全部工作线程"""
+        for stage in self.stages:
+            stage.stop()
+        self._started = False
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        return {stage.name: stage.metrics() for stage in self.stages}
@@ -0,0 +1,202 @@
+from typing import Dict, List, Optional
+import cProfile
+import io
+import marshal
+import os
+import sys
+import threading
+import time
+
+# 文件处理/请求超过该耗时（秒）后开始采样，0 表示关闭
+PROFILE_FILE_THRESHOLD = float(os.getenv("PROFILE_FILE_THRESHOLD", "30"))
+PROFILE_REQUEST_THRESHOLD = float(os.getenv("PROFILE_REQUEST_THRESHOLD", "5"))
+# 采样间隔（秒）
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.01"))
+# 单次剖析最多保留的不同调用栈数量，超出的栈计入 "<truncated>"
+PROFILE_MAX_STACKS = int(os.getenv("PROFILE_MAX_STACKS", "20000"))
+# 调用栈最大深度
+PROFILE_MAX_DEPTH = 128
+
+class ProfileResult:
+    """一次剖析的结果"""
+
+    def __init__(self, name: str, mode: str, duration: float, data: bytes, sample_count: int = 0):
+        self.name = name
+        self.mode = mode
+        self.duration = duration
+        self.data = data
+        self.sample_count = sample_count
+
+class ProfileSession:
+    """一个被监视的工作单元（一次请求或一个文件的某个处理阶段）
+
+    sampling 模式下，耗时超过阈值之前只登记开始时间，不做任何采样；
+    force 模式（管理员要求）下在当前线程启用 cProfile 记录完整调用。
+    """
+
+    def __init__(self, profiler: "SamplingProfiler", name: str, threshold: float, force: bool = False):
+        self.profiler = profiler
+        self.name = name
+        self.threshold = threshold
+        self.force = force
+        self.thread_id = threading.get_ident()
+        self.result: Optional[ProfileResult] = None
+        self._stacks: Dict[str, int] = {}
+        self._samples = 0
+        self._cprofile: Optional[cProfile.Profile] = None
+        self._watched = False
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.deadline = self.started + self.threshold
+        if self.force:
+            self._cprofile = cProfile.Profile()
+            try:
+                self._cprofile.enable()
+            except ValueError:
+                # 当前线程已有其他剖析器在运行（如嵌套的强制剖析）
+                self._cprofile = None
+        if self._cprofile is None and self.threshold > 0:
+            self.profiler._watch(self)
+            self._watched = True
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter() - self.started
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.create_stats()
+            self.result = ProfileResult(self.name, "cprofile", duration, marshal.dumps(self._cprofile.stats))
+        elif self._watched:
+            self.profiler._unwatch(self)
+            if self._samples:
+                self.result = ProfileResult(self.name, "sampling", duration,
+                                            self._collapsed().encode('utf-8'), self._samples)
+        return False
+
+    def _sample(self, frame):
+        stack = []
+        while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        key = ";".join(reversed(stack))
+        if key not in self._stacks and len(self._stacks) >= PROFILE_MAX_STACKS:
+            key = "<truncated>"
+        self._stacks[key] = self._stacks.get(key, 0) + 1
+        self._samples += 1
+
+    def _collapsed(self) -> str:
+        """折叠栈格式（每行“调用栈 次数”），可直接交给 flamegraph.pl 或 speedscope"""
+        out = io.StringIO()
+        for stack, count in sorted(self._stacks.items(), key=lambda item: -item[1]):
+            out.write(f"{stack} {count}\n")
+        return out.getvalue()
+
+class SamplingProfiler:
+    """按阈值触发的采样剖析器
+
+    单个后台线程睡眠到最早的截止时间；只有超时的工作单元才会被周期性地抓取调用栈
+    （sys._current_frames），因此阈值内完成的工作单元只有一次登记和注销的开销。
+    同一线程上嵌套的工作单元（如上传请求中的文件处理）各自得到完整的采样。
+    """
+
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self._sessions: Dict[int, List[ProfileSession]] = {}
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def session(self, name: str, threshold: float, force: bool = False) -> ProfileSession:
+        return ProfileSession(self, name, threshold, force)
+
+    def _watch(self, session: ProfileSession):
+        with self._cond:
+            self._sessions.setdefault(session.thread_id, []).append(session)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _unwatch(self, session: ProfileSession):
+        with self._cond:
+            stack = self._sessions.get(session.thread_id, [])
+            if session in stack:
+                stack.remove(session)
+            if not stack:
+                self._sessions.pop(session.thread_id, None)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                now = time.perf_counter()
+                watched = [s for stack in self._sessions.values() for s in stack]
+                due = [s for s in watched if s.deadline <= now]
+                if not due:
+                    upcoming = [s.deadline for s in watched]
+                    self._cond.wait(min(upcoming) - now if upcoming else None)
+                    continue
+
+                # 持锁采样，注销后的工作单元不会再被写入
+                frames = sys._current_frames()
+                for session in due:
+                    frame = frames.get(session.thread_id)
+                    if frame is not None:
+                        session._sample(frame)
+                del frames
+            time.sleep(self.interval)
+
+profiler = SamplingProfiler()
+
+def profile_file(name: str, force: bool = False) -> ProfileSession:
+    """监视一个文件处理单元"""
+    return profiler.session(name, PROFILE_FILE_THRESHOLD, force)
+
+def profile_request(name: str, force: bool = False) -> ProfileSession:
+    """监视一次HTTP请求"""
+    return profiler.session(name, PROFILE_REQUEST_THRESHOLD, force)
+
+class RequestProfilingMiddleware:
+    """ASGI中间件：监视每个HTTP请求，超过阈值的请求交给 on_result 保存
+
+    异步请求共享事件循环线程，采样到的是该线程上正在执行的代码，
+    因此慢请求的剖析中可能混有同时阻塞事件循环的其他请求。
+    """
+
+    def __init__(self, app, on_result, exclude_suffixes=()):
+        self.app = app
+        self.on_result = on_result
+        # 长连接（如SSE事件流）本身就是“慢请求”，不做剖析
+        self.exclude_suffixes = tuple(exclude_suffixes)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'].endswith(self.exclude_suffixes):
+            await self.app(scope, receive, send)
+            return
+
+        session = profile_request(f"{scope['method']} {scope['path']}")
+        with session:
+            await self.app(scope, receive, send)
+        if session.result is not None:
+            try:
+                self.on_result(session.result)
+            except Exception as e:
+                print(f"保存请求剖析失败: {e}")
+
+def save_profile(db, result: ProfileResult, kind: str, file_id: Optional[int] = None):
+    """保存剖析结果"""
+    from models import ProfileRecord
+
+    record = ProfileRecord(
+        file_id=file_id,
+        kind=kind,
+        name=result.name,
+        mode=result.mode,
+        duration_seconds=result.duration,
+        sample_count=result.sample_count,
+        data=result.data
+    )
+    db.add(record)
+    db.commit()
+    print(f"已保存性能剖析: {kind} {result.name} ({result.mode}, {result.duration:.1f}s)")
+    return record
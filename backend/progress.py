@@ -0,0 +1,147 @@
+from collections import deque
+from typing import Any, Dict, List, Optional
+import asyncio
+import json
+import os
+import threading
+import time
+
+from metrics import registry, METRICS_ENABLED
+
+# 每个订阅者最多缓存的事件数，超出时丢弃最旧的事件
+PROGRESS_QUEUE_SIZE = int(os.getenv("PROGRESS_QUEUE_SIZE", "100"))
+# 没有事件时发送心跳的间隔（秒），防止代理断开空闲连接
+PROGRESS_HEARTBEAT_INTERVAL = float(os.getenv("PROGRESS_HEARTBEAT_INTERVAL", "15"))
+
+# 文件处理结束的事件类型，单文件订阅收到后结束推送
+TERMINAL_EVENTS = ("completed", "error")
+
+SUBSCRIBERS = registry.gauge("kg_progress_subscribers", "当前进度事件订阅者数量")
+EVENTS_PUBLISHED = registry.counter("kg_progress_events_published_total", "发布的进度事件数", ["event"])
+EVENTS_DROPPED = registry.counter("kg_progress_events_dropped_total", "因订阅者缓冲区已满而丢弃的事件数")
+
+class Subscription:
+    """一个订阅者：有界缓冲区 + 唤醒事件
+
+    缓冲区满时丢弃最旧的事件（进度事件后面的总是比前面的新），
+    被丢弃的数量随下一个送达的事件一起告知客户端。
+    """
+
+    def __init__(self, broker: "ProgressBroker", user_id: int, file_id: Optional[int], maxsize: int):
+        self.broker = broker
+        self.user_id = user_id
+        self.file_id = file_id
+        self.dropped = 0
+        self._buffer: deque = deque()
+        self._maxsize = maxsize
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+
+    def _deliver(self, event: Dict[str, Any]):
+        """在事件循环线程中调用"""
+        if len(self._buffer) >= self._maxsize:
+            self._buffer.popleft()
+            self.dropped += 1
+            EVENTS_DROPPED.inc()
+        self._buffer.append(event)
+        self._ready.set()
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """取下一个事件，超时返回 None"""
+        if not self._buffer:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        event = self._buffer.popleft()
+        if self.dropped:
+            event = {**event, 'dropped': self.dropped}
+            self.dropped = 0
+        return event
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+class ProgressBroker:
+    """进程内的进度事件发布/订阅
+
+    publish 可在任意线程调用（上传请求的工作线程、批量流水线的阶段线程）；
+    事件通过 call_soon_threadsafe 投递到订阅者所在的事件循环，发布方不会被慢客户端阻塞。
+    """
+
+    def __init__(self, queue_size: int = PROGRESS_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._by_user: Dict[int, List[Subscription]] = {}
+
+    def subscribe(self, user_id: int, file_id: Optional[int] = None) -> Subscription:
+        """订阅用户的全部文件（file_id 为 None）或单个文件的事件，须在事件循环中调用"""
+        subscription = Subscription(self, user_id, file_id, self.queue_size)
+        with self._lock:
+            self._by_user.setdefault(user_id, []).append(subscription)
+            SUBSCRIBERS.set(self._count())
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._by_user.get(subscription.user_id, [])
+            if subscription in subscriptions:
+                subscriptions.remove(subscription)
+            if not subscriptions:
+                self._by_user.pop(subscription.user_id, None)
+            SUBSCRIBERS.set(self._count())
+
+    def publish(self, user_id: int, file_id: int, event: str, **data):
+        """发布事件；没有订阅者时只有一次字典查找的开销"""
+        with self._lock:
+            subscriptions = [s for s in self._by_user.get(user_id, ())
+                             if s.file_id is None or s.file_id == file_id]
+        if METRICS_ENABLED:
+            EVENTS_PUBLISHED.inc(event=event)
+        if not subscriptions:
+            return
+
+        payload = {'file_id': file_id, 'event': event, 'time': time.time(), **data}
+        for subscription in subscriptions:
+            try:
+                subscription._loop.call_soon_threadsafe(subscription._deliver, payload)
+            except RuntimeError:
+                # 事件循环已关闭
+                self.unsubscribe(subscription)
+
+    def _count(self) -> int:
+        return sum(len(subscriptions) for subscriptions in self._by_user.values())
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return self._count()
+
+def format_sse(event: Dict[str, Any]) -> str:
+    return f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+async def stream_events(subscription: Subscription, initial: Optional[List[Dict[str, Any]]] = None,
+                        heartbeat: float = PROGRESS_HEARTBEAT_INTERVAL):
+    """生成SSE数据流：先发送初始事件，之后推送订阅到的事件，空闲时发送心跳
+
+    单文件订阅在文件处理结束后结束数据流。
+    """
+    try:
+        for event in initial or ():
+            yield format_sse(event)
+            if subscription.file_id is not None and event['event'] in TERMINAL_EVENTS:
+                return
+
+        while True:
+            event = await subscription.get(timeout=heartbeat)
+            if event is None:
+                yield ": heartbeat\n\n"
+                continue
+            yield format_sse(event)
+            if subscription.file_id is not None and event['event'] in TERMINAL_EVENTS:
+                return
+    finally:
+        subscription.close()
+
+broker = ProgressBroker()
@@ -0,0 +1,59 @@
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Tuple
+import os
+import threading
+
+from metrics import registry
+
+# 图查询结果缓存的条目数上限（0 表示不缓存）
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "2048"))
+
+REQUESTS = registry.counter("kg_query_cache_requests_total", "图查询结果缓存的请求数", ["operation", "result"])
+ENTRIES = registry.gauge("kg_query_cache_entries", "图查询结果缓存中的条目数")
+EVICTIONS = registry.counter("kg_query_cache_evictions_total", "因超出条目上限被淘汰的缓存条目数")
+
+class QueryCache:
+    """图查询（实体搜索、路径、邻域）结果的LRU缓存
+
+    键为 (操作, 用户, 图谱代数, 规范化后的参数)。用户的图谱代数保存在数据库中，文件入库或删除时加一，
+    之后旧代数的条目不会再被命中，随LRU淘汰，因此无需主动清除；多个worker各自缓存，
+    但读到的代数一致，不会返回其他worker入库前的结果。
+    """
+
+    def __init__(self, max_entries: int = QUERY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, operation: str, user_id: int, generation: int,
+                       params: Tuple[Hashable, ...], compute: Callable[[], Any]) -> Any:
+        """返回缓存的结果，未命中时调用 compute() 计算并缓存
+
+        返回的对象由多个请求共用，调用方不应修改。
+        """
+        if self.max_entries <= 0:
+            return compute()
+
+        key = (operation, user_id, generation, params)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                REQUESTS.inc(operation=operation, result="hit")
+                return self._entries[key]
+        REQUESTS.inc(operation=operation, result="miss")
+
+        # 在锁外计算，同一个键并发未命中时各自计算一次，结果相同
+        value = compute()
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                EVICTIONS.inc()
+            ENTRIES.set(len(self._entries))
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            ENTRIES.set(0)
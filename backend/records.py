@@ -0,0 +1,97 @@
+from sys import intern
+from typing import Any, Dict, List, Optional
+
+class Entity:
+    """实体记录
+
+    抽取、图谱写入、索引和统计全程使用该记录，只在持久化和接口返回时转换为字典。
+    使用 __slots__ 不为每个实例分配属性字典；文本和类型标签驻留（intern），
+    同一文档中反复出现的实体和成千上万个相同的标签共享同一个字符串对象。
+    timestamps 只用于视频：实体出现的各关键帧时间（秒），其他文件为 None，不出现在字典中。
+    """
+
+    __slots__ = ('text', 'label', 'start', 'end', 'confidence', 'timestamps')
+
+    def __init__(self, text: str, label: str, start: int = 0, end: int = 0, confidence: float = 0.0,
+                 timestamps: Optional[List[float]] = None):
+        self.text = intern(text)
+        self.label = intern(label)
+        self.start = start
+        self.end = end
+        self.confidence = confidence
+        self.timestamps = timestamps
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Entity":
+        return cls(data['text'], data.get('label', ''), data.get('start', 0), data.get('end', 0),
+                   data.get('confidence', 0.0), data.get('timestamps'))
+
+    def __reduce__(self):
+        # 按位置参数序列化（进程池回传结果时不重复写出字段名），反序列化时重新驻留字符串
+        if self.timestamps is None:
+            return Entity, (self.text, self.label, self.start, self.end, self.confidence)
+        return Entity, (self.text, self.label, self.start, self.end, self.confidence, self.timestamps)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            'text': self.text,
+            'label': self.label,
+            'start': self.start,
+            'end': self.end,
+            'confidence': self.confidence
+        }
+        if self.timestamps is not None:
+            data['timestamps'] = self.timestamps
+        return data
+
+    def __repr__(self) -> str:
+        return f"Entity({self.text!r}, {self.label!r}, {self.start}, {self.end}, {self.confidence})"
+
+class Relation:
+    """关系记录
+
+    上下文句子不单独保存：source 引用抽取时的整篇文本（同一文档的所有关系共享一个字符串），
+    只记录句子的起止偏移，读取 context 时才切片。主语、宾语和关系类型同样驻留。
+    """
+
+    __slots__ = ('subject', 'predicate', 'object', 'confidence', 'source', 'context_start', 'context_end')
+
+    def __init__(self, subject: str, predicate: str, obj: str, confidence: float = 0.0,
+                 source: str = '', context_start: int = 0, context_end: Optional[int] = None):
+        self.subject = intern(subject)
+        self.predicate = intern(predicate)
+        self.object = intern(obj)
+        self.confidence = confidence
+        self.source = source
+        self.context_start = context_start
+        self.context_end = len(source) if context_end is None else context_end
+
+    @property
+    def context(self) -> str:
+        return self.source[self.context_start:self.context_end]
+
+    @property
+    def key(self) -> tuple:
+        return self.subject, self.predicate, self.object
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Relation":
+        return cls(data['subject'], data['predicate'], data['object'], data.get('confidence', 0.0),
+                   data.get('context', ''))
+
+    def __reduce__(self):
+        # 同一次序列化中 source 只写出一次
+        return Relation, (self.subject, self.predicate, self.object, self.confidence,
+                          self.source, self.context_start, self.context_end)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'subject': self.subject,
+            'predicate': self.predicate,
+            'object': self.object,
+            'confidence': self.confidence,
+            'context': self.context
+        }
+
+    def __repr__(self) -> str:
+        return f"Relation({self.subject!r}, {self.predicate!r}, {self.object!r}, {self.confidence})"
@@ -0,0 +1,136 @@
+from typing import List, Dict, Tuple, Optional, Iterable
+import json
+import os
+import re
+
+from records import Relation
+
+# 用户自定义关系模式配置文件（JSON）
+RELATION_PATTERNS_FILE = os.getenv("RELATION_PATTERNS_FILE", "")
+
+# 句子分隔符与子句分隔符：关系的主语和宾语不会跨越子句
+SENTENCE_DELIMITERS = "。！？!?；;\n"
+CLAUSE_DELIMITERS = "，,、：:"
+_SENTENCE_RE = re.compile(r"[^" + re.escape(SENTENCE_DELIMITERS) + r"]+")
+# 英文句点只有后跟空白或位于末尾时才视为句子结束，避免切开小数
+_PERIOD_RE = re.compile(r"\.(?=\s|$)")
+
+def split_sentences(text: str) -> List[Tuple[int, int]]:
+    """切分句子，返回(起始, 结束)偏移列表"""
+    text = _PERIOD_RE.sub("\n", text) if "." in text else text
+    sentences = []
+    for match in _SENTENCE_RE.finditer(text):
+        start, end = match.span()
+        # 去掉首尾空白
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if start < end:
+            sentences.append((start, end))
+    return sentences
+
+class RelationPattern:
+    """关系模式：触发词 + 关系类型，主语取触发词前的子句片段，宾语取其后的子句片段"""
+
+    def __init__(self, relation: str, triggers: Iterable[str], suffixes: Iterable[str] = (),
+                 confidence: float = 0.7):
+        self.relation = relation
+        self.triggers = tuple(triggers)
+        self.suffixes = tuple(sorted(suffixes, key=len, reverse=True))  # 触发词后可跳过的助词，如“了”
+        self.confidence = confidence
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "RelationPattern":
+        return cls(
+            relation=data['relation'],
+            triggers=data['triggers'],
+            suffixes=data.get('suffixes', ()),
+            confidence=data.get('confidence', 0.7)
+        )
+
+DEFAULT_PATTERNS = [
+    RelationPattern('is_a', ['是', '为']),
+    RelationPattern('works_at', ['工作于', '任职于', '在']),
+    RelationPattern('located_in', ['位于', '在']),
+    RelationPattern('owns', ['拥有', '持有']),
+    RelationPattern('founded', ['创建', '建立', '创办'], suffixes=['了']),
+    RelationPattern('participates_in', ['参与', '参加'], suffixes=['了']),
+]
+
+class RelationPatternEngine:
+    """关系模式引擎
+
+    先一次性切分句子，再用由全部触发词编译成的单个正则在每个句子上扫描一遍；
+    主语和宾语在触发词两侧各截取不超过 max_span 个字符且不跨越子句分隔符，
+    因此每个字符的处理代价有界，不存在回溯爆炸。
+    """
+
+    def __init__(self, patterns: Optional[List[RelationPattern]] = None, max_span: int = 20,
+                 config_path: Optional[str] = None):
+        self.max_span = max_span
+        self.patterns: List[RelationPattern] = list(DEFAULT_PATTERNS if patterns is None else patterns)
+        config_path = RELATION_PATTERNS_FILE if config_path is None else config_path
+        if config_path:
+            self.load_config(config_path)
+        self._compile()
+
+    def register(self, pattern: RelationPattern):
+        """注册新的关系模式"""
+        self.patterns.append(pattern)
+        self._compile()
+
+    def load_config(self, path: str):
+        """从JSON文件加载关系模式，格式为 [{"relation": ..., "triggers": [...], "suffixes": [...]}]"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                for item in json.load(f):
+                    self.patterns.append(RelationPattern.from_dict(item))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"关系模式配置加载失败: {e}")
+        self._compile()
+
+    def _compile(self):
+        self._trigger_patterns: Dict[str, List[RelationPattern]] = {}
+        for pattern in self.patterns:
+            for trigger in pattern.triggers:
+                self._trigger_patterns.setdefault(trigger, []).append(pattern)
+        # 长触发词优先，保证“工作于”不会被“在”之类的短词截断
+        triggers = sorted(self._trigger_patterns, key=len, reverse=True)
+        self._trigger_re = re.compile("|".join(re.escape(t) for t in triggers)) if triggers else None
+
+    def split_sentences(self, text: str) -> List[Tuple[int, int]]:
+        return split_sentences(text)
+
+    def extract(self, text: str, sentences: Optional[List[Tuple[int, int]]] = None) -> List[Relation]:
+        """抽取关系，上下文为所在句子（以偏移引用 text）"""
+        if self._trigger_re is None:
+            return []
+        if sentences is None:
+            sentences = self.split_sentences(text)
+
+        relations = []
+        for start, end in sentences:
+            sentence = text[start:end]
+            for match in self._trigger_re.finditer(sentence):
+                for pattern in self._trigger_patterns[match.group()]:
+                    subject = self._left_span(sentence, match.start())
+                    obj = self._right_span(sentence, match.end(), pattern.suffixes)
+                    if subject and obj:
+                        relations.append(Relation(subject, pattern.relation, obj, pattern.confidence,
+                                                  text, start, end))
+        return relations
+
+    def _left_span(self, sentence: str, pos: int) -> str:
+        window = sentence[max(0, pos - self.max_span):pos]
+        cut = max(window.rfind(d) for d in CLAUSE_DELIMITERS)
+        return window[cut + 1:].strip()
+
+    def _right_span(self, sentence: str, pos: int, suffixes: Tuple[str, ...]) -> str:
+        for suffix in suffixes:
+            if sentence.startswith(suffix, pos):
+                pos += len(suffix)
+                break
+        window = sentence[pos:pos + self.max_span]
+        cuts = [i for i in (window.find(d) for d in CLAUSE_DELIMITERS) if i != -1]
+        return window[:min(cuts)].strip() if cuts else window.strip()
@@ -65,6 +65,7 @@ class GraphEdgeSchema(BaseModel):
 class GraphResponse(BaseModel):
     id: int
     file_id: int
+    version: Optional[int] = None
     entities: List[EntitySchema]
     relations: List[RelationSchema]
     graph_data: Dict[str, Any]
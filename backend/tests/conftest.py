@@ -0,0 +1,48 @@
+"""测试公共配置：数据库和各数据目录指向临时目录（须在导入 database、main 等模块之前设置）"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+WORKDIR = tempfile.mkdtemp(prefix="kg-test-")
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(WORKDIR, 'test.db')}",
+    'GRAPH_BACKEND': 'memory',
+    'GRAPH_DATA_DIR': os.path.join(WORKDIR, 'graph_data'),
+    'ENTITY_INDEX_DIR': os.path.join(WORKDIR, 'entity_index'),
+    'WARM_UP_ON_STARTUP': 'false',
+    'PRELOAD_COMPONENTS': 'false',
+    'STATS_RECONCILE_INTERVAL': '0',
+    'RATE_LIMITS': ''
+})
+# 上传目录等相对路径同样位于临时目录
+os.chdir(WORKDIR)
+os.makedirs("uploads", exist_ok=True)
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """独立的SQLite数据库（已建表）"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from database import Base
+    import models  # noqa: F401  注册全部模型
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'db.sqlite'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+@pytest.fixture(scope="session")
+def client():
+    """以管理员身份登录的应用测试客户端"""
+    from fastapi.testclient import TestClient
+    from main import app
+
+    with TestClient(app) as client:
+        token = client.post("/auth/login", json={'username': 'admin', 'password': 'admin123'}).json()['access_token']
+        client.headers['Authorization'] = f"Bearer {token}"
+        yield client
@@ -0,0 +1,43 @@
+"""批量上传：ZIP展开、任务进度查询和任务记录的淘汰"""
+import io
+import time
+import zipfile
+
+import main
+
+def _wait_for_batch(client, batch_id, total, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        counts = client.get(f"/files/batch/{batch_id}").json()['status_counts']
+        if sum(counts.get(status, 0) for status in ('completed', 'error')) == total:
+            return counts
+        time.sleep(0.1)
+    raise AssertionError(f"批量任务超时: {counts}")
+
+def test_batch_upload_expands_zip(client):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.writestr('docs/a.txt', '张伟在北京的华夏科技公司工作。')
+        zf.writestr('docs/b.txt', '李娜毕业于清华大学。')
+        zf.writestr('setup.exe', 'MZ')
+    response = client.post("/files/batch-upload", files=[
+        ('files', ('archive.zip', archive.getvalue(), 'application/zip')),
+        ('files', ('c.txt', '王芳在上海工作。'.encode('utf-8'), 'text/plain')),
+    ])
+    assert response.status_code == 200
+    body = response.json()
+    assert sorted(f['filename'] for f in body['files']) == ['a.txt', 'b.txt', 'c.txt']
+    assert body['skipped'] == ['setup.exe']
+    assert _wait_for_batch(client, body['batch_id'], 3) == {'completed': 3}
+
+def test_batch_jobs_are_evicted(monkeypatch):
+    monkeypatch.setattr(main, 'batch_jobs', main.OrderedDict())
+    monkeypatch.setattr(main, 'BATCH_JOB_MAX_ENTRIES', 2)
+    for i in range(3):
+        main._remember_batch(f"b{i}", 1, [i])
+    assert list(main.batch_jobs) == ['b1', 'b2']
+
+    monkeypatch.setattr(main, 'BATCH_JOB_TTL', 60)
+    main.batch_jobs['b1']['created'] -= 120
+    main._remember_batch("b3", 1, [3])
+    assert list(main.batch_jobs) == ['b2', 'b3']
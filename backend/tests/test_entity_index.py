@@ -0,0 +1,91 @@
+"""实体向量索引：限定用户的检索、逻辑删除后的压缩与重新加载"""
+import os
+import threading
+
+import numpy as np
+
+from entity_index import EntityVectorIndex
+from records import Entity
+
+def _entities(prefix, count):
+    return [Entity(f"{prefix}{i:05d}", 'ORG', 0, 0, 0.5) for i in range(count)]
+
+def _trained_index(data_dir=None):
+    index = EntityVectorIndex(data_dir, nprobe=2, min_train_size=256)
+    for file_id in range(8):
+        index.add_entities(file_id, 1, _entities(f"公司{file_id}-", 100))
+    index.wait_for_training()
+    assert index._centroids is not None
+    return index
+
+def test_small_user_gets_exact_results_after_training():
+    index = _trained_index()
+    index.add_entities(100, 2, [Entity('量子计算研究所', 'ORG', 0, 7, 0.9),
+                                Entity('北京大学', 'ORG', 0, 4, 0.9)])
+    results = index.search('量子计算', limit=5, user_id=2)
+    assert [r['text'] for r in results] == ['量子计算研究所', '北京大学']
+
+def test_large_user_widens_probe_until_limit():
+    index = _trained_index()
+    # 另一个用户的实体多到不走精确扫描，但大多不在离查询最近的簇中
+    index.add_entities(200, 3, _entities("研究院", 400))
+    index.wait_for_training()
+    index.train()
+    limit = 50
+    nearest = int(np.argmax(index._centroids @ index.embedder.embed('公司0-00001')))
+    assert index._user_hits(np.array(index._lists[nearest]), 3) < limit
+    results = index.search('公司0-00001', limit=limit, user_id=3, nprobe=1)
+    assert len(results) == limit
+    assert all(r['user_id'] == 3 for r in results)
+
+def test_compaction_on_retrain_drops_deleted_rows(tmp_path):
+    data_dir = str(tmp_path / "index")
+    index = _trained_index(data_dir)
+    for file_id in range(6):
+        index.remove_file(file_id)
+    index.train()
+    assert index._size == index.size == 200
+    assert sorted(os.listdir(data_dir)) == sorted(['centroids.npy', 'entities.jsonl', index._vectors_file])
+    with open(os.path.join(data_dir, "entities.jsonl"), encoding="utf-8") as f:
+        assert sum(1 for _ in f) == 201
+
+    index.add_entities(50, 1, [Entity('压缩后新增', 'ORG', 0, 5, 0.5)])
+    index.remove_file(6)
+    reloaded = EntityVectorIndex(data_dir, nprobe=2, min_train_size=256)
+    assert reloaded.size == 101
+    assert reloaded.search('公司7-00042', limit=1, user_id=1)[0]['text'] == '公司7-00042'
+    assert reloaded.search('公司0-00042', limit=1, user_id=1)[0]['file_id'] != 0
+    assert reloaded.search('压缩后新增', limit=1)[0]['file_id'] == 50
+
+def test_remove_compacts_when_mostly_deleted():
+    index = EntityVectorIndex(None, min_train_size=64)
+    for file_id in range(4):
+        index.add_entities(file_id, 1, _entities(f"文件{file_id}-", 50))
+    for file_id in range(3):
+        index.remove_file(file_id)
+    assert index._size == index.size == 50
+    assert [r['file_id'] for r in index.search('文件3-00007', limit=1, user_id=1)] == [3]
+
+def test_background_training_keeps_rows_added_meanwhile(monkeypatch):
+    index = EntityVectorIndex(None, nprobe=64, min_train_size=256)
+    started, release = threading.Event(), threading.Event()
+    assign = EntityVectorIndex._assign
+
+    def slow_assign(vectors, rows, centroids):
+        if not started.is_set():
+            started.set()
+            release.wait(5)
+        return assign(vectors, rows, centroids)
+    monkeypatch.setattr(EntityVectorIndex, '_assign', staticmethod(slow_assign))
+
+    index.add_entities(1, 1, _entities("公司", 300))
+    assert started.wait(5)
+    # 训练进行中写入和检索不被阻塞
+    index.add_entities(2, 2, [Entity('训练期间新增', 'ORG', 0, 6, 0.5)])
+    assert index.search('训练期间新增', limit=1)[0]['file_id'] == 2
+    release.set()
+    index.wait_for_training()
+
+    assert index._centroids is not None
+    assert sorted(row for rows in index._lists for row in rows) == list(range(301))
+    assert index.search('训练期间新增', limit=1)[0]['file_id'] == 2
@@ -0,0 +1,44 @@
+"""实体偏移对应原文：清洗文本时折叠的空白和删除的特殊字符不影响实体在原文中的位置"""
+from concurrent.futures import ThreadPoolExecutor
+
+import nlp_processor
+from document import Document, clean_text
+from nlp_processor import NLPProcessor
+
+RAW = "  【通知】\n\n张伟   在北京的华夏科技公司工作。\t李娜★毕业于清华大学，  现在在上海工作。\n"
+
+def _processor():
+    processor = NLPProcessor()
+    processor.nlp = None  # 规则识别，结果与是否安装模型无关
+    return processor
+
+def test_original_span_round_trip():
+    document = Document(RAW)
+    for word in ('张伟', '华夏科技公司', '清华大学', '上海'):
+        start = document.text.index(word)
+        original = document.original_span(start, start + len(word))
+        assert RAW[original[0]:original[1]] == word
+    assert document.original_span(3, 3)[0] == document.original_span(3, 4)[0]
+
+def test_entities_report_original_offsets():
+    entities, _ = _processor().extract_knowledge(RAW)
+    assert '张伟' in {entity.text for entity in entities}
+    for entity in entities:
+        # 原文区间内被清洗删除的字符（如★）保留在区间中
+        assert clean_text(RAW[entity.start:entity.end]) == entity.text
+    person = next(entity for entity in entities if entity.text == '张伟')
+    assert (person.start, person.end) == (RAW.index('张伟'), RAW.index('张伟') + 2)
+
+def test_parallel_extraction_reports_original_offsets(monkeypatch):
+    monkeypatch.setattr(nlp_processor, 'PARALLEL_EXTRACT_MIN_CHARS', 1)
+    monkeypatch.setattr(nlp_processor, 'PARALLEL_EXTRACT_CHUNK_CHARS', 20)
+    monkeypatch.setattr(nlp_processor, 'PARALLEL_EXTRACT_OVERLAP_CHARS', 5)
+    processor = _processor()
+    raw = RAW * 5
+    monkeypatch.setattr(nlp_processor, 'extract_chunk_worker', processor._extract_chunk)
+    with ThreadPoolExecutor(2) as executor:
+        entities, _ = processor.extract_knowledge(raw, executor)
+    serial, _ = processor.extract_knowledge(raw)
+    assert [(e.text, e.start, e.end) for e in entities] == [(e.text, e.start, e.end) for e in serial]
+    for entity in entities:
+        assert clean_text(raw[entity.start:entity.end]) == entity.text
@@ -0,0 +1,40 @@
+"""图谱分析接口：文件重新处理后不返回缓存的旧结果"""
+from database import SessionLocal
+from models import FileRecord
+
+def _upload(client, name, text):
+    response = client.post("/files/upload", files={'file': (name, text.encode('utf-8'), 'text/plain')})
+    assert response.json()['status'] == 'completed'
+    return response.json()['id']
+
+def _rewrite(file_id, text):
+    db = SessionLocal()
+    try:
+        path = db.query(FileRecord).get(file_id).file_path
+    finally:
+        db.close()
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+def test_reprocessed_file_is_reanalyzed(client):
+    file_id = _upload(client, 'analytics.txt', '张伟在北京的华夏科技公司工作。')
+    before = client.get(f"/graph/{file_id}/analytics").json()
+    user_before = client.get("/graph/analytics").json()
+
+    _rewrite(file_id, '张伟在北京的华夏科技公司工作。李娜毕业于清华大学，现在在上海的星辰集团担任经理。')
+    response = client.post(f"/files/{file_id}/reprocess", params={'reextract': True})
+    assert response.status_code == 200
+
+    after = client.get(f"/graph/{file_id}/analytics").json()
+    assert after != before
+    assert client.get("/graph/analytics").json() != user_before
+
+def test_cache_hit_skips_loading_graphs(client, monkeypatch):
+    import main
+    file_id = _upload(client, 'analytics_hit.txt', '李娜毕业于清华大学。')
+    first = client.get(f"/graph/{file_id}/analytics").json()
+
+    def fail(*args):
+        raise AssertionError("缓存命中时不应读取图谱内容")
+    monkeypatch.setattr(main, '_load_graph_views', fail)
+    assert client.get(f"/graph/{file_id}/analytics").json() == first
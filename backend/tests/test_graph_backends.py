@@ -0,0 +1,186 @@
+"""图存储后端的一致性测试：内置图引擎与Neo4j运行同一组用例
+
+设置 TEST_NEO4J_URI（及 NEO4J_USERNAME/NEO4J_PASSWORD）时同时测试该Neo4j实例，否则跳过；
+用例使用的文件ID较大，结束时删除写入的数据。
+"""
+import glob
+import os
+import time
+
+import numpy as np
+import pytest
+
+from records import Entity, Relation
+
+USER = 1
+OTHER_USER = 2
+FILE = 900001
+OTHER_FILE = 900002
+
+@pytest.fixture(params=["memory", "neo4j"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        from memory_graph import MemoryGraphBackend
+        backend = MemoryGraphBackend(str(tmp_path / "graph"))
+    else:
+        uri = os.getenv("TEST_NEO4J_URI")
+        if not uri:
+            pytest.skip("未设置 TEST_NEO4J_URI")
+        from neo4j import GraphDatabase
+        from knowledge_graph import Neo4jGraphBackend
+        backend = Neo4jGraphBackend(GraphDatabase.driver(uri, auth=(
+            os.getenv("NEO4J_USERNAME", "neo4j"), os.getenv("NEO4J_PASSWORD", "password"))))
+    yield backend
+    for file_id in (FILE, OTHER_FILE):
+        backend.delete_file(file_id)
+    backend.close()
+
+def _chain():
+    """张伟 -工作于-> 华夏科技公司 -位于-> 北京"""
+    entities = [Entity('张伟', 'PERSON', 0, 2, 0.6), Entity('华夏科技公司', 'ORG', 5, 11, 0.7),
+                Entity('北京', 'GPE', 14, 16, 0.6)]
+    relations = [Relation('张伟', '工作于', '华夏科技公司', 0.8, '张伟工作于华夏科技公司'),
+                 Relation('华夏科技公司', '位于', '北京', 0.8, '华夏科技公司位于北京')]
+    return entities, relations
+
+def _texts(nodes):
+    return sorted(node['text'] for node in nodes)
+
+def test_write_returns_visualization(backend):
+    graph = backend.write_graph(*_chain(), FILE, USER)
+    assert graph['stats'] == {'total_nodes': 3, 'total_edges': 2}
+    assert sorted(node['label'] for node in graph['nodes']) == ['北京', '华夏科技公司', '张伟']
+    assert sorted(edge['relation'] for edge in graph['edges']) == ['位于', '工作于']
+
+def test_search_is_scoped_to_user(backend):
+    backend.write_graph(*_chain(), FILE, USER)
+    backend.write_graph([Entity('华夏科技公司', 'ORG', 0, 6, 0.9)], [], OTHER_FILE, OTHER_USER)
+
+    results = backend.search_entities(USER, '华夏')
+    assert [(r['text'], r['file_id']) for r in results] == [('华夏科技公司', FILE)]
+    assert [r['file_id'] for r in backend.search_entities(OTHER_USER, '华夏')] == [OTHER_FILE]
+    assert backend.search_entities(USER, '上海') == []
+
+def test_find_paths(backend):
+    backend.write_graph(*_chain(), FILE, USER)
+    paths = backend.find_paths(USER, '张伟', '北京')
+    assert len(paths) == 1
+    path = paths[0]
+    assert [step['text'] for step in path if step['type'] == 'node'] == ['张伟', '华夏科技公司', '北京']
+    assert [step['relation'] for step in path if step['type'] == 'relationship'] == ['工作于', '位于']
+    assert backend.find_paths(USER, '张伟', '北京', max_depth=1) == []
+    assert backend.find_paths(OTHER_USER, '张伟', '北京') == []
+
+def test_get_neighbors(backend):
+    backend.write_graph(*_chain(), FILE, USER)
+    one_hop = backend.get_neighbors(USER, '张伟', depth=1)
+    assert _texts(one_hop['nodes']) == ['华夏科技公司', '张伟']
+    assert [edge['relation'] for edge in one_hop['edges']] == ['工作于']
+    assert _texts(backend.get_neighbors(USER, '张伟', depth=2)['nodes']) == ['北京', '华夏科技公司', '张伟']
+    assert backend.get_neighbors(OTHER_USER, '张伟') == {'nodes': [], 'edges': []}
+
+def test_graph_stats(backend):
+    backend.write_graph(*_chain(), FILE, USER)
+    stats = backend.get_graph_stats(USER)
+    assert (stats['total_entities'], stats['total_relations']) == (3, 2)
+    assert sorted(stats['entity_types']) == ['GPE', 'ORG', 'PERSON']
+    assert backend.get_graph_stats(USER, OTHER_FILE)['total_entities'] == 0
+
+def test_write_batch_matches_write_graph(backend):
+    entities, relations = _chain()
+    backend.write_batch([(entities, relations, FILE, USER),
+                         ([Entity('北京', 'GPE', 0, 2, 0.5)], [], OTHER_FILE, USER)])
+    assert backend.get_graph_stats(USER, FILE)['total_relations'] == 2
+    assert [r['file_id'] for r in backend.search_entities(USER, '北京')] in ([FILE, OTHER_FILE], [OTHER_FILE, FILE])
+    assert len(backend.find_paths(USER, '张伟', '北京')) == 1
+
+def test_delete_file(backend):
+    backend.write_graph(*_chain(), FILE, USER)
+    backend.write_graph([Entity('北京', 'GPE', 0, 2, 0.6)], [], OTHER_FILE, USER)
+    backend.delete_file(FILE)
+    assert [r['file_id'] for r in backend.search_entities(USER, '北京')] == [OTHER_FILE]
+    assert backend.search_entities(USER, '张伟') == []
+    assert backend.find_paths(USER, '张伟', '北京') == []
+    assert backend.get_graph_stats(USER)['total_relations'] == 0
+
+def test_memory_backend_flushes_when_idle(tmp_path):
+    from memory_graph import MemoryGraphBackend
+    data_dir = str(tmp_path / "graph")
+    backend = MemoryGraphBackend(data_dir, save_interval=0.2)
+    try:
+        backend.save()
+        saved = backend._last_save
+        # 刚落盘过，这次写入只改内存，随后不再有写入
+        backend.write_graph(*_chain(), FILE, USER)
+        deadline = time.time() + 5
+        while backend._last_save == saved and time.time() < deadline:
+            time.sleep(0.05)
+        reloaded = MemoryGraphBackend(data_dir, save_interval=float('inf'))
+        assert [r['text'] for r in reloaded.search_entities(USER, '华夏')] == ['华夏科技公司']
+        reloaded.close()
+    finally:
+        backend.close()
+
+def test_backend_interface_is_abstract():
+    from knowledge_graph import GraphBackend
+
+    class Partial(GraphBackend):
+        def write_graph(self, entities, relations, file_id, user_id):
+            return {}
+
+    with pytest.raises(TypeError):
+        Partial()
+
+def test_memory_backend_save_is_atomic(tmp_path, monkeypatch):
+    from memory_graph import MemoryGraphBackend
+    data_dir = str(tmp_path / "graph")
+    backend = MemoryGraphBackend(data_dir, save_interval=float('inf'))
+    backend.write_graph(*_chain(), FILE, USER)
+    backend.save()
+    backend.write_graph([Entity('上海', 'GPE', 0, 2, 0.6)], [], OTHER_FILE, USER)
+
+    # 写到一半时退出：上一个快照仍完整可用，残留的快照目录在下次加载时清除
+    real_save = np.save
+    calls = []
+    def failing_save(f, values):
+        calls.append(1)
+        if len(calls) == 3:
+            raise OSError("模拟进程退出")
+        real_save(f, values)
+    monkeypatch.setattr(np, 'save', failing_save)
+    with pytest.raises(OSError):
+        backend.save()
+    monkeypatch.undo()
+    assert backend._dirty
+    assert len(glob.glob(os.path.join(data_dir, "snapshot-*"))) == 2
+
+    reloaded = MemoryGraphBackend(data_dir, save_interval=float('inf'))
+    assert reloaded.get_graph_stats(USER)['total_entities'] == 3
+    assert len(glob.glob(os.path.join(data_dir, "snapshot-*"))) == 1
+    reloaded.close()
+
+    backend.save()
+    assert MemoryGraphBackend(data_dir, save_interval=float('inf')).get_graph_stats(USER)['total_entities'] == 4
+    assert len(glob.glob(os.path.join(data_dir, "snapshot-*"))) == 1
+    backend.close()
+
+def test_memory_backend_loads_legacy_layout(tmp_path):
+    """旧版本直接保存在数据目录中的文件可以加载，下次落盘后改为快照目录"""
+    from memory_graph import MemoryGraphBackend
+    data_dir = str(tmp_path / "graph")
+    backend = MemoryGraphBackend(data_dir, save_interval=float('inf'))
+    backend.write_graph(*_chain(), FILE, USER)
+    backend.save()
+    snapshot = glob.glob(os.path.join(data_dir, "snapshot-*"))[0]
+    for name in os.listdir(snapshot):
+        os.replace(os.path.join(snapshot, name), os.path.join(data_dir, name))
+    os.rmdir(snapshot)
+    os.remove(os.path.join(data_dir, "CURRENT"))
+
+    legacy = MemoryGraphBackend(data_dir, save_interval=float('inf'))
+    assert legacy.get_graph_stats(USER)['total_entities'] == 3
+    legacy.write_graph([Entity('上海', 'GPE', 0, 2, 0.6)], [], OTHER_FILE, USER)
+    legacy.close()
+    assert sorted(os.listdir(data_dir))[0] == 'CURRENT'
+    assert not glob.glob(os.path.join(data_dir, "*.npy"))
+    assert MemoryGraphBackend(data_dir).get_graph_stats(USER)['total_entities'] == 4
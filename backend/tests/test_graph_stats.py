@@ -0,0 +1,78 @@
+import threading
+
+from graph_stats import GraphStatsManager
+from models import FileRecord, User
+from records import Entity, Relation
+
+def _user_with_files(session_factory, files: int):
+    db = session_factory()
+    try:
+        user = User(username="stats", email="stats@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        records = [FileRecord(filename=f"f{i}.txt", file_path=f"f{i}.txt", file_type=".txt", file_size=1,
+                              user_id=user.id) for i in range(files)]
+        db.add_all(records)
+        db.commit()
+        return user.id, [record.id for record in records]
+    finally:
+        db.close()
+
+def _knowledge(i: int):
+    entities = [Entity(f"张{i}", 'PERSON'), Entity(f"华夏科技公司{i}", 'ORG')]
+    return entities, [Relation(entities[0].text, '工作于', entities[1].text, 0.8)]
+
+def test_record_and_remove_file(session_factory):
+    manager = GraphStatsManager()
+    user_id, file_ids = _user_with_files(session_factory, 2)
+    db = session_factory()
+    for file_id in file_ids:
+        manager.record_file(db, db.get(FileRecord, file_id), *_knowledge(file_id))
+        db.commit()
+    # 重新处理同一文件按差值更新
+    manager.record_file(db, db.get(FileRecord, file_ids[0]), [Entity("北京", 'GPE')], [])
+    db.commit()
+    stats = manager.get_stats(db, user_id)
+    assert stats == {'total_entities': 3, 'total_relations': 1, 'entity_types': {'PERSON': 1, 'ORG': 1, 'GPE': 1},
+                     'relation_types': {'工作于': 1}, 'files_processed': 2}
+
+    manager.remove_file(db, file_ids[1])
+    db.commit()
+    assert manager.get_stats(db, user_id) == {'total_entities': 1, 'total_relations': 0, 'entity_types': {'GPE': 1},
+                                              'relation_types': {}, 'files_processed': 1}
+    assert manager.generation(db, user_id) == 4
+    db.close()
+
+def test_concurrent_sessions_do_not_lose_increments(session_factory):
+    manager = GraphStatsManager()
+    threads, per_thread = 4, 10
+    user_id, file_ids = _user_with_files(session_factory, threads * per_thread)
+    errors = []
+
+    def ingest(ids):
+        db = session_factory()
+        try:
+            for file_id in ids:
+                manager.record_file(db, db.get(FileRecord, file_id), *_knowledge(file_id))
+                db.commit()
+        except Exception as e:
+            errors.append(e)
+        finally:
+            db.close()
+
+    workers = [threading.Thread(target=ingest, args=(file_ids[i::threads],)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert not errors
+    db = session_factory()
+    stats = manager.get_stats(db, user_id)
+    total = threads * per_thread
+    assert stats['files_processed'] == total
+    assert stats['total_entities'] == 2 * total
+    assert stats['entity_types'] == {'PERSON': total, 'ORG': total}
+    assert stats['relation_types'] == {'工作于': total}
+    assert manager.generation(db, user_id) == total
+    db.close()
@@ -0,0 +1,87 @@
+"""图谱版本：增量编码、并发处理时的版本号分配、旧格式数据的转换"""
+import json
+
+import pytest
+
+from content_store import ContentStore
+from graph_versions import GraphVersionManager, apply_delta, diff_document
+from models import FileRecord, GraphVersion, KnowledgeGraph, User
+from records import Entity, Relation
+
+@pytest.fixture(autouse=True)
+def _content_store_tables():
+    """压缩字典保存在全局数据库中（conftest 指向的临时数据库）"""
+    from database import Base, engine
+    Base.metadata.create_all(bind=engine)
+
+def _entity(i):
+    return {'text': f'实体{i}', 'label': 'ORG', 'confidence': 0.5}
+
+def test_delta_copies_unchanged_runs():
+    base = {'entities': [_entity(i) for i in range(1000)], 'relations': []}
+    new = {'entities': [_entity(i) for i in range(1000) if i != 500] + [_entity(2000), _entity(3)],
+           'relations': [{'subject': '实体1', 'predicate': '位于', 'object': '实体2'}]}
+    delta = diff_document(base, new)
+    assert apply_delta(base, delta) == new
+    assert delta['entities']['list'] == [[0, 500], [501, 1000], {'+': [_entity(2000)]}, [3, 4]]
+
+def _file(db):
+    user = db.query(User).first()
+    if user is None:
+        user = User(username='versions', email='versions@example.com', hashed_password='x')
+        db.add(user)
+        db.flush()
+    record = FileRecord(filename='v.txt', file_path='v.txt', file_type='text', file_size=1,
+                        user_id=user.id, status='completed')
+    db.add(record)
+    db.flush()
+    return record.id
+
+def test_concurrent_save_takes_next_version(session_factory, monkeypatch):
+    manager = GraphVersionManager()
+    first, second = session_factory(), session_factory()
+    try:
+        file_id = _file(first)
+        manager.save(first, file_id, [Entity('北京', 'GPE')], [])
+        first.commit()
+
+        # 第二个会话读取最新版本之后、插入之前，另一个会话提交了同一版本号
+        encode = manager._encode
+        def racing_encode(db, *args):
+            if db is second and manager.list_versions(first, file_id)[0]['version'] == 1:
+                manager.save(first, file_id, [Entity('上海', 'GPE')], [])
+                first.commit()
+            return encode(db, *args)
+        monkeypatch.setattr(manager, '_encode', racing_encode)
+
+        current = manager.save(second, file_id, [Entity('广州', 'GPE')], [Relation('广州', '位于', '广东')])
+        second.commit()
+        assert current.version == 3
+        assert [v['version'] for v in manager.list_versions(second, file_id)] == [3, 2, 1]
+        assert manager.get(second, file_id, 2)['entities'][0]['text'] == '上海'
+        assert manager.get(second, file_id, 3)['entities'][0]['text'] == '广州'
+    finally:
+        first.close()
+        second.close()
+
+def test_compress_legacy_detects_text_rows(session_factory):
+    manager = GraphVersionManager()
+    db = session_factory()
+    try:
+        file_id = _file(db)
+        entities = [_entity(1)]
+        legacy = KnowledgeGraph(file_id=file_id, entities=json.dumps(entities, ensure_ascii=False).encode('utf-8'),
+                                relations=b'[]', version=1)
+        db.add(legacy)
+        db.add(GraphVersion(file_id=file_id, version=1, entity_count=1, relation_count=0,
+                            data=json.dumps({'entities': entities, 'relations': []}).encode('utf-8')))
+        db.commit()
+
+        converted = manager.compress_legacy(db)
+        assert converted['graphs'] >= 1 and converted['versions'] >= 1
+        db.refresh(legacy)
+        assert not ContentStore.is_legacy(legacy.entities)
+        assert manager.get(db, file_id, 1)['entities'] == entities
+        assert manager.compress_legacy(db) == {'graphs': 0, 'versions': 0}
+    finally:
+        db.close()
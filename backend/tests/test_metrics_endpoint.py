@@ -0,0 +1,46 @@
+"""/metrics 接口：处理示例文件后各阶段的耗时直方图和计数器"""
+import os
+import re
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                           "sample_data", "sample_text.txt")
+
+_SAMPLE_RE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+
+def _parse(text):
+    """Prometheus 文本格式 -> {(指标名, 排序后的标签): 值}"""
+    samples = {}
+    for line in text.splitlines():
+        match = _SAMPLE_RE.match(line)
+        if match:
+            labels = tuple(sorted(re.findall(r'(\w+)="([^"]*)"', match.group(2) or '')))
+            samples[(match.group(1), labels)] = float(match.group(3))
+    return samples
+
+def _value(samples, name, **labels):
+    """同名指标中包含给定标签的样本之和"""
+    wanted = set(labels.items())
+    return sum(value for (sample, sample_labels), value in samples.items()
+               if sample == name and wanted <= set(sample_labels))
+
+def test_metrics_after_processing_sample_file(client):
+    with open(SAMPLE_FILE, 'rb') as f:
+        response = client.post("/files/upload", files={'file': ('sample_text.txt', f, 'text/plain')})
+    assert response.status_code == 200
+    assert response.json()['status'] == 'completed'
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain')
+    samples = _parse(response.text)
+
+    # NLP阶段和合并写入图存储（graph_flush）在文件类型未知的位置计时，不带 file_type 标签
+    for stage in ('extract', 'clean', 'ner', 'relations', 'graph_flush', 'text_save', 'sql_save', 'index'):
+        assert _value(samples, 'kg_stage_duration_seconds_count', stage=stage) >= 1, stage
+        assert _value(samples, 'kg_stage_duration_seconds_sum', stage=stage) > 0, stage
+        assert _value(samples, 'kg_stage_duration_seconds_bucket', stage=stage, le='+Inf') >= 1, stage
+    assert _value(samples, 'kg_stage_duration_seconds_count', stage='extract', file_type='.txt') >= 1
+    assert _value(samples, 'kg_file_processing_seconds_count', file_type='.txt', status='completed') >= 1
+    assert _value(samples, 'kg_file_size_bytes_sum', file_type='.txt') >= os.path.getsize(SAMPLE_FILE)
+    assert _value(samples, 'kg_files_processed_total', file_type='.txt', status='completed') >= 1
+    assert _value(samples, 'kg_entities_extracted_total') > 0
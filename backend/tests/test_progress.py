@@ -0,0 +1,107 @@
+"""进度事件的发布/订阅：多订阅者、按文件过滤、缓冲区满时丢弃最旧事件、SSE数据流的结束"""
+import asyncio
+import json
+import threading
+
+from progress import ProgressBroker, stream_events
+
+USER = 1
+
+async def _drain(subscription, timeout=0.05):
+    events = []
+    while True:
+        event = await subscription.get(timeout=timeout)
+        if event is None:
+            return events
+        events.append(event)
+
+def _publish_from_thread(broker, *events):
+    """模拟处理线程发布事件"""
+    thread = threading.Thread(target=lambda: [broker.publish(USER, file_id, event) for file_id, event in events])
+    thread.start()
+    thread.join()
+
+def test_many_subscribers_on_one_user():
+    async def run():
+        broker = ProgressBroker()
+        subscriptions = [broker.subscribe(USER) for _ in range(200)]
+        assert broker.subscriber_count == 200
+        _publish_from_thread(broker, (3, 'processing'), (3, 'completed'))
+        for subscription in subscriptions:
+            events = [await subscription.get(timeout=1), await subscription.get(timeout=1)]
+            assert [e['event'] for e in events] == ['processing', 'completed']
+        assert await _drain(subscriptions[-1]) == []
+        for subscription in subscriptions:
+            subscription.close()
+        assert broker.subscriber_count == 0
+    asyncio.run(run())
+
+def test_events_are_filtered_by_user_and_file():
+    async def run():
+        broker = ProgressBroker()
+        all_files = broker.subscribe(USER)
+        one_file = broker.subscribe(USER, file_id=3)
+        other_user = broker.subscribe(USER + 1)
+        _publish_from_thread(broker, (3, 'extracted'), (4, 'extracted'), (3, 'completed'))
+        assert [(e['file_id'], e['event']) for e in await _drain(all_files)] == \
+            [(3, 'extracted'), (4, 'extracted'), (3, 'completed')]
+        assert [(e['file_id'], e['event']) for e in await _drain(one_file)] == [(3, 'extracted'), (3, 'completed')]
+        assert await _drain(other_user) == []
+    asyncio.run(run())
+
+def test_full_buffer_drops_oldest_and_reports_count():
+    async def run():
+        broker = ProgressBroker(queue_size=3)
+        subscription = broker.subscribe(USER)
+        for done in range(5):
+            broker.publish(USER, 3, 'extracting', done=done, total=5)
+        events = await _drain(subscription)
+        assert [e['done'] for e in events] == [2, 3, 4]
+        assert events[0]['dropped'] == 2
+        assert 'dropped' not in events[1] and 'dropped' not in events[2]
+    asyncio.run(run())
+
+def _collect(stream):
+    async def run():
+        return [chunk async for chunk in stream]
+    return run
+
+def _events(chunks):
+    return [json.loads(chunk.split('data: ', 1)[1])['event'] for chunk in chunks if chunk.startswith('event:')]
+
+def test_file_stream_ends_on_terminal_event():
+    async def run():
+        broker = ProgressBroker()
+        for terminal in ('completed', 'error'):
+            subscription = broker.subscribe(USER, file_id=3)
+            collector = asyncio.ensure_future(_collect(stream_events(subscription, heartbeat=0.01))())
+            await asyncio.sleep(0.03)
+            _publish_from_thread(broker, (3, 'processing'), (4, 'processing'), (3, terminal), (3, 'late'))
+            chunks = await asyncio.wait_for(collector, 1)
+            assert _events(chunks) == ['processing', terminal]
+            assert ': heartbeat\n\n' in chunks
+            assert broker.subscriber_count == 0
+    asyncio.run(run())
+
+def test_file_stream_ends_immediately_for_finished_file():
+    async def run():
+        broker = ProgressBroker()
+        subscription = broker.subscribe(USER, file_id=3)
+        chunks = await asyncio.wait_for(
+            _collect(stream_events(subscription, initial=[{'file_id': 3, 'event': 'completed'}]))(), 1)
+        assert _events(chunks) == ['completed']
+        assert broker.subscriber_count == 0
+    asyncio.run(run())
+
+def test_user_stream_continues_after_file_completes():
+    async def run():
+        broker = ProgressBroker()
+        subscription = broker.subscribe(USER)
+        stream = stream_events(subscription, heartbeat=0.01)
+        broker.publish(USER, 3, 'completed')
+        broker.publish(USER, 4, 'processing')
+        assert _events([await stream.__anext__(), await stream.__anext__()]) == ['completed', 'processing']
+        assert await stream.__anext__() == ": heartbeat\n\n"
+        await stream.aclose()
+        assert broker.subscriber_count == 0
+    asyncio.run(run())
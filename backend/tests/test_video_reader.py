@@ -0,0 +1,106 @@
+"""视频抽帧、关键帧选择和时间标记"""
+import shutil
+
+import pytest
+
+import video_reader
+from benchmarks import corpus
+from image_hash import fingerprint
+from records import Entity
+from video_reader import (KeyframeSelector, format_timestamp, keyframe_segments, sample_frames,
+                          tag_timestamps)
+
+def _scene_changes(scenes):
+    return [scene for i, scene in enumerate(scenes) if i == 0 or scene != scenes[i - 1]]
+
+def test_keyframes_follow_scene_changes():
+    frames = corpus.slide_frames(4, 6)
+    selector = KeyframeSelector()
+    kept = [scene for image, scene in frames if selector.is_keyframe(fingerprint(image))]
+    # 指针移动和压缩噪声不产生关键帧；只改动一行文字的画面产生新的关键帧
+    assert kept == _scene_changes([scene for _, scene in frames])
+    assert '1-edited' in kept
+
+def test_negative_distance_keeps_every_frame():
+    frames = corpus.slide_frames(1, 5)
+    selector = KeyframeSelector(phash_distance=-1)
+    assert all(selector.is_keyframe(fingerprint(image)) for image, _ in frames)
+
+def test_resized_frame_is_keyframe():
+    image = corpus.screenshot(0).convert('L')
+    selector = KeyframeSelector()
+    assert selector.is_keyframe(fingerprint(image))
+    assert not selector.is_keyframe(fingerprint(image))
+    assert selector.is_keyframe(fingerprint(image.resize((400, 300))))
+
+def test_format_timestamp():
+    assert format_timestamp(0) == "[00:00:00.000]"
+    assert format_timestamp(65.5) == "[00:01:05.500]"
+    assert format_timestamp(3725.25) == "[01:02:05.250]"
+
+def test_keyframe_segments_round_trip():
+    text = "\n".join([format_timestamp(0), "第一帧", format_timestamp(65.5), "第二帧\n两行",
+                      format_timestamp(3725.25), "第三帧"])
+    segments = keyframe_segments("片头说明\n" + text)
+    assert [seconds for seconds, _ in segments] == [0, 65.5, 3725.25]
+    assert [segment.strip() for _, segment in segments] == ["第一帧", "第二帧\n两行", "第三帧"]
+    assert keyframe_segments("没有时间标记的文本") == []
+
+def test_tag_timestamps():
+    text = "\n".join([format_timestamp(1), "张伟在华夏科技公司工作。", format_timestamp(12.5),
+                      "华夏科技公司位于北京。", format_timestamp(30), "王芳在上海。"])
+    entities = [Entity('华夏科技公司', 'ORG'), Entity('王芳', 'PERSON'), Entity('李娜', 'PERSON'),
+                Entity('00:00:01.000', 'TIME')]
+    # 时间标记清洗后的残留片段被丢弃，未出现在任何关键帧中的普通实体保留
+    tagged = {entity.text: entity.timestamps for entity in tag_timestamps(text, entities)}
+    assert tagged == {'华夏科技公司': [1.0, 12.5], '王芳': [30.0], '李娜': []}
+
+def test_missing_ffmpeg_is_reported(monkeypatch, tmp_path):
+    monkeypatch.setattr(video_reader, 'FFMPEG_BINARY', str(tmp_path / "no-ffmpeg"))
+    with pytest.raises(RuntimeError, match="ffmpeg"):
+        next(sample_frames(str(tmp_path / "video.mp4")))
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason="未安装ffmpeg")
+def test_sample_frames(tmp_path):
+    frames = corpus.slide_frames(3, 4)
+    path = corpus.write_video(str(tmp_path / "slides.mp4"), frames, fps=2)
+    sampled = list(sample_frames(path, rate=2))
+    # 编码器可能在结尾多输出一帧
+    assert len(frames) <= len(sampled) <= len(frames) + 1
+    assert [seconds for seconds, _ in sampled] == [i / 2 for i in range(len(sampled))]
+    assert all(image.mode == 'L' and image.size == frames[0][0].size for _, image in sampled)
+
+    assert [image.size for _, image in sample_frames(path, rate=2, max_frames=3, max_width=400)] == [(400, 300)] * 3
+    selector = KeyframeSelector()
+    keyframes = sum(selector.is_keyframe(fingerprint(image)) for _, image in sampled)
+    assert len(_scene_changes([scene for _, scene in frames])) <= keyframes < len(sampled)
+
+def test_returning_keyframe_reuses_ocr(monkeypatch, session_factory):
+    """A、B、A 三个画面：第三帧复用第一帧已完成的识别结果"""
+    from concurrent.futures import ThreadPoolExecutor
+    import file_handler
+    from image_hash import ImageFingerprintStore
+
+    slides = [corpus.screenshot(0).convert('L'), corpus.screenshot(1).convert('L')]
+    ocr_calls = []
+    def fake_ocr(size, pixels):
+        ocr_calls.append(size)
+        return f"第{len(ocr_calls)}次识别"
+
+    store = ImageFingerprintStore(session_factory)
+    processor = file_handler.FileProcessor(fingerprints=store)
+    pool = ThreadPoolExecutor(1)
+    def frames(path):
+        for seconds, image in enumerate([slides[0], slides[1], slides[0]]):
+            if seconds == 2:
+                # 第三帧到达前，前两帧的识别已经完成
+                pool.submit(lambda: None).result()
+            yield float(seconds), image
+    monkeypatch.setattr(video_reader, 'sample_frames', frames)
+    monkeypatch.setattr(file_handler, 'ocr_frame_worker', fake_ocr)
+    monkeypatch.setattr(processor, '_video_ocr_pool', lambda: pool)
+
+    text = processor._process_video("slides.mp4", owner=(1, 1))
+    pool.shutdown()
+    assert len(ocr_calls) == 2
+    assert keyframe_segments(text)[2][1].strip() == "第1次识别"
@@ -0,0 +1,134 @@
+"""合并写入的写入日志：图存储落盘之前不追加检查点，进程退出后可从日志重放"""
+import glob
+import json
+import os
+import time
+
+from records import Entity, Relation
+from write_behind import GraphWriteBuffer, replay_logs
+
+def _write(file_id):
+    return ([Entity('张伟', 'PERSON', 0, 2, 0.6), Entity('北京', 'GPE', 3, 5, 0.6)],
+            [Relation('张伟', '位于', '北京', 0.8, '张伟在北京')], file_id, 1)
+
+def _log_records(log_dir):
+    records = []
+    for path in glob.glob(os.path.join(log_dir, "write-*.log")):
+        with open(path, encoding="utf-8") as f:
+            records.extend(json.loads(line) for line in f)
+    return records
+
+def _unflushed(log_dir):
+    records = _log_records(log_dir)
+    flushed = {seq for record in records for seq in record.get('flushed', ())}
+    return sorted(record['file_id'] for record in records if 'seq' in record and record['seq'] not in flushed)
+
+def _crash(buffer):
+    """模拟进程退出：释放日志的文件锁，不写检查点也不删除日志"""
+    buffer._log.close()
+    buffer._log = None
+
+def test_log_kept_until_backend_persists(tmp_path):
+    log_dir = str(tmp_path / "log")
+    written, persisted = [], []
+    buffer = GraphWriteBuffer(written.extend, log_dir, max_files=10, persist=lambda: persisted.append(len(written)),
+                              sync_interval=3600)
+    for file_id in (1, 2):
+        buffer.submit(*_write(file_id)).result(5)
+    # 已写入图存储（内存），但尚未落盘：日志保留两个文件的写入
+    assert [w[2] for w in written] == [1, 2] and persisted == []
+    assert _unflushed(log_dir) == [1, 2]
+
+    _crash(buffer)
+    replayed = []
+    assert replay_logs(replayed.extend, log_dir) == [1, 2]
+    assert [w[2] for w in replayed] == [1, 2]
+    assert glob.glob(os.path.join(log_dir, "write-*.log")) == []
+    buffer.close()
+
+def test_checkpoint_after_periodic_persist(tmp_path):
+    log_dir = str(tmp_path / "log")
+    written, persisted = [], []
+    buffer = GraphWriteBuffer(written.extend, log_dir, max_files=10, persist=lambda: persisted.append(len(written)),
+                              sync_interval=0.1)
+    try:
+        for file_id in (1, 2, 3):
+            buffer.submit(*_write(file_id)).result(5)
+        deadline = time.time() + 5
+        while _unflushed(log_dir) and time.time() < deadline:
+            time.sleep(0.02)
+        assert _unflushed(log_dir) == []
+        # 同一间隔内写入的批次共用落盘
+        assert 1 <= len(persisted) <= 3 and persisted[-1] == 3
+    finally:
+        buffer.close()
+    assert glob.glob(os.path.join(log_dir, "write-*.log")) == []
+
+def test_failed_persist_keeps_log_for_replay(tmp_path):
+    log_dir = str(tmp_path / "log")
+
+    def persist():
+        raise OSError("磁盘已满")
+
+    buffer = GraphWriteBuffer(lambda batch: None, log_dir, max_files=10, persist=persist, sync_interval=0)
+    buffer.submit(*_write(7)).result(5)
+    buffer.close()
+    assert _unflushed(log_dir) == [7]
+    assert replay_logs(lambda batch: None, log_dir) == [7]
+
+def test_memory_backend_replay_after_crash(tmp_path):
+    from knowledge_graph import KnowledgeGraphBuilder
+    from memory_graph import MemoryGraphBackend
+    data_dir, log_dir = str(tmp_path / "graph"), str(tmp_path / "log")
+
+    backend = MemoryGraphBackend(data_dir, save_interval=float('inf'))
+    builder = KnowledgeGraphBuilder(backend, batch_files=10, write_log_dir=log_dir)
+    builder.submit_graph(*_write(11)).result(5)
+    assert backend.search_entities(1, '张伟')
+    _crash(builder.writer)
+
+    # 图数据从未落盘：重新打开时为空，由写入日志恢复
+    recovered = MemoryGraphBackend(data_dir, save_interval=float('inf'))
+    assert recovered.search_entities(1, '张伟') == []
+    replayed = []
+    builder2 = KnowledgeGraphBuilder(recovered, batch_files=10, write_log_dir=log_dir, on_replayed=replayed.extend)
+    assert replayed == [11]
+    builder2.close()
+    assert [r['file_id'] for r in MemoryGraphBackend(data_dir).search_entities(1, '张伟')] == [11]
+    builder.writer.close()
+
+def test_failed_write_reaches_caller_and_log_recovers(tmp_path):
+    from knowledge_graph import KnowledgeGraphBuilder
+    from memory_graph import MemoryGraphBackend
+    log_dir = str(tmp_path / "log")
+    builder = KnowledgeGraphBuilder(MemoryGraphBackend(None), batch_files=10, write_log_dir=log_dir)
+    write_batch = builder.backend.write_batch
+    def failing(writes):
+        if any(w[2] == 21 for w in writes):
+            raise OSError("图存储不可用")
+        write_batch(writes)
+    builder.backend.write_batch = failing
+
+    future = builder.submit_graph(*_write(21))
+    assert isinstance(future.exception(5), OSError)
+    builder.submit_graph(*_write(22)).result(5)
+    # 失败的写入保留在日志中，之后的成功写入只追加检查点
+    assert _unflushed(log_dir) == [21]
+
+    # 重新处理：删除旧图数据后重新写入，失败的记录不再需要重放，日志随即截断
+    builder.backend.write_batch = write_batch
+    builder.delete_file(21)
+    builder.submit_graph(*_write(21)).result(5)
+    assert _log_records(log_dir) == []
+    builder.close()
+    assert glob.glob(os.path.join(log_dir, "write-*.log")) == []
+
+def test_failed_write_kept_for_replay_on_close(tmp_path):
+    log_dir = str(tmp_path / "log")
+    def write(batch):
+        raise OSError("图存储不可用")
+    buffer = GraphWriteBuffer(write, log_dir, max_files=10)
+    assert isinstance(buffer.submit(*_write(31)).exception(5), OSError)
+    buffer.close()
+    assert _unflushed(log_dir) == [31]
+    assert replay_logs(lambda batch: None, log_dir) == [31]
@@ -0,0 +1,123 @@
+from typing import Iterator, List, Optional, Tuple
+import os
+import re
+import subprocess
+
+from document import clean_text
+from image_hash import (Fingerprint, IMAGE_DEDUP_DETAIL_DISTANCE, IMAGE_DEDUP_PHASH_DISTANCE,
+                        detail_distance)
+from records import Entity
+
+# 支持的视频格式
+VIDEO_EXTENSIONS = ['.mp4', '.mov', '.avi', '.mkv', '.webm']
+# ffmpeg 可执行文件
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+# 每秒抽取的帧数、每个视频最多抽取的帧数，以及抽帧宽度上限（更宽的视频等比缩小，OCR不需要更高的分辨率）
+VIDEO_FRAME_RATE = float(os.getenv("VIDEO_FRAME_RATE", "1"))
+VIDEO_MAX_FRAMES = int(os.getenv("VIDEO_MAX_FRAMES", "3600"))
+VIDEO_MAX_WIDTH = int(os.getenv("VIDEO_MAX_WIDTH", "1920"))
+# 与上一个关键帧近似相同的帧跳过OCR：pHash 的 Hamming 距离上限（为负数时每一帧都识别）和细节 dHash 的条带差异上限
+VIDEO_FRAME_PHASH_DISTANCE = int(os.getenv("VIDEO_FRAME_PHASH_DISTANCE", str(IMAGE_DEDUP_PHASH_DISTANCE)))
+VIDEO_FRAME_DETAIL_DISTANCE = float(os.getenv("VIDEO_FRAME_DETAIL_DISTANCE", str(IMAGE_DEDUP_DETAIL_DISTANCE)))
+
+# 提取文本中每个关键帧的识别结果前一行是该帧的时间标记
+_MARKER_RE = re.compile(r'^\[(\d+):(\d{2}):(\d{2}(?:\.\d+)?)\]$', re.MULTILINE)
+# 时间标记清洗后残留的片段（spaCy可能把它识别为时间实体）
+_MARKER_FRAGMENT_RE = re.compile(r'[\d:.\s]+')
+
+def sample_frames(file_path: str, rate: float = VIDEO_FRAME_RATE, max_frames: int = VIDEO_MAX_FRAMES,
+                  max_width: int = VIDEO_MAX_WIDTH) -> Iterator[Tuple[float, object]]:
+    """用 ffmpeg 按固定帧率抽帧，逐帧返回 (时间秒数, 灰度图像)
+
+    ffmpeg 把帧编码为PGM经管道输出（每帧自带宽高，旋转过的视频也无需另外探测尺寸），
+    解码与调用方的处理并行进行；提前停止迭代时结束 ffmpeg 进程。
+    """
+    from PIL import Image
+
+    command = [FFMPEG_BINARY, '-nostdin', '-loglevel', 'error', '-i', file_path, '-an', '-sn',
+               '-vf', f"fps={rate},scale='min({max_width},iw)':-2", '-frames:v', str(max_frames),
+               '-f', 'image2pipe', '-c:v', 'pgm', '-']
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise RuntimeError(f"未找到ffmpeg（{FFMPEG_BINARY}），无法处理视频")
+
+    index = 0
+    finished = False
+    try:
+        while True:
+            header = [process.stdout.readline() for _ in range(3)]
+            if not header[0]:
+                break
+            if header[0].strip() != b'P5':
+                raise RuntimeError("无法解析ffmpeg输出的视频帧")
+            width, height = map(int, header[1].split())
+            data = process.stdout.read(width * height)
+            if len(data) < width * height:
+                break
+            yield index / rate, Image.frombytes('L', (width, height), data)
+            index += 1
+        finished = True
+    finally:
+        if not finished:
+            process.kill()
+        process.stdout.close()
+        error = process.stderr.read().decode('utf-8', 'replace').strip()
+        process.stderr.close()
+        process.wait()
+    if process.returncode != 0 and index == 0:
+        raise RuntimeError(f"视频解码失败: {error or process.returncode}")
+
+class KeyframeSelector:
+    """关键帧选择：与上一个关键帧比较 pHash 和细节 dHash，画面几乎不变的帧视为冗余
+
+    与上一个保留的关键帧（而不是上一帧）比较，缓慢的渐变累积到阈值后仍会产生新的关键帧；
+    幻灯片或字幕只改动一行文字时细节 dHash 的条带差异超过阈值，不会被误判为冗余。
+    """
+
+    def __init__(self, phash_distance: int = VIDEO_FRAME_PHASH_DISTANCE,
+                 detail_distance: float = VIDEO_FRAME_DETAIL_DISTANCE):
+        self.phash_distance = phash_distance
+        self.detail_distance = detail_distance
+        self._last: Optional[Fingerprint] = None
+
+    def is_keyframe(self, fp: Fingerprint) -> bool:
+        last = self._last
+        if last is not None and self.phash_distance >= 0 and (fp.width, fp.height) == (last.width, last.height) \
+                and bin(fp.phash ^ last.phash).count('1') <= self.phash_distance \
+                and detail_distance(fp.dhash, last.dhash) <= self.detail_distance:
+            return False
+        self._last = fp
+        return True
+
+def format_timestamp(seconds: float) -> str:
+    """关键帧的时间标记，如 [00:01:05.500]"""
+    minutes, secs = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    return f"[{hours:02d}:{minutes:02d}:{secs:06.3f}]"
+
+def keyframe_segments(text: str) -> List[Tuple[float, str]]:
+    """按时间标记切分视频的提取文本，返回 [(时间秒数, 该关键帧的文本)]"""
+    markers = list(_MARKER_RE.finditer(text))
+    segments = []
+    for i, match in enumerate(markers):
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(text)
+        seconds = int(match.group(1)) * 3600 + int(match.group(2)) * 60 + float(match.group(3))
+        segments.append((seconds, text[match.end():end]))
+    return segments
+
+def tag_timestamps(text: str, entities: List[Entity]) -> List[Entity]:
+    """为视频中抽取的实体标注出现的时间（包含该实体的各关键帧的时间，升序）
+
+    实体文本来自清洗后的文本，因此与清洗后的各关键帧文本比较；时间只由提取文本推导，
+    重新处理复用保存的文本时同样可以标注。没有出现在任何关键帧中的时间标记残留片段被丢弃。
+    """
+    segments = [(seconds, clean_text(segment)) for seconds, segment in keyframe_segments(text)]
+    tagged = []
+    for entity in entities:
+        timestamps = [round(seconds, 3) for seconds, segment in segments if entity.text in segment]
+        if not timestamps and _MARKER_FRAGMENT_RE.fullmatch(entity.text):
+            continue
+        entity.timestamps = timestamps
+        tagged.append(entity)
+    return tagged
@@ -0,0 +1,360 @@
+"""图存储写入的跨文件合并（write-behind）
+
+大量小文件同时处理完成时，逐个文件写入图存储（每个文件一个会话和事务）的开销主要在事务本身。
+GraphWriteBuffer 收集各个处理任务提交的写入，由一个写入线程在批量事务中写入：上一批写入期间到达的文件
+合并到下一批（不超过文件数/行数上限），负载低时单个文件不额外等待。写入完成后才通过 Future 和回调
+通知各个文件，调用方据此把文件标记为已完成。
+
+提交的写入先追加到本地日志，写入并持久化后追加检查点；进程意外退出时尚未持久化到图存储的数据
+在下次启动时从日志重放（图存储的写入按 (文本, 文件) 合并，重放是幂等的）。写入返回时尚未落盘的
+图存储（内置图引擎）提供 persist，检查点推迟到 persist 返回之后：距上次持久化超过
+GRAPH_WRITE_SYNC_INTERVAL 秒时由写入线程调用，期间写入的各批次共用一次落盘。每个进程使用
+自己的日志文件并持有文件锁，启动时只重放锁已释放（所属进程已退出）的日志。
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import glob
+import json
+import os
+import threading
+import time
+
+from metrics import registry, record_error, span
+from records import Entity, Relation
+
+try:
+    import fcntl
+except ImportError:  # Windows：不加锁，同一目录只应有一个进程
+    fcntl = None
+
+# 一批最多合并的文件数（0 表示不合并，每个文件直接写入）和节点+边行数
+GRAPH_WRITE_BATCH_FILES = int(os.getenv("GRAPH_WRITE_BATCH_FILES", "200"))
+GRAPH_WRITE_BATCH_ROWS = int(os.getenv("GRAPH_WRITE_BATCH_ROWS", "20000"))
+# 第一个写入到达后额外等待更多文件的秒数（0 表示不等待，只合并上一批写入期间到达的文件）
+GRAPH_WRITE_FLUSH_INTERVAL = float(os.getenv("GRAPH_WRITE_FLUSH_INTERVAL", "0"))
+# 等待写入的文件数上限，超出时提交方阻塞（批量流水线的背压）
+GRAPH_WRITE_MAX_PENDING = int(os.getenv("GRAPH_WRITE_MAX_PENDING", "1000"))
+# 重放日志目录；每次追加后是否 fsync（关闭时只防进程崩溃，不防断电）
+GRAPH_WRITE_LOG_DIR = os.getenv("GRAPH_WRITE_LOG_DIR",
+                                os.path.join(os.getenv("GRAPH_DATA_DIR", "./graph_data"), "write_log"))
+GRAPH_WRITE_LOG_FSYNC = os.getenv("GRAPH_WRITE_LOG_FSYNC", "false").lower() == "true"
+# 图存储需要单独落盘时（内置图引擎），写入后至多等待该秒数即落盘并追加检查点（写入线程空闲时也按此间隔）
+GRAPH_WRITE_SYNC_INTERVAL = float(os.getenv("GRAPH_WRITE_SYNC_INTERVAL", "5"))
+
+BATCH_FILES = registry.histogram("kg_graph_write_batch_files", "每个批量写入事务合并的文件数",
+                                 buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500))
+PENDING_FILES = registry.gauge("kg_graph_write_pending_files", "等待写入图存储的文件数")
+
+# (实体, 关系, 文件ID, 用户ID)
+GraphWrite = Tuple[List[Entity], List[Relation], int, int]
+
+def graph_counts(entities: List[Entity], relations: List[Relation]) -> Dict[str, int]:
+    """写入图存储后该文件的节点和边数（节点按文本合并，边按主语、宾语和关系类型合并）"""
+    texts = {entity.text for entity in entities}
+    edges = {(relation.subject, relation.object, relation.predicate) for relation in relations
+             if relation.subject in texts and relation.object in texts}
+    return {'total_nodes': len(texts), 'total_edges': len(edges)}
+
+class _Pending:
+    __slots__ = ('seq', 'write', 'rows', 'future')
+
+    def __init__(self, seq: int, write: GraphWrite):
+        self.seq = seq
+        self.write = write
+        self.rows = len(write[0]) + len(write[1])
+        self.future: Future = Future()
+
+class GraphWriteBuffer:
+    """合并多个文件的图存储写入
+
+    write(batch) 在一个事务中写入一批 GraphWrite；submit 返回的 Future 在该文件所在批次写入后
+    得到 {'stats': 节点和边数}，写入失败时得到异常。回调在单独的线程中依次执行，不阻塞后续批次的写入。
+    persist 不为 None 时写入后的数据要调用它才会持久化，在此之前日志中保留这些写入。
+    """
+
+    def __init__(self, write: Callable[[List[GraphWrite]], None], log_dir: Optional[str] = GRAPH_WRITE_LOG_DIR,
+                 max_files: int = GRAPH_WRITE_BATCH_FILES, max_rows: int = GRAPH_WRITE_BATCH_ROWS,
+                 flush_interval: float = GRAPH_WRITE_FLUSH_INTERVAL, max_pending: int = GRAPH_WRITE_MAX_PENDING,
+                 fsync: bool = GRAPH_WRITE_LOG_FSYNC, persist: Optional[Callable[[], None]] = None,
+                 sync_interval: float = GRAPH_WRITE_SYNC_INTERVAL):
+        self._write = write
+        self._persist = persist
+        self.sync_interval = sync_interval
+        self.max_files = max(max_files, 1)
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.max_pending = max(max_pending, self.max_files)
+        self.fsync = fsync
+
+        self._pending: List[_Pending] = []
+        self._by_file: Dict[int, List[_Pending]] = {}
+        self._seq = 0
+        # 已写入图存储、等待 persist 后才能追加检查点的序号
+        self._unsynced: List[int] = []
+        self._last_sync = time.monotonic()
+        # 写入失败的序号（按文件ID）：日志中保留这些记录，下次启动时重放；
+        # 该文件之后写入成功或其图数据被删除时不再需要重放，追加检查点后清除
+        self._failed: Dict[int, List[int]] = {}
+        self._closed = False
+        self._cond = threading.Condition()
+        self._callbacks = ThreadPoolExecutor(max_workers=1, thread_name_prefix="graph-write-callback")
+
+        self.log_dir = log_dir
+        # 本进程的日志在第一次提交时创建
+        self._log = None
+
+        self._flusher = threading.Thread(target=self._run, name="graph-write-behind", daemon=True)
+        self._flusher.start()
+
+    # ---- 提交 ----
+
+    def submit(self, entities: List[Entity], relations: List[Relation], file_id: int, user_id: int,
+               callback: Optional[Callable[[Future], Any]] = None) -> Future:
+        """提交一个文件的写入（先追加到日志），返回写入完成时结束的 Future"""
+        # 日志记录在锁外序列化，锁内只补上序号；实体和关系按位置参数保存为数组
+        record = json.dumps({
+            'file_id': file_id, 'user_id': user_id,
+            'entities': [[e.text, e.label, e.start, e.end, e.confidence] for e in entities],
+            'relations': [[r.subject, r.predicate, r.object, r.confidence, r.context] for r in relations]
+        }, ensure_ascii=False, separators=(',', ':')).encode('utf-8') if self.log_dir else None
+        with self._cond:
+            while len(self._pending) >= self.max_pending and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                raise RuntimeError("图存储写入缓冲已关闭")
+            self._seq += 1
+            item = _Pending(self._seq, (entities, relations, file_id, user_id))
+            if record is not None:
+                self._append_log(b'{"seq":%d,' % item.seq + record[1:])
+            self._pending.append(item)
+            self._by_file.setdefault(file_id, []).append(item)
+            PENDING_FILES.set(len(self._pending))
+            self._cond.notify_all()
+        if callback is not None:
+            self.add_callback(item.future, callback)
+        return item.future
+
+    def add_callback(self, future: Future, callback: Callable[[Future], Any]):
+        """future 完成后在回调线程中执行 callback（Future 自身的回调在写入线程中执行，会推迟下一批写入）"""
+        future.add_done_callback(lambda done: self._callbacks.submit(callback, done))
+
+    def wait_file(self, file_id: int, timeout: Optional[float] = None):
+        """等待该文件已提交的写入完成（删除文件的图数据之前调用），其中写入失败的记录不再重放"""
+        with self._cond:
+            futures = [item.future for item in self._by_file.get(file_id, [])]
+        for future in futures:
+            try:
+                future.result(timeout)
+            except Exception:
+                pass
+        with self._cond:
+            failed = self._failed.pop(file_id, [])
+            if failed:
+                self._checkpoint(failed)
+
+    def flush(self):
+        """立即写入当前等待的全部数据并等待完成"""
+        with self._cond:
+            futures = [item.future for item in self._pending]
+            self._cond.notify_all()
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                pass
+
+    # ---- 写入线程 ----
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed and not self._sync_due():
+                    self._cond.wait(self._sync_wait())
+                closing = self._closed and not self._pending
+                batch = []
+                if self._pending:
+                    # 可选：第一个写入到达后等待更多文件，达到上限或超时即写入
+                    deadline = time.monotonic() + self.flush_interval
+                    while self.flush_interval > 0 and not self._closed and not self._full():
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    batch = self._take()
+            if batch:
+                self._flush(batch)
+            if closing or self._sync_due():
+                self._sync()
+            if closing:
+                return
+
+    def _full(self) -> bool:
+        return (len(self._pending) >= self.max_files
+                or (self.max_rows > 0 and sum(item.rows for item in self._pending) >= self.max_rows))
+
+    def _take(self) -> List[_Pending]:
+        """取出一批（调用方持有锁），至少一个文件"""
+        rows = 0
+        count = 0
+        for item in self._pending:
+            if count and (count >= self.max_files or (self.max_rows > 0 and rows + item.rows > self.max_rows)):
+                break
+            rows += item.rows
+            count += 1
+        batch = self._pending[:count]
+        del self._pending[:count]
+        return batch
+
+    def _flush(self, batch: List[_Pending]):
+        error = None
+        try:
+            with span(stage="graph_flush"):
+                self._write([item.write for item in batch])
+        except Exception as e:
+            record_error("graph")
+            print(f"图存储批量写入失败({len(batch)} 个文件): {e}")
+            error = e
+        BATCH_FILES.observe(len(batch))
+
+        with self._cond:
+            if error is None:
+                # 同一文件之前失败的写入已被这次写入取代
+                seqs = [item.seq for item in batch]
+                for item in batch:
+                    seqs.extend(self._failed.pop(item.write[2], []))
+                if self._persist is not None:
+                    self._unsynced.extend(seqs)
+                else:
+                    self._checkpoint(seqs)
+            else:
+                for item in batch:
+                    self._failed.setdefault(item.write[2], []).append(item.seq)
+            for item in batch:
+                items = self._by_file.get(item.write[2], [])
+                if item in items:
+                    items.remove(item)
+                if not items:
+                    self._by_file.pop(item.write[2], None)
+            PENDING_FILES.set(len(self._pending))
+            self._cond.notify_all()
+
+        for item in batch:
+            if error is None:
+                entities, relations = item.write[0], item.write[1]
+                item.future.set_result({'stats': graph_counts(entities, relations)})
+            else:
+                item.future.set_exception(error)
+
+    def _sync_due(self) -> bool:
+        return bool(self._unsynced) and time.monotonic() - self._last_sync >= self.sync_interval
+
+    def _sync_wait(self) -> Optional[float]:
+        if not self._unsynced:
+            return None
+        return max(self._last_sync + self.sync_interval - time.monotonic(), 0.0)
+
+    def _sync(self):
+        """持久化已写入的数据，随后为这些写入追加检查点；失败时保留，下次再试"""
+        with self._cond:
+            seqs, self._unsynced = self._unsynced, []
+        if not seqs:
+            return
+        try:
+            self._persist()
+            error = None
+        except Exception as e:
+            record_error("graph")
+            print(f"图存储落盘失败({len(seqs)} 个写入保留在日志中): {e}")
+            error = e
+        with self._cond:
+            self._last_sync = time.monotonic()
+            if error is None:
+                self._checkpoint(seqs)
+            else:
+                self._unsynced[:0] = seqs
+
+    # ---- 日志 ----
+
+    def _append_log(self, line: bytes):
+        if self._log is None:
+            os.makedirs(self.log_dir, exist_ok=True)
+            self._log = open(os.path.join(self.log_dir, f"write-{os.getpid()}-{int(time.time() * 1000)}.log"), "ab")
+            if fcntl is not None:
+                fcntl.flock(self._log.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._log.write(line + b"\n")
+        self._log.flush()
+        if self.fsync:
+            os.fsync(self._log.fileno())
+
+    def _checkpoint(self, seqs: List[int]):
+        """记录已持久化（或不再需要重放）的写入（调用方持有锁）；没有等待中、未持久化和失败的写入时截断日志"""
+        if self._log is None:
+            return
+        if not self._pending and not self._unsynced and not self._failed:
+            self._log.truncate(0)
+            self._log.seek(0)
+        else:
+            self._append_log(json.dumps({'flushed': seqs}).encode('utf-8'))
+
+    def close(self):
+        """写入并持久化剩余数据，停止写入线程并删除本进程的日志（有写入或落盘失败时保留日志，下次启动重放）"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._flusher.join()
+        self._callbacks.shutdown(wait=True)
+        if self._log is not None:
+            path = self._log.name
+            self._log.close()
+            if not self._failed and not self._unsynced:
+                os.remove(path)
+
+def replay_logs(write: Callable[[List[GraphWrite]], None], log_dir: Optional[str] = GRAPH_WRITE_LOG_DIR,
+                batch_files: int = GRAPH_WRITE_BATCH_FILES,
+                persist: Optional[Callable[[], None]] = None) -> List[int]:
+    """重放已退出进程遗留的日志中未写入的记录，返回涉及的文件ID
+
+    正在运行的进程持有其日志的文件锁，跳过；重放并持久化（persist）成功后删除日志，失败时保留到下次启动。
+    """
+    if not log_dir or not os.path.isdir(log_dir):
+        return []
+    replayed: List[int] = []
+    for path in sorted(glob.glob(os.path.join(log_dir, "write-*.log"))):
+        with open(path, "rb") as f:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue
+            writes: Dict[int, Dict[str, Any]] = {}
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 进程退出时写了一半的最后一行
+                    break
+                if 'flushed' in record:
+                    for seq in record['flushed']:
+                        writes.pop(seq, None)
+                else:
+                    writes[record['seq']] = record
+            batch = [([Entity(*entity) for entity in record['entities']],
+                      [Relation(*relation) for relation in record['relations']],
+                      record['file_id'], record['user_id']) for _, record in sorted(writes.items())]
+            step = max(batch_files, 1)
+            try:
+                for start in range(0, len(batch), step):
+                    write(batch[start:start + step])
+                if batch and persist is not None:
+                    persist()
+            except Exception as e:
+                record_error("graph")
+                print(f"图存储写入日志重放失败({path}): {e}")
+                continue
+        os.remove(path)
+        replayed.extend(file_id for _, _, file_id, _ in batch)
+        if batch:
+            print(f"已从写入日志重放 {len(batch)} 个文件的图数据: {os.path.basename(path)}")
+    return sorted(set(replayed))
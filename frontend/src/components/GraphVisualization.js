@@ -79,12 +79,26 @@ const GraphVisualization = ({ data, onNodeClick, onNodeDoubleClick, height = 600
       const nodes = data.nodes.map(d => ({ ...d }));
       const links = data.edges.map(d => ({ ...d }));
 
-      // 创建力导向布局
-      const sim = d3.forceSimulation(nodes)
-        .force('link', d3.forceLink(links).id(d => d.id).distance(linkDistance))
-        .force('charge', d3.forceManyBody().strength(chargeStrength))
-        .force('center', d3.forceCenter(width / 2, graphHeight / 2))
-        .force('collision', d3.forceCollide().radius(d => d.size + 5));
+      // 后端已预先计算布局时直接使用节点坐标（以原点为中心），不在浏览器中运行力导向模拟
+      const precomputed = nodes.every(d => Number.isFinite(d.x) && Number.isFinite(d.y));
+      let sim;
+      if (precomputed) {
+        nodes.forEach(d => {
+          d.x += width / 2;
+          d.y += graphHeight / 2;
+        });
+        // 只保留强度为0的连线力，用于把连线的端点ID解析为节点对象；拖拽时其他节点保持不动
+        sim = d3.forceSimulation(nodes)
+          .force('link', d3.forceLink(links).id(d => d.id).strength(0))
+          .stop();
+      } else {
+        // 创建力导向布局
+        sim = d3.forceSimulation(nodes)
+          .force('link', d3.forceLink(links).id(d => d.id).distance(linkDistance))
+          .force('charge', d3.forceManyBody().strength(chargeStrength))
+          .force('center', d3.forceCenter(width / 2, graphHeight / 2))
+          .force('collision', d3.forceCollide().radius(d => d.size + 5));
+      }
 
       setSimulation(sim);
 
@@ -163,7 +177,7 @@ const GraphVisualization = ({ data, onNodeClick, onNodeDoubleClick, height = 600
         .text(d => d.label.length > 10 ? d.label.substring(0, 10) + '...' : d.label);
 
       // 力导向布局更新
-      sim.on('tick', () => {
+      const ticked = () => {
         link
           .attr('x1', d => d.source.x)
           .attr('y1', d => d.source.y)
@@ -181,7 +195,11 @@ const GraphVisualization = ({ data, onNodeClick, onNodeDoubleClick, height = 600
         nodeLabel
           .attr('x', d => d.x)
           .attr('y', d => d.y);
-      });
+      };
+      sim.on('tick', ticked);
+      if (precomputed) {
+        ticked();
+      }
 
       // 拖拽事件处理
       function dragstarted(event, d) {
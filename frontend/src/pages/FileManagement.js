@@ -37,12 +37,43 @@ const FileManagement = () => {
   const [uploading, setUploading] = useState(false);
   const [uploadProgress, setUploadProgress] = useState({});
   const [searchText, setSearchText] = useState('');
+  const [processing, setProcessing] = useState({});
   const navigate = useNavigate();
 
   useEffect(() => {
     loadFiles();
   }, []);
 
+  // 通过SSE接收处理进度，替代轮询文件列表
+  useEffect(() => {
+    const source = fileAPI.subscribeEvents((event) => {
+      const status = {
+        processing: 'processing',
+        extracting: 'processing',
+        extracted: 'processing',
+        analyzed: 'processing',
+        graph_written: 'processing',
+        completed: 'completed',
+        error: 'error',
+      }[event.event];
+      if (status) {
+        setFiles(prev => prev.map(file =>
+          file.id === event.file_id ? { ...file, status } : file
+        ));
+      }
+      setProcessing(prev => {
+        const next = { ...prev };
+        if (event.event === 'completed' || event.event === 'error') {
+          delete next[event.file_id];
+        } else {
+          next[event.file_id] = event;
+        }
+        return next;
+      });
+    });
+    return () => source.close();
+  }, []);
+
   const loadFiles = async () => {
     try {
       setLoading(true);
@@ -99,7 +130,22 @@ const FileManagement = () => {
     });
   };
 
-  const getStatusTag = (status) => {
+  const getProgressText = (event) => {
+    switch (event.event) {
+      case 'extracting':
+        return `提取文本 ${event.done}/${event.total}`;
+      case 'extracted':
+        return '知识抽取中';
+      case 'analyzed':
+        return `${event.entities} 个实体，${event.relations} 个关系`;
+      case 'graph_written':
+        return `已写入 ${event.nodes} 个节点`;
+      default:
+        return null;
+    }
+  };
+
+  const getStatusTag = (status, record) => {
     const statusMap = {
       uploaded: { color: 'blue', text: '已上传' },
       processing: { color: 'orange', text: '处理中' },
@@ -108,6 +154,19 @@ const FileManagement = () => {
     };
     
     const config = statusMap[status] || { color: 'default', text: status };
+    const event = record && processing[record.id];
+    if (status === 'processing' && event) {
+      const percent = event.event === 'extracting' && event.total
+        ? Math.round((event.done * 100) / event.total)
+        : null;
+      return (
+        <Space direction="vertical" size={0}>
+          <Tag color={config.color}>{config.text}</Tag>
+          {percent !== null && <Progress percent={percent} size="small" />}
+          <Text type="secondary" style={{ fontSize: 12 }}>{getProgressText(event)}</Text>
+        </Space>
+      );
+    }
     return <Tag color={config.color}>{config.text}</Tag>;
   };
 
@@ -134,6 +193,7 @@ const FileManagement = () => {
       'application/vnd.openxmlformats-officedocument.wordprocessingml.document': ['.docx'],
       'image/jpeg': ['.jpg', '.jpeg'],
       'image/png': ['.png'],
+      'video/*': ['.mp4', '.mov', '.avi', '.mkv', '.webm'],
     },
     multiple: true,
   });
@@ -166,6 +226,7 @@ const FileManagement = () => {
         { text: 'DOCX', value: '.docx' },
         { text: 'JPG', value: '.jpg' },
         { text: 'PNG', value: '.png' },
+        { text: 'MP4', value: '.mp4' },
       ],
       onFilter: (value, record) => record.file_type === value,
     },
@@ -181,7 +242,7 @@ const FileManagement = () => {
       title: '状态',
       dataIndex: 'status',
       key: 'status',
-      width: 100,
+      width: 160,
       render: getStatusTag,
       filters: [
         { text: '已上传', value: 'uploaded' },
@@ -271,7 +332,7 @@ const FileManagement = () => {
                     {isDragActive ? '放开鼠标上传文件' : '点击或拖拽文件到这里上传'}
                   </Text>
                   <Text type="secondary">
-                    支持 .txt, .pdf, .docx, .jpg, .png 格式，最大 100MB
+                    支持 .txt, .pdf, .docx, .jpg, .png 及 .mp4 等视频格式，最大 100MB
                   </Text>
                 </div>
               </div>
@@ -292,7 +353,7 @@ const FileManagement = () => {
                   beforeUpload={handleUpload}
                   showUploadList={false}
                   multiple
-                  accept=".txt,.pdf,.docx,.jpg,.jpeg,.png"
+                  accept=".txt,.pdf,.docx,.jpg,.jpeg,.png,.mp4,.mov,.avi,.mkv,.webm"
                 >
                   <Button
                     type="primary"
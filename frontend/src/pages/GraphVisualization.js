@@ -77,7 +77,7 @@ const GraphVisualizationPage = () => {
       
       // 转换数据格式以适配D3
       const transformedData = {
-        nodes: data.graph_data.nodes || [],
+        nodes: await applyNodeImportance(fId, data.graph_data.nodes || []),
         edges: data.graph_data.edges || [],
       };
       
@@ -94,6 +94,29 @@ const GraphVisualizationPage = () => {
     }
   };
 
+  // 按PageRank设置节点大小，分析接口失败时保留原有大小
+  const applyNodeImportance = async (fId, nodes) => {
+    try {
+      const response = await graphAPI.getGraphAnalytics(fId);
+      const analytics = new Map(response.data.nodes.map(n => [n.id, n]));
+      const maxRank = Math.max(...response.data.nodes.map(n => n.pagerank), 0);
+      if (maxRank <= 0) return nodes;
+
+      return nodes.map(node => {
+        const info = analytics.get(node.id);
+        if (!info) return node;
+        return {
+          ...node,
+          size: 10 + 20 * (info.pagerank / maxRank),
+          pagerank: info.pagerank,
+          community: info.community,
+        };
+      });
+    } catch (error) {
+      return nodes;
+    }
+  };
+
   const handleSearch = async (query) => {
     if (!query.trim()) {
       setSearchResults([]);
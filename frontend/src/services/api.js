@@ -86,8 +86,33 @@ export const fileAPI = {
             },
         });
     },
+    batchUpload: (files) => {
+        const formData = new FormData();
+        files.forEach((file) => formData.append('files', file));
+
+        return api.post('/files/batch-upload', formData, {
+            headers: {
+                'Content-Type': 'multipart/form-data',
+            },
+        });
+    },
+    getBatchStatus: (batchId) => api.get(`/files/batch/${batchId}`),
     getFiles: () => api.get('/files'),
     deleteFile: (fileId) => api.delete(`/files/${fileId}`),
+    reprocessFile: (fileId) => api.post(`/files/${fileId}/reprocess`),
+    // 订阅文件处理进度（SSE），返回 EventSource，调用方负责 close()
+    subscribeEvents: (onEvent, fileId) => {
+        const token = localStorage.getItem('token');
+        const path = fileId ? `/files/${fileId}/events` : '/files/events';
+        const source = new EventSource(
+            `${api.defaults.baseURL}${path}?token=${encodeURIComponent(token)}`
+        );
+        ['processing', 'extracting', 'extracted', 'analyzed', 'graph_written', 'completed', 'error', 'status']
+            .forEach((type) => {
+                source.addEventListener(type, (event) => onEvent(JSON.parse(event.data)));
+            });
+        return source;
+    },
 };
 
 // 知识图谱相关API
@@ -95,6 +120,11 @@ export const graphAPI = {
     getGraph: (fileId) => api.get(`/graph/${fileId}`),
     searchGraph: (query) => api.get('/graph/search', { params: { query } }),
     getGraphStats: (fileId) => api.get('/graph/stats', { params: { file_id: fileId } }),
+    getGraphAnalytics: (fileId) => api.get(`/graph/${fileId}/analytics`),
+    getGraphVersions: (fileId) => api.get(`/graph/${fileId}/versions`),
+    getGraphVersion: (fileId, version) => api.get(`/graph/${fileId}/versions/${version}`),
+    diffGraphVersions: (fileId, fromVersion, toVersion) =>
+        api.get(`/graph/${fileId}/diff`, { params: { from_version: fromVersion, to_version: toVersion } }),
 };
 
 // 用户管理相关API